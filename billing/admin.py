@@ -1,3 +1,36 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ClienteStripe, EventoStripe, PrecioStripe, SuscripcionStripe
+from .procesador import reprogramar
+
+
+@admin.register(EventoStripe)
+class EventoStripeAdmin(admin.ModelAdmin):
+    list_display = ("stripe_id", "tipo", "cliente", "estado", "intentos", "creado", "procesado")
+    list_filter = ("estado", "tipo")
+    search_fields = ("stripe_id", "cliente")
+    ordering = ("-creado",)
+    readonly_fields = ("stripe_id", "tipo", "cliente", "payload", "creado", "recibido", "procesado", "error")
+    actions = ("reencolar",)
+
+    @admin.action(description="Volver a procesar")
+    def reencolar(self, request, queryset):
+        self.message_user(request, f"{reprogramar(queryset)} eventos reencolados.")
+
+
+@admin.register(ClienteStripe)
+class ClienteStripeAdmin(admin.ModelAdmin):
+    list_display = ("stripe_id", "usuario", "email", "eliminado", "actualizado")
+    search_fields = ("stripe_id", "email", "usuario__username")
+
+
+@admin.register(SuscripcionStripe)
+class SuscripcionStripeAdmin(admin.ModelAdmin):
+    list_display = ("stripe_id", "cliente", "precio", "estado", "fin_periodo", "cancelar_al_final", "actualizado")
+    list_filter = ("estado",)
+    search_fields = ("stripe_id", "cliente")
+
+
+@admin.register(PrecioStripe)
+class PrecioStripeAdmin(admin.ModelAdmin):
+    list_display = ("stripe_id", "producto", "monto", "moneda", "intervalo", "activo")
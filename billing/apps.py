@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class BillingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'billing'
+
+    def ready(self):
+        # Cliente HTTP de Stripe con conexiones reutilizables y timeouts (billing/conexion.py)
+        from billing import conexion
+        conexion.configurar()
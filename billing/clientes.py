@@ -0,0 +1,90 @@
+"""
+@file clientes.py
+@brief Alta de Customers de Stripe en lote (usuarios registrados sin Customer).
+@details
+ El registro ya no crea el Customer (ver `cuentas.models.crear_perfil_automatico`);
+ `crear_faltantes` lo hace para los perfiles que aún no lo tienen:
+  - Las llamadas a Stripe corren en un pool de hilos, con un ritmo máximo de
+    peticiones por segundo compartido por todos (`Ritmo`); los reintentos (429, red)
+    los hace `billing.conexion.llamar`.
+  - La base de datos sólo se toca desde el hilo que llama: los hilos reciben los
+    parámetros ya armados y devuelven el id del Customer.
+  - La llave de idempotencia por usuario (`Perfil.stripe_customer_params`) hace que
+    repetir el comando, o que coincida con un Checkout, no duplique Customers.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import stripe
+from django.conf import settings
+
+from billing.conexion import llamar
+from cuentas.models import Perfil
+
+
+class Ritmo:
+    """
+    @class Ritmo
+    @brief Limita las llamadas a `por_segundo`, repartidas entre todos los hilos.
+    """
+
+    def __init__(self, por_segundo: float):
+        self._intervalo = 1.0 / por_segundo if por_segundo > 0 else 0.0
+        self._siguiente = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._siguiente)
+            self._siguiente = turno + self._intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+def _crear(params: dict, ritmo: Ritmo) -> str:
+    ritmo.esperar()
+    return llamar(stripe.Customer.create, **params)["id"]
+
+
+def pendientes():
+    """
+    @brief Perfiles de usuarios activos sin Customer de Stripe.
+    """
+    return (
+        Perfil.objects
+        .filter(stripe_customer_id__isnull=True, user__is_active=True)
+        .select_related("user")
+        .order_by("pk")
+    )
+
+
+def crear_faltantes(perfiles=None, hilos: int = 8, por_segundo: float = 20, lote: int = 200) -> dict:
+    """
+    @brief Crea el Customer de cada perfil que no lo tenga.
+    @param perfiles QuerySet de `Perfil` (por defecto `pendientes()`).
+    @param hilos Llamadas simultáneas a Stripe.
+    @param por_segundo Máximo de peticiones por segundo (Stripe permite 100 en vivo, 25 en pruebas).
+    @param lote Perfiles que se leen y envían al pool a la vez.
+    @return Conteo `{"creados": n, "errores": m}`.
+    """
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    perfiles = (pendientes() if perfiles is None else perfiles).iterator(chunk_size=lote)
+    ritmo = Ritmo(por_segundo)
+    conteo = {"creados": 0, "errores": 0}
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="clientes-stripe") as pool:
+        while bloque := list(islice(perfiles, lote)):
+            futuros = [(p, pool.submit(_crear, p.stripe_customer_params(), ritmo)) for p in bloque]
+            for perfil, futuro in futuros:
+                try:
+                    customer_id = futuro.result()
+                except stripe.StripeError as e:
+                    print(f"[Stripe] Error creando Customer de {perfil.user_id}: {e}")
+                    conteo["errores"] += 1
+                    continue
+                Perfil.objects.filter(pk=perfil.pk, stripe_customer_id__isnull=True).update(stripe_customer_id=customer_id)
+                conteo["creados"] += 1
+    return conteo
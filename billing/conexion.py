@@ -0,0 +1,196 @@
+"""
+@file conexion.py
+@brief Llamadas a la API de Stripe: conexiones reutilizables, timeouts, reintentos y circuito.
+@details
+ Todas las llamadas de la app pasan por `llamar(...)`:
+  - `configurar()` (desde `BillingConfig.ready`) instala como cliente HTTP global de
+    la librería uno con sesiones `requests` por hilo (keep-alive, hasta
+    `STRIPE_CONEXIONES` sockets) y timeouts de conexión/lectura
+    (`STRIPE_TIMEOUT_CONEXION`, `STRIPE_TIMEOUT_LECTURA`). Los reintentos internos de
+    la librería se apagan: los hace `llamar`.
+  - Reintentos: errores de red, 429 y 5xx, hasta `STRIPE_REINTENTOS` veces con espera
+    exponencial aleatoria ("full jitter") y sin pasar de `STRIPE_TIEMPO_MAX` segundos
+    en total. Las escrituras llevan siempre una llave de idempotencia (se genera si
+    el llamador no la da), así un reintento nunca duplica un cobro o un Customer.
+  - Circuito: tras `STRIPE_CIRCUITO_FALLAS` fallas seguidas de red o 5xx deja de
+    llamar durante `STRIPE_CIRCUITO_PAUSA` segundos y falla de inmediato con
+    `StripeNoDisponible`; después deja pasar una llamada de prueba. Es por proceso.
+  - Métricas: `stripe_request_duration_seconds` y `stripe_requests_total` por
+    operación y resultado.
+
+ `StripeNoDisponible` hereda de `stripe.StripeError`: el código que ya maneja errores
+ de Stripe degrada igual (las vistas responden 503 con un mensaje).
+"""
+
+import random
+import threading
+import time
+import uuid
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from vivienda.metrics import store
+
+
+class StripeNoDisponible(stripe.StripeError):
+    """
+    @class StripeNoDisponible
+    @brief Stripe no respondió (circuito abierto o reintentos agotados).
+    """
+
+
+def _ajuste(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+# ============================
+# Cliente HTTP
+# ============================
+
+def _sesion() -> requests.Session:
+    sesion = requests.Session()
+    tamano = _ajuste("STRIPE_CONEXIONES", 10)
+    sesion.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=tamano, max_retries=0))
+    return sesion
+
+
+class _ClienteHTTP(stripe.RequestsClient):
+    """
+    @brief `RequestsClient` de la librería con una sesión por hilo de tamaño configurado.
+    """
+
+    def _request_internal(self, *args, **kwargs):
+        if getattr(self._thread_local, "session", None) is None:
+            self._thread_local.session = _sesion()
+        return super()._request_internal(*args, **kwargs)
+
+
+def configurar():
+    """
+    @brief Instala el cliente HTTP global de `stripe` (llamar una vez por proceso).
+    """
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.max_network_retries = 0
+    stripe.default_http_client = _ClienteHTTP(
+        timeout=(_ajuste("STRIPE_TIMEOUT_CONEXION", 3), _ajuste("STRIPE_TIMEOUT_LECTURA", 10)),
+    )
+
+
+# ============================
+# Circuito
+# ============================
+
+class Circuito:
+    """
+    @class Circuito
+    @brief Corta las llamadas tras varias fallas seguidas; una llamada de prueba lo cierra.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fallas = 0
+        self._abierto_hasta = 0.0
+        self._probando = False
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self._fallas < _ajuste("STRIPE_CIRCUITO_FALLAS", 5):
+                return True
+            if time.monotonic() < self._abierto_hasta or self._probando:
+                return False
+            self._probando = True  # medio abierto: sólo esta llamada pasa
+            return True
+
+    def exito(self):
+        with self._lock:
+            self._fallas = 0
+            self._probando = False
+
+    def falla(self):
+        with self._lock:
+            self._fallas += 1
+            self._probando = False
+            if self._fallas >= _ajuste("STRIPE_CIRCUITO_FALLAS", 5):
+                if time.monotonic() >= self._abierto_hasta:
+                    store.inc("stripe_circuit_opened_total")
+                self._abierto_hasta = time.monotonic() + _ajuste("STRIPE_CIRCUITO_PAUSA", 30)
+
+    @property
+    def abierto(self) -> bool:
+        with self._lock:
+            return self._fallas >= _ajuste("STRIPE_CIRCUITO_FALLAS", 5) and time.monotonic() < self._abierto_hasta
+
+
+circuito = Circuito()
+
+
+# ============================
+# Llamadas
+# ============================
+
+def _clasificar(error) -> str:
+    """
+    @return 'red' / 'servidor' (cuentan para el circuito y se reintentan), 'limite'
+     (429: se reintenta) o 'cliente' (4xx: error definitivo).
+    """
+    if isinstance(error, stripe.APIConnectionError):
+        return "red"
+    if isinstance(error, stripe.RateLimitError):
+        return "limite"
+    if isinstance(error, stripe.APIError) and (error.http_status or 500) >= 500:
+        return "servidor"
+    return "cliente"
+
+
+def _es_escritura(operacion: str) -> bool:
+    return operacion.rsplit(".", 1)[-1] not in ("list", "retrieve", "search")
+
+
+def llamar(funcion, *args, operacion: str | None = None, **kwargs):
+    """
+    @brief Ejecuta una llamada de la librería `stripe` con reintentos y circuito.
+    @param funcion Método de la librería, p.ej. `stripe.Customer.create`.
+    @param operacion Nombre para métricas y para decidir si es escritura (por defecto
+     el `__qualname__`, p.ej. 'Customer.create').
+    @return Lo que devuelva `funcion`.
+    @throws StripeNoDisponible Si el circuito está abierto o se agotaron los reintentos.
+    @throws stripe.StripeError Errores definitivos (4xx) tal cual.
+    """
+    operacion = operacion or getattr(funcion, "__qualname__", "stripe")
+    if _es_escritura(operacion):
+        kwargs.setdefault("idempotency_key", f"{operacion}-{uuid.uuid4()}")
+    reintentos = _ajuste("STRIPE_REINTENTOS", 2)
+    base = _ajuste("STRIPE_REINTENTO_BASE", 0.25)
+    limite = time.monotonic() + _ajuste("STRIPE_TIEMPO_MAX", 20)
+
+    for intento in range(reintentos + 1):
+        if not circuito.permitir():
+            store.inc("stripe_requests_total", operation=operacion, result="circuit_open")
+            raise StripeNoDisponible("Stripe no disponible (circuito abierto).")
+        inicio = time.perf_counter()
+        try:
+            resultado = funcion(*args, **kwargs)
+        except stripe.StripeError as e:
+            clase = _clasificar(e)
+            store.observe("stripe_request_duration_seconds", time.perf_counter() - inicio,
+                          operation=operacion, result=clase)
+            store.inc("stripe_requests_total", operation=operacion, result=clase)
+            if clase == "cliente":
+                circuito.exito()  # Stripe respondió
+                raise
+            if clase == "limite":
+                circuito.exito()  # responde, sólo pide bajar el ritmo
+            else:
+                circuito.falla()
+            espera = random.uniform(0, base * 2 ** intento)
+            if intento == reintentos or time.monotonic() + espera > limite:
+                raise StripeNoDisponible(f"Stripe no disponible: {e}") from e
+            time.sleep(espera)
+            continue
+        store.observe("stripe_request_duration_seconds", time.perf_counter() - inicio, operation=operacion, result="ok")
+        store.inc("stripe_requests_total", operation=operacion, result="ok")
+        circuito.exito()
+        return resultado
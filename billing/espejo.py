@@ -0,0 +1,486 @@
+"""
+@file espejo.py
+@brief Espejo local del estado de Stripe (clientes, suscripciones y precios).
+@details
+ Ninguna petición de usuario consulta la API de Stripe para saber si alguien está
+ suscrito: `Perfil.has_active_subscription` lee `SuscripcionStripe`. Las tablas sólo
+ se escriben desde:
+  - los webhooks (`billing/procesador.py`), con el `created` del evento;
+  - `reconciliar()`, que recorre las listas de Stripe (`manage.py reconciliar_stripe`
+    y, cada `STRIPE_RECONCILIAR_CADA` segundos, el hilo del procesador en un solo
+    worker) para corregir lo que algún webhook perdido haya dejado atrás: descarga
+    en paralelo con límite de peticiones, escribe con `bulk_create`/`bulk_update` y
+    reporta la deriva encontrada.
+ Cada escritura lleva la fecha de la información y se descarta si la fila ya tiene
+ algo más reciente.
+
+ Los campos `stripe_*` / `is_subscribed` de `Perfil` se siguen llenando desde aquí
+ (resumen de la suscripción principal) para las plantillas y el admin.
+"""
+
+import json
+import queue
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from billing.clientes import Ritmo
+from billing.conexion import llamar
+from billing.models import ClienteStripe, PrecioStripe, SuscripcionStripe
+from cuentas.models import Perfil
+from vivienda.metrics import store
+
+
+def _ts_to_dt(ts):
+    return datetime.fromtimestamp(ts, tz=dt_timezone.utc) if ts else None
+
+
+def _dict(obj) -> dict:
+    """
+    @brief Los objetos de la librería `stripe` a dict plano (los webhooks ya lo son).
+    """
+    return obj if isinstance(obj, dict) else json.loads(str(obj))
+
+
+def _id(valor):
+    return valor.get("id") if isinstance(valor, dict) else valor
+
+
+def _guardar(modelo, stripe_id: str, cuando, valores: dict):
+    """
+    @brief Inserta o actualiza una fila del espejo si `cuando` no es más viejo que lo guardado.
+    @return Tupla `(fila, cambio)`.
+    """
+    with transaction.atomic():
+        fila = modelo.objects.select_for_update().filter(stripe_id=stripe_id).first()
+        if fila is None:
+            try:
+                with transaction.atomic():
+                    return modelo.objects.create(stripe_id=stripe_id, actualizado=cuando, **valores), True
+            except IntegrityError:  # otro proceso la creó primero
+                fila = modelo.objects.select_for_update().get(stripe_id=stripe_id)
+        if fila.actualizado > cuando:
+            return fila, False
+        cambios = {k: v for k, v in valores.items() if getattr(fila, k) != v}
+        fila.actualizado = cuando
+        for campo, valor in cambios.items():
+            setattr(fila, campo, valor)
+        fila.save(update_fields=["actualizado", *cambios])
+        return fila, bool(cambios)
+
+
+# ============================
+# Escritura por objeto
+# ============================
+
+def _valores_clientes(objetos, eliminado=False) -> dict:
+    """
+    @brief Campos de `ClienteStripe` por id de Customer, para un grupo de objetos.
+    @details El usuario sale de `metadata.django_user_id` (lo pone
+     `Perfil.stripe_customer_params`) o de `Perfil.stripe_customer_id`; sólo se asigna
+     si ese usuario existe y no está ligado ya a otro Customer.
+    """
+    objetos = [_dict(o) for o in objetos]
+    ids = [o["id"] for o in objetos]
+    por_perfil = dict(Perfil.objects.filter(stripe_customer_id__in=ids).values_list("stripe_customer_id", "user_id"))
+    candidatos = {}
+    for obj in objetos:
+        usuario_id = (obj.get("metadata") or {}).get("django_user_id") or por_perfil.get(obj["id"])
+        if str(usuario_id or "").isdigit():
+            candidatos[obj["id"]] = int(usuario_id)
+    existentes = set(Perfil.objects.filter(user_id__in=candidatos.values()).values_list("user_id", flat=True))
+    ligados = dict(ClienteStripe.objects.filter(usuario_id__in=candidatos.values()).values_list("usuario_id", "stripe_id"))
+
+    valores = {}
+    for obj in objetos:
+        valores[obj["id"]] = v = {
+            "email": obj.get("email") or "", "eliminado": eliminado or bool(obj.get("deleted")),
+        }
+        usuario_id = candidatos.get(obj["id"])
+        if usuario_id in existentes and ligados.get(usuario_id, obj["id"]) == obj["id"]:
+            v["usuario_id"] = usuario_id
+            ligados[usuario_id] = obj["id"]
+    return valores
+
+
+def guardar_cliente(obj, cuando, eliminado=False):
+    """
+    @brief Refleja un Customer (ver `_valores_clientes` para la asociación al usuario).
+    """
+    obj = _dict(obj)
+    return _guardar(ClienteStripe, obj["id"], cuando, _valores_clientes([obj], eliminado)[obj["id"]])[0]
+
+
+def valores_precio(obj, eliminado=False) -> dict:
+    """
+    @brief Campos de `PrecioStripe` a partir de un objeto Price.
+    """
+    obj = _dict(obj)
+    recurrente = obj.get("recurring") or {}
+    return {
+        "producto": _id(obj.get("product")) or "",
+        "moneda": (obj.get("currency") or "")[:3],
+        "monto": obj.get("unit_amount"),
+        "intervalo": recurrente.get("interval") or "",
+        "intervalo_cuenta": recurrente.get("interval_count") or 1,
+        "activo": bool(obj.get("active", True)) and not eliminado,
+    }
+
+
+def guardar_precio(obj, cuando, eliminado=False):
+    obj = _dict(obj)
+    return _guardar(PrecioStripe, obj["id"], cuando, valores_precio(obj, eliminado))[0]
+
+
+def _fin_de_periodo(sub: dict):
+    """
+    @brief `current_period_end`; las versiones recientes de la API lo llevan por item.
+    """
+    fin = sub.get("current_period_end")
+    if fin is None:
+        items = (sub.get("items") or {}).get("data") or []
+        fin = max((i["current_period_end"] for i in items if i.get("current_period_end")), default=None)
+    return _ts_to_dt(fin)
+
+
+def valores_suscripcion(obj) -> dict:
+    """
+    @brief Campos de `SuscripcionStripe` a partir de un objeto Subscription.
+    """
+    obj = _dict(obj)
+    items = (obj.get("items") or {}).get("data") or []
+    fin = _fin_de_periodo(obj)
+    if obj.get("ended_at"):  # terminada antes del fin del periodo: no hay gracia
+        fin = min(filter(None, (fin, _ts_to_dt(obj["ended_at"]))))
+    return {
+        "cliente": _id(obj.get("customer")) or "",
+        "precio": _id((items[0].get("price") if items else None)) or "",
+        "estado": obj.get("status") or "",
+        "fin_periodo": fin,
+        "cancelar_al_final": bool(obj.get("cancel_at_period_end")),
+    }
+
+
+def guardar_suscripcion(obj, cuando):
+    obj = _dict(obj)
+    fila, cambio = _guardar(SuscripcionStripe, obj["id"], cuando, valores_suscripcion(obj))
+    if cambio:
+        reflejar_en_perfil(fila.cliente)
+    return fila
+
+
+def guardar_pago(subscription_id: str, cliente: str, fin_periodo, cuando):
+    """
+    @brief Una factura pagada: la suscripción queda activa hasta el fin del periodo cobrado.
+    """
+    fila = SuscripcionStripe.objects.filter(stripe_id=subscription_id).first()
+    valores = {"cliente": cliente or (fila.cliente if fila else ""), "estado": "active"}
+    if fin_periodo:
+        valores["fin_periodo"] = fin_periodo
+    if fila is not None:
+        valores.update(precio=fila.precio, cancelar_al_final=fila.cancelar_al_final)
+        valores.setdefault("fin_periodo", fila.fin_periodo)
+    fila, cambio = _guardar(SuscripcionStripe, subscription_id, cuando, valores)
+    if cambio:
+        reflejar_en_perfil(fila.cliente)
+    return fila
+
+
+# ============================
+# Lectura
+# ============================
+
+def _principal(suscripciones, ahora):
+    minimo = datetime.min.replace(tzinfo=dt_timezone.utc)
+    return max(
+        suscripciones,
+        key=lambda s: (s.activa(ahora), s.fin_periodo or minimo, s.actualizado),
+        default=None,
+    )
+
+
+def suscripcion_principal(cliente: str, ahora=None):
+    """
+    @brief La suscripción que representa al cliente: la activa que vence más tarde o,
+     si ninguna lo está, la más reciente.
+    """
+    if not cliente:
+        return None
+    return _principal(SuscripcionStripe.objects.filter(cliente=cliente), ahora or timezone.now())
+
+
+#: Campos de `Perfil` que resumen la suscripción principal
+CAMPOS_RESUMEN = [
+    "stripe_subscription_id", "stripe_status", "stripe_price_id", "stripe_current_period_end",
+    "stripe_provisional_hasta", "is_subscribed",
+]
+
+
+def _resumir(perfil, suscripciones, ahora) -> bool:
+    """
+    @brief Pone en `perfil` el resumen de sus suscripciones (sin guardar).
+    @return True si algún campo cambió.
+    """
+    sub = _principal(suscripciones, ahora)
+    if sub is None:
+        return False
+    antes = [getattr(perfil, c) for c in CAMPOS_RESUMEN]
+    perfil.stripe_subscription_id = sub.stripe_id
+    perfil.stripe_status = sub.estado if sub.estado in dict(Perfil.STRIPE_STATUS_CHOICES) else None
+    perfil.stripe_price_id = sub.precio or None
+    perfil.stripe_current_period_end = sub.fin_periodo
+    if sub.estado != "incomplete":
+        perfil.stripe_provisional_hasta = None
+    perfil.is_subscribed = suscripcion_activa(perfil, ahora, suscripciones)
+    return antes != [getattr(perfil, c) for c in CAMPOS_RESUMEN]
+
+
+def reflejar_en_perfil(cliente: str):
+    """
+    @brief Copia el resumen de la suscripción principal a los campos `stripe_*` del Perfil.
+    @details Con un estado definitivo (cualquiera salvo 'incomplete') termina la
+     activación provisional de la página de éxito.
+    """
+    perfil = Perfil.objects.filter(stripe_customer_id=cliente).first() if cliente else None
+    if perfil is not None and _resumir(perfil, list(SuscripcionStripe.objects.filter(cliente=cliente)), timezone.now()):
+        perfil.save(update_fields=CAMPOS_RESUMEN)
+
+
+def suscripcion_activa(perfil, ahora=None, suscripciones=None) -> bool:
+    """
+    @brief Respuesta de `Perfil.has_active_subscription` (sólo base de datos local).
+    @param suscripciones Las `SuscripcionStripe` del cliente, si ya se tienen.
+    """
+    ahora = ahora or timezone.now()
+    if perfil.stripe_provisional_hasta and perfil.stripe_provisional_hasta > ahora:
+        return True
+    if not perfil.stripe_customer_id:
+        return False
+    if suscripciones is None:
+        suscripciones = SuscripcionStripe.objects.filter(cliente=perfil.stripe_customer_id)
+    return any(s.activa(ahora) for s in suscripciones)
+
+
+# ============================
+# Reconciliación
+# ============================
+
+#: `Subscription.list` se parte por estado: cada estado es una cadena de páginas
+#: independiente y se descargan en paralelo
+ESTADOS_SUSCRIPCION = (
+    "active", "trialing", "past_due", "unpaid", "canceled", "incomplete", "incomplete_expired", "paused",
+)
+
+
+class Deriva:
+    """
+    @class Deriva
+    @brief Diferencias entre el espejo y Stripe encontradas por `reconciliar`.
+    """
+
+    def __init__(self, detalle_max: int = 200):
+        self.leidos = Counter()       #: objetos leídos por tipo
+        self.nuevos = Counter()       #: filas que no existían
+        self.cambios = Counter()      #: (tipo, campo) -> filas con ese campo distinto
+        self.omitidos = Counter()     #: filas con datos más recientes que la corrida
+        self.perfiles = 0             #: perfiles cuyo resumen cambió
+        self.huerfanos = []           #: perfiles con stripe_subscription_id que Stripe no devolvió
+        self.detalle = []             #: (tipo, stripe_id, campo, local, stripe), hasta `detalle_max`
+        self._detalle_max = detalle_max
+
+    def cambio(self, tipo, stripe_id, campo, local, remoto):
+        self.cambios[(tipo, campo)] += 1
+        store.inc("stripe_reconcile_drift_total", object=tipo, field=campo)
+        if len(self.detalle) < self._detalle_max:
+            self.detalle.append((tipo, stripe_id, campo, local, remoto))
+
+    @property
+    def total(self) -> int:
+        return sum(self.nuevos.values()) + sum(self.cambios.values())
+
+
+def _paginas(recurso, ritmo: Ritmo, **filtros):
+    """
+    @brief Recorre una lista de Stripe página por página (cursor `starting_after`).
+    """
+    cursor = None
+    while True:
+        ritmo.esperar()
+        pagina = llamar(recurso.list, operacion=f"{getattr(recurso, 'OBJECT_NAME', 'stripe')}.list",
+                        limit=100, **filtros, **({"starting_after": cursor} if cursor else {}))
+        datos = list(pagina["data"])
+        if datos:
+            yield datos
+        if not pagina.get("has_more") or not datos:
+            return
+        cursor = datos[-1]["id"]
+
+
+def _descargar(tareas, hilos: int, por_segundo: float):
+    """
+    @brief Descarga en paralelo varias listas y entrega `(tipo, página)` conforme llegan.
+    @details Los hilos sólo hacen peticiones; la base de datos se escribe en el hilo
+     que consume. La cola acotada frena la descarga si la escritura va más lenta.
+    """
+    ritmo = Ritmo(por_segundo)
+    cola = queue.Queue(maxsize=hilos * 2)
+    parar = threading.Event()
+    fin = object()
+
+    def poner(elemento):
+        while not parar.is_set():
+            try:
+                return cola.put(elemento, timeout=0.5)
+            except queue.Full:
+                continue
+
+    def trabajar(tipo, recurso, filtros):
+        try:
+            for pagina in _paginas(recurso, ritmo, **filtros):
+                if parar.is_set():
+                    break
+                poner((tipo, pagina))
+        except Exception as e:
+            poner((fin, e))
+        else:
+            poner((fin, None))
+
+    error = None
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="reconciliar-stripe") as pool:
+        for tarea in tareas:
+            pool.submit(trabajar, *tarea)
+        try:
+            restantes = len(tareas)
+            while restantes:
+                tipo, dato = cola.get()
+                if tipo is fin:
+                    restantes -= 1
+                    error = error or dato
+                    continue
+                yield tipo, dato
+        finally:
+            parar.set()
+    if error is not None:
+        raise error
+
+
+def _aplicar(modelo, tipo, valores: dict, cuando, deriva: Deriva, escribir: bool) -> list:
+    """
+    @brief Aplica una página al espejo: `bulk_create` de las nuevas y `bulk_update`
+     de las que cambiaron; las filas con datos más nuevos que `cuando` no se tocan.
+    @param valores Dict `stripe_id -> campos`.
+    @return Filas nuevas o cambiadas.
+    """
+    with transaction.atomic():
+        existentes = {f.stripe_id: f for f in modelo.objects.select_for_update().filter(stripe_id__in=list(valores))}
+        nuevas, cambiadas, vigentes, campos = [], [], [], set()
+        for stripe_id, campos_fila in valores.items():
+            fila = existentes.get(stripe_id)
+            if fila is None:
+                nuevas.append(modelo(stripe_id=stripe_id, actualizado=cuando, **campos_fila))
+                deriva.nuevos[tipo] += 1
+                continue
+            if fila.actualizado > cuando:
+                deriva.omitidos[tipo] += 1
+                continue
+            vigentes.append(fila.pk)
+            distintos = {k: v for k, v in campos_fila.items() if getattr(fila, k) != v}
+            for campo, valor in distintos.items():
+                deriva.cambio(tipo, stripe_id, campo, getattr(fila, campo), valor)
+                setattr(fila, campo, valor)
+            if distintos:
+                fila.actualizado = cuando
+                cambiadas.append(fila)
+                campos.update(distintos)
+        if escribir:
+            modelo.objects.bulk_create(nuevas, ignore_conflicts=True)
+            if cambiadas:
+                modelo.objects.bulk_update(cambiadas, ["actualizado", *sorted(campos)])
+            # Las que coinciden quedan confirmadas a la hora de la corrida
+            modelo.objects.filter(pk__in=vigentes).update(actualizado=cuando)
+    return nuevas + cambiadas
+
+
+def _reflejar_en_perfiles(clientes, ahora) -> int:
+    """
+    @brief `reflejar_en_perfil` para muchos clientes: una lectura y un `bulk_update` por bloque.
+    """
+    clientes = sorted(clientes)
+    cambiados = 0
+    for i in range(0, len(clientes), 500):
+        bloque = clientes[i:i + 500]
+        por_cliente = defaultdict(list)
+        for sub in SuscripcionStripe.objects.filter(cliente__in=bloque):
+            por_cliente[sub.cliente].append(sub)
+        perfiles = [
+            p for p in Perfil.objects.filter(stripe_customer_id__in=bloque)
+            if _resumir(p, por_cliente[p.stripe_customer_id], ahora)
+        ]
+        Perfil.objects.bulk_update(perfiles, CAMPOS_RESUMEN)
+        cambiados += len(perfiles)
+    return cambiados
+
+
+def reconciliar(hilos: int | None = None, por_segundo: float | None = None, escribir: bool = True) -> Deriva:
+    """
+    @brief Compara precios, clientes y suscripciones de Stripe con el espejo y lo corrige.
+    @details
+     - Una petición por cada 100 objetos (listas paginadas), con las listas
+       (precios, clientes y suscripciones por estado) descargadas en paralelo por
+       `hilos` y a lo más `por_segundo` peticiones por segundo.
+     - `cuando` es la hora de inicio: lo que Stripe devuelva es al menos así de
+       reciente, y los webhooks posteriores a esa hora no se pisan.
+     - Al final se recalcula el resumen de los Perfiles de los clientes que cambiaron.
+    @param escribir False para sólo reportar la deriva.
+    @return `Deriva` con lo encontrado.
+    """
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    hilos = hilos or getattr(settings, "STRIPE_RECONCILIAR_HILOS", 4)
+    por_segundo = por_segundo or getattr(settings, "STRIPE_RECONCILIAR_POR_SEGUNDO", 20)
+    cuando = timezone.now()
+    deriva = Deriva()
+    tareas = [("precio", stripe.Price, {}), ("cliente", stripe.Customer, {})]
+    tareas += [("suscripcion", stripe.Subscription, {"status": e}) for e in ESTADOS_SUSCRIPCION]
+
+    vistas, afectados = set(), set()
+    for tipo, pagina in _descargar(tareas, hilos, por_segundo):
+        pagina = [_dict(o) for o in pagina]
+        deriva.leidos[tipo] += len(pagina)
+        if tipo == "precio":
+            _aplicar(PrecioStripe, tipo, {o["id"]: valores_precio(o) for o in pagina}, cuando, deriva, escribir)
+        elif tipo == "cliente":
+            _aplicar(ClienteStripe, tipo, _valores_clientes(pagina), cuando, deriva, escribir)
+        else:
+            vistas.update(o["id"] for o in pagina)
+            filas = _aplicar(SuscripcionStripe, tipo, {o["id"]: valores_suscripcion(o) for o in pagina},
+                             cuando, deriva, escribir)
+            afectados.update(f.cliente for f in filas)
+
+    deriva.huerfanos = [
+        (user_id, sub_id) for user_id, sub_id in
+        Perfil.objects.filter(stripe_subscription_id__isnull=False).values_list("user_id", "stripe_subscription_id")
+        if sub_id not in vistas
+    ]
+    if escribir:
+        deriva.perfiles = _reflejar_en_perfiles(afectados - {""}, timezone.now())
+    return deriva
+
+
+def reconciliar_si_toca():
+    """
+    @brief Reconciliación periódica desde el hilo del procesador: un solo worker por
+     intervalo (`cache.add` en el nivel compartido).
+    """
+    cada = getattr(settings, "STRIPE_RECONCILIAR_CADA", None)
+    if not cada or not settings.STRIPE_SECRET_KEY:
+        return None
+    if not cache.add("stripe:reconciliar", 1, cada):
+        return None
+    return reconciliar()
@@ -0,0 +1,37 @@
+"""
+@file crear_clientes_stripe.py
+@brief Comando `crear_clientes_stripe`: crea el Customer de los usuarios que no lo tienen.
+@details
+ El registro ya no llama a Stripe; el Customer se crea en el primer Checkout. Este
+ comando lo adelanta para los usuarios existentes (p.ej. tras una importación), en
+ paralelo y bajo un límite de peticiones por segundo (ver billing/clientes.py).
+
+ Ejemplo:
+  python manage.py crear_clientes_stripe
+  python manage.py crear_clientes_stripe --hilos 4 --por-segundo 10 --limite 1000
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from billing import clientes
+
+
+class Command(BaseCommand):
+    help = "Crea en Stripe los Customers que faltan, en paralelo y con límite de peticiones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, default=8, help="Peticiones simultáneas (default 8).")
+        parser.add_argument("--por-segundo", type=float, default=20, help="Máximo de peticiones por segundo (default 20).")
+        parser.add_argument("--limite", type=int, help="Procesa como máximo este número de perfiles.")
+
+    def handle(self, *args, **opts):
+        if not settings.STRIPE_SECRET_KEY:
+            raise CommandError("STRIPE_SECRET_KEY no configurado.")
+        if opts["hilos"] < 1:
+            raise CommandError("--hilos debe ser al menos 1.")
+        perfiles = clientes.pendientes()
+        if opts["limite"]:
+            perfiles = perfiles[:opts["limite"]]
+        conteo = clientes.crear_faltantes(perfiles, hilos=opts["hilos"], por_segundo=opts["por_segundo"])
+        self.stdout.write(self.style.SUCCESS(f"Creados: {conteo['creados']}, errores: {conteo['errores']}"))
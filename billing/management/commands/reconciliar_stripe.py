@@ -0,0 +1,61 @@
+"""
+@file reconciliar_stripe.py
+@brief Comando `reconciliar_stripe`: actualiza el espejo local con las listas de Stripe.
+@details
+ Descarga precios, clientes y suscripciones (una petición por cada 100, varias listas
+ en paralelo y con límite de peticiones por segundo), corrige las filas de
+ `billing.models` que algún webhook perdido haya dejado atrás y recalcula el resumen
+ de los Perfiles afectados. Los datos más recientes que el inicio de la corrida no se
+ tocan. El hilo del procesador de webhooks lo hace solo cada `STRIPE_RECONCILIAR_CADA`
+ segundos.
+
+ Ejemplo:
+  python manage.py reconciliar_stripe
+  python manage.py reconciliar_stripe --solo-reportar --detalle
+  python manage.py reconciliar_stripe --hilos 8 --por-segundo 50
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from billing import espejo
+
+
+class Command(BaseCommand):
+    help = "Sincroniza el espejo local (clientes, suscripciones, precios) con Stripe y reporta la deriva."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, help="Listas descargadas a la vez (default STRIPE_RECONCILIAR_HILOS).")
+        parser.add_argument("--por-segundo", type=float,
+                            help="Máximo de peticiones por segundo (default STRIPE_RECONCILIAR_POR_SEGUNDO).")
+        parser.add_argument("--solo-reportar", action="store_true", help="No escribe; sólo muestra las diferencias.")
+        parser.add_argument("--detalle", action="store_true", help="Lista cada campo distinto (hasta 200).")
+
+    def handle(self, *args, **opts):
+        if not settings.STRIPE_SECRET_KEY:
+            raise CommandError("STRIPE_SECRET_KEY no configurado.")
+        if opts["hilos"] is not None and opts["hilos"] < 1:
+            raise CommandError("--hilos debe ser al menos 1.")
+        deriva = espejo.reconciliar(opts["hilos"], opts["por_segundo"], escribir=not opts["solo_reportar"])
+
+        leidos = ", ".join(f"{n} {tipo}" for tipo, n in sorted(deriva.leidos.items()))
+        self.stdout.write(f"Leídos: {leidos or 'nada'}")
+        for tipo, n in sorted(deriva.nuevos.items()):
+            self.stdout.write(f"  {tipo}: {n} nuevos")
+        for (tipo, campo), n in sorted(deriva.cambios.items()):
+            self.stdout.write(f"  {tipo}.{campo}: {n} distintos")
+        for tipo, n in sorted(deriva.omitidos.items()):
+            self.stdout.write(f"  {tipo}: {n} omitidos (el espejo ya tenía datos más recientes)")
+        if deriva.huerfanos:
+            self.stdout.write(self.style.WARNING(
+                f"  {len(deriva.huerfanos)} perfiles con una suscripción que Stripe no devolvió: "
+                + ", ".join(f"usuario {u} ({s})" for u, s in deriva.huerfanos[:20])
+            ))
+        if opts["detalle"]:
+            for tipo, stripe_id, campo, local, remoto in deriva.detalle:
+                self.stdout.write(f"    {tipo} {stripe_id} {campo}: {local!r} -> {remoto!r}")
+
+        accion = "encontradas" if opts["solo_reportar"] else "corregidas"
+        self.stdout.write(self.style.SUCCESS(
+            f"Diferencias {accion}: {deriva.total}; perfiles actualizados: {deriva.perfiles}"
+        ))
@@ -0,0 +1,82 @@
+"""
+@file reprocesar_eventos_stripe.py
+@brief Comando `reprocesar_eventos_stripe`: vacía o rearma la cola de webhooks de Stripe.
+@details
+ Sin opciones procesa lo que esté pendiente (útil en cron o tras un despliegue, si
+ ningún webhook nuevo despertó al procesador). Con filtros, vuelve a encolar eventos
+ ya recibidos antes de procesar; con `--descargar` además pide a Stripe los eventos de
+ `--desde` en adelante (Stripe los guarda 30 días) y agrega los que no llegaron.
+
+ Ejemplo:
+  python manage.py reprocesar_eventos_stripe
+  python manage.py reprocesar_eventos_stripe --fallidos
+  python manage.py reprocesar_eventos_stripe --evento evt_123 --evento evt_456
+  python manage.py reprocesar_eventos_stripe --desde 2025-01-31 --tipo invoice.payment_succeeded
+  python manage.py reprocesar_eventos_stripe --descargar --desde 2025-01-31
+"""
+
+import json
+from datetime import datetime, time, timezone as dt_timezone
+
+import stripe
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.conexion import llamar
+from billing.models import EventoStripe
+from billing.procesador import MANEJADORES, procesar_pendientes, registrar, reprogramar
+
+
+def _fecha(valor: str) -> datetime:
+    try:
+        return datetime.combine(datetime.strptime(valor, "%Y-%m-%d").date(), time.min, tzinfo=dt_timezone.utc)
+    except ValueError as e:
+        raise CommandError(f"Fecha inválida (AAAA-MM-DD): {valor}") from e
+
+
+class Command(BaseCommand):
+    help = "Procesa los webhooks de Stripe pendientes; opcionalmente reencola o descarga eventos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--evento", action="append", default=[], help="ID de evento a reprocesar (repetible).")
+        parser.add_argument("--fallidos", action="store_true", help="Reencola los eventos que agotaron sus intentos.")
+        parser.add_argument("--desde", help="Reencola los eventos creados desde esta fecha (AAAA-MM-DD).")
+        parser.add_argument("--tipo", action="append", default=[], help="Limita --desde/--descargar a este tipo (repetible).")
+        parser.add_argument("--descargar", action="store_true",
+                            help="Descarga de Stripe los eventos desde --desde y agrega los que falten.")
+
+    def handle(self, *args, **opts):
+        desde = _fecha(opts["desde"]) if opts["desde"] else None
+        if opts["descargar"]:
+            if desde is None:
+                raise CommandError("--descargar requiere --desde.")
+            self._descargar(desde, opts["tipo"])
+
+        filtros = []
+        if opts["evento"]:
+            filtros.append(EventoStripe.objects.filter(stripe_id__in=opts["evento"]))
+        if opts["fallidos"]:
+            filtros.append(EventoStripe.objects.filter(estado=EventoStripe.FALLIDO))
+        if desde is not None and not opts["descargar"]:
+            eventos = EventoStripe.objects.filter(creado__gte=desde)
+            if opts["tipo"]:
+                eventos = eventos.filter(tipo__in=opts["tipo"])
+            filtros.append(eventos)
+        for eventos in filtros:
+            self.stdout.write(f"Reencolados: {reprogramar(eventos)}")
+
+        total = 0
+        while (n := procesar_pendientes()):
+            total += n
+        fallidos = EventoStripe.objects.filter(estado__in=[EventoStripe.ERROR, EventoStripe.FALLIDO]).count()
+        self.stdout.write(self.style.SUCCESS(f"Procesados: {total}; con error o fallidos: {fallidos}"))
+
+    def _descargar(self, desde: datetime, tipos: list[str]):
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        params = {"created": {"gte": int(desde.timestamp())}, "limit": 100}
+        params["types"] = tipos or list(MANEJADORES)
+        nuevos = vistos = 0
+        for evento in llamar(stripe.Event.list, **params).auto_paging_iter():
+            vistos += 1
+            nuevos += registrar(json.loads(str(evento)))[1]
+        self.stdout.write(f"Descargados: {vistos}; nuevos: {nuevos}")
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoStripe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_id', models.CharField(max_length=255, unique=True)),
+                ('tipo', models.CharField(max_length=100)),
+                ('cliente', models.CharField(blank=True, default='', max_length=255)),
+                ('payload', models.JSONField()),
+                ('creado', models.DateTimeField()),
+                ('recibido', models.DateTimeField(default=django.utils.timezone.now)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('procesado', 'Procesado'), ('error', 'Error (se reintentará)'), ('fallido', 'Fallido')], default='pendiente', max_length=12)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('disponible', models.DateTimeField(default=django.utils.timezone.now)),
+                ('procesado', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ('creado', 'id'),
+                'indexes': [models.Index(fields=['estado', 'disponible'], name='billing_eve_estado_58ff21_idx'), models.Index(fields=['cliente', 'creado'], name='billing_eve_cliente_3710c2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecioStripe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_id', models.CharField(max_length=255, unique=True)),
+                ('actualizado', models.DateTimeField()),
+                ('producto', models.CharField(blank=True, max_length=255)),
+                ('moneda', models.CharField(blank=True, max_length=3)),
+                ('monto', models.PositiveIntegerField(blank=True, null=True)),
+                ('intervalo', models.CharField(blank=True, max_length=10)),
+                ('intervalo_cuenta', models.PositiveSmallIntegerField(default=1)),
+                ('activo', models.BooleanField(default=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='SuscripcionStripe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_id', models.CharField(max_length=255, unique=True)),
+                ('actualizado', models.DateTimeField()),
+                ('cliente', models.CharField(db_index=True, max_length=255)),
+                ('precio', models.CharField(blank=True, max_length=255)),
+                ('estado', models.CharField(max_length=32)),
+                ('fin_periodo', models.DateTimeField(blank=True, null=True)),
+                ('cancelar_al_final', models.BooleanField(default=False)),
+            ],
+            options={
+                'ordering': ('-fin_periodo',),
+            },
+        ),
+        migrations.CreateModel(
+            name='ClienteStripe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_id', models.CharField(max_length=255, unique=True)),
+                ('actualizado', models.DateTimeField()),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('eliminado', models.BooleanField(default=False)),
+                ('usuario', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cliente_stripe', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='SesionCheckout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_id', models.CharField(max_length=255, unique=True)),
+                ('plan', models.CharField(blank=True, max_length=20)),
+                ('creada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('completada', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sesiones_checkout', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0002_espejo_stripe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sesioncheckout',
+            name='provisional_usada',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,3 +1,166 @@
+"""
+@file models.py
+@brief Modelos de la aplicación `billing`.
+@details
+ Contiene:
+  - `EventoStripe`: bitácora de los webhooks de Stripe. El id del evento es único,
+    así un reintento de Stripe no se procesa dos veces; `billing/procesador.py`
+    consume los pendientes en orden por cliente.
+  - Espejo local de Stripe (`ClienteStripe`, `SuscripcionStripe`, `PrecioStripe`):
+    lo escriben sólo los webhooks y el reconciliador (`billing/espejo.py`); las
+    peticiones de usuarios lo leen en lugar de llamar a la API.
+  - `SesionCheckout`: sesiones de Checkout creadas por la app, para validar la página
+    de éxito sin consultar a Stripe.
+"""
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+
+class EventoStripe(models.Model):
+    """
+    @class EventoStripe
+    @brief Un evento de webhook recibido de Stripe y su estado de procesamiento.
+    @details
+     `disponible` es cuándo puede tomarse: al tomarlo se mueve al futuro (un
+     arrendamiento, por si el proceso muere a la mitad) y tras un error se aplaza con
+     espera exponencial. Después de `STRIPE_EVENTOS_MAX_INTENTOS` queda `fallido`
+     hasta que se reprocese a mano (`manage.py reprocesar_eventos_stripe`).
+    """
+    PENDIENTE = "pendiente"
+    PROCESANDO = "procesando"
+    PROCESADO = "procesado"
+    ERROR = "error"
+    FALLIDO = "fallido"
+    ESTADOS = [
+        (PENDIENTE, "Pendiente"),
+        (PROCESANDO, "Procesando"),
+        (PROCESADO, "Procesado"),
+        (ERROR, "Error (se reintentará)"),
+        (FALLIDO, "Fallido"),
+    ]
+
+    #: ID del evento en Stripe (p.ej. 'evt_ABC123')
+    stripe_id = models.CharField(max_length=255, unique=True)
+    tipo = models.CharField(max_length=100)
+    #: Customer al que pertenece el objeto del evento ('' si no aplica); define el orden
+    cliente = models.CharField(max_length=255, blank=True, default="")
+    payload = models.JSONField()
+    #: `created` del evento en Stripe
+    creado = models.DateTimeField()
+    recibido = models.DateTimeField(default=timezone.now)
+
+    estado = models.CharField(max_length=12, choices=ESTADOS, default=PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    disponible = models.DateTimeField(default=timezone.now)
+    procesado = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ("creado", "id")
+        indexes = [
+            models.Index(fields=["estado", "disponible"]),
+            models.Index(fields=["cliente", "creado"]),
+        ]
+
+    def __str__(self):
+        return f"{self.stripe_id} · {self.tipo} · {self.estado}"
+
+
+class _Espejo(models.Model):
+    """
+    @brief Base de las tablas espejo: id de Stripe y fecha de la información.
+    @details `actualizado` es el `created` del evento (o la hora de la consulta del
+     reconciliador) del que salió la fila; una actualización más vieja se descarta,
+     así un webhook que llega tarde no pisa datos más recientes.
+    """
+    stripe_id = models.CharField(max_length=255, unique=True)
+    actualizado = models.DateTimeField()
+
+    class Meta:
+        abstract = True
+
+
+class ClienteStripe(_Espejo):
+    """
+    @class ClienteStripe
+    @brief Customer de Stripe y el usuario al que pertenece (si se conoce).
+    """
+    usuario = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="cliente_stripe",
+    )
+    email = models.EmailField(blank=True)
+    eliminado = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.stripe_id} · {self.email}"
+
+
+class PrecioStripe(_Espejo):
+    """
+    @class PrecioStripe
+    @brief Price de Stripe (monto en centavos).
+    """
+    producto = models.CharField(max_length=255, blank=True)
+    moneda = models.CharField(max_length=3, blank=True)
+    monto = models.PositiveIntegerField(null=True, blank=True)
+    intervalo = models.CharField(max_length=10, blank=True)
+    intervalo_cuenta = models.PositiveSmallIntegerField(default=1)
+    activo = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.stripe_id} · {self.monto} {self.moneda}/{self.intervalo}"
+
+
+class SuscripcionStripe(_Espejo):
+    """
+    @class SuscripcionStripe
+    @brief Subscription de Stripe.
+    @details `cliente` y `precio` guardan los ids de Stripe (no llaves foráneas): los
+     webhooks pueden llegar en cualquier orden y la suscripción a veces llega antes
+     que su Customer o su Price.
+    """
+    cliente = models.CharField(max_length=255, db_index=True)
+    precio = models.CharField(max_length=255, blank=True)
+    estado = models.CharField(max_length=32)
+    fin_periodo = models.DateTimeField(null=True, blank=True)
+    cancelar_al_final = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ("-fin_periodo",)
+
+    def __str__(self):
+        return f"{self.stripe_id} · {self.cliente} · {self.estado}"
+
+    def activa(self, ahora=None) -> bool:
+        """
+        @brief Indica si la suscripción se considera activa a nivel de negocio.
+        @details
+         - 'trialing' y 'active' son activas mientras el periodo no haya vencido (o no
+           se conozca).
+         - Cualquier otro estado ('past_due', 'canceled', 'unpaid', ...) conserva el
+           acceso hasta el fin del periodo ya pagado (gracia).
+        """
+        ahora = ahora or timezone.now()
+        if self.estado in ("trialing", "active"):
+            return self.fin_periodo is None or self.fin_periodo > ahora
+        return bool(self.fin_periodo and self.fin_periodo > ahora)
+
+
+class SesionCheckout(models.Model):
+    """
+    @class SesionCheckout
+    @brief Sesión de Checkout creada por `create_checkout_session`.
+    """
+    stripe_id = models.CharField(max_length=255, unique=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="sesiones_checkout")
+    plan = models.CharField(max_length=20, blank=True)
+    creada = models.DateTimeField(default=timezone.now)
+    #: Cuándo llegó `checkout.session.completed`
+    completada = models.DateTimeField(null=True, blank=True)
+    #: Ya concedió el acceso provisional de la página de éxito (sólo una vez por sesión)
+    provisional_usada = models.BooleanField(default=False)
 
-# Create your models here.
+    def __str__(self):
+        return f"{self.stripe_id} · {self.usuario_id}"
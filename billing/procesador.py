@@ -0,0 +1,299 @@
+"""
+@file procesador.py
+@brief Procesamiento diferido y ordenado de los webhooks de Stripe.
+@details
+ El webhook (`billing.views.stripe_webhook`) sólo verifica la firma, guarda el evento
+ en `EventoStripe` (el id es único: los reintentos de Stripe se descartan) y responde
+ 200 de inmediato. Después:
+  - `procesar_pendientes` toma los eventos listos en orden de `created` y los aplica
+    al espejo local (`billing/espejo.py`) con los datos del propio evento, sin
+    consultar la API de Stripe.
+  - Orden por cliente: mientras un evento de un Customer esté en proceso o esperando
+    reintento, los siguientes de ese Customer no se tocan. Tomar un evento es un
+    `UPDATE` condicionado, así dos procesos nunca aplican el mismo.
+  - Errores: se reintentan con espera exponencial (`STRIPE_EVENTOS_ESPERA_BASE`)
+    hasta `STRIPE_EVENTOS_MAX_INTENTOS`; luego quedan `fallido`.
+  - `procesador`: un hilo por proceso que despierta con cada webhook y además cada
+    `STRIPE_EVENTOS_INTERVALO` segundos (reintentos). `manage.py reprocesar_eventos_stripe`
+    hace lo mismo a mano o desde cron, y permite reprocesar o descargar eventos.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from billing import espejo
+from billing.models import EventoStripe, SesionCheckout
+from cuentas.models import Perfil
+from vivienda.metrics import store
+
+logger = logging.getLogger(__name__)
+
+
+def _ts_to_dt(ts: int):
+    """Convierte timestamp (segundos) a datetime con tz UTC."""
+    return datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+
+
+def cliente_de(evento: dict) -> str:
+    """
+    @brief Customer dueño del objeto del evento ('' si no tiene).
+    """
+    obj = (evento.get("data") or {}).get("object") or {}
+    if obj.get("object") == "customer":
+        return obj.get("id") or ""
+    cliente = obj.get("customer")
+    if isinstance(cliente, dict):  # expandido
+        cliente = cliente.get("id")
+    return cliente or ""
+
+
+def registrar(evento: dict):
+    """
+    @brief Guarda un evento de Stripe si no se había recibido.
+    @param evento Evento completo (dict del JSON de Stripe).
+    @return Tupla `(EventoStripe, nuevo)`.
+    """
+    registro, nuevo = EventoStripe.objects.get_or_create(
+        stripe_id=evento["id"],
+        defaults={
+            "tipo": evento.get("type", ""),
+            "cliente": cliente_de(evento),
+            "payload": evento,
+            "creado": _ts_to_dt(evento.get("created") or timezone.now().timestamp()),
+        },
+    )
+    store.inc("stripe_webhooks_total", type=registro.tipo, result="new" if nuevo else "duplicate")
+    return registro, nuevo
+
+
+# ============================
+# Aplicar eventos al Perfil
+# ============================
+
+def _suscripcion_de_factura(invoice_obj: dict):
+    sub = invoice_obj.get("subscription")
+    if not sub:
+        detalles = ((invoice_obj.get("parent") or {}).get("subscription_details") or {})
+        sub = detalles.get("subscription")
+    return sub.get("id") if isinstance(sub, dict) else sub
+
+
+def _activate_profile_from_session(session_obj: dict, cuando):
+    """
+    Checkout terminado: liga el Customer al usuario. El estado y el periodo llegan
+    en los eventos `customer.subscription.*` / `invoice.*` de la misma compra.
+    """
+    SesionCheckout.objects.filter(stripe_id=session_obj.get("id"), completada__isnull=True).update(completada=cuando)
+    meta = session_obj.get("metadata") or {}
+    user_id = meta.get("user_id")
+    customer_id = session_obj.get("customer")
+    if not user_id or not customer_id:
+        return
+
+    perfil = Perfil.objects.filter(user_id=user_id).first()
+    if perfil is None:
+        return
+    perfil.stripe_customer_id = customer_id
+    perfil.trial_ended = True  # si manejas trial interno
+    perfil.save()
+    espejo.guardar_cliente({"id": customer_id, "metadata": {"django_user_id": user_id}}, cuando)
+    espejo.reflejar_en_perfil(customer_id)
+
+
+def _update_period_from_invoice(invoice_obj: dict, cuando):
+    """
+    Para renovaciones: la suscripción sigue activa hasta el fin del periodo cobrado.
+    """
+    subscription_id = _suscripcion_de_factura(invoice_obj)
+    if not subscription_id:
+        return
+    lineas = (invoice_obj.get("lines") or {}).get("data") or []
+    fin = max(((l.get("period") or {}).get("end") or 0 for l in lineas), default=0)
+    espejo.guardar_pago(subscription_id, invoice_obj.get("customer"), _ts_to_dt(fin) if fin else None, cuando)
+
+
+def _sync_from_subscription(sub_obj: dict, cuando):
+    espejo.guardar_suscripcion(sub_obj, cuando)
+
+
+def _sync_customer(obj: dict, cuando):
+    espejo.guardar_cliente(obj, cuando)
+
+
+def _delete_customer(obj: dict, cuando):
+    espejo.guardar_cliente(obj, cuando, eliminado=True)
+
+
+def _sync_price(obj: dict, cuando):
+    espejo.guardar_precio(obj, cuando)
+
+
+def _delete_price(obj: dict, cuando):
+    espejo.guardar_precio(obj, cuando, eliminado=True)
+
+
+#: Tipo de evento -> función que recibe `data.object` y el `created` del evento
+MANEJADORES = {
+    "checkout.session.completed": _activate_profile_from_session,
+    "invoice.payment_succeeded": _update_period_from_invoice,
+    "customer.subscription.created": _sync_from_subscription,
+    "customer.subscription.updated": _sync_from_subscription,
+    "customer.subscription.deleted": _sync_from_subscription,
+    "customer.subscription.paused": _sync_from_subscription,
+    "customer.subscription.resumed": _sync_from_subscription,
+    "customer.created": _sync_customer,
+    "customer.updated": _sync_customer,
+    "customer.deleted": _delete_customer,
+    "price.created": _sync_price,
+    "price.updated": _sync_price,
+    "price.deleted": _delete_price,
+}
+
+
+def aplicar(evento: EventoStripe) -> bool:
+    """
+    @brief Aplica un evento al espejo local.
+    @return False si el tipo no se maneja (se marca procesado sin hacer nada).
+    """
+    manejador = MANEJADORES.get(evento.tipo)
+    if manejador is None:
+        return False
+    manejador((evento.payload.get("data") or {}).get("object") or {}, evento.creado)
+    return True
+
+
+# ============================
+# Cola
+# ============================
+
+def _espera(intentos: int) -> timedelta:
+    base = getattr(settings, "STRIPE_EVENTOS_ESPERA_BASE", 30)
+    return timedelta(seconds=min(base * 2 ** max(intentos - 1, 0), 6 * 60 * 60))
+
+
+def _tomar(evento: EventoStripe, ahora) -> bool:
+    arrendamiento = timedelta(seconds=getattr(settings, "STRIPE_EVENTOS_ARRENDAMIENTO", 300))
+    tomado = EventoStripe.objects.filter(
+        pk=evento.pk, estado=evento.estado, disponible=evento.disponible,
+    ).update(estado=EventoStripe.PROCESANDO, disponible=ahora + arrendamiento, intentos=F("intentos") + 1)
+    if tomado:
+        evento.intentos += 1
+    return bool(tomado)
+
+
+def _procesar(evento: EventoStripe) -> bool:
+    try:
+        with transaction.atomic():
+            manejado = aplicar(evento)
+            EventoStripe.objects.filter(pk=evento.pk).update(
+                estado=EventoStripe.PROCESADO, procesado=timezone.now(), error="",
+            )
+    except Exception as e:
+        logger.exception("Error procesando %s (%s)", evento.stripe_id, evento.tipo)
+        agotado = evento.intentos >= getattr(settings, "STRIPE_EVENTOS_MAX_INTENTOS", 8)
+        EventoStripe.objects.filter(pk=evento.pk).update(
+            estado=EventoStripe.FALLIDO if agotado else EventoStripe.ERROR,
+            disponible=timezone.now() + _espera(evento.intentos),
+            error=f"{type(e).__name__}: {e}"[:2000],
+        )
+        store.inc("stripe_events_processed_total", type=evento.tipo, result="error")
+        return False
+    store.inc("stripe_events_processed_total", type=evento.tipo, result="ok" if manejado else "ignored")
+    return True
+
+
+def procesar_pendientes(limite: int | None = None) -> int:
+    """
+    @brief Procesa un lote de eventos listos, en orden y sin adelantar a un cliente.
+    @param limite Máximo de eventos a revisar (por defecto `STRIPE_EVENTOS_LOTE`).
+    @return Número de eventos tomados (0 si no había nada listo).
+    """
+    limite = limite or getattr(settings, "STRIPE_EVENTOS_LOTE", 100)
+    ahora = timezone.now()
+    activos = [EventoStripe.PENDIENTE, EventoStripe.ERROR, EventoStripe.PROCESANDO]
+    # Clientes con un evento en curso (arrendamiento vigente) o esperando reintento
+    bloqueados = set(
+        EventoStripe.objects
+        .filter(estado__in=[EventoStripe.PROCESANDO, EventoStripe.ERROR], disponible__gt=ahora)
+        .exclude(cliente="")
+        .values_list("cliente", flat=True)
+    )
+    listos = (
+        EventoStripe.objects
+        .filter(estado__in=activos, disponible__lte=ahora)
+        .exclude(cliente__in=bloqueados)
+        .order_by("creado", "id")
+    )
+
+    tomados = 0
+    for evento in listos[:limite]:
+        if evento.cliente in bloqueados:
+            continue
+        if not _tomar(evento, ahora):
+            # Otro proceso lo tomó: sus siguientes eventos tampoco son nuestros en esta pasada
+            bloqueados.add(evento.cliente)
+            continue
+        tomados += 1
+        if not _procesar(evento) and evento.cliente:
+            bloqueados.add(evento.cliente)
+    return tomados
+
+
+def reprogramar(eventos) -> int:
+    """
+    @brief Devuelve eventos a la cola para procesarlos otra vez (reprocesar a mano).
+    @param eventos QuerySet de `EventoStripe`.
+    """
+    return eventos.exclude(estado=EventoStripe.PROCESANDO).update(
+        estado=EventoStripe.PENDIENTE, intentos=0, disponible=timezone.now(), error="",
+    )
+
+
+class Procesador:
+    """
+    @class Procesador
+    @brief Hilo por proceso que vacía la cola; se arranca con el primer webhook.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._aviso = threading.Event()
+        self._hilo = None
+        self._pid = None
+
+    def despertar(self):
+        """
+        @brief Pide procesar la cola cuanto antes (llamar tras confirmar la transacción).
+        """
+        if not getattr(settings, "STRIPE_EVENTOS_EN_SEGUNDO_PLANO", True):
+            return
+        with self._lock:
+            # Tras un fork (gunicorn) el hilo del padre no existe en el hijo
+            if self._hilo is None or not self._hilo.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._hilo = threading.Thread(target=self._ciclo, name="eventos-stripe", daemon=True)
+                self._hilo.start()
+        self._aviso.set()
+
+    def _ciclo(self):
+        while True:
+            self._aviso.wait(getattr(settings, "STRIPE_EVENTOS_INTERVALO", 30))
+            self._aviso.clear()
+            try:
+                while procesar_pendientes():
+                    pass
+                espejo.reconciliar_si_toca()
+            except Exception:
+                logger.exception("Error en el procesador de eventos de Stripe")
+            finally:
+                close_old_connections()
+
+
+procesador = Procesador()
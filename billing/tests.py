@@ -1,3 +1,486 @@
-from django.test import TestCase
+"""
+@file tests.py
+@brief Pruebas de la aplicación `billing`.
+"""
 
-# Create your tests here.
+import hashlib
+import hmac
+import io
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+import stripe
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from billing import clientes, conexion, espejo, procesador
+from billing.models import ClienteStripe, EventoStripe, PrecioStripe, SesionCheckout, SuscripcionStripe
+from cuentas.models import Perfil
+
+from principal.tests import crear_usuario
+
+SECRETO = "whsec_pruebas"
+
+
+class StripeLocal:
+    """
+    @class StripeLocal
+    @brief Sustituto local de Stripe: arma eventos con ids y `created` crecientes y los
+     firma como lo hace Stripe (`Stripe-Signature: t=...,v1=HMAC-SHA256`).
+    """
+
+    def __init__(self):
+        self._n = 0
+        self._reloj = int(time.time()) - 60
+
+    def evento(self, tipo: str, obj: dict, id=None) -> dict:
+        self._n += 1
+        self._reloj += 1
+        return {
+            "id": id or f"evt_{self._n}", "object": "event", "type": tipo,
+            "created": self._reloj, "data": {"object": obj},
+        }
+
+    @staticmethod
+    def firmar(cuerpo: bytes, secreto=SECRETO) -> str:
+        t = int(time.time())
+        firma = hmac.new(secreto.encode(), f"{t}.".encode() + cuerpo, hashlib.sha256).hexdigest()
+        return f"t={t},v1={firma}"
+
+    def enviar(self, client, evento: dict, secreto=SECRETO):
+        cuerpo = json.dumps(evento).encode()
+        return client.post(
+            reverse("billing:stripe_webhook"), cuerpo, content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=self.firmar(cuerpo, secreto),
+        )
+
+
+def _suscripcion(sub_id, cliente, status="active", fin=None, precio="price_mensual"):
+    fin = fin or int(time.time()) + 30 * 86400
+    return {
+        "id": sub_id, "object": "subscription", "customer": cliente, "status": status,
+        "items": {"data": [{"current_period_end": fin, "price": {"id": precio}}]},
+    }
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=SECRETO, STRIPE_EVENTOS_EN_SEGUNDO_PLANO=False)
+class WebhookStripeTests(TestCase):
+    """
+    @class WebhookStripeTests
+    @brief El webhook sólo guarda (sin duplicados) y la cola aplica los eventos en orden por cliente.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = crear_usuario("suscriptor")
+        Perfil.objects.filter(user=cls.usuario).update(stripe_customer_id="cus_1")
+        cls.otro = crear_usuario("otro")
+        Perfil.objects.filter(user=cls.otro).update(stripe_customer_id="cus_2")
+
+    def setUp(self):
+        self.stripe = StripeLocal()
+        # Ningún evento de estas pruebas debería necesitar consultar a Stripe
+        parche = mock.patch("stripe.Subscription.retrieve", side_effect=AssertionError("consulta a Stripe"))
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def _perfil(self, usuario=None):
+        return Perfil.objects.get(user=usuario or self.usuario)
+
+    def test_guarda_sin_procesar_y_descarta_reintentos(self):
+        evento = self.stripe.evento("customer.subscription.created", _suscripcion("sub_1", "cus_1"))
+        self.assertEqual(self.stripe.enviar(self.client, evento).status_code, 200)
+        self.assertEqual(self.stripe.enviar(self.client, evento).status_code, 200)
+
+        guardado = EventoStripe.objects.get()
+        self.assertEqual((guardado.stripe_id, guardado.cliente, guardado.estado), ("evt_1", "cus_1", "pendiente"))
+        self.assertIsNone(self._perfil().stripe_subscription_id)
+
+    def test_firma_invalida(self):
+        evento = self.stripe.evento("customer.subscription.created", _suscripcion("sub_1", "cus_1"))
+        self.assertEqual(self.stripe.enviar(self.client, evento, secreto="otro").status_code, 400)
+        self.assertFalse(EventoStripe.objects.exists())
+
+    def test_compra_completa_desde_el_payload(self):
+        fin = int(time.time()) + 7 * 86400
+        eventos = [
+            self.stripe.evento("customer.subscription.created", _suscripcion("sub_1", "cus_1", "incomplete", fin)),
+            self.stripe.evento("invoice.payment_succeeded", {
+                "object": "invoice", "customer": "cus_1", "subscription": "sub_1",
+                "lines": {"data": [{"period": {"start": fin - 7 * 86400, "end": fin}}]},
+            }),
+            self.stripe.evento("checkout.session.completed", {
+                "object": "checkout.session", "customer": "cus_1", "subscription": "sub_1",
+                "metadata": {"user_id": str(self.usuario.pk)},
+            }),
+            self.stripe.evento("customer.created", {"object": "customer", "id": "cus_1"}),
+        ]
+        for evento in eventos:
+            self.stripe.enviar(self.client, evento)
+
+        self.assertEqual(procesador.procesar_pendientes(), 4)
+        perfil = self._perfil()
+        self.assertEqual((perfil.stripe_subscription_id, perfil.stripe_status), ("sub_1", "active"))
+        self.assertEqual(perfil.stripe_price_id, "price_mensual")
+        self.assertEqual(int(perfil.stripe_current_period_end.timestamp()), fin)
+        self.assertTrue(perfil.is_subscribed)
+        self.assertFalse(EventoStripe.objects.exclude(estado="procesado").exists())
+
+        # Cancelada de inmediato: `ended_at` termina el periodo aunque estuviera pagado
+        cancelada = dict(_suscripcion("sub_1", "cus_1", "canceled", fin), ended_at=int(time.time()) - 1)
+        self.stripe.enviar(self.client, self.stripe.evento("customer.subscription.deleted", cancelada))
+        procesador.procesar_pendientes()
+        self.assertFalse(self._perfil().is_subscribed)
+        self.assertFalse(self._perfil().has_active_subscription)
+
+    def test_error_detiene_solo_a_ese_cliente(self):
+        primero = self.stripe.evento("customer.subscription.created", _suscripcion("sub_1", "cus_1", "trialing"))
+        otro_cliente = self.stripe.evento("customer.subscription.created", _suscripcion("sub_2", "cus_2"))
+        segundo = self.stripe.evento("customer.subscription.updated", _suscripcion("sub_1", "cus_1", "active"))
+        for evento in (primero, otro_cliente, segundo):
+            self.stripe.enviar(self.client, evento)
+
+        original = procesador.MANEJADORES["customer.subscription.created"]
+
+        def fallar_sub_1(obj, cuando):
+            if obj["id"] == "sub_1":
+                raise RuntimeError("caída")
+            original(obj, cuando)
+
+        with mock.patch.dict(procesador.MANEJADORES, {"customer.subscription.created": fallar_sub_1}), \
+                self.assertLogs("billing.procesador", "ERROR"):
+            procesador.procesar_pendientes()
+
+        estados = dict(EventoStripe.objects.values_list("stripe_id", "estado"))
+        self.assertEqual(estados, {"evt_1": "error", "evt_2": "procesado", "evt_3": "pendiente"})
+        self.assertEqual(self._perfil(self.otro).stripe_status, "active")
+
+        # Vencida la espera se procesan en orden: el "updated" queda al final
+        EventoStripe.objects.filter(stripe_id="evt_1").update(disponible=timezone.now() - timedelta(seconds=1))
+        procesador.procesar_pendientes()
+        self.assertEqual(self._perfil().stripe_status, "active")
+        self.assertEqual(EventoStripe.objects.get(stripe_id="evt_1").intentos, 2)
+
+    @override_settings(STRIPE_EVENTOS_MAX_INTENTOS=1)
+    def test_fallido_y_reproceso(self):
+        self.stripe.enviar(self.client, self.stripe.evento("customer.subscription.created",
+                                                           _suscripcion("sub_1", "cus_1")))
+        with mock.patch.dict(procesador.MANEJADORES, {"customer.subscription.created": mock.Mock(side_effect=KeyError)}), \
+                self.assertLogs("billing.procesador", "ERROR"):
+            procesador.procesar_pendientes()
+        self.assertEqual(EventoStripe.objects.get().estado, "fallido")
+
+        salida = io.StringIO()
+        call_command("reprocesar_eventos_stripe", fallidos=True, stdout=salida)
+        self.assertIn("Reencolados: 1", salida.getvalue())
+        self.assertEqual(EventoStripe.objects.get().estado, "procesado")
+        self.assertEqual(self._perfil().stripe_subscription_id, "sub_1")
+
+
+class ListaLocal:
+    """
+    @class ListaLocal
+    @brief Sustituto de un recurso de Stripe con `list` paginado (`limit`,
+     `starting_after`, filtro `status`); cuenta las peticiones.
+    """
+
+    def __init__(self, objetos):
+        self.objetos = list(objetos)
+        self.peticiones = []
+
+    def list(self, limit=10, starting_after=None, **filtros):
+        self.peticiones.append(dict(filtros, starting_after=starting_after))
+        objetos = [o for o in self.objetos if all(o.get(k) == v for k, v in filtros.items())]
+        if starting_after:
+            objetos = objetos[[o["id"] for o in objetos].index(starting_after) + 1:]
+        return {"object": "list", "data": objetos[:limit], "has_more": len(objetos) > limit}
+
+    @classmethod
+    def parches(cls, precios=(), clientes=(), suscripciones=()):
+        """Instala los tres recursos; devuelve `(parches, recursos)`."""
+        recursos = {"Price": cls(precios), "Customer": cls(clientes), "Subscription": cls(suscripciones)}
+        return [mock.patch(f"stripe.{nombre}", r) for nombre, r in recursos.items()], recursos
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=SECRETO, STRIPE_EVENTOS_EN_SEGUNDO_PLANO=False)
+class EspejoStripeTests(TestCase):
+    """
+    @class EspejoStripeTests
+    @brief El estado de la suscripción se lee del espejo local; sólo webhooks y reconciliador lo escriben.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = crear_usuario("suscriptor")
+        Perfil.objects.filter(user=cls.usuario).update(stripe_customer_id="cus_1")
+
+    def setUp(self):
+        self.stripe = StripeLocal()
+        for nombre in ("stripe.Subscription.retrieve", "stripe.checkout.Session.retrieve", "stripe.Customer.retrieve"):
+            parche = mock.patch(nombre, side_effect=AssertionError("consulta a Stripe"))
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def _perfil(self):
+        return Perfil.objects.get(user=self.usuario)
+
+    def test_evento_atrasado_no_pisa_uno_mas_reciente(self):
+        ahora = timezone.now()
+        espejo.guardar_suscripcion(_suscripcion("sub_1", "cus_1", "past_due"), ahora)
+        espejo.guardar_suscripcion(_suscripcion("sub_1", "cus_1", "active"), ahora - timedelta(minutes=5))
+        self.assertEqual(SuscripcionStripe.objects.get().estado, "past_due")
+        self.assertEqual(self._perfil().stripe_status, "past_due")
+
+    def test_suscripcion_activa_sin_consultar_stripe(self):
+        self.assertFalse(self._perfil().has_active_subscription)
+        espejo.guardar_suscripcion(_suscripcion("sub_1", "cus_1", "trialing"), timezone.now())
+        self.assertTrue(self._perfil().has_active_subscription)
+
+        vencida = _suscripcion("sub_1", "cus_1", "past_due", fin=int(time.time()) - 60)
+        espejo.guardar_suscripcion(vencida, timezone.now())
+        self.assertFalse(self._perfil().has_active_subscription)
+
+    def test_exito_provisional_y_confirmacion_por_webhook(self):
+        self.client.force_login(self.usuario)
+        SesionCheckout.objects.create(stripe_id="cs_1", usuario=self.usuario, plan="monthly")
+
+        ajena = self.client.get(reverse("billing:stripe_success"), {"session_id": "cs_otra"})
+        self.assertEqual(ajena.status_code, 302)
+        self.assertFalse(self._perfil().has_active_subscription)
+
+        respuesta = self.client.get(reverse("billing:stripe_success"), {"session_id": "cs_1"})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(respuesta.context["confirmada"])
+        self.assertTrue(self._perfil().has_active_subscription)
+        self.assertEqual(self.client.get(reverse("billing:stripe_estado")).json(), {"activa": True, "confirmada": False})
+
+        self.stripe.enviar(self.client, self.stripe.evento(
+            "customer.subscription.created", _suscripcion("sub_1", "cus_1")))
+        procesador.procesar_pendientes()
+        self.assertIsNone(self._perfil().stripe_provisional_hasta)
+        self.assertEqual(self.client.get(reverse("billing:stripe_estado")).json(), {"activa": True, "confirmada": True})
+
+    def test_provisional_una_vez_por_sesion_pendiente(self):
+        self.client.force_login(self.usuario)
+        SesionCheckout.objects.create(stripe_id="cs_1", usuario=self.usuario, plan="monthly")
+        self.client.get(reverse("billing:stripe_success"), {"session_id": "cs_1"})
+        self.assertTrue(self._perfil().has_active_subscription)
+        self.assertTrue(SesionCheckout.objects.get(stripe_id="cs_1").provisional_usada)
+
+        # Sin pagar vence la ventana; volver a la página no la renueva
+        Perfil.objects.filter(user=self.usuario).update(stripe_provisional_hasta=timezone.now() - timedelta(seconds=1))
+        self.client.get(reverse("billing:stripe_success"), {"session_id": "cs_1"})
+        self.assertFalse(self._perfil().has_active_subscription)
+
+        # Una sesión ya completada tampoco concede acceso provisional
+        SesionCheckout.objects.create(stripe_id="cs_2", usuario=self.usuario, plan="monthly", completada=timezone.now())
+        self.client.get(reverse("billing:stripe_success"), {"session_id": "cs_2"})
+        self.assertFalse(self._perfil().has_active_subscription)
+
+
+
+@override_settings(STRIPE_SECRET_KEY="sk_test_local", STRIPE_RECONCILIAR_POR_SEGUNDO=1000)
+class ReconciliacionStripeTests(TestCase):
+    """
+    @class ReconciliacionStripeTests
+    @brief La reconciliación en lote contra un Stripe local: paginación, escritura en
+     bloque, filas más recientes intactas y reporte de deriva.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = crear_usuario("suscriptor")
+        Perfil.objects.filter(user=cls.usuario).update(stripe_customer_id="cus_1", stripe_subscription_id="sub_1")
+
+    def _instalar(self):
+        precios = [{"id": "price_mensual", "product": "prod_1", "currency": "mxn", "unit_amount": 19900,
+                    "recurring": {"interval": "month", "interval_count": 1}, "active": True}]
+        clientes = [{"id": "cus_1", "email": "a@b.mx", "metadata": {}}]
+        clientes += [{"id": f"cus_x{i}", "email": "", "metadata": {}} for i in range(120)]
+        suscripciones = [_suscripcion("sub_1", "cus_1", "unpaid", fin=int(time.time()) - 60)]
+        suscripciones += [_suscripcion(f"sub_x{i}", f"cus_x{i}") for i in range(230)]
+        parches, self.recursos = ListaLocal.parches(precios, clientes, suscripciones)
+        for parche in parches:
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def _reconciliar(self, **kwargs):
+        self._instalar()
+        return espejo.reconciliar(**kwargs)
+
+    def test_corrige_webhooks_perdidos_con_listas_paginadas(self):
+        espejo.guardar_suscripcion(_suscripcion("sub_1", "cus_1", "active"), timezone.now() - timedelta(days=1))
+        self.assertTrue(Perfil.objects.get(user=self.usuario).is_subscribed)
+
+        deriva = self._reconciliar(hilos=3)
+
+        self.assertEqual(dict(deriva.leidos), {"precio": 1, "cliente": 121, "suscripcion": 231})
+        self.assertEqual(deriva.cambios[("suscripcion", "estado")], 1)
+        # 100 por petición: 231 activas = 3 páginas, 121 clientes = 2, y una por cada otro estado
+        activas = [p for p in self.recursos["Subscription"].peticiones if p["status"] == "active"]
+        self.assertEqual(len(activas), 3)
+        self.assertEqual(len(self.recursos["Customer"].peticiones), 2)
+        self.assertEqual(SuscripcionStripe.objects.count(), 231)
+        self.assertEqual(PrecioStripe.objects.get().monto, 19900)
+        self.assertEqual(ClienteStripe.objects.get(stripe_id="cus_1").usuario, self.usuario)
+        perfil = Perfil.objects.get(user=self.usuario)
+        self.assertEqual(perfil.stripe_status, "unpaid")
+        self.assertFalse(perfil.is_subscribed)
+
+    def test_no_pisa_datos_mas_recientes(self):
+        espejo.guardar_suscripcion(_suscripcion("sub_1", "cus_1", "active"), timezone.now() + timedelta(minutes=1))
+        deriva = self._reconciliar()
+        self.assertEqual(deriva.omitidos["suscripcion"], 1)
+        self.assertEqual(SuscripcionStripe.objects.get(stripe_id="sub_1").estado, "active")
+
+    def test_solo_reportar_y_huerfanos(self):
+        espejo.guardar_suscripcion(_suscripcion("sub_1", "cus_1", "active"), timezone.now() - timedelta(days=1))
+        Perfil.objects.filter(user=self.usuario).update(stripe_subscription_id="sub_perdida")
+
+        deriva = self._reconciliar(escribir=False)
+
+        self.assertEqual(deriva.nuevos["suscripcion"], 230)
+        self.assertIn(("suscripcion", "sub_1", "estado", "active", "unpaid"), deriva.detalle)
+        self.assertEqual(deriva.huerfanos, [(self.usuario.pk, "sub_perdida")])
+        self.assertEqual(SuscripcionStripe.objects.count(), 1)
+        self.assertEqual(SuscripcionStripe.objects.get().estado, "active")
+
+    def test_comando(self):
+        self._instalar()
+        salida = io.StringIO()
+        call_command("reconciliar_stripe", "--hilos", "2", "--solo-reportar", stdout=salida)
+        self.assertIn("suscripcion: 231 nuevos", salida.getvalue())
+        self.assertIn("Diferencias encontradas: 353", salida.getvalue())
+        self.assertFalse(SuscripcionStripe.objects.exists())
+
+
+@override_settings(STRIPE_SECRET_KEY="sk_test_local")
+class ClientesStripeTests(TestCase):
+    """
+    @class ClientesStripeTests
+    @brief El registro no llama a Stripe; el Customer se crea en el primer Checkout o en lote.
+    """
+
+    def setUp(self):
+        self.creados = []
+
+        def crear(**params):
+            self.creados.append(params)
+            return {"id": f"cus_{params['metadata']['django_user_id']}"}
+
+        parche = mock.patch("stripe.Customer.create", side_effect=crear)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_registro_sin_llamar_a_stripe(self):
+        usuario = crear_usuario("nuevo")
+        self.assertEqual(self.creados, [])
+        self.assertIsNone(Perfil.objects.get(user=usuario).stripe_customer_id)
+
+    def test_customer_en_el_primer_checkout(self):
+        usuario = crear_usuario("comprador")
+        self.client.force_login(usuario)
+        sesiones = [mock.Mock(id=f"cs_{i}", url=f"https://checkout.local/cs_{i}") for i in (1, 2)]
+        with mock.patch("stripe.checkout.Session.create", side_effect=sesiones) as crear_sesion:
+            self.client.post(reverse("billing:stripe_create_session"), {"plan": "monthly"})
+            self.client.post(reverse("billing:stripe_create_session"), {"plan": "monthly"})
+
+        self.assertEqual(len(self.creados), 1)
+        self.assertEqual(self.creados[0]["idempotency_key"], f"customer-user-{usuario.pk}")
+        self.assertEqual(crear_sesion.call_args.kwargs["customer"], f"cus_{usuario.pk}")
+        self.assertEqual(Perfil.objects.get(user=usuario).stripe_customer_id, f"cus_{usuario.pk}")
+
+    def test_crear_faltantes_en_paralelo(self):
+        usuarios = [crear_usuario(f"u{i}") for i in range(6)]
+        Perfil.objects.filter(user=usuarios[0]).update(stripe_customer_id="cus_existente")
+
+        salida = io.StringIO()
+        call_command("crear_clientes_stripe", hilos=3, por_segundo=1000, stdout=salida)
+
+        self.assertIn("Creados: 5, errores: 0", salida.getvalue())
+        self.assertEqual(
+            dict(Perfil.objects.filter(user__in=usuarios).values_list("user_id", "stripe_customer_id")),
+            {u.pk: "cus_existente" if u == usuarios[0] else f"cus_{u.pk}" for u in usuarios},
+        )
+
+    def test_ritmo_compartido(self):
+        ritmo = clientes.Ritmo(por_segundo=50)
+        inicio = time.monotonic()
+        hilos = [threading.Thread(target=ritmo.esperar) for _ in range(6)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        self.assertGreaterEqual(time.monotonic() - inicio, 5 / 50 - 0.01)
+
+
+@override_settings(STRIPE_REINTENTOS=2, STRIPE_REINTENTO_BASE=0, STRIPE_CIRCUITO_FALLAS=3, STRIPE_CIRCUITO_PAUSA=30)
+class ConexionStripeTests(TestCase):
+    """
+    @class ConexionStripeTests
+    @brief Reintentos con la misma llave de idempotencia, errores definitivos sin
+     reintento y circuito que falla rápido y se recupera.
+    """
+
+    def setUp(self):
+        parche = mock.patch.object(conexion, "circuito", conexion.Circuito())
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_reintenta_con_la_misma_llave(self):
+        funcion = mock.Mock(side_effect=[stripe.APIConnectionError("timeout"), {"id": "cus_1"}])
+        self.assertEqual(conexion.llamar(funcion, operacion="Customer.create", email="a@b.mx"), {"id": "cus_1"})
+        llaves = [c.kwargs["idempotency_key"] for c in funcion.call_args_list]
+        self.assertEqual(len(llaves), 2)
+        self.assertEqual(llaves[0], llaves[1])
+
+        lectura = mock.Mock(return_value={"id": "sub_1"})
+        conexion.llamar(lectura, "sub_1", operacion="Subscription.retrieve")
+        self.assertNotIn("idempotency_key", lectura.call_args.kwargs)
+
+    def test_error_del_cliente_no_se_reintenta(self):
+        funcion = mock.Mock(side_effect=stripe.InvalidRequestError("sin precio", "price"))
+        with self.assertRaises(stripe.InvalidRequestError):
+            conexion.llamar(funcion, operacion="checkout.Session.create")
+        self.assertEqual(funcion.call_count, 1)
+        self.assertFalse(conexion.circuito.abierto)
+
+    def test_circuito_abre_falla_rapido_y_se_recupera(self):
+        caida = mock.Mock(side_effect=stripe.APIError("bad gateway", http_status=502))
+        with self.assertRaises(conexion.StripeNoDisponible):
+            conexion.llamar(caida, operacion="Customer.create")
+        self.assertEqual(caida.call_count, 3)
+        self.assertTrue(conexion.circuito.abierto)
+
+        sana = mock.Mock(return_value={"id": "cus_1"})
+        with self.assertRaises(conexion.StripeNoDisponible):
+            conexion.llamar(sana, operacion="Customer.create")
+        sana.assert_not_called()
+
+        # Pasada la pausa una llamada de prueba cierra el circuito
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 31):
+            self.assertEqual(conexion.llamar(sana, operacion="Customer.create"), {"id": "cus_1"})
+        self.assertFalse(conexion.circuito.abierto)
+
+    def test_checkout_degrada_con_503(self):
+        self.client.force_login(crear_usuario("comprador"))
+        Perfil.objects.filter(user__username="comprador").update(stripe_customer_id="cus_1")
+        caida = stripe.APIConnectionError("timeout")
+        with mock.patch("stripe.checkout.Session.create", side_effect=caida) as crear:
+            respuesta = self.client.post(reverse("billing:stripe_create_session"), {"plan": "monthly"})
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertIn("no están disponibles", respuesta.json()["error"])
+        self.assertEqual(crear.call_count, 3)
+        self.assertFalse(SesionCheckout.objects.exists())
+
+    def test_cliente_http_con_timeouts(self):
+        with override_settings(STRIPE_TIMEOUT_CONEXION=2, STRIPE_TIMEOUT_LECTURA=7):
+            conexion.configurar()
+        self.addCleanup(conexion.configurar)
+        self.assertEqual(stripe.default_http_client._timeout, (2, 7))
+        self.assertEqual(stripe.max_network_retries, 0)
@@ -1,83 +1,28 @@
 # billing/views.py
+import json
+
 import stripe
-from datetime import datetime, timezone
+from datetime import timedelta
 
 from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.http import JsonResponse, HttpResponse
 from django.shortcuts import render, redirect
 from django.urls import reverse
-from django.views.decorators.http import require_POST
+from django.utils import timezone
+from django.views.decorators.http import require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
 
-from cuentas.models import Perfil  # ajusta si tu modelo vive en otro módulo
+from .conexion import StripeNoDisponible, llamar
+from .models import SesionCheckout, SuscripcionStripe
+from .procesador import procesador, registrar
 
 # --- Stripe API key ---
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
-
-# ========== Utils ==========
-def _ts_to_dt(ts: int):
-    """Convierte timestamp (segundos) a datetime con tz UTC."""
-    return datetime.fromtimestamp(ts, tz=timezone.utc)
-
-
-def _activate_profile_from_session(session_obj: dict):
-    """
-    Marca al usuario como suscrito cuando Checkout termina (evento webhook).
-    """
-    meta = session_obj.get("metadata") or {}
-    user_id = meta.get("user_id")
-    if not user_id:
-        return
-
-    subscription_id = session_obj.get("subscription")
-    customer_id = session_obj.get("customer")
-
-    try:
-        perfil = Perfil.objects.get(user_id=user_id)
-        perfil.is_subscribed = True
-        perfil.stripe_customer_id = customer_id
-        perfil.stripe_subscription_id = subscription_id
-        perfil.trial_ended = True  # si manejas trial interno
-
-        if subscription_id:
-            sub = stripe.Subscription.retrieve(subscription_id)
-            perfil.stripe_current_period_end = _ts_to_dt(sub["current_period_end"])
-        perfil.save()
-    except Perfil.DoesNotExist:
-        pass
-
-
-def _update_period_from_invoice(invoice_obj: dict):
-    """
-    Para renovaciones: mantener period_end e is_subscribed (webhook).
-    """
-    subscription_id = invoice_obj.get("subscription")
-    if not subscription_id:
-        return
-    try:
-        perfil = Perfil.objects.get(stripe_subscription_id=subscription_id)
-        sub = stripe.Subscription.retrieve(subscription_id)
-        perfil.stripe_current_period_end = _ts_to_dt(sub["current_period_end"])
-        perfil.is_subscribed = True
-        perfil.save()
-    except Perfil.DoesNotExist:
-        pass
-
-
-def _deactivate_from_subscription(sub_obj: dict):
-    """
-    Si se cancela/expira la suscripción, desactivar (webhook).
-    """
-    subscription_id = sub_obj.get("id")
-    if not subscription_id:
-        return
-    try:
-        perfil = Perfil.objects.get(stripe_subscription_id=subscription_id)
-        perfil.is_subscribed = False
-        perfil.save()
-    except Perfil.DoesNotExist:
-        pass
+#: Respuesta cuando Stripe no contesta (ver billing/conexion.py)
+PAGOS_NO_DISPONIBLES = "Los pagos no están disponibles en este momento. Intenta de nuevo en unos minutos."
 
 
 # ========== Checkout Session ==========
@@ -99,13 +44,23 @@ def create_checkout_session(request):
     success_url = request.build_absolute_uri(reverse("billing:stripe_success")) + "?session_id={CHECKOUT_SESSION_ID}"
     cancel_url = request.build_absolute_uri(reverse("billing:stripe_cancel"))
 
+    # El Customer se crea aquí la primera vez (no en el registro); si Stripe falla,
+    # Checkout crea uno con el email y el webhook lo liga al usuario
+    perfil = getattr(request.user, "perfil", None) if request.user.is_authenticated else None
+    if perfil is not None and perfil.ensure_stripe_customer():
+        cliente = {"customer": perfil.stripe_customer_id}
+    else:
+        cliente = {"customer_email": request.user.email if request.user.is_authenticated else None}
+
     try:
-        session = stripe.checkout.Session.create(
+        session = llamar(
+            stripe.checkout.Session.create,
+            operacion="checkout.Session.create",
             mode="subscription",
             line_items=[{"price": price_id, "quantity": 1}],
             success_url=success_url,
             cancel_url=cancel_url,
-            customer_email=request.user.email if request.user.is_authenticated else None,
+            **cliente,
             metadata={
                 "user_id": request.user.id if request.user.is_authenticated else "",
                 "plan": plan,
@@ -113,7 +68,11 @@ def create_checkout_session(request):
             allow_promotion_codes=True,
             automatic_tax={"enabled": False},
         )
+        if request.user.is_authenticated:
+            SesionCheckout.objects.create(stripe_id=session.id, usuario=request.user, plan=plan)
         return JsonResponse({"url": session.url})
+    except StripeNoDisponible:
+        return JsonResponse({"error": PAGOS_NO_DISPONIBLES}, status=503)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
@@ -123,46 +82,81 @@ def create_checkout_session(request):
 def create_customer_portal_session(request):
     """
     Crea sesión del Portal de Facturación para que el usuario gestione su suscripción.
-    Espera POST con 'session_id' (el Checkout Session id).
+    Usa el Customer del usuario; sin sesión iniciada espera POST con 'session_id'
+    (una sesión de Checkout creada por esta app).
     """
-    try:
+    customer = None
+    if request.user.is_authenticated:
+        customer = getattr(request.user.perfil, "stripe_customer_id", None)
+    if not customer:
         checkout_session_id = request.POST.get("session_id")
         if not checkout_session_id:
             return JsonResponse({"error": "session_id requerido"}, status=400)
+        sesion = SesionCheckout.objects.select_related("usuario__perfil").filter(stripe_id=checkout_session_id).first()
+        customer = sesion and sesion.usuario.perfil.stripe_customer_id
+        if not customer:
+            return JsonResponse({"error": "Sin suscripción asociada"}, status=400)
 
-        checkout_session = stripe.checkout.Session.retrieve(checkout_session_id)
-        portal_session = stripe.billing_portal.Session.create(
-            customer=checkout_session.customer,
+    try:
+        portal_session = llamar(
+            stripe.billing_portal.Session.create,
+            operacion="billing_portal.Session.create",
+            customer=customer,
             return_url=request.build_absolute_uri(reverse("billing:stripe_success")),
         )
         return JsonResponse({"url": portal_session.url})
+    except StripeNoDisponible:
+        return JsonResponse({"error": PAGOS_NO_DISPONIBLES}, status=503)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
+
 def success_view(request):
+    """
+    Regreso de Checkout. No consulta a Stripe: si la sesión es una que este usuario
+    creó hace poco, se concede acceso provisional (`STRIPE_ACTIVACION_PROVISIONAL`)
+    y la página espera la confirmación del webhook consultando `billing:stripe_estado`.
+    El acceso provisional se concede una sola vez por sesión y sólo mientras siga
+    pendiente; recargar la página o abrir checkouts sin pagar no lo renueva.
+    """
     session_id = request.GET.get("session_id")
-    if request.user.is_authenticated and session_id:
-        try:
-            sess = stripe.checkout.Session.retrieve(session_id)
-            if str(sess.get("metadata", {}).get("user_id")) == str(request.user.id):
-                sub_id = sess.get("subscription")
-                cust_id = sess.get("customer")
-                perfil = Perfil.objects.get(user=request.user)
-                perfil.is_subscribed = True
-                perfil.stripe_subscription_id = sub_id
-                perfil.stripe_customer_id = cust_id
-                if sub_id:
-                    sub = stripe.Subscription.retrieve(sub_id)
-                    perfil.stripe_current_period_end = datetime.fromtimestamp(
-                        sub["current_period_end"], tz=timezone.utc
-                    )
-                perfil.trial_ended = True
-                perfil.save()
-        except Exception as e:
-            print("Error en success_view:", e)
-
-    # 🔁 Al terminar, redirige directamente al panel
-    return redirect("publicaciones:panel")
+    if not (request.user.is_authenticated and session_id):
+        return redirect("publicaciones:panel")
+
+    vigencia = timezone.now() - timedelta(days=1)
+    sesion = SesionCheckout.objects.filter(stripe_id=session_id, usuario=request.user, creada__gte=vigencia).first()
+    if sesion is None:
+        return redirect("publicaciones:panel")
+
+    perfil = request.user.perfil
+    # UPDATE condicional: sólo una petición puede marcarla, aun con recargas simultáneas
+    if not perfil.has_active_subscription and SesionCheckout.objects.filter(
+        pk=sesion.pk, completada__isnull=True, provisional_usada=False,
+    ).update(provisional_usada=True):
+        perfil.stripe_provisional_hasta = timezone.now() + timedelta(
+            seconds=getattr(settings, "STRIPE_ACTIVACION_PROVISIONAL", 30 * 60)
+        )
+        perfil.save(update_fields=["stripe_provisional_hasta"])
+        procesador.despertar()
+    return render(request, "billing/success.html", {"confirmada": _confirmada(perfil)})
+
+
+def _confirmada(perfil) -> bool:
+    return bool(perfil.stripe_customer_id) and SuscripcionStripe.objects.filter(
+        cliente=perfil.stripe_customer_id, estado__in=("active", "trialing"),
+    ).exists()
+
+
+@login_required
+@require_GET
+def estado_suscripcion(request):
+    """
+    Estado de la suscripción del usuario desde el espejo local (la página de éxito lo
+    consulta hasta que llega la confirmación).
+    """
+    perfil = request.user.perfil
+    return JsonResponse({"activa": perfil.has_active_subscription, "confirmada": _confirmada(perfil)})
+
 
 def cancel_view(request):
     return render(request, "billing/cancel.html")
@@ -170,9 +164,12 @@ def cancel_view(request):
 
 # ========== Webhook ==========
 @csrf_exempt  # Stripe no envía CSRF; este endpoint DEBE estar exento
+@require_POST
 def stripe_webhook(request):
     """
-    Webhook: valida firma y procesa eventos.
+    Webhook: valida firma, guarda el evento y responde de inmediato.
+    El procesamiento ocurre después y en orden por cliente (billing/procesador.py);
+    los reintentos de Stripe de un evento ya recibido sólo se confirman.
     Configura STRIPE_WEBHOOK_SECRET en tus variables de entorno.
     """
     payload = request.body
@@ -180,26 +177,14 @@ def stripe_webhook(request):
     endpoint_secret = settings.STRIPE_WEBHOOK_SECRET
 
     try:
-        event = stripe.Webhook.construct_event(
+        stripe.Webhook.construct_event(
             payload=payload, sig_header=sig_header, secret=endpoint_secret
         )
-    except (ValueError, stripe.error.SignatureVerificationError):
+        evento = json.loads(payload)
+    except (ValueError, stripe.SignatureVerificationError):
         return HttpResponse(status=400)
 
-    etype = event.get("type")
-    data = event.get("data", {}).get("object", {})
-
-    if etype == "checkout.session.completed":
-        _activate_profile_from_session(data)
-
-    elif etype == "invoice.payment_succeeded":
-        _update_period_from_invoice(data)
-
-    elif etype in (
-        "customer.subscription.deleted",
-        "customer.subscription.canceled",
-        "customer.subscription.paused",
-    ):
-        _deactivate_from_subscription(data)
-
+    _, nuevo = registrar(evento)
+    if nuevo:
+        transaction.on_commit(procesador.despertar)
     return HttpResponse(status=200)
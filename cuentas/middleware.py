@@ -1,3 +1,4 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.shortcuts import redirect
 from django.urls import reverse
 
@@ -6,9 +7,15 @@ class RequireCompleteProfileMiddleware:
     Si el usuario está autenticado y su perfil está incompleto, lo redirige a
     `cuentas:complete_profile` en cualquier URL que no esté en la lista blanca.
     Deja pasar logout, login, signup, static/media/admin.
+    Funciona en modo síncrono y asíncrono (vistas async servidas por ASGI).
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
         self._computed = False
         self.exempt_paths = set()
         self.exempt_prefixes = ("/static/", "/media/", "/admin/")
@@ -35,33 +42,50 @@ class RequireCompleteProfileMiddleware:
                 pass
         self._computed = True
 
-    def __call__(self, request):
+    def _exento(self, request):
         if not self._computed:
             self._compute_exempt()
 
         path = request.path
+        if path.startswith(self.exempt_prefixes) or path in self.exempt_paths:
+            return True
+
+        try:
+            complete_profile_path = reverse("cuentas:complete_profile")
+        except Exception:
+            complete_profile_path = "/cuentas/completar/"
+        return path == complete_profile_path
+
+    @staticmethod
+    def _incompleto(user):
+        perfil = getattr(user, "perfil", None)
+        return bool(perfil is not None and hasattr(perfil, "is_complete") and not perfil.is_complete())
 
-        if path.startswith(self.exempt_prefixes):
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if self._exento(request):
             return self.get_response(request)
 
         user = request.user
         if not user.is_authenticated:
             return self.get_response(request)
 
-        if path in self.exempt_paths:
-            return self.get_response(request)
+        if self._incompleto(user):
+            return redirect("cuentas:complete_profile")
 
-        try:
-            complete_profile_path = reverse("cuentas:complete_profile")
-        except Exception:
-            complete_profile_path = "/cuentas/completar/"
-        if path == complete_profile_path:
-            return self.get_response(request)
+        return self.get_response(request)
 
-        perfil = getattr(user, "perfil", None)
-        is_incomplete = bool(perfil is not None and hasattr(perfil, "is_complete") and not perfil.is_complete())
+    async def __acall__(self, request):
+        if self._exento(request):
+            return await self.get_response(request)
 
-        if is_incomplete:
+        user = await request.auser()
+        if not user.is_authenticated:
+            return await self.get_response(request)
+
+        if await sync_to_async(self._incompleto)(user):
             return redirect("cuentas:complete_profile")
 
-        return self.get_response(request)
+        return await self.get_response(request)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuentas', '0005_perfil_stripe_current_period_end_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfil',
+            name='stripe_provisional_hasta',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -5,7 +5,7 @@
  Contiene:
   - Validadores para RFC y número de WhatsApp.
   - Modelo `Perfil` asociado a cada usuario.
-  - Señal para crear automáticamente un perfil al registrar un usuario.
+  - Señal para crear automáticamente un perfil al registrar un usuario (sin llamar a Stripe).
   - Función helper para comprobar si un perfil está incompleto.
   - Integración lista para Stripe (customer/subscription/price + helpers).
 """
@@ -127,6 +127,9 @@ class Perfil(models.Model):
     #: Fin de periodo actual (para saber si aún está vigente)
     stripe_current_period_end = models.DateTimeField(null=True, blank=True)
 
+    #: Acceso concedido al volver de Checkout mientras llega la confirmación (webhook)
+    stripe_provisional_hasta = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
         """
         @brief Representación en texto del perfil.
@@ -165,30 +168,12 @@ class Perfil(models.Model):
         """
         @brief Indica si la suscripción se considera activa a nivel de negocio.
         @details
-         Reglas comunes:
-          - Estados 'trialing' y 'active' cuentan como activos.
-          - 'past_due' puede considerarse activo durante el periodo vigente.
-          - 'canceled' y 'unpaid' no son activos, salvo que el periodo no haya expirado (gracia).
+         Se responde con el espejo local de Stripe (`billing.SuscripcionStripe`, ver
+         `SuscripcionStripe.activa` para las reglas por estado), sin llamar a la API.
+         También cuenta la activación provisional de la página de éxito de Checkout.
         """
-        now = timezone.now()
-        status = (self.stripe_status or "").lower() if self.stripe_status else None
-
-        if not status:
-            return False
-
-        if status in ("trialing", "active"):
-            # Si Stripe dice activo/trial y la fecha de fin no expiró (o no está establecida), aceptamos
-            return (self.stripe_current_period_end is None) or (self.stripe_current_period_end > now)
-
-        if status == "past_due":
-            # Permitimos acceso mientras no haya vencido el periodo actual
-            return bool(self.stripe_current_period_end and self.stripe_current_period_end > now)
-
-        if status in ("canceled", "unpaid", "incomplete", "incomplete_expired"):
-            # Puede existir acceso por periodo pagado hasta su fin (gracia)
-            return bool(self.stripe_current_period_end and self.stripe_current_period_end > now)
-
-        return False
+        from billing.espejo import suscripcion_activa  # billing depende de cuentas
+        return suscripcion_activa(self)
 
     def _stripe_configured(self) -> bool:
         """
@@ -204,10 +189,25 @@ class Perfil(models.Model):
         stripe.api_key = secret
         return True
 
+    def stripe_customer_params(self) -> dict:
+        """
+        @brief Parámetros de `stripe.Customer.create` para este usuario.
+        """
+        u = self.user
+        return {
+            "email": u.email or None,
+            "name": f"{(u.first_name or '').strip()} {(u.last_name or '').strip()}".strip() or u.username,
+            "metadata": {"django_user_id": str(u.id)},
+            "idempotency_key": f"customer-user-{u.id}",
+        }
+
     def ensure_stripe_customer(self) -> bool:
         """
         @brief Crea (si no existe) el Customer en Stripe y guarda el `stripe_customer_id`.
         @return True si hay Customer asegurado (ya existía o se creó), False si no fue posible.
+        @note Llama a la API. Ya no se usa en el alta de usuarios: se llama al iniciar el
+         primer Checkout y desde `manage.py crear_clientes_stripe`. La llave de idempotencia
+         por usuario evita Customers duplicados si ambos coinciden.
         """
         if self.stripe_customer_id:
             return True
@@ -215,13 +215,11 @@ class Perfil(models.Model):
             return False
 
         try:
-            customer = stripe.Customer.create(
-                email=self.user.email or None,
-                name=f"{(self.user.first_name or '').strip()} {(self.user.last_name or '').strip()}".strip() or self.user.username,
-                metadata={"django_user_id": str(self.user.id)}
-            )
+            from billing.conexion import llamar
+            customer = llamar(stripe.Customer.create, **self.stripe_customer_params())
+            # Sólo si nadie lo guardó mientras tanto (misma llave => mismo Customer)
+            Perfil.objects.filter(pk=self.pk, stripe_customer_id__isnull=True).update(stripe_customer_id=customer.get("id"))
             self.stripe_customer_id = customer.get("id")
-            self.save(update_fields=["stripe_customer_id"])
             return True
         except Exception as e:  # pragma: no cover
             print(f"[Stripe] Error creando Customer: {e}")
@@ -234,6 +232,7 @@ class Perfil(models.Model):
         @param trial_days Días de prueba opcionales
         @return True si se inicia y sincroniza correctamente, False en caso contrario.
         @note Este método está pensado para flujos server-side sencillos (sin Checkout Session).
+         Llama a la API de Stripe.
         """
         if not self.ensure_stripe_customer():
             return False
@@ -250,19 +249,13 @@ class Perfil(models.Model):
             if trial_days and trial_days > 0:
                 params["trial_period_days"] = trial_days
 
-            subscription = stripe.Subscription.create(**params)
-
-            # Guardar datos base y marcar para completar pago en frontend si aplica
-            self.stripe_subscription_id = subscription.get("id")
-            self.stripe_price_id = price_id
-            self.stripe_status = subscription.get("status")
-            period = subscription.get("current_period_end")
-            self.stripe_current_period_end = timezone.datetime.fromtimestamp(period, tz=timezone.utc) if period else None
-            self.is_subscribed = self.has_active_subscription
-            self.save(update_fields=[
-                "stripe_subscription_id", "stripe_price_id", "stripe_status",
-                "stripe_current_period_end", "is_subscribed"
-            ])
+            from billing.conexion import llamar
+            subscription = llamar(stripe.Subscription.create, **params)
+
+            # El espejo local actualiza también los campos stripe_* de este perfil
+            from billing.espejo import guardar_suscripcion
+            guardar_suscripcion(subscription, timezone.now())
+            self.refresh_from_db()
             return True
         except Exception as e:  # pragma: no cover
             print(f"[Stripe] Error iniciando suscripción: {e}")
@@ -270,8 +263,10 @@ class Perfil(models.Model):
 
     def sync_subscription(self) -> bool:
         """
-        @brief Sincroniza campos locales con el estado real de Stripe.
+        @brief Sincroniza el espejo local con el estado real de Stripe (una suscripción).
         @return True si se sincronizó correctamente, False si no fue posible.
+        @note Llama a la API: no usar dentro de una petición de usuario; para todos los
+         perfiles existe `manage.py reconciliar_stripe`.
         """
         if not self._stripe_configured():
             return False
@@ -282,12 +277,10 @@ class Perfil(models.Model):
             return False
 
         try:
-            sub = stripe.Subscription.retrieve(self.stripe_subscription_id)
-            self.stripe_status = sub.get("status")
-            period = sub.get("current_period_end")
-            self.stripe_current_period_end = timezone.datetime.fromtimestamp(period, tz=timezone.utc) if period else None
-            self.is_subscribed = self.has_active_subscription
-            self.save(update_fields=["stripe_status", "stripe_current_period_end", "is_subscribed"])
+            from billing.conexion import llamar
+            from billing.espejo import guardar_suscripcion
+            guardar_suscripcion(llamar(stripe.Subscription.retrieve, self.stripe_subscription_id), timezone.now())
+            self.refresh_from_db()
             return True
         except Exception as e:  # pragma: no cover
             print(f"[Stripe] Error sincronizando suscripción: {e}")
@@ -307,13 +300,9 @@ def crear_perfil_automatico(sender, instance, created, **kwargs):
     @param kwargs Argumentos adicionales de la señal.
     """
     if created:
-        perfil, _ = Perfil.objects.get_or_create(user=instance)
-        # Intentar crear automáticamente el Customer en Stripe (opcional)
-        try:
-            perfil.ensure_stripe_customer()
-        except Exception as e:  # pragma: no cover
-            # No bloquear el alta del usuario si falla Stripe
-            print(f"[Stripe] Aviso: no se pudo crear Customer en alta de usuario: {e}")
+        # El Customer de Stripe se crea al iniciar el primer Checkout (o con
+        # `manage.py crear_clientes_stripe`), no dentro de la petición de registro.
+        Perfil.objects.get_or_create(user=instance)
 
 # ============================
 # Helper de compatibilidad
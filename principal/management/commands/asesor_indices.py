@@ -0,0 +1,349 @@
+"""
+@file asesor_indices.py
+@brief Comando `asesor_indices`: recorre las vistas, revisa el plan de cada consulta y sugiere índices.
+@details
+ Pide cada vista de `ESCENARIOS` con parámetros representativos (como un usuario con
+ sesión, dentro de una transacción que se revierte al final) y captura su SQL con
+ `QueryRecorder`. A cada SELECT distinto le corre `EXPLAIN QUERY PLAN` (SQLite) o
+ `EXPLAIN (FORMAT JSON)` (PostgreSQL) y marca:
+  - recorridos completos de tabla (`SCAN tabla` / `Seq Scan`),
+  - ordenamientos en memoria (`USE TEMP B-TREE FOR ORDER BY` / nodo `Sort`).
+ Para cada tabla marcada arma un índice compuesto: columnas comparadas por igualdad
+ (`=`, `IN`, `IS NOT NULL`), luego las del `ORDER BY` (o la primera de rango si no hay
+ orden); si la consulta sólo lee una o dos columnas más de esa tabla se agregan al
+ final para que el índice sea de cobertura. `IS NULL` no cuenta: en este esquema casi
+ siempre es el filtro de lápidas (`Publicacion.eliminada`) y casi todas las filas lo
+ cumplen. Se omiten los que ya cubre un índice existente y los de tablas fuera del
+ proyecto.
+
+ Con `--escribir` genera la migración `AddIndex` en la app de cada modelo (o en
+ `--directorio`) y muestra las líneas de `Meta.indexes` a agregar al modelo para que
+ `makemigrations` no la revierta.
+
+ Ejemplo:
+  python manage.py asesor_indices
+  python manage.py asesor_indices --usuario demo --escribir
+"""
+
+import json
+import re
+from collections import defaultdict
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, migrations, models, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from publicaciones.models import Favorito, Publicacion
+from vivienda.queryinspector import QueryRecorder, normalize_sql
+
+User = get_user_model()
+
+#: Vistas a recorrer: (nombre de URL, kwargs de la URL, query string). En los kwargs,
+#: "pk" se sustituye por una publicación disponible y "pk_propia" por una del usuario.
+ESCENARIOS = [
+    ("principal:home", {}, {}),
+    ("principal:resultados_busqueda", {}, {}),
+    ("principal:resultados_busqueda", {}, {"tipo_operacion": "venta", "ciudad": "Juárez", "precio_max": "3000000"}),
+    ("principal:resultados_busqueda", {}, {"direccion": "centro", "rec_min": "2", "page": "2"}),
+    ("principal:publicacion_detalle", {"pk": "pk"}, {}),
+    ("principal:mis_favoritos", {}, {}),
+    ("principal:recientes_html", {}, {}),
+    ("publicaciones:panel", {}, {}),
+    ("publicaciones:panel", {}, {"estatus": "disponible", "operacion": "venta"}),
+    ("publicaciones:editar", {"pk": "pk_propia"}, {}),
+]
+
+_ALIAS_RE = re.compile(r'"(\w+)"\s+(?:AS\s+)?([A-Z]\d+)\b')
+_FROM_RE = re.compile(r'\bFROM\s+"(\w+)"', re.IGNORECASE)
+_COLUMNA = r'(?:"(\w+)"|\b([A-Z]\d+))\."(\w+)"'
+_PREDICADO_RE = re.compile(_COLUMNA + r"\s*(=|IN\b|IS\s+NOT\b|IS\b|>=|<=|>|<|BETWEEN\b)", re.IGNORECASE)
+_ORDEN_RE = re.compile(_COLUMNA + r"\s*(ASC|DESC)?", re.IGNORECASE)
+_FIN_WHERE_RE = re.compile(r"\b(?:GROUP BY|ORDER BY|LIMIT|HAVING)\b", re.IGNORECASE)
+
+
+# ============================
+# Planes
+# ============================
+
+def _alias(sql: str) -> dict:
+    """
+    @return {alias o tabla: tabla} de la consulta.
+    """
+    tablas = {t: t for t in re.findall(r'"(\w+)"\.', sql)}
+    tablas.update({alias: tabla for tabla, alias in _ALIAS_RE.findall(sql)})
+    return tablas
+
+
+def _tabla_del_orden(sql: str, tablas: dict):
+    """
+    @return La tabla de la primera columna del `ORDER BY`, si la hay.
+    """
+    _, encontrado, orden = sql.rpartition(" ORDER BY ")
+    coincidencia = re.match(r"\s*" + _COLUMNA, orden) if encontrado else None
+    return tablas.get(coincidencia.group(1) or coincidencia.group(2)) if coincidencia else None
+
+
+def problemas_del_plan(sql: str, params) -> tuple[list, list[str]]:
+    """
+    @brief Corre el EXPLAIN de la consulta y ubica recorridos completos y ordenamientos.
+    @return (problemas, plan): problemas como `[(tipo, tabla)]` con tipo 'scan' o
+     'orden'; plan como líneas de texto para el reporte.
+    """
+    tablas = _alias(sql)
+    principal = (_FROM_RE.findall(sql) or [None])[0]
+    problemas, plan = [], []
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            datos = cursor.fetchone()[0]
+            if isinstance(datos, str):
+                datos = json.loads(datos)
+            pendientes = [datos[0]["Plan"]]
+            while pendientes:
+                nodo = pendientes.pop()
+                plan.append(f"{nodo['Node Type']} {nodo.get('Relation Name', '')}".strip())
+                if nodo["Node Type"] == "Seq Scan":
+                    problemas.append(("scan", nodo["Relation Name"]))
+                elif nodo["Node Type"] in ("Sort", "Incremental Sort") and principal:
+                    problemas.append(("orden", _tabla_del_orden(sql, tablas) or principal))
+                pendientes.extend(nodo.get("Plans", []))
+            return problemas, plan
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        for fila in cursor.fetchall():
+            detalle = fila[-1]
+            plan.append(detalle)
+            partes = detalle.split()
+            if partes[0] == "SCAN" and len(partes) > 1 and "CONSTANT ROW" not in detalle:
+                problemas.append(("scan", tablas.get(partes[1], partes[1])))
+            elif detalle.startswith("USE TEMP B-TREE FOR") and "ORDER BY" in detalle and principal:
+                problemas.append(("orden", _tabla_del_orden(sql, tablas) or principal))
+    return problemas, plan
+
+
+# ============================
+# Índices propuestos
+# ============================
+
+def _modelo_de_tabla(tabla: str):
+    base = str(Path(settings.BASE_DIR).resolve())
+    for modelo in apps.get_models():
+        if modelo._meta.db_table == tabla and str(Path(modelo._meta.app_config.path).resolve()).startswith(base):
+            return modelo
+    return None
+
+
+def columnas_de_indice(sql: str, tabla: str) -> tuple[list[tuple[str, bool]], int]:
+    """
+    @brief Columnas del índice compuesto para `tabla` según la consulta.
+    @return (`[(columna, descendente)]`, cuántas son de igualdad): igualdad, luego
+     orden (o el primer rango) y las columnas leídas si faltan una o dos para cubrir
+     la consulta.
+    """
+    tablas = _alias(sql)
+
+    def de_tabla(quoted, alias):
+        return tablas.get(quoted or alias) == tabla
+
+    arriba, _, resto = sql.partition(" WHERE ")
+    fin = _FIN_WHERE_RE.search(resto)
+    where = resto[:fin.start()] if fin else resto
+    igualdad, listas, rango = [], [], []
+    for quoted, alias, columna, operador in _PREDICADO_RE.findall(where):
+        if not de_tabla(quoted, alias):
+            continue
+        operador = " ".join(operador.upper().split())
+        if operador == "IS":
+            continue  # IS NULL: no reduce las filas
+        destino = igualdad if operador in ("=", "IS NOT") else listas if operador == "IN" else rango
+        if all(columna not in grupo for grupo in (igualdad, listas, rango)):
+            destino.append(columna)
+    if not igualdad and not listas and not rango:
+        return [], 0
+
+    _, encontrado, orden_sql = sql.rpartition(" ORDER BY ")
+    orden = []
+    if encontrado:
+        orden_sql = re.split(r"\b(?:LIMIT|OFFSET)\b", orden_sql)[0]
+        for quoted, alias, columna, sentido in _ORDEN_RE.findall(orden_sql):
+            if de_tabla(quoted, alias) and columna not in igualdad:
+                orden.append((columna, sentido.upper() == "DESC"))
+
+    # Con `IN` el índice ya no entrega las filas ordenadas: sólo sirve para filtrar
+    llave = [(c, False) for c in igualdad + listas]
+    if orden and not listas:
+        llave += orden
+    else:
+        llave += [(c, False) for c in rango[:1]]
+    usadas = {c for c, _ in llave}
+    leidas = []
+    for quoted, alias, columna in re.findall(_COLUMNA, arriba.partition(" FROM ")[0]):
+        if de_tabla(quoted, alias) and columna not in usadas and columna not in leidas:
+            leidas.append(columna)
+    if 0 < len(leidas) <= 2:
+        llave += [(c, False) for c in leidas]
+    return llave, len(igualdad) + len(listas)
+
+
+def _ya_cubierto(tabla: str, columnas: list[str], n_igualdad: int) -> bool:
+    with connection.cursor() as cursor:
+        restricciones = connection.introspection.get_constraints(cursor, tabla)
+    for info in restricciones.values():
+        existentes = info["columns"] or []
+        if not (info["index"] or info["unique"] or info["primary_key"]):
+            continue
+        if (
+            len(existentes) >= len(columnas)
+            and set(existentes[:n_igualdad]) == set(columnas[:n_igualdad])
+            and existentes[n_igualdad:len(columnas)] == columnas[n_igualdad:]
+        ):
+            return True
+    return False
+
+
+def proponer(sql: str, tabla: str):
+    """
+    @brief Índice de Django para `tabla` según la consulta, o None si no aplica o ya existe.
+    @return (modelo, models.Index) o None.
+    """
+    modelo = _modelo_de_tabla(tabla)
+    if modelo is None:
+        return None
+    llave, n_igualdad = columnas_de_indice(sql, tabla)
+    if not llave:
+        return None
+    columnas = [c for c, _ in llave]
+    if columnas[-1] == modelo._meta.pk.column and len(columnas) > 1:
+        columnas, llave = columnas[:-1], llave[:-1]  # la llave primaria ya va en todo índice
+    por_columna = {f.column: f.name for f in modelo._meta.concrete_fields}
+    if any(c not in por_columna for c in columnas):
+        return None
+    if _ya_cubierto(tabla, columnas, n_igualdad):
+        return None
+    campos = [("-" if desc else "") + por_columna[c] for c, desc in llave]
+    indice = models.Index(fields=campos)
+    indice.set_name_with_model(modelo)
+    return modelo, indice
+
+
+def escribir_migraciones(propuestas, directorio=None) -> list[str]:
+    """
+    @brief Escribe una migración `AddIndex` por app con los índices propuestos.
+    @param propuestas Lista de (modelo, models.Index).
+    @param directorio Carpeta de salida; por defecto la de migraciones de cada app.
+    @return Rutas de los archivos escritos.
+    """
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    por_app = defaultdict(list)
+    for modelo, indice in propuestas:
+        por_app[modelo._meta.app_label].append(
+            migrations.AddIndex(model_name=modelo._meta.model_name, index=indice)
+        )
+    rutas = []
+    for app_label, operaciones in por_app.items():
+        hojas = loader.graph.leaf_nodes(app_label)
+        numero = int(hojas[0][1][:4]) + 1 if hojas and hojas[0][1][:4].isdigit() else 1
+        migracion = migrations.Migration(f"{numero:04d}_indices_sugeridos", app_label)
+        migracion.dependencies = hojas
+        migracion.operations = operaciones
+        writer = MigrationWriter(migracion)
+        ruta = Path(directorio) / writer.filename if directorio else Path(writer.path)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta.write_text(writer.as_string())
+        rutas.append(str(ruta))
+    return rutas
+
+
+class Command(BaseCommand):
+    help = "Recorre las vistas, revisa el plan de sus consultas y sugiere índices (opcionalmente como migración)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuario", help="Usuario con el que se piden las vistas (por omisión el de más favoritos).")
+        parser.add_argument("--escribir", action="store_true", help="Genera la migración con los índices sugeridos.")
+        parser.add_argument("--directorio", help="Carpeta donde escribir la migración (por omisión la de la app).")
+
+    def handle(self, *args, **opts):
+        consultas = {}  # forma -> {"sql", "params", "vistas"}
+        with transaction.atomic():
+            cliente = Client()
+            contexto = self._contexto(opts["usuario"])
+            cliente.force_login(contexto["usuario"])
+            for nombre, kwargs, query in ESCENARIOS:
+                try:
+                    kwargs = {k: contexto[v] for k, v in kwargs.items()}
+                except KeyError:
+                    self.stdout.write(f"{nombre}: sin datos para {list(kwargs)}, se omite")
+                    continue
+                recorder = QueryRecorder()
+                with connection.execute_wrapper(recorder):
+                    respuesta = cliente.get(reverse(nombre, kwargs=kwargs), query)
+                selects = [q for q in recorder.queries if q["sql"].lstrip().upper().startswith("SELECT")]
+                self.stdout.write(f"{nombre} {query or ''}: HTTP {respuesta.status_code}, {recorder.count} consultas")
+                for q in selects:
+                    forma = normalize_sql(q["sql"])
+                    consultas.setdefault(forma, {"sql": q["sql"], "params": q["params"], "vistas": set()})
+                    consultas[forma]["vistas"].add(nombre)
+
+            propuestas = {}  # (modelo, campos) -> (modelo, índice, vistas)
+            for forma, q in consultas.items():
+                problemas, plan = problemas_del_plan(q["sql"], q["params"])
+                if not problemas:
+                    continue
+                self.stdout.write(self.style.WARNING(f"\n{', '.join(sorted(q['vistas']))}: {forma[:200]}"))
+                for linea in plan:
+                    self.stdout.write(f"    {linea}")
+                for _, tabla in dict.fromkeys(problemas):
+                    propuesta = proponer(q["sql"], tabla)
+                    if propuesta is None:
+                        continue
+                    modelo, indice = propuesta
+                    clave = (modelo, tuple(indice.fields))
+                    _, _, vistas = propuestas.setdefault(clave, (modelo, indice, set()))
+                    vistas.update(q["vistas"])
+            transaction.set_rollback(True)
+
+        if not propuestas:
+            self.stdout.write(self.style.SUCCESS("\nSin índices que sugerir."))
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING("\nÍndices sugeridos:"))
+        for modelo, indice, vistas in propuestas.values():
+            self.stdout.write(
+                f"  {modelo._meta.label}: models.Index(fields={list(indice.fields)!r}, name={indice.name!r})"
+                f"  <- {', '.join(sorted(vistas))}"
+            )
+        if opts["escribir"]:
+            for ruta in escribir_migraciones([(m, i) for m, i, _ in propuestas.values()], opts["directorio"]):
+                self.stdout.write(self.style.SUCCESS(f"Migración escrita en {ruta}"))
+            self.stdout.write("Agrega los índices a Meta.indexes de cada modelo para que makemigrations no los quite.")
+
+    def _contexto(self, username):
+        """
+        @brief Usuario y publicaciones de ejemplo para los kwargs de `ESCENARIOS`.
+        """
+        if username:
+            usuario = User.objects.filter(username=username).first()
+            if usuario is None:
+                raise CommandError(f"No existe el usuario {username!r}.")
+        else:
+            fila = Favorito.objects.values("usuario").annotate(n=Count("id")).order_by("-n").first()
+            usuario = (
+                User.objects.filter(pk=fila["usuario"]).first() if fila
+                else User.objects.filter(publicaciones__isnull=False).first()
+            )
+            # Sin datos: un usuario temporal (la transacción se revierte)
+            usuario = usuario or User.objects.create_user(username="asesor_indices", password=None)
+        contexto = {"usuario": usuario}
+        disponible = Publicacion.objects.filter(estatus="disponible").values_list("pk", flat=True).first()
+        propia = Publicacion.objects.filter(usuario=usuario).values_list("pk", flat=True).first()
+        if disponible:
+            contexto["pk"] = disponible
+        if propia:
+            contexto["pk_propia"] = propia
+        return contexto
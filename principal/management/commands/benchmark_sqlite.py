@@ -0,0 +1,179 @@
+"""
+@file benchmark_sqlite.py
+@brief Comando `benchmark_sqlite`: lecturas y escrituras concurrentes sobre SQLite, antes y después de los ajustes.
+@details
+ Crea una base temporal con una tabla parecida a la de publicaciones y corre, durante
+ `--duracion` segundos, hilos lectores (rangos de filas, como el listado) y escritores
+ (leer y actualizar un contador en una transacción, como `toggle_favorito`), cada uno
+ con su propia conexión, en dos modos:
+  - `antes`: lo que usaba Django por omisión (journal DELETE, `BEGIN` diferido).
+  - `despues`: `SQLITE_PRAGMAS` de settings, `BEGIN IMMEDIATE` y reintento con
+    espera ante "database is locked" (como `vivienda.sqlite.reintentar_bloqueos`).
+ Reporta operaciones por segundo, errores por candado y latencias p50/p95/p99.
+
+ Ejemplo:
+  python manage.py benchmark_sqlite
+  python manage.py benchmark_sqlite --lectores 16 --escritores 4 --duracion 10 --salida bench/sqlite.json
+"""
+
+import json
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from vivienda.sqlite import es_bloqueo, init_command
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+class _Modo:
+    """
+    @brief Cómo abre conexiones y transacciones cada modo del benchmark.
+    """
+
+    def __init__(self, nombre, pragmas, inicio, reintentos):
+        self.nombre = nombre
+        self.pragmas = pragmas
+        self.inicio = inicio
+        self.reintentos = reintentos
+
+    def conectar(self, ruta):
+        conexion = sqlite3.connect(ruta, isolation_level=None, check_same_thread=False)
+        if self.pragmas:
+            conexion.executescript(init_command(self.pragmas) + ";")
+        return conexion
+
+
+class Command(BaseCommand):
+    help = "Mide lecturas/escrituras concurrentes en SQLite con la configuración por omisión y con la de settings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lectores", type=int, default=8)
+        parser.add_argument("--escritores", type=int, default=4)
+        parser.add_argument("--duracion", type=float, default=5.0, help="Segundos por modo (default 5).")
+        parser.add_argument("--filas", type=int, default=20000)
+        parser.add_argument("--salida", help="Guarda el resultado en este JSON.")
+
+    def handle(self, *args, **opts):
+        modos = [
+            _Modo("antes", {}, "BEGIN", 0),
+            _Modo("despues", settings.SQLITE_PRAGMAS, "BEGIN IMMEDIATE", getattr(settings, "SQLITE_REINTENTOS", 3)),
+        ]
+        resultados = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for modo in modos:
+                ruta = str(Path(tmp) / f"{modo.nombre}.sqlite3")
+                self._preparar(modo, ruta, opts["filas"])
+                resultados[modo.nombre] = self._correr(modo, ruta, opts)
+                self._reportar(modo.nombre, resultados[modo.nombre])
+
+        antes, despues = resultados["antes"], resultados["despues"]
+        for tipo in ("lecturas", "escrituras"):
+            if antes[tipo]["por_segundo"]:
+                factor = despues[tipo]["por_segundo"] / antes[tipo]["por_segundo"]
+                self.stdout.write(f"{tipo}: x{factor:.2f}")
+        if opts["salida"]:
+            Path(opts["salida"]).parent.mkdir(parents=True, exist_ok=True)
+            Path(opts["salida"]).write_text(json.dumps(resultados, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Resultado guardado en {opts['salida']}"))
+
+    def _preparar(self, modo, ruta, filas):
+        conexion = modo.conectar(ruta)
+        conexion.execute("CREATE TABLE pub (id INTEGER PRIMARY KEY, likes INTEGER NOT NULL, titulo TEXT NOT NULL)")
+        conexion.execute("BEGIN")
+        conexion.executemany(
+            "INSERT INTO pub (likes, titulo) VALUES (0, ?)", ((f"Casa {i} " * 8,) for i in range(filas)),
+        )
+        conexion.execute("COMMIT")
+        conexion.close()
+
+    def _correr(self, modo, ruta, opts):
+        fin = time.monotonic() + opts["duracion"]
+        filas = opts["filas"]
+        lock = threading.Lock()
+        datos = {t: {"latencias": [], "errores": 0, "reintentos": 0} for t in ("lecturas", "escrituras")}
+
+        def leer(conexion):
+            desde = random.randint(1, filas - 50)
+            conexion.execute("SELECT id, likes, titulo FROM pub WHERE id BETWEEN ? AND ?", (desde, desde + 50)).fetchall()
+
+        def escribir(conexion):
+            pk = random.randint(1, filas)
+            conexion.execute(modo.inicio)
+            try:
+                conexion.execute("SELECT likes FROM pub WHERE id = ?", (pk,)).fetchone()
+                conexion.execute("UPDATE pub SET likes = likes + 1 WHERE id = ?", (pk,))
+                conexion.execute("COMMIT")
+            except BaseException:
+                if conexion.in_transaction:
+                    conexion.execute("ROLLBACK")
+                raise
+
+        def trabajar(tipo, operacion):
+            conexion = modo.conectar(ruta)
+            propios = {"latencias": [], "errores": 0, "reintentos": 0}
+            while time.monotonic() < fin:
+                inicio = time.perf_counter()
+                for intento in range(modo.reintentos + 1):
+                    try:
+                        operacion(conexion)
+                    except sqlite3.OperationalError as e:
+                        if not es_bloqueo(e):
+                            raise
+                        if intento == modo.reintentos:
+                            propios["errores"] += 1
+                            break
+                        propios["reintentos"] += 1
+                        time.sleep(random.uniform(0, 0.05 * 2 ** intento))
+                        continue
+                    propios["latencias"].append(time.perf_counter() - inicio)
+                    break
+            conexion.close()
+            with lock:
+                for clave in ("errores", "reintentos"):
+                    datos[tipo][clave] += propios[clave]
+                datos[tipo]["latencias"] += propios["latencias"]
+
+        hilos = [threading.Thread(target=trabajar, args=("lecturas", leer)) for _ in range(opts["lectores"])]
+        hilos += [threading.Thread(target=trabajar, args=("escrituras", escribir)) for _ in range(opts["escritores"])]
+        inicio = time.monotonic()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.monotonic() - inicio
+
+        resultado = {}
+        for tipo, d in datos.items():
+            lat = d["latencias"]
+            resultado[tipo] = {
+                "operaciones": len(lat),
+                "por_segundo": round(len(lat) / duracion, 1),
+                "errores_candado": d["errores"],
+                "reintentos": d["reintentos"],
+                "p50_ms": round(_percentil(lat, 50) * 1000, 2),
+                "p95_ms": round(_percentil(lat, 95) * 1000, 2),
+                "p99_ms": round(_percentil(lat, 99) * 1000, 2),
+                "media_ms": round(statistics.fmean(lat) * 1000, 2) if lat else 0.0,
+            }
+        return resultado
+
+    def _reportar(self, nombre, resultado):
+        self.stdout.write(self.style.MIGRATE_HEADING(nombre))
+        for tipo, r in resultado.items():
+            self.stdout.write(
+                f"  {tipo:<10} {r['por_segundo']:>9}/s  errores={r['errores_candado']:<5} "
+                f"reintentos={r['reintentos']:<5} p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms"
+            )
@@ -0,0 +1,102 @@
+"""
+@file vendorizar_estaticos.py
+@brief Descarga las librerías de terceros para servirlas desde la app.
+@details
+ Para cada librería de `vivienda.estaticos.VENDOR` descarga sus archivos a
+ `principal/static/vendor/<nombre>/`. De Font Awesome sólo se conserva:
+  - una hoja (`css/iconos.min.css`) con la base y los íconos que aparecen en las
+    plantillas, JS y vistas del proyecto (más los de `--icono`);
+  - las fuentes que esa hoja referencia; si `fontTools` está instalado, recortadas a
+    los glifos de esos íconos.
+
+ Se corre al actualizar una librería o al usar íconos nuevos, y se versiona el
+ resultado; `collectstatic` luego agrega hash y genera `.gz`/`.br`.
+
+ Ejemplo:
+  python manage.py vendorizar_estaticos
+  python manage.py vendorizar_estaticos --solo fontawesome --icono eye
+"""
+
+import posixpath
+import re
+import urllib.request
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from vivienda.estaticos import VENDOR, iconos_usados, recortar_css, vendorizado
+
+#: Carpeta `static/` donde se guardan las librerías
+DESTINO = Path(settings.BASE_DIR) / "principal" / "static" / "vendor"
+
+_URL_CSS = re.compile(r"url\(\s*['\"]?([^'\")?#]+)")
+
+
+def _descargar(url: str) -> bytes:
+    try:
+        with urllib.request.urlopen(url, timeout=30) as resp:
+            return resp.read()
+    except OSError as e:
+        raise CommandError(f"No se pudo descargar {url}: {e}") from e
+
+
+class Command(BaseCommand):
+    help = "Descarga Leaflet y Font Awesome a principal/static/vendor (Font Awesome recortado a los íconos usados)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--solo", action="append", choices=list(VENDOR), help="Librería a descargar (repetible).")
+        parser.add_argument("--icono", action="append", default=[],
+                            help="Ícono extra sin el prefijo fa- (p.ej. usado en JS dinámico). Repetible.")
+
+    def handle(self, *args, **opts):
+        for nombre in opts["solo"] or VENDOR:
+            info = VENDOR[nombre]
+            carpeta = DESTINO / nombre
+            for archivo in info["archivos"]:
+                self._guardar(carpeta / archivo, _descargar(info["origen"] + archivo))
+            if nombre == "fontawesome":
+                self._fontawesome(info, carpeta, set(opts["icono"]))
+            self.stdout.write(self.style.SUCCESS(f"{nombre} {info['version']} -> {carpeta}"))
+        vendorizado.cache_clear()
+
+    def _guardar(self, ruta: Path, datos: bytes):
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta.write_bytes(datos)
+        self.stdout.write(f"  {ruta.relative_to(DESTINO)} ({len(datos) / 1024:.1f} KiB)")
+
+    def _fontawesome(self, info, carpeta: Path, extra: set[str]):
+        completo = _descargar(info["origen"] + info["css_cdn"]).decode("utf-8")
+        iconos = iconos_usados(Path(settings.BASE_DIR)) | extra
+        css, codigos = recortar_css(completo, iconos)
+        self.stdout.write(
+            f"  {len(codigos)} íconos usados; hoja {len(completo) / 1024:.0f} KiB -> {len(css) / 1024:.1f} KiB"
+        )
+        self._guardar(carpeta / info["css"], css.encode("utf-8"))
+
+        # Fuentes referenciadas por la hoja, relativas a su carpeta (`../webfonts/...`)
+        base_css = posixpath.dirname(info["css"])
+        for ref in sorted(set(_URL_CSS.findall(css))):
+            relativa = posixpath.normpath(posixpath.join(base_css, ref))
+            ruta = carpeta / relativa
+            self._guardar(ruta, _descargar(info["origen"] + relativa))
+            self._recortar_fuente(ruta, codigos)
+
+    def _recortar_fuente(self, ruta: Path, codigos: set[int]):
+        try:
+            from fontTools import subset
+            from fontTools.ttLib import TTFont
+        except ImportError:
+            return
+        opciones = subset.Options()
+        opciones.flavor = "woff2" if ruta.suffix == ".woff2" else None
+        try:
+            fuente = TTFont(ruta)
+            subsetter = subset.Subsetter(opciones)
+            subsetter.populate(unicodes=codigos)
+            subsetter.subset(fuente)
+            fuente.save(ruta)
+        except Exception as e:  # woff2 sin Brotli, fuente sin glifos usados, etc.
+            self.stderr.write(f"  {ruta.name}: se deja completa ({e})")
+            return
+        self.stdout.write(f"  {ruta.name} recortada ({ruta.stat().st_size / 1024:.1f} KiB)")
@@ -51,3 +51,38 @@ class Propiedad(models.Model):
         @return Título de la propiedad.
         """
         return self.titulo
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Señales: invalidar la lista de recientes en caché (ver principal/views.py)
+# ──────────────────────────────────────────────────────────────────────────────
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+def _invalidar_recientes(pub_id=None):
+    from principal.views import invalidar_recientes
+    # Al confirmar: antes, una petición concurrente volvería a guardar la lista vieja
+    transaction.on_commit(lambda: invalidar_recientes(pub_id))
+
+
+@receiver([post_save, post_delete], sender="publicaciones.Publicacion")
+@receiver([post_save, post_delete], sender="cuentas.Perfil")
+def _recientes_publicacion(sender, **kwargs):
+    _invalidar_recientes()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def _recientes_vendedor(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    _invalidar_recientes()
+
+
+@receiver([post_save, post_delete], sender="publicaciones.FotoPublicacion")
+@receiver([post_save, post_delete], sender="publicaciones.Favorito")
+def _recientes_relacionado(sender, instance, **kwargs):
+    _invalidar_recientes(instance.publicacion_id)
@@ -0,0 +1,40 @@
+# principal/templatetags/vendorizados.py
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from vivienda.estaticos import ruta_vendor, url_cdn, vendorizado
+
+register = template.Library()
+
+
+def _url(nombre, tipo):
+    ruta = ruta_vendor(nombre, tipo)
+    if vendorizado(ruta):
+        return static(ruta), False
+    return url_cdn(nombre, tipo), True
+
+
+@register.simple_tag
+def css_vendor(nombre):
+    """
+    Hoja de estilos de una librería de `vivienda.estaticos.VENDOR`: la copia local
+    (con hash, servida por WhiteNoise) o, si aún no se descargó, la del CDN.
+    Uso: {% css_vendor "leaflet" %}
+    """
+    url, cdn = _url(nombre, "css")
+    if cdn:
+        return format_html('<link rel="stylesheet" href="{}" crossorigin="">', url)
+    return format_html('<link rel="stylesheet" href="{}">', url)
+
+
+@register.simple_tag
+def js_vendor(nombre):
+    """
+    Script de una librería de `vivienda.estaticos.VENDOR` (local o CDN).
+    Uso: {% js_vendor "leaflet" %}
+    """
+    url, cdn = _url(nombre, "js")
+    if cdn:
+        return format_html('<script src="{}" crossorigin=""></script>', url)
+    return format_html('<script src="{}"></script>', url)
@@ -1,3 +1,866 @@
-from django.test import TestCase
+"""
+@file tests.py
+@brief Pruebas de la aplicación `principal`.
+@details
+ Verifica que las vistas de listado respeten su presupuesto de consultas SQL
+ (`settings.QUERY_BUDGETS`) y no introduzcan patrones N+1 al crecer el número de tarjetas.
+"""
 
-# Create your tests here.
+import asyncio
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError, connection, connections
+from django.template import Context, Template
+from django.http import Http404
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import include, path, reverse
+
+from principal import views_async
+from principal.urls import construir_urlpatterns
+from principal.views import LLAVE_RECIENTES, recientes_en_cache
+from publicaciones.models import Favorito, FotoPublicacion, Publicacion
+from vivienda import urls as urls_proyecto
+from vivienda.cache import CacheDosNiveles, obtener_o_calcular
+from vivienda.estaticos import iconos_usados, recortar_css, vendorizado
+from vivienda.media import servir_media
+from vivienda.eventos import Bus, bus
+from vivienda.metrics import MetricsStore, store
+from vivienda.replicas import LLAVE_SESION, RouterReplicas, lectura_en_replica, salud
+from vivienda.queryinspector import QueryBudgetExceeded, QueryRecorder, normalize_sql
+from vivienda.sqlite import init_command, reintentar_bloqueos
+
+User = get_user_model()
+
+#: URLconf de pruebas: el proyecto completo con las vistas asíncronas de `principal`
+urlpatterns = [
+    path("", include((construir_urlpatterns(views_async), "principal"))),
+    *[u for u in urls_proyecto.urlpatterns if getattr(u, "namespace", None) != "principal"],
+]
+
+
+def crear_usuario(username, **extra):
+    """
+    @brief Crea un usuario con perfil completo (para no ser redirigido a completar perfil).
+    """
+    user = User.objects.create_user(
+        username=username, email=f"{username}@example.com", password="x",
+        first_name="Nombre", last_name="Apellido", **extra,
+    )
+    user.perfil.rfc = f"GODE5612{user.pk:02d}GR8"[:13]
+    user.perfil.whatsapp = "6561234567"
+    user.perfil.save()
+    return user
+
+
+def crear_publicaciones(usuario, n, fotos=2):
+    pubs = []
+    for i in range(n):
+        pub = Publicacion.objects.create(
+            usuario=usuario, titulo=f"Casa {i}", precio=1_000_000 + i, tipo_operacion="venta",
+            calle="Calle", colonia="Centro", ciudad="Juárez", estado="Chihuahua", codigo_postal="32000",
+            latitud=31.7, longitud=-106.4,
+        )
+        for j in range(fotos):
+            FotoPublicacion.objects.create(publicacion=pub, imagen=f"publicaciones/test/{i}-{j}.jpg", orden=j)
+        pubs.append(pub)
+    return pubs
+
+
+@override_settings(QUERY_INSPECTOR_ENABLED=True, QUERY_INSPECTOR_STRICT=True)
+class PresupuestoConsultasTests(TestCase):
+    """
+    @class PresupuestoConsultasTests
+    @brief Las vistas públicas no deben crecer en consultas con el número de tarjetas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = crear_usuario("vendedor")
+        cls.visitante = crear_usuario("visitante")
+        cls.pubs = crear_publicaciones(cls.vendedor, 14)
+        for pub in cls.pubs[:5]:
+            Favorito.objects.create(usuario=cls.visitante, publicacion=pub)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.visitante)
+
+    def test_home(self):
+        self.assertEqual(self.client.get(reverse("principal:home")).status_code, 200)
+
+    def test_resultados_busqueda(self):
+        r = self.client.get(reverse("principal:resultados_busqueda"), {"direccion": "Casa"})
+        self.assertEqual(r.status_code, 200)
+
+    def test_publicacion_detalle(self):
+        r = self.client.get(reverse("principal:publicacion_detalle", args=[self.pubs[0].pk]))
+        self.assertEqual(r.status_code, 200)
+
+    def test_mis_favoritos(self):
+        self.assertEqual(self.client.get(reverse("principal:mis_favoritos")).status_code, 200)
+
+    @override_settings(QUERY_BUDGETS={"principal:home": 1})
+    def test_presupuesto_excedido_falla(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse("principal:home"))
+
+
+class QueryInspectorTests(TestCase):
+    """
+    @class QueryInspectorTests
+    @brief Normalización de SQL y agrupación de consultas repetidas.
+    """
+
+    def test_normalize_sql(self):
+        a = normalize_sql("SELECT * FROM t WHERE id IN (1, 2, 3) AND nombre = 'x'")
+        b = normalize_sql("SELECT *  FROM t WHERE id IN (%s, %s) AND nombre = %s")
+        self.assertEqual(a, b)
+
+    def test_detecta_consulta_repetida(self):
+        vendedor = crear_usuario("otro")
+        pubs = crear_publicaciones(vendedor, 4, fotos=1)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for pub in Publicacion.objects.filter(pk__in=[p.pk for p in pubs]):
+                list(pub.fotos.all())
+        repetidas = recorder.repeated(3)
+        self.assertEqual(len(repetidas), 1)
+        self.assertEqual(repetidas[0]["count"], 4)
+        self.assertIn("principal/tests.py", repetidas[0]["site"])
+
+
+class ConditionalGetTests(TestCase):
+    """
+    @class ConditionalGetTests
+    @brief Detalle, recientes y resultados responden 304 mientras nada cambie.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = crear_usuario("vendedor")
+        cls.comprador = crear_usuario("comprador")
+        cls.pubs = crear_publicaciones(cls.vendedor, 3)
+
+    def setUp(self):
+        cache.clear()
+
+    def _revalidar(self, url):
+        r = self.client.get(url)
+        self.assertEqual(r.status_code, 200)
+        return r, self.client.get(url, HTTP_IF_NONE_MATCH=r["ETag"])
+
+    def test_304_sin_cambios(self):
+        self.client.force_login(self.comprador)
+        for url in (
+            reverse("principal:publicacion_detalle", args=[self.pubs[0].pk]),
+            reverse("principal:recientes_html"),
+            reverse("principal:resultados_busqueda") + "?ciudad=Juárez",
+        ):
+            r, r2 = self._revalidar(url)
+            self.assertEqual(r2.status_code, 304, url)
+            self.assertIn("Cookie", r2["Vary"])
+            self.assertIn("private", r2["Cache-Control"])
+
+    def test_304_no_ejecuta_la_vista(self):
+        url = reverse("principal:resultados_busqueda")
+        r = self.client.get(url)
+        with self.assertNumQueries(1):  # sólo las generaciones (anónimo)
+            r2 = self.client.get(url, HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(r2.status_code, 304)
+
+    def test_cambio_en_publicacion_invalida(self):
+        url = reverse("principal:publicacion_detalle", args=[self.pubs[0].pk])
+        r = self.client.get(url)
+        pub = Publicacion.objects.get(pk=self.pubs[0].pk)
+        pub.precio += 1
+        pub.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=r["ETag"]).status_code, 200)
+
+    def test_favorito_del_usuario_invalida(self):
+        self.client.force_login(self.comprador)
+        url = reverse("principal:resultados_busqueda")
+        r = self.client.get(url)
+        Favorito.objects.create(usuario=self.comprador, publicacion=self.pubs[1])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=r["ETag"]).status_code, 200)
+
+    def test_etag_distinto_por_usuario(self):
+        url = reverse("principal:publicacion_detalle", args=[self.pubs[0].pk])
+        self.client.force_login(self.comprador)
+        etag = self.client.get(url)["ETag"]
+        self.client.force_login(self.vendedor)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(EVENTOS_COALESCE_SEGUNDOS=0.01)
+class BusEventosTests(SimpleTestCase):
+    """
+    @class BusEventosTests
+    @brief El bus agrupa actualizaciones rápidas y acepta publicaciones desde otros hilos.
+    """
+
+    def test_agrupa_likes(self):
+        async def escenario():
+            b = Bus()
+            sus = b.suscribir()
+            for pub_id, delta in ((1, 1), (1, 1), (2, 1), (2, -1)):
+                b.publicar_like(pub_id, delta)
+            evento = await asyncio.wait_for(sus.cola.get(), 1)
+            self.assertEqual(evento, ("likes", {"1": 2}))
+            self.assertTrue(sus.cola.empty())
+
+        asyncio.run(escenario())
+
+    def test_publicar_desde_otro_hilo(self):
+        async def escenario():
+            b = Bus()
+            sus = b.suscribir()
+            hilo = threading.Thread(target=b.publicar_publicacion, args=(7, {"id": 7}))
+            hilo.start()
+            hilo.join()
+            self.assertEqual(await asyncio.wait_for(sus.cola.get(), 1), ("publicaciones", [{"id": 7}]))
+
+        asyncio.run(escenario())
+
+    def test_cola_llena_cierra_conexion(self):
+        async def escenario():
+            b = Bus()
+            sus = b.suscribir()
+            for _ in range(sus.cola.maxsize + 1):
+                sus.entregar(("likes", {}))
+            self.assertTrue(sus.desbordada)
+            ultimo = None
+            while not sus.cola.empty():
+                ultimo = sus.cola.get_nowait()
+            self.assertIsNone(ultimo)
+
+        asyncio.run(escenario())
+
+
+@override_settings(EVENTOS_COALESCE_SEGUNDOS=0.01)
+class EventosViewTests(TestCase):
+    """
+    @class EventosViewTests
+    @brief El endpoint SSE transmite bajo ASGI y se desactiva bajo WSGI.
+    """
+
+    def test_wsgi_responde_204(self):
+        self.assertEqual(self.client.get(reverse("principal:eventos")).status_code, 204)
+
+    async def test_stream(self):
+        r = await self.async_client.get(reverse("principal:eventos"))
+        self.assertEqual(r["Content-Type"], "text/event-stream")
+        stream = r.streaming_content
+        self.assertTrue((await anext(stream)).startswith(b"retry:"))
+        bus.publicar_like(3, 1)
+        chunk = await asyncio.wait_for(anext(stream), 1)
+        self.assertEqual(chunk, b'event: likes\ndata: {"3":1}\n\n')
+
+        # El servidor ASGI cancela la tarea al desconectarse el cliente
+        pendiente = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pendiente.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pendiente
+        self.assertEqual(bus.conexiones, 0)
+
+
+@override_settings(ROOT_URLCONF="principal.tests", QUERY_INSPECTOR_ENABLED=True, QUERY_INSPECTOR_STRICT=True)
+class VistasAsyncTests(TestCase):
+    """
+    @class VistasAsyncTests
+    @brief Las vistas asíncronas responden igual que las síncronas y respetan el presupuesto.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = crear_usuario("vendedor")
+        cls.visitante = crear_usuario("visitante")
+        cls.pubs = crear_publicaciones(cls.vendedor, 14)
+        for pub in cls.pubs[:5]:
+            Favorito.objects.create(usuario=cls.visitante, publicacion=pub)
+
+    def setUp(self):
+        cache.clear()
+        self.async_client.force_login(self.visitante)
+
+    async def test_home(self):
+        r = await self.async_client.get(reverse("principal:home"))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.context["recientes"]), 6)
+
+    async def test_recientes(self):
+        r = await self.async_client.get(reverse("principal:recientes_html"))
+        self.assertContains(r, 'class="home-card"', count=6)
+
+    async def test_resultados_busqueda(self):
+        r = await self.async_client.get(reverse("principal:resultados_busqueda"), {"direccion": "Casa"})
+        self.assertEqual(r.context["total"], 14)
+        self.assertEqual(len(r.context["page_obj"].object_list), 12)
+        self.assertEqual(len(r.context["liked_ids"]), 3)  # favoritas 0-4; la página 1 trae de la 13 a la 2
+
+    async def test_resultados_sin_acentos_y_pagina_fuera_de_rango(self):
+        r = await self.async_client.get(reverse("principal:resultados_busqueda"), {"direccion": "juarez", "page": 9})
+        self.assertEqual(r.context["total"], 14)
+        self.assertEqual(r.context["page_obj"].number, 2)
+        self.assertEqual(len(r.context["page_obj"].object_list), 2)
+
+    async def test_publicacion_detalle(self):
+        url = reverse("principal:publicacion_detalle", args=[self.pubs[0].pk])
+        r = await self.async_client.get(url)
+        self.assertTrue(r.context["liked"])
+        r2 = await self.async_client.get(url, headers={"If-None-Match": r["ETag"]})
+        self.assertEqual(r2.status_code, 304)
+
+    async def test_mis_favoritos(self):
+        r = await self.async_client.get(reverse("principal:mis_favoritos"))
+        self.assertEqual(len(r.context["publicaciones"]), 5)
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "l2": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "l2"},
+})
+class CacheDosNivelesTests(SimpleTestCase):
+    """
+    @class CacheDosNivelesTests
+    @brief Nivel 1 por proceso, single-flight y refresco anticipado.
+    """
+
+    def setUp(self):
+        caches["l2"].clear()
+        self.cache = CacheDosNiveles("", {"OPTIONS": {"COMPARTIDO": "l2", "L1_TIMEOUT": 0.2}})
+
+    def test_nivel_1_sirve_sin_ir_al_compartido(self):
+        self.cache.set("a:1", {"x": 1})
+        caches["l2"].delete("a:1")
+        self.assertEqual(self.cache.get("a:1"), {"x": 1})
+        time.sleep(0.25)
+        self.assertIsNone(self.cache.get("a:1"))
+
+    def test_borrar_llega_a_ambos_niveles(self):
+        self.cache.set_many({"a:1": 1, "a:2": 2})
+        self.cache.delete("a:1")
+        self.assertEqual(self.cache.get_many(["a:1", "a:2"]), {"a:2": 2})
+        self.assertFalse(caches["l2"].has_key("a:1"))
+
+    def test_single_flight(self):
+        llamadas = []
+        inicio = threading.Barrier(8)
+
+        def calcular():
+            llamadas.append(1)
+            time.sleep(0.2)
+            return "valor"
+
+        def lector(resultados):
+            inicio.wait()
+            resultados.append(obtener_o_calcular("caliente:1", calcular, 60, cache=self.cache))
+
+        resultados = []
+        hilos = [threading.Thread(target=lector, args=(resultados,)) for _ in range(8)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(resultados, ["valor"] * 8)
+
+    def test_refresco_anticipado(self):
+        self.cache.set("caliente:2", {"valor": "viejo", "delta": 10.0, "expira": time.time() + 1})
+        with mock.patch("vivienda.cache.random.random", return_value=0.5):
+            self.assertEqual(obtener_o_calcular("caliente:2", lambda: "nuevo", 60, beta=0, cache=self.cache), "viejo")
+            # -10 * ln(0.5) ≈ 6.9 s de adelanto > 1 s restante
+            self.assertEqual(obtener_o_calcular("caliente:2", lambda: "nuevo", 60, beta=1, cache=self.cache), "nuevo")
+
+    def test_metricas_por_prefijo(self):
+        self.cache.set("tarjeta:1", 1)
+        self.cache.get("tarjeta:1")
+        self.cache.get("tarjeta:2")
+        counters = {(n, labels): v for (n, labels), v in store._counters.items() if n == "cache_requests_total"}
+        self.assertGreaterEqual(counters[("cache_requests_total", (("prefix", "tarjeta"), ("result", "l1")))], 1)
+        self.assertGreaterEqual(counters[("cache_requests_total", (("prefix", "tarjeta"), ("result", "miss")))], 1)
+
+    def test_candado_entre_workers(self):
+        with tempfile.TemporaryDirectory() as d, override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "archivos": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": d},
+        }):
+            # Dos workers: cada uno con su nivel 1, el mismo directorio compartido
+            opciones = {"COMPARTIDO": "archivos", "CANDADOS": Path(d, "candados")}
+            a, b = (CacheDosNiveles("", {"OPTIONS": opciones}) for _ in range(2))
+            token_a = a.tomar_candado("caliente:3", 5)
+            self.assertTrue(token_a)
+            self.assertIsNone(b.tomar_candado("caliente:3", 5))
+            self.assertTrue(Path(d, "candados").is_dir())
+            a.soltar_candado("caliente:3", token_a)
+            token_b = b.tomar_candado("caliente:3", 5)
+            self.assertTrue(token_b)
+            # Dueño caído: el candado vence solo
+            self.assertIsNone(a.tomar_candado("caliente:3", 60))
+            token_a = a.tomar_candado("caliente:3", 0)
+            self.assertTrue(token_a)
+            # El dueño anterior ya no puede soltar el candado de quien lo reemplazó
+            b.soltar_candado("caliente:3", token_b)
+            self.assertIsNone(b.tomar_candado("caliente:3", 60))
+            a.soltar_candado("caliente:3", token_a)
+            self.assertTrue(b.tomar_candado("caliente:3", 60))
+            a.clear()
+            self.assertTrue(Path(d, "candados").is_dir())
+
+
+class MetricsStoreTests(SimpleTestCase):
+    """
+    @class MetricsStoreTests
+    @brief Los archivos de workers terminados pasan al agregado y los contadores no bajan.
+    """
+
+    def setUp(self):
+        self.dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+
+    def _volcado(self, nombre, valor):
+        datos = {"counters": [["http_requests_total", [["view", "home"]], valor]], "histograms": []}
+        (self.dir / nombre).write_text(json.dumps(datos), encoding="utf-8")
+
+    def _total(self, metricas):
+        counters, _ = metricas.collect()
+        return counters.get(("http_requests_total", (("view", "home"),)), 0)
+
+    def test_worker_muerto_pasa_al_agregado(self):
+        muerto = subprocess.Popen([sys.executable, "-c", ""])
+        muerto.wait()
+        self._volcado(f"{muerto.pid}.json", 5)
+        metricas = MetricsStore(self.dir)
+        self.assertEqual(self._total(metricas), 5)
+        self.assertFalse((self.dir / f"{muerto.pid}.json").exists())
+        self.assertTrue((self.dir / MetricsStore.RETIRED_FILE).exists())
+        self.assertEqual(self._total(metricas), 5)
+
+    def test_pid_reutilizado_no_resta(self):
+        self._volcado(f"{os.getpid()}.json", 3)
+        metricas = MetricsStore(self.dir)
+        metricas.inc("http_requests_total", view="home")
+        metricas.flush(force=True)
+        self.assertEqual(self._total(metricas), 4)
+        metricas.close()
+
+    def test_al_salir_se_retira(self):
+        metricas = MetricsStore(self.dir)
+        metricas.inc("http_requests_total", 2, view="home")
+        metricas.flush(force=True)
+        metricas.close()
+        self.assertEqual(sorted(p.name for p in self.dir.glob("*.json")), [MetricsStore.RETIRED_FILE])
+        self.assertEqual(self._total(MetricsStore(self.dir)), 2)
+
+    def test_volcado_asincrono_fuera_del_event_loop(self):
+        from django.http import HttpResponse
+        from vivienda.metrics import MetricsMiddleware
+
+        async def vista(request):
+            return HttpResponse("ok")
+
+        hilos = []
+        middleware = MetricsMiddleware(vista)
+        store._last_flush = 0.0
+        with mock.patch.object(store, "flush", side_effect=lambda **kw: hilos.append(threading.get_ident())):
+            async def dos_peticiones():
+                for _ in range(2):
+                    await middleware(RequestFactory().get("/"))
+                return threading.get_ident()
+            hilo_loop = asyncio.run(dos_peticiones())
+        # Una sola vez por intervalo, y en otro hilo
+        self.assertEqual(len(hilos), 1)
+        self.assertNotEqual(hilos[0], hilo_loop)
+
+    def test_endpoint_exige_token(self):
+        url = reverse("metrics")
+        # Detrás del proxy todo llega desde 127.0.0.1: la IP no basta
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with override_settings(METRICS_TOKEN="secreto", METRICS_DIR=self.dir):
+            self.assertEqual(self.client.get(url).status_code, 403)
+            self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer otro"}).status_code, 403)
+            r = self.client.get(url, headers={"Authorization": "Bearer secreto"})
+        self.assertEqual(r.status_code, 200)
+        self.assertIn("# TYPE", r.content.decode())
+
+
+class RecientesCacheTests(TestCase):
+    """
+    @class RecientesCacheTests
+    @brief La lista de recientes del home se calcula una vez y se invalida con los cambios.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = crear_usuario("vendedor")
+        cls.comprador = crear_usuario("comprador")
+        cls.pubs = crear_publicaciones(cls.vendedor, 8, fotos=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_segunda_lectura_sin_consultas(self):
+        recientes_en_cache()
+        with self.assertNumQueries(0):
+            self.assertEqual(len(recientes_en_cache()), 6)
+
+    def test_cambio_en_publicacion_invalida(self):
+        recientes_en_cache()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.pubs[0].titulo = "Otro"
+            self.pubs[0].save()
+        # Hasta confirmar la lista sigue ahí: borrarla antes dejaría volver a guardar la vieja
+        self.assertIsNotNone(cache.get(LLAVE_RECIENTES))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(LLAVE_RECIENTES))
+
+    def test_like_fuera_de_la_lista_no_invalida(self):
+        ids = {p.id for p in recientes_en_cache()}
+        fuera = next(p for p in self.pubs if p.id not in ids)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorito.objects.create(usuario=self.comprador, publicacion=fuera)
+        self.assertIsNotNone(cache.get(LLAVE_RECIENTES))
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorito.objects.create(usuario=self.comprador, publicacion_id=next(iter(ids)))
+        self.assertIsNone(cache.get(LLAVE_RECIENTES))
+
+
+class EstaticosTests(SimpleTestCase):
+    """
+    @class EstaticosTests
+    @brief Recorte de Font Awesome, librerías locales con respaldo al CDN y `collectstatic`.
+    """
+
+    CSS_FA = (
+        '/*! Font Awesome */.fa{font-family:var(--fa-style-family,"Font Awesome 6 Free")}'
+        '.fa-spin{animation-name:fa-spin}'
+        '.fa-home:before,.fa-house:before{content:"\\f015"}'
+        '.fa-heart:before{content:"\\f004"}'
+        '.fa-user:before{content:"\\f007"}'
+        '@font-face{font-family:"Font Awesome 6 Free";src:url(../webfonts/fa-solid-900.woff2) format("woff2")}'
+        '@keyframes fa-spin{0%{transform:rotate(0)}to{transform:rotate(1turn)}}'
+    )
+
+    def tearDown(self):
+        vendorizado.cache_clear()
+
+    def test_recortar_css(self):
+        css, codigos = recortar_css(self.CSS_FA, {"home", "heart"})
+        self.assertIn(".fa-home:before{", css)
+        self.assertNotIn(".fa-house", css)
+        self.assertNotIn(".fa-user", css)
+        self.assertIn(".fa-spin{", css)
+        self.assertIn("@font-face{", css)
+        self.assertIn("@keyframes fa-spin{0%{transform:rotate(0)}to{transform:rotate(1turn)}}", css)
+        self.assertTrue(css.startswith("/*! Font Awesome */"))
+        self.assertEqual(codigos, {0xF015, 0xF004})
+
+    def test_iconos_usados(self):
+        with tempfile.TemporaryDirectory() as d:
+            raiz = Path(d)
+            (raiz / "a.html").write_text('<i class="fas fa-house-circle-check"></i>', encoding="utf-8")
+            (raiz / "vendor").mkdir()
+            (raiz / "vendor" / "b.js").write_text("fa-ignorado", encoding="utf-8")
+            self.assertEqual(iconos_usados(raiz), {"house-circle-check"})
+
+    def test_css_vendor_local_o_cdn(self):
+        plantilla = Template('{% load vendorizados %}{% css_vendor "leaflet" %}{% js_vendor "leaflet" %}')
+        with mock.patch("vivienda.estaticos.finders.find", return_value=None):
+            html = plantilla.render(Context())
+        self.assertIn("https://unpkg.com/leaflet@1.9.4/dist/leaflet.css", html)
+        self.assertIn("https://unpkg.com/leaflet@1.9.4/dist/leaflet.js", html)
+
+        vendorizado.cache_clear()
+        with mock.patch("vivienda.estaticos.finders.find", return_value="/x"):
+            html = plantilla.render(Context())
+        self.assertIn('href="/static/vendor/leaflet/leaflet.css"', html)
+        self.assertNotIn("unpkg.com", html)
+
+    def test_collectstatic_con_hash_y_comprimido(self):
+        with tempfile.TemporaryDirectory() as d, override_settings(STATIC_ROOT=d):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            from django.contrib.staticfiles.storage import staticfiles_storage
+            url = staticfiles_storage.url("css/base.css")
+            self.assertRegex(url, r"^/static/css/base\.[0-9a-f]{12}\.css$")
+            self.assertTrue((Path(d) / (url.removeprefix("/static/") + ".gz")).exists())
+            # Archivo fuera del manifiesto: nombre original en lugar de error
+            self.assertEqual(staticfiles_storage.url("no/existe.js"), "/static/no/existe.js")
+
+
+class MediaTests(SimpleTestCase):
+    """
+    @class MediaTests
+    @brief Fotos servidas con validadores, rangos, caché inmutable y delegación al proxy.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        raiz = Path(self.dir.name)
+        (raiz / "fotos").mkdir()
+        (raiz / "fotos" / "casa.jpg").write_bytes(b"0123456789")
+        (raiz / "fotos" / "casa.0123456789abcdef.jpg").write_bytes(b"abc")
+        (raiz / "fotos" / f"{'ab' * 32}.jpg").write_bytes(b"abc")
+        ajustes = override_settings(MEDIA_ROOT=raiz)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def _get(self, ruta, **headers):
+        return self.client.get(f"/media/{ruta}", headers=headers)
+
+    def test_completo_con_validadores(self):
+        r = self._get("fotos/casa.jpg")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(b"".join(r.streaming_content), b"0123456789")
+        self.assertEqual(r["Accept-Ranges"], "bytes")
+        self.assertEqual(r["Cache-Control"], "public, max-age=3600")
+        self.assertEqual(self._get("fotos/casa.jpg", if_none_match=r["ETag"]).status_code, 304)
+
+    def test_rangos(self):
+        r = self._get("fotos/casa.jpg", range="bytes=2-5")
+        self.assertEqual(r.status_code, 206)
+        self.assertEqual(b"".join(r.streaming_content), b"2345")
+        self.assertEqual(r["Content-Range"], "bytes 2-5/10")
+        r = self._get("fotos/casa.jpg", range="bytes=-3")
+        self.assertEqual(b"".join(r.streaming_content), b"789")
+        r = self._get("fotos/casa.jpg", range="bytes=20-")
+        self.assertEqual(r.status_code, 416)
+        self.assertEqual(r["Content-Range"], "bytes */10")
+
+    def test_if_range_obsoleto_devuelve_completo(self):
+        r = self._get("fotos/casa.jpg", range="bytes=2-5", if_range='"otro"')
+        self.assertEqual(r.status_code, 200)
+
+    def test_nombre_con_hash_es_inmutable(self):
+        r = self._get("fotos/casa.0123456789abcdef.jpg")
+        self.assertIn("immutable", r["Cache-Control"])
+        r = self._get(f"fotos/{'ab' * 32}.jpg")  # almacenamiento por contenido
+        self.assertIn("immutable", r["Cache-Control"])
+
+    @override_settings(MEDIA_ACELERADOR="x-accel-redirect")
+    def test_x_accel_redirect(self):
+        r = self._get("fotos/casa.jpg")
+        self.assertEqual(r["X-Accel-Redirect"], "/_media/fotos/casa.jpg")
+        self.assertEqual(r.content, b"")
+        self.assertIn("ETag", r)
+
+    def test_no_sale_de_media_root(self):
+        request = RequestFactory().get("/media/x")
+        with self.assertRaises(Http404):
+            servir_media(request, "../settings.py")
+        self.assertEqual(self._get("fotos/no-existe.jpg").status_code, 404)
+
+
+class SqliteTests(TransactionTestCase):
+    """
+    @class SqliteTests
+    @brief Pragmas de conexión, `BEGIN IMMEDIATE` y reintento de vistas ante "database is locked".
+    @details `TransactionTestCase`: el reintento sólo aplica fuera de una transacción.
+    """
+
+    def test_pragmas_y_transacciones_inmediatas(self):
+        with connection.cursor() as cursor:
+            self.assertEqual(cursor.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+            self.assertEqual(cursor.execute("PRAGMA temp_store").fetchone()[0], 2)   # MEMORY
+            self.assertEqual(cursor.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+
+    def test_wal_en_archivo(self):
+        from django.conf import settings
+        with tempfile.TemporaryDirectory() as tmp:
+            conexion = sqlite3.connect(Path(tmp) / "db.sqlite3")
+            conexion.executescript(init_command(settings.SQLITE_PRAGMAS) + ";")
+            self.assertEqual(conexion.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            conexion.close()
+
+    @override_settings(SQLITE_REINTENTOS=2, SQLITE_REINTENTO_BASE=0)
+    def test_reintenta_la_vista_si_la_base_esta_bloqueada(self):
+        llamadas = []
+
+        @reintentar_bloqueos
+        def vista(request):
+            llamadas.append(connection.in_atomic_block)
+            if len(llamadas) < 3:
+                raise OperationalError("database is locked")
+            return "ok"
+
+        self.assertEqual(vista(None), "ok")
+        self.assertEqual(llamadas, [True, True, True])
+
+        llamadas.clear()
+
+        @reintentar_bloqueos
+        def siempre(request):
+            llamadas.append(1)
+            raise OperationalError("database is locked")
+
+        with self.assertRaises(OperationalError):
+            siempre(None)
+        self.assertEqual(len(llamadas), 3)
+
+    def test_otros_errores_no_se_reintentan(self):
+        vista = mock.Mock(side_effect=OperationalError("no such table: x"), __name__="vista")
+        with self.assertRaises(OperationalError):
+            reintentar_bloqueos(vista)(None)
+        self.assertEqual(vista.call_count, 1)
+
+    def test_benchmark(self):
+        salida = io.StringIO()
+        call_command("benchmark_sqlite", duracion=0.2, filas=200, lectores=2, escritores=2, stdout=salida)
+        self.assertIn("despues", salida.getvalue())
+        self.assertIn("escrituras: x", salida.getvalue())
+
+
+@override_settings(REPLICAS=["replica_prueba"], REPLICAS_RETRASO_MAX=5, REPLICAS_REVISAR_CADA=0)
+class ReplicasRouterTests(TestCase):
+    """
+    @class ReplicasRouterTests
+    @brief Decisiones del router: vistas marcadas, lectura de lo propio y réplicas atrasadas o caídas.
+    """
+
+    def setUp(self):
+        salud.olvidar()
+        self.router = RouterReplicas()
+        self.request = RequestFactory().get("/")
+        self.request.session = {}
+
+    def _destino(self, modelo=Publicacion):
+        @lectura_en_replica
+        def vista(request):
+            return self.router.db_for_read(modelo)
+        return vista(self.request)
+
+    @mock.patch("vivienda.replicas.medir_retraso", return_value=0.0)
+    def test_solo_las_vistas_marcadas_leen_de_replicas(self, _):
+        self.assertIsNone(self.router.db_for_read(Publicacion))
+        self.assertEqual(self._destino(), "replica_prueba")
+        self.assertEqual(self.router.db_for_write(Publicacion), "default")
+
+    @mock.patch("vivienda.replicas.medir_retraso", return_value=0.0)
+    def test_sesiones_y_usuario_que_acaba_de_escribir_leen_de_la_primaria(self, _):
+        from django.contrib.sessions.models import Session
+        self.assertIsNone(self._destino(Session))
+        self.request.session[LLAVE_SESION] = time.time() + 10
+        self.assertIsNone(self._destino())
+        self.request.session[LLAVE_SESION] = time.time() - 1  # ventana vencida
+        self.assertEqual(self._destino(), "replica_prueba")
+
+    def test_replica_atrasada_o_caida_se_salta(self):
+        with mock.patch("vivienda.replicas.medir_retraso", return_value=60.0):
+            self.assertIsNone(self._destino())
+        salud.olvidar()
+        with mock.patch("vivienda.replicas.medir_retraso", side_effect=DatabaseError("caida")) as medir:
+            self.assertIsNone(self._destino())
+            self.assertIsNone(self._destino())
+        self.assertEqual(medir.call_count, 1)  # no se vuelve a medir durante REPLICAS_PAUSA
+
+    def test_sin_replicas_no_cambia_nada(self):
+        with override_settings(REPLICAS=[]):
+            self.assertIsNone(self._destino())
+            user = crear_usuario("sinreplicas")
+            self.client.force_login(user)
+            pub = crear_publicaciones(user, 1, fotos=0)[0]
+            self.client.post(reverse("principal:toggle_favorito", args=[pub.pk]))
+            self.assertNotIn(LLAVE_SESION, self.client.session)
+
+    @mock.patch("vivienda.replicas.medir_retraso", return_value=60.0)  # sin réplica al día: todo a la primaria
+    def test_escritura_fija_la_sesion_a_la_primaria(self, _):
+        user = crear_usuario("fijado")
+        pub = crear_publicaciones(user, 1, fotos=0)[0]
+        self.client.get(reverse("principal:resultados_busqueda"))
+        self.assertNotIn(LLAVE_SESION, self.client.session)
+        self.client.force_login(user)
+        self.client.post(reverse("principal:toggle_favorito", args=[pub.pk]))
+        self.assertGreater(self.client.session[LLAVE_SESION], time.time())
+
+
+@override_settings(REPLICAS=["replica_prueba"])
+class ReplicasIntegracionTests(TransactionTestCase):
+    """
+    @class ReplicasIntegracionTests
+    @brief Una segunda conexión a la base de pruebas hace de réplica: las vistas marcadas
+     leen de ella y, tras escribir, el usuario vuelve a la primaria.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # Misma base en memoria (cache compartida), otra conexión: ve lo ya confirmado.
+        # Se agrega aquí y no en `databases` porque el runner valida los alias al inicio.
+        connections.settings["replica_prueba"] = dict(connections["default"].settings_dict)
+        cls.databases = {"default", "replica_prueba"}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["replica_prueba"].close()
+        del connections["replica_prueba"]
+        del connections.settings["replica_prueba"]
+
+    def setUp(self):
+        salud.olvidar()
+        self.user = crear_usuario("replica")
+        self.pub = crear_publicaciones(self.user, 2, fotos=0)[0]
+        self.client.force_login(self.user)
+
+    def _lecturas_en_replica(self, url, tabla="publicaciones_publicacion"):
+        with CaptureQueriesContext(connections["replica_prueba"]) as consultas:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return [c["sql"] for c in consultas if tabla in c["sql"]]
+
+    def test_busqueda_y_detalle_leen_de_la_replica_salvo_tras_escribir(self):
+        self.assertTrue(self._lecturas_en_replica(reverse("principal:resultados_busqueda")))
+        # El detalle compartido en caché se arma desde la primaria; el like del visitante no
+        detalle = reverse("principal:publicacion_detalle", args=[self.pub.pk])
+        self.assertTrue(self._lecturas_en_replica(detalle, "publicaciones_favorito"))
+        self.assertEqual(self._lecturas_en_replica(detalle), [])
+        self.client.post(reverse("principal:toggle_favorito", args=[self.pub.pk]))
+        self.assertEqual(self._lecturas_en_replica(reverse("principal:mis_favoritos")), [])
+
+
+class AsesorIndicesTests(TestCase):
+    """
+    @class AsesorIndicesTests
+    @brief `asesor_indices`: planes con recorridos/ordenamientos y migración con los índices sugeridos.
+    """
+
+    def test_columnas_de_indice(self):
+        from principal.management.commands.asesor_indices import columnas_de_indice
+        sql = (
+            'SELECT "publicaciones_favorito"."publicacion_id" FROM "publicaciones_favorito" '
+            'WHERE "publicaciones_favorito"."usuario_id" = %s ORDER BY "publicaciones_favorito"."creado" DESC'
+        )
+        self.assertEqual(
+            columnas_de_indice(sql, "publicaciones_favorito"),
+            ([("usuario_id", False), ("creado", True), ("publicacion_id", False)], 1),
+        )
+
+    def test_sugiere_indices_y_escribe_migracion(self):
+        user = crear_usuario("asesor")
+        for pub in crear_publicaciones(user, 3, fotos=1):
+            Favorito.objects.create(usuario=user, publicacion=pub)
+        salida = io.StringIO()
+        with tempfile.TemporaryDirectory() as tmp:
+            call_command("asesor_indices", escribir=True, directorio=tmp, stdout=salida)
+            migracion = next(Path(tmp).glob("*_indices_sugeridos.py")).read_text()
+        texto = salida.getvalue()
+        self.assertIn("USE TEMP B-TREE FOR ORDER BY", texto)
+        self.assertIn("publicaciones.Publicacion: models.Index(fields=['estatus', '-fecha_creacion']", texto)
+        self.assertIn("publicaciones.Publicacion: models.Index(fields=['usuario', '-fecha_creacion']", texto)
+        self.assertNotIn("publicaciones.Favorito:", texto)  # (usuario, publicacion) ya es único
+        self.assertIn("migrations.AddIndex(", migracion)
+        self.assertEqual(Favorito.objects.count(), 3)  # la transacción del comando se revierte
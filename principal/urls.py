@@ -4,32 +4,46 @@
 @details Define las URLs que conectan las vistas principales del sitio:
          - Página de inicio.
          - Resultados de búsqueda de propiedades.
+         - Fragmento de publicaciones recientes.
+         - Stream de eventos (SSE).
+         Con `settings.VISTAS_ASYNC` las vistas de lectura se toman de `views_async`.
 """
 
+from django.conf import settings
 from django.urls import path
 from . import views
-from . import views as principal_views
+from . import views_async
 
 #: Namespace de la app `principal` para diferenciar sus rutas
-app_name = "principal"  
+app_name = "principal"
 
-#: Lista de patrones de URL de la app `principal`
-urlpatterns = [
-    path(
-        '', 
-        views.home, 
-        name='home'
-    ),  #: Página principal (vista home)
 
-    path(
-        'resultados/', 
-        views.resultados_busqueda, 
-        name='resultados_busqueda'
-    ),  #: Página de resultados de búsqueda de propiedades
+def construir_urlpatterns(lectura):
+    """
+    @brief Patrones de la app usando `lectura` (módulo `views` o `views_async`)
+     para las vistas de sólo lectura.
+    """
+    return [
+        path(
+            '',
+            lectura.home,
+            name='home'
+        ),  #: Página principal (vista home)
+
+        path(
+            'resultados/',
+            lectura.resultados_busqueda,
+            name='resultados_busqueda'
+        ),  #: Página de resultados de búsqueda de propiedades
 
-    path("me-encantas/", principal_views.mis_favoritos, name="mis_favoritos"),
-    path("fav/toggle/<int:pk>/", views.toggle_favorito, name="toggle_favorito"),
+        path("me-encantas/", lectura.mis_favoritos, name="mis_favoritos"),
+        path("fav/toggle/<int:pk>/", views.toggle_favorito, name="toggle_favorito"),
 
-    path("publicacion/<int:pk>/", views.publicacion_detalle, name="publicacion_detalle"),
-]
+        path("publicacion/<int:pk>/", lectura.publicacion_detalle, name="publicacion_detalle"),
+        path("recientes/", lectura.recientes_html, name="recientes_html"),  #: Fragmento de recientes (AJAX)
+        path("eventos/", views.eventos, name="eventos"),  #: Stream SSE (requiere ASGI)
+    ]
 
+
+#: Lista de patrones de URL de la app `principal`
+urlpatterns = construir_urlpatterns(views_async if settings.VISTAS_ASYNC else views)
@@ -1,13 +1,24 @@
+import asyncio
+
 from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator
-from django.db.models import Q, Count, Prefetch
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.db.models import Q, Count
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 import unicodedata
 from cuentas.models import perfil_incompleto
+from principal.validadores import condicional
+from vivienda.cache import obtener_o_calcular
+from vivienda.eventos import bus, formatear_sse
+from vivienda.replicas import lectura_en_replica
+from vivienda.sqlite import reintentar_bloqueos
 
 
-from publicaciones.models import Publicacion, Favorito, FotoPublicacion
+from publicaciones.detalle import obtener_detalle
+from publicaciones.models import Publicacion, Favorito, Generacion
 
 def _to_decimal(s):
     """
@@ -29,7 +40,8 @@ def _liked_ids_for(user, pubs_queryset_or_list):
     """
     if not user.is_authenticated:
         return set()
-    ids = list(getattr(pubs_queryset_or_list, "values_list", lambda *a, **k: pubs_queryset_or_list)("id", flat=True))
+    # Iterar (no `values_list`) reutiliza el queryset ya evaluado por la plantilla/vista
+    ids = [p.id for p in pubs_queryset_or_list]
     if not ids:
         return set()
     liked = Favorito.objects.filter(usuario=user, publicacion_id__in=ids).values_list("publicacion_id", flat=True)
@@ -47,6 +59,7 @@ def _quitar_acentos(texto):
     texto = ''.join(char for char in texto if unicodedata.category(char) != 'Mn')
     return texto.lower()
 
+@lectura_en_replica
 @login_required
 def home(request):
     """
@@ -55,14 +68,7 @@ def home(request):
     @param request Objeto HttpRequest
     @return HttpResponse renderizado con template home.html
     """
-    recientes = (
-        Publicacion.objects
-        .filter(estatus="disponible")
-        .select_related("usuario__perfil")
-        .prefetch_related("fotos")
-        .annotate(like_count=Count("favoritos"))
-        .order_by("-fecha_creacion")[:6]
-    )
+    recientes = recientes_en_cache()
     liked_ids = _liked_ids_for(request.user, recientes)
 
     return render(request, "principal/home.html", {
@@ -70,20 +76,34 @@ def home(request):
         "liked_ids": liked_ids,
     })
 
-def resultados_busqueda(request):
-    texto = (request.GET.get("direccion") or "").strip()
-    tipo_sel = (request.GET.get("tipo_operacion") or "").strip().lower()
-    financiamiento = (request.GET.get("financiamiento") or "").strip().lower()
-    estado = (request.GET.get("estado") or "").strip()
-    ciudad = (request.GET.get("ciudad") or "").strip()
-
-    precio_min = _to_decimal(request.GET.get("precio_min"))
-    precio_max = _to_decimal(request.GET.get("precio_max"))
-    rec_min    = _to_decimal(request.GET.get("rec_min"))
-    banos_min  = _to_decimal(request.GET.get("banos_min"))
-    est_min    = _to_decimal(request.GET.get("est_min"))
-    m2c_min    = _to_decimal(request.GET.get("m2c_min"))
-    m2t_min    = _to_decimal(request.GET.get("m2t_min"))
+
+#: Campos en los que se busca el texto libre de `direccion`
+CAMPOS_TEXTO = (
+    "titulo", "descripcion", "calle", "numero", "colonia", "ciudad", "estado", "codigo_postal",
+)
+
+
+def _filtrar_busqueda(params):
+    """
+    @brief Aplica los filtros del buscador sobre las publicaciones disponibles
+    @details No ejecuta consultas; la vista (síncrona o asíncrona) decide si usa el
+     filtro por tokens o, si no hay coincidencias, la búsqueda sin acentos.
+    @param params QueryDict con los parámetros GET
+    @return Tupla `(qs, qs_tokens, ctx)`; `qs_tokens` es None si no hay texto libre
+    """
+    texto = (params.get("direccion") or "").strip()
+    tipo_sel = (params.get("tipo_operacion") or "").strip().lower()
+    financiamiento = (params.get("financiamiento") or "").strip().lower()
+    estado = (params.get("estado") or "").strip()
+    ciudad = (params.get("ciudad") or "").strip()
+
+    precio_min = _to_decimal(params.get("precio_min"))
+    precio_max = _to_decimal(params.get("precio_max"))
+    rec_min    = _to_decimal(params.get("rec_min"))
+    banos_min  = _to_decimal(params.get("banos_min"))
+    est_min    = _to_decimal(params.get("est_min"))
+    m2c_min    = _to_decimal(params.get("m2c_min"))
+    m2t_min    = _to_decimal(params.get("m2t_min"))
 
     qs = Publicacion.objects.filter(estatus="disponible")
 
@@ -114,99 +134,131 @@ def resultados_busqueda(request):
     if ciudad:
         qs = qs.filter(ciudad__icontains=ciudad)
 
+    qs_tokens = None
     if texto:
         tokens = [t for t in texto.replace(",", " ").split() if len(t) >= 2]
-        campos = [
-            "titulo__icontains",
-            "descripcion__icontains",
-            "calle__icontains",
-            "numero__icontains",
-            "colonia__icontains",
-            "ciudad__icontains",
-            "estado__icontains",
-            "codigo_postal__icontains",
-        ]
-        
-        qs_filtrado = qs
+        qs_tokens = qs
         for tk in tokens:
             or_block = Q()
-            for c in campos:
-                or_block |= Q(**{c: tk})
-            qs_filtrado = qs_filtrado.filter(or_block)
-        
-        if not qs_filtrado.exists():
-            texto_sin_acentos = _quitar_acentos(texto)
-            ids_coincidentes = []
-            
-            for pub in qs:
-                campos_texto = [
-                    pub.titulo or "",
-                    pub.descripcion or "",
-                    pub.calle or "",
-                    pub.numero or "",
-                    pub.colonia or "",
-                    pub.ciudad or "",
-                    pub.estado or "",
-                    pub.codigo_postal or "",
-                ]
-                
-                texto_completo = " ".join(campos_texto).lower()
-                texto_completo_sin_acentos = _quitar_acentos(texto_completo)
-                
-                if texto_sin_acentos in texto_completo_sin_acentos:
-                    ids_coincidentes.append(pub.id)
-            
-            qs = qs.filter(id__in=ids_coincidentes)
-        else:
-            qs = qs_filtrado
+            for c in CAMPOS_TEXTO:
+                or_block |= Q(**{f"{c}__icontains": tk})
+            qs_tokens = qs_tokens.filter(or_block)
+
+    ctx = {
+        "tipo_sel": tipo_sel,
+        "q": texto,
 
-    qs = (
+
+        "precio_min": params.get("precio_min", ""),
+        "precio_max": params.get("precio_max", ""),
+        "rec_min": params.get("rec_min", ""),
+        "banos_min": params.get("banos_min", ""),
+        "est_min": params.get("est_min", ""),
+        "m2c_min": params.get("m2c_min", ""),
+        "m2t_min": params.get("m2t_min", ""),
+        "financiamiento": financiamiento,
+        "estado": estado,
+        "ciudad": ciudad,
+    }
+    return qs, qs_tokens, ctx
+
+
+def _coincidencias_sin_acentos(filas, texto):
+    """
+    @brief IDs cuyo texto concatenado contiene `texto` ignorando acentos y mayúsculas
+    @param filas Iterable de tuplas `(id, *CAMPOS_TEXTO)`
+    @param texto Texto buscado
+    """
+    texto_sin_acentos = _quitar_acentos(texto)
+    return [
+        fila[0] for fila in filas
+        if texto_sin_acentos in _quitar_acentos(" ".join(v or "" for v in fila[1:]))
+    ]
+
+
+def _listado(qs):
+    """
+    @brief Carga relacionada, conteo de likes y orden comunes a los listados
+    """
+    return (
         qs.select_related("usuario__perfil")
           .prefetch_related("fotos")
           .annotate(like_count=Count("favoritos"))
           .order_by("-fecha_creacion")
     )
 
-    paginator = Paginator(qs, 12)
+
+def _recientes():
+    """
+    @brief Las 6 publicaciones disponibles más recientes (home y fragmento de recientes)
+    """
+    return _listado(Publicacion.objects.filter(estatus="disponible"))[:6]
+
+
+#: Llave de la lista de recientes en caché (incrementar si cambia lo que se guarda)
+LLAVE_RECIENTES = "recientes:v1"
+
+
+def recientes_en_cache():
+    """
+    @brief Lista de `_recientes()` desde caché; sólo una petición la recalcula al vencer
+    @details Las señales de `principal/models.py` la invalidan cuando cambia una
+     publicación, sus fotos, el vendedor o los likes de alguna de la lista.
+    """
+    return obtener_o_calcular(
+        LLAVE_RECIENTES, lambda: list(_recientes()), getattr(settings, "RECIENTES_CACHE_TIMEOUT", 60),
+    )
+
+
+def invalidar_recientes(pub_id=None):
+    """
+    @brief Borra la lista de recientes; con `pub_id`, sólo si esa publicación está en ella
+    """
+    if pub_id is not None:
+        sobre = cache.get(LLAVE_RECIENTES)
+        if sobre is None or all(p.id != pub_id for p in sobre["valor"]):
+            return
+    cache.delete(LLAVE_RECIENTES)
+
+
+@lectura_en_replica
+@condicional(Generacion.PUBLICACIONES)
+def resultados_busqueda(request):
+    qs, qs_tokens, ctx = _filtrar_busqueda(request.GET)
+
+    # Con búsqueda por texto el total sale de la propia búsqueda: no hace falta otro COUNT
+    total = None
+    if qs_tokens is not None:
+        total = qs_tokens.count()
+        if total:
+            qs = qs_tokens
+        else:
+            ids = _coincidencias_sin_acentos(qs.values_list("id", *CAMPOS_TEXTO), ctx["q"])
+            qs, total = qs.filter(id__in=ids), len(ids)
+
+    paginator = Paginator(_listado(qs), 12)
+    if total is not None:
+        paginator.count = total  # `count` es cached_property
     page_obj = paginator.get_page(request.GET.get("page"))
 
     liked_ids = _liked_ids_for(request.user, page_obj.object_list)
 
-    ctx = {
+    ctx.update({
         "page_obj": page_obj,
         "total": paginator.count,
-        "tipo_sel": tipo_sel,
-        "q": texto,
-
-
-        "precio_min": request.GET.get("precio_min", ""),
-        "precio_max": request.GET.get("precio_max", ""),
-        "rec_min": request.GET.get("rec_min", ""),
-        "banos_min": request.GET.get("banos_min", ""),
-        "est_min": request.GET.get("est_min", ""),
-        "m2c_min": request.GET.get("m2c_min", ""),
-        "m2t_min": request.GET.get("m2t_min", ""),
-        "financiamiento": financiamiento,
-        "estado": estado,
-        "ciudad": ciudad,
         "liked_ids": liked_ids,
-    }
+    })
     return render(request, "principal/resultados_busqueda.html", ctx)
 
+@lectura_en_replica
+@condicional(Generacion.PUBLICACIONES, Generacion.FAVORITOS)
 def recientes_html(request):
     """
     @brief Vista parcial para cargar publicaciones recientes via AJAX
     @param request Objeto HttpRequest
     @return HttpResponse con template parcial _recientes.html
     """
-    recientes = (
-        Publicacion.objects
-        .filter(estatus="disponible")
-        .select_related("usuario__perfil")
-        .prefetch_related("fotos")
-        .annotate(like_count=Count("favoritos"))
-        .order_by("-fecha_creacion")[:6]
-    )
+    recientes = recientes_en_cache()
     liked_ids = _liked_ids_for(request.user, recientes)
     return render(request, "principal/_recientes.html", {
         "recientes": recientes,
@@ -214,6 +266,7 @@ def recientes_html(request):
     })
 
 @login_required
+@reintentar_bloqueos
 def toggle_favorito(request, pk):
     """
     @brief Alterna el estado de favorito de una publicación via AJAX
@@ -229,6 +282,7 @@ def toggle_favorito(request, pk):
         obj.delete()
     return JsonResponse({"liked": created})
 
+@lectura_en_replica
 @login_required
 def mis_favoritos(request):
     """
@@ -236,14 +290,7 @@ def mis_favoritos(request):
     @param request Objeto HttpRequest (requiere autenticación)
     @return HttpResponse con template mis_favoritos.html
     """
-    pubs = (
-        Publicacion.objects
-        .filter(favoritos__usuario=request.user)
-        .select_related("usuario__perfil")
-        .prefetch_related("fotos")
-        .annotate(like_count=Count("favoritos"))
-        .order_by("-fecha_creacion")
-    )
+    pubs = _listado(Publicacion.objects.filter(favoritos__usuario=request.user))
     liked_ids = _liked_ids_for(request.user, pubs)
     return render(request, "principal/mis_favoritos.html", {
         "publicaciones": pubs,
@@ -251,32 +298,61 @@ def mis_favoritos(request):
     })
 
 
+@lectura_en_replica
+@condicional(Generacion.PUBLICACIONES, extra=lambda request, pk: (pk,))
 def publicacion_detalle(request, pk: int):
     """
     @brief Vista de detalle completo de una publicación
-    @details Muestra información completa, galería de fotos, mapa y estado de favorito
+    @details Muestra información completa, galería de fotos, mapa y estado de favorito.
+     Los datos de la publicación salen de la caché de detalle (`publicaciones/detalle.py`);
+     sólo el estado de favorito del visitante se consulta en cada petición.
     @param request Objeto HttpRequest
     @param pk ID de la publicación a mostrar
     @return HttpResponse con template publicacion_detalle.html
     """
-    pub = (
-        Publicacion.objects
-        .select_related("usuario__perfil")
-        .prefetch_related(
-            Prefetch("fotos", queryset=FotoPublicacion.objects.order_by("orden", "id"))
-        )
-        .annotate(like_count=Count("favoritos"))
-        .filter(pk=pk)
-        .first()
-    )
-    if not pub:
-        pub = get_object_or_404(Publicacion, pk=pk)
+    pub = obtener_detalle(pk)
 
     liked = False
     if request.user.is_authenticated:
-        liked = Favorito.objects.filter(usuario=request.user, publicacion=pub).exists()
+        liked = Favorito.objects.filter(usuario=request.user, publicacion_id=pk).exists()
 
     return render(request, "principal/publicacion_detalle.html", {
         "pub": pub,
         "liked": liked,
-    })
\ No newline at end of file
+    })
+
+
+async def eventos(request):
+    """
+    @brief Stream SSE con publicaciones nuevas y deltas de likes
+    @details Sólo funciona servido por `vivienda.asgi`: el stream es un generador asíncrono
+     en el event loop, sin hilo por conexión. Bajo WSGI responde 204, que indica a
+     `EventSource` que no vuelva a intentar.
+    @param request Objeto HttpRequest
+    @return StreamingHttpResponse `text/event-stream`
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    sus = bus.suscribir()
+    latido = getattr(settings, "EVENTOS_HEARTBEAT_SEGUNDOS", 15)
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    evento = await asyncio.wait_for(sus.cola.get(), timeout=latido)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if evento is None:  # cola desbordada: cerrar y dejar que el cliente reconecte
+                    return
+                yield formatear_sse(*evento)
+        finally:
+            bus.cancelar(sus)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
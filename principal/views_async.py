@@ -0,0 +1,185 @@
+"""
+@file views_async.py
+@brief Versiones asíncronas de las vistas de lectura de `principal`.
+@details
+ Mismo comportamiento y plantillas que `principal/views.py`, pero con el ORM asíncrono
+ y `asyncio.gather` para las consultas independientes (página del listado, conteo,
+ favoritos del usuario, detalle). Se activan con `settings.VISTAS_ASYNC` y sólo tienen
+ sentido servidas por `vivienda.asgi`, que por ahora es opcional (ver la sección
+ "Vistas asíncronas" de `settings.py`).
+
+ El render de la plantilla corre en un hilo del pool (`thread_sensitive=False`) para no
+ bloquear el event loop; antes de renderizar todo lo que la plantilla necesita ya está
+ cargado (usuario resuelto, listas materializadas con sus fotos y vendedor), así que
+ ese hilo no toca la base de datos.
+
+ Nota: Django ejecuta el ORM asíncrono en un único hilo por proceso, de modo que
+ `gather` solapa el trabajo de Python (caché, render, otras peticiones) más que las
+ consultas en sí.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.shortcuts import render
+
+from principal.validadores import condicional
+from principal.views import (
+    CAMPOS_TEXTO,
+    _coincidencias_sin_acentos,
+    _filtrar_busqueda,
+    _listado,
+    recientes_en_cache,
+)
+from publicaciones.detalle import aobtener_detalle
+from publicaciones.models import Favorito, Generacion, Publicacion
+from vivienda.replicas import lectura_en_replica
+
+#: Publicaciones por página en resultados (igual que la vista síncrona)
+POR_PAGINA = 12
+
+
+async def _alista(qs):
+    return [obj async for obj in qs]
+
+
+async def _aliked_ids(user, ids):
+    """
+    @brief IDs (de `ids`, lista o subconsulta) que el usuario marcó como favoritos
+    """
+    if not user.is_authenticated:
+        return set()
+    qs = Favorito.objects.filter(usuario=user, publicacion_id__in=ids).values_list("publicacion_id", flat=True)
+    return {pid async for pid in qs}
+
+
+async def _arender(request, user, template, ctx):
+    """
+    @brief Renderiza en un hilo del pool con el usuario ya resuelto
+    """
+    request.user = user
+    return await sync_to_async(render, thread_sensitive=False)(request, template, ctx)
+
+
+async def _arecientes(user):
+    # La lista viene del caché (ver `recientes_en_cache`); el single-flight es síncrono
+    recientes = await sync_to_async(recientes_en_cache)()
+    return recientes, await _aliked_ids(user, [p.id for p in recientes])
+
+
+@lectura_en_replica
+@login_required
+async def home(request):
+    """
+    @brief Versión asíncrona de `principal.views.home`
+    """
+    user = await request.auser()
+    recientes, liked_ids = await _arecientes(user)
+    return await _arender(request, user, "principal/home.html", {
+        "recientes": recientes,
+        "liked_ids": liked_ids,
+    })
+
+
+@lectura_en_replica
+@condicional(Generacion.PUBLICACIONES, Generacion.FAVORITOS)
+async def recientes_html(request):
+    """
+    @brief Versión asíncrona de `principal.views.recientes_html`
+    """
+    user = await request.auser()
+    recientes, liked_ids = await _arecientes(user)
+    return await _arender(request, user, "principal/_recientes.html", {
+        "recientes": recientes,
+        "liked_ids": liked_ids,
+    })
+
+
+@lectura_en_replica
+@condicional(Generacion.PUBLICACIONES)
+async def resultados_busqueda(request):
+    """
+    @brief Versión asíncrona de `principal.views.resultados_busqueda`
+    @details Con texto buscado el total sale de la búsqueda por tokens (o del filtro sin
+     acentos). Sin texto, en la primera página el conteo y las filas se consultan a la
+     vez; en las demás se cuenta primero. La página fuera de rango se ajusta (igual
+     que `get_page`) antes de pedir sus filas.
+    """
+    user = await request.auser()
+    qs, qs_tokens, ctx = _filtrar_busqueda(request.GET)
+
+    # Con búsqueda por texto el total sale de la propia búsqueda: no hace falta otro COUNT
+    total = None
+    if qs_tokens is not None:
+        total = await qs_tokens.acount()
+        if total:
+            qs = qs_tokens
+        else:
+            filas = await _alista(qs.values_list("id", *CAMPOS_TEXTO))
+            ids = _coincidencias_sin_acentos(filas, ctx["q"])
+            qs, total = qs.filter(id__in=ids), len(ids)
+
+    listado = _listado(qs)
+    try:
+        pedida = max(1, int(request.GET.get("page") or 1))
+    except ValueError:
+        pedida = 1
+
+    paginator = Paginator(listado, POR_PAGINA)
+    if total is None and pedida == 1:
+        # La primera página siempre existe: se pide a la vez que el conteo
+        total, filas = await asyncio.gather(qs.acount(), _alista(listado[:POR_PAGINA]))
+        paginator.count = total  # `count` es cached_property: evita el COUNT síncrono
+        page_obj = paginator.get_page(1)
+    else:
+        # Con el total ya conocido la página fuera de rango se ajusta sin repetir la consulta
+        if total is None:
+            total = await qs.acount()
+        paginator.count = total
+        page_obj = paginator.get_page(pedida)
+        filas = await _alista(page_obj.object_list)
+    page_obj.object_list = filas
+
+    ctx.update({
+        "page_obj": page_obj,
+        "total": total,
+        "liked_ids": await _aliked_ids(user, [p.id for p in page_obj.object_list]),
+    })
+    return await _arender(request, user, "principal/resultados_busqueda.html", ctx)
+
+
+@lectura_en_replica
+@login_required
+async def mis_favoritos(request):
+    """
+    @brief Versión asíncrona de `principal.views.mis_favoritos`
+    """
+    user = await request.auser()
+    pubs = await _alista(_listado(Publicacion.objects.filter(favoritos__usuario=user)))
+    return await _arender(request, user, "principal/mis_favoritos.html", {
+        "publicaciones": pubs,
+        # Todas son favoritas del usuario: no hace falta consultar
+        "liked_ids": {p.id for p in pubs},
+    })
+
+
+async def _aliked(user, pk):
+    if not user.is_authenticated:
+        return False
+    return await Favorito.objects.filter(usuario=user, publicacion_id=pk).aexists()
+
+
+@lectura_en_replica
+@condicional(Generacion.PUBLICACIONES, extra=lambda request, pk: (pk,))
+async def publicacion_detalle(request, pk: int):
+    """
+    @brief Versión asíncrona de `principal.views.publicacion_detalle`
+    """
+    user = await request.auser()
+    pub, liked = await asyncio.gather(aobtener_detalle(pk), _aliked(user, pk))
+    return await _arender(request, user, "principal/publicacion_detalle.html", {
+        "pub": pub,
+        "liked": liked,
+    })
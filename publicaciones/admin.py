@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.apps import apps
-from .models import Publicacion, Favorito
+from .models import Publicacion, Favorito, PublicacionArchivada
+from .archivo import restaurar
 
 Publicacion = apps.get_model("publicaciones", "Publicacion")
 FotoPublicacion = apps.get_model("publicaciones", "FotoPublicacion")
@@ -65,4 +66,19 @@ class FotoPublicacionAdmin(admin.ModelAdmin):
 class FavoritoAdmin(admin.ModelAdmin):
     list_display = ("usuario", "publicacion", "creado")
     list_filter = ("creado",)
-    search_fields = ("usuario__username", "publicacion__titulo")
\ No newline at end of file
+    search_fields = ("usuario__username", "publicacion__titulo")
+
+
+@admin.register(PublicacionArchivada)
+class PublicacionArchivadaAdmin(admin.ModelAdmin):
+    list_display = ("id", "titulo", "usuario", "tipo_operacion", "precio", "ciudad", "archivada")
+    list_filter = ("tipo_operacion", "archivada")
+    search_fields = ("titulo", "usuario__username", "usuario__email")
+    readonly_fields = ("fotos", "favoritos", "archivada")
+    actions = ["restaurar_seleccionadas"]
+
+    @admin.action(description="Restaurar a publicaciones (quedan cerradas)")
+    def restaurar_seleccionadas(self, request, queryset):
+        for archivada in queryset:
+            restaurar(archivada)
+        self.message_user(request, f"{len(queryset)} publicaciones restauradas.")
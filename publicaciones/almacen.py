@@ -0,0 +1,178 @@
+"""
+@file almacen.py
+@brief Almacenamiento de fotos por contenido: un archivo por SHA-256, compartido por todas las fotos iguales.
+@details
+ `FotoPublicacion.imagen` usa `AlmacenPorContenido` (`STORAGES["fotos"]`): al subir,
+ el archivo se guarda como `publicaciones/contenido/<ab>/<sha256>.<ext>`. Si ya existe
+ (el vendedor subió la misma foto en otra publicación o la volvió a subir al editar)
+ no se escribe otra copia; la fila sólo apunta al archivo existente. Así:
+  - los mismos bytes se guardan y procesan una vez, y sus derivados
+    (`<sha256>.<variante>.<ext>`) se comparten;
+  - la URL de un archivo nunca cambia de contenido, así que `vivienda/media.py` la
+    sirve como `immutable` por un año.
+
+ Referencias: `referenciados(nombres)` dice cuáles archivos de un lote siguen en uso
+ por fotos vivas (índice sobre `imagen`) o archivadas (una pasada por el archivo por
+ lote). Se calcula en vez de guardarse porque la purga y el archivo mueven o borran
+ filas sin señales. Al quitar fotos, `liberar(nombres)` borra sólo los archivos que
+ quedaron sin referencias. Un archivo por contenido que se acaba de reutilizar (mtime de menos de
+ `FOTOS_CONTENIDO_GRACIA` segundos) no se borra: su nueva fila puede no existir aún.
+
+ Los archivos anteriores (por fecha de subida) se migran con
+ `manage.py migrar_fotos_contenido`.
+"""
+
+import hashlib
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, storages
+
+from vivienda.metrics import store
+
+logger = logging.getLogger(__name__)
+
+#: Carpeta (relativa a `MEDIA_ROOT`) de los archivos por contenido
+CARPETA = "publicaciones/contenido"
+
+#: Extensiones equivalentes que se unifican en el nombre
+_EXTENSIONES = {"jpeg": "jpg", "jpe": "jpg", "tif": "tiff"}
+
+#: Bytes por lectura al calcular el hash
+TROZO = 1024 * 1024
+
+
+def extension(nombre: str) -> str:
+    ext = os.path.splitext(nombre)[1].lstrip(".").lower()
+    return _EXTENSIONES.get(ext, ext) or "bin"
+
+
+def nombre_por_contenido(digest: str, ext: str) -> str:
+    return f"{CARPETA}/{digest[:2]}/{digest}.{ext}"
+
+
+def es_por_contenido(nombre: str) -> bool:
+    return nombre.startswith(CARPETA + "/")
+
+
+def digest_de(archivo) -> str:
+    """
+    @brief SHA-256 (hex) de un archivo abierto o de un `File` de Django, leído por trozos.
+    """
+    h = hashlib.sha256()
+    if hasattr(archivo, "chunks"):
+        for trozo in archivo.chunks(TROZO):
+            h.update(trozo)
+    else:
+        for trozo in iter(lambda: archivo.read(TROZO), b""):
+            h.update(trozo)
+    return h.hexdigest()
+
+
+class AlmacenPorContenido(FileSystemStorage):
+    """
+    @class AlmacenPorContenido
+    @brief `FileSystemStorage` que nombra cada archivo por su SHA-256 y no duplica contenido.
+    @details El nombre que propone `upload_to` sólo aporta la extensión.
+    """
+
+    def _save(self, name, content):
+        if hasattr(content, "seek"):
+            content.seek(0)
+        destino = nombre_por_contenido(digest_de(content), extension(name))
+        if self.exists(destino):
+            self._reusar(destino)
+            return destino
+        if hasattr(content, "seek"):
+            content.seek(0)
+        guardado = super()._save(destino, content)
+        if guardado != destino:
+            # Otra subida igual lo escribió entre `exists` y `_save`: mismo contenido
+            self.delete(guardado)
+            self._reusar(destino)
+            return destino
+        store.inc("photo_store_writes_total", result="new")
+        return destino
+
+    def _reusar(self, nombre):
+        # La fila que lo usará aún no existe: el mtime reciente evita que `liberar`
+        # (o `limpiar_media`) lo borre mientras tanto
+        try:
+            os.utime(self.path(nombre))
+        except FileNotFoundError:
+            pass
+        store.inc("photo_store_writes_total", result="dedup")
+
+
+def almacen_fotos():
+    """
+    @brief Storage de `FotoPublicacion.imagen` (callable para que las migraciones no lo congelen).
+    """
+    return storages["fotos"]
+
+
+def referenciados(nombres) -> set:
+    """
+    @brief Cuáles de `nombres` usa alguna foto (viva, eliminada sin purgar o archivada).
+    @details Una consulta por índice (`imagen IN ...`) para las vivas y una sola pasada
+     por el archivo para todo el lote, no una por archivo.
+    """
+    from publicaciones.models import FotoPublicacion, PublicacionArchivada
+
+    nombres = set(nombres)
+    usados = set()
+    pendientes = list(nombres)
+    for i in range(0, len(pendientes), 500):
+        usados.update(
+            FotoPublicacion.objects.filter(imagen__in=pendientes[i:i + 500]).values_list("imagen", flat=True)
+        )
+    if usados == nombres or not PublicacionArchivada.objects.exists():
+        return usados
+    # Las archivadas guardan sus fotos como JSON: se leen una vez para todo el lote
+    for fotos in PublicacionArchivada.objects.values_list("fotos", flat=True).iterator(chunk_size=1000):
+        for foto in fotos or ():
+            if foto.get("imagen") in nombres:
+                usados.add(foto["imagen"])
+    return usados
+
+
+def liberar(nombres) -> int:
+    """
+    @brief Borra los archivos de `nombres` que ya no tienen referencias (y sus derivados).
+    @return Archivos borrados.
+    """
+    almacen = almacen_fotos()
+    reciente = time.time() - getattr(settings, "FOTOS_CONTENIDO_GRACIA", 600)
+    nombres = set(filter(None, nombres))
+    borrados = 0
+    for nombre in nombres - referenciados(nombres):
+        if es_por_contenido(nombre) and _mtime(almacen, nombre) > reciente:
+            continue
+        for ruta in [nombre, *_derivados(almacen, nombre)]:
+            try:
+                almacen.delete(ruta)
+                borrados += 1
+            except OSError:
+                logger.warning("No se pudo borrar %s", ruta, exc_info=True)
+    return borrados
+
+
+def _mtime(almacen, nombre: str) -> float:
+    try:
+        return os.path.getmtime(almacen.path(nombre))
+    except FileNotFoundError:
+        return 0.0
+
+
+def _derivados(almacen, nombre: str):
+    if not es_por_contenido(nombre):
+        return []
+    carpeta, archivo = os.path.split(nombre)
+    base = os.path.splitext(archivo)[0] + "."
+    try:
+        _, archivos = almacen.listdir(carpeta)
+    except FileNotFoundError:
+        return []
+    return [f"{carpeta}/{a}" for a in archivos if a.startswith(base) and a != archivo]
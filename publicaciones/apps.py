@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class PublicacionesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'publicaciones'
+
+    def ready(self):
+        # Abre el índice de CPs antes de que los workers atiendan peticiones
+        from publicaciones.codigos_postales import catalogo
+        catalogo()
@@ -0,0 +1,127 @@
+"""
+@file archivo.py
+@brief Archivo de publicaciones cerradas: las saca de la tabla viva por lotes y las restaura.
+@details
+ `home` y `resultados_busqueda` sólo muestran publicaciones disponibles, pero las
+ cerradas se quedaban para siempre en `publicaciones_publicacion`, haciendo más grandes
+ sus índices y recorridos. `archivar` mueve las cerradas cuya última actualización
+ (el cierre actualiza `fecha_actualizacion`) tiene más de `ARCHIVO_DIAS` días a
+ `PublicacionArchivada`, en lotes de `ARCHIVO_LOTE` con una transacción por lote:
+  - La publicación archivada conserva el id; el detalle (`publicaciones/detalle.py`)
+    la sigue mostrando en sólo lectura y el panel del vendedor la lista aparte.
+  - Las fotos se guardan como lista (los archivos no se tocan) y los favoritos como
+    `(usuario, fecha)`; se borran de sus tablas junto con la publicación.
+  - `restaurar` hace lo inverso: recrea la publicación con el mismo id, sus fotos y
+    los favoritos de usuarios que aún existen, y borra la fila archivada.
+
+ Se corre con `manage.py archivar_publicaciones` (p.ej. diario desde cron).
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from publicaciones.detalle import invalidar_detalle
+from publicaciones.models import Favorito, FotoPublicacion, Publicacion, PublicacionArchivada
+
+#: Campos que se copian tal cual entre `Publicacion` y `PublicacionArchivada`
+CAMPOS = [
+    f.attname for f in Publicacion._meta.concrete_fields
+    if f.attname in {g.attname for g in PublicacionArchivada._meta.concrete_fields}
+]
+
+
+def candidatas(dias: int | None = None):
+    """
+    @brief Publicaciones cerradas sin cambios en los últimos `dias` (por omisión `ARCHIVO_DIAS`).
+    """
+    dias = getattr(settings, "ARCHIVO_DIAS", 180) if dias is None else dias
+    limite = timezone.now() - timedelta(days=dias)
+    return Publicacion.objects.filter(estatus="cerrada", fecha_actualizacion__lt=limite)
+
+
+def _archivar_lote(pks) -> int:
+    with transaction.atomic():
+        pubs = list(Publicacion.objects.select_for_update().filter(pk__in=pks, estatus="cerrada"))
+        fotos, favoritos = {}, {}
+        for foto in FotoPublicacion.objects.filter(publicacion__in=pubs).order_by("orden", "id"):
+            fotos.setdefault(foto.publicacion_id, []).append(
+                {"imagen": foto.imagen.name, "es_portada": foto.es_portada, "orden": foto.orden}
+            )
+        for fav in Favorito.objects.filter(publicacion__in=pubs).order_by("creado"):
+            favoritos.setdefault(fav.publicacion_id, []).append(
+                {"usuario_id": fav.usuario_id, "creado": fav.creado.isoformat()}
+            )
+        PublicacionArchivada.objects.bulk_create([
+            PublicacionArchivada(
+                **{campo: getattr(pub, campo) for campo in CAMPOS},
+                fotos=fotos.get(pub.pk, []), favoritos=favoritos.get(pub.pk, []),
+            )
+            for pub in pubs
+        ])
+        # En cascada se van fotos y favoritos; las señales invalidan cachés y generaciones
+        archivadas = [pub.pk for pub in pubs]
+        Publicacion.objects.filter(pk__in=archivadas).delete()
+        # Un lector concurrente pudo volver a guardar el detalle vivo antes del commit
+        transaction.on_commit(lambda: invalidar_detalle(*archivadas))
+    return len(pubs)
+
+
+def archivar(dias: int | None = None, lote: int | None = None, limite: int | None = None) -> int:
+    """
+    @brief Mueve al archivo las publicaciones de `candidatas(dias)`, un lote por transacción.
+    @param lote Publicaciones por transacción (por omisión `ARCHIVO_LOTE`).
+    @param limite Máximo de publicaciones a archivar en esta corrida.
+    @return Cuántas se archivaron.
+    """
+    lote = lote or getattr(settings, "ARCHIVO_LOTE", 200)
+    total = 0
+    while limite is None or total < limite:
+        tamano = lote if limite is None else min(lote, limite - total)
+        pks = list(candidatas(dias).order_by("pk").values_list("pk", flat=True)[:tamano])
+        if not pks:
+            break
+        total += _archivar_lote(pks)
+    return total
+
+
+@transaction.atomic
+def restaurar(archivada: PublicacionArchivada) -> Publicacion:
+    """
+    @brief Devuelve una publicación archivada a la tabla viva (mismo id, fotos y favoritos).
+    @details Queda cerrada; el vendedor decide si la vuelve a poner disponible. Su
+     `fecha_actualizacion` es la de la restauración, así que no se vuelve a archivar
+     de inmediato.
+    """
+    pub = Publicacion(**{campo: getattr(archivada, campo) for campo in CAMPOS})
+    pub.save(force_insert=True)
+    # auto_now_add pisa la fecha original al insertar
+    Publicacion.objects.filter(pk=pub.pk).update(fecha_creacion=archivada.fecha_creacion)
+    pub.fecha_creacion = archivada.fecha_creacion
+
+    FotoPublicacion.objects.bulk_create([
+        FotoPublicacion(publicacion=pub, imagen=f["imagen"], es_portada=f.get("es_portada", False), orden=f.get("orden", 0))
+        for f in archivada.fotos
+    ])
+    existentes = set(
+        get_user_model().objects.filter(pk__in=[f["usuario_id"] for f in archivada.favoritos]).values_list("pk", flat=True)
+    )
+    favoritos = [
+        Favorito(usuario_id=f["usuario_id"], publicacion=pub)
+        for f in archivada.favoritos if f["usuario_id"] in existentes
+    ]
+    Favorito.objects.bulk_create(favoritos)
+    # Igual que arriba: `creado` es auto_now_add; se devuelve la fecha original
+    creados = {f["usuario_id"]: parse_datetime(f["creado"]) for f in archivada.favoritos}
+    restaurados = list(Favorito.objects.filter(publicacion=pub))
+    for fav in restaurados:
+        fav.creado = creados[fav.usuario_id]
+    Favorito.objects.bulk_update(restaurados, ["creado"])
+
+    archivada.delete()
+    transaction.on_commit(lambda: invalidar_detalle(pub.pk))
+    return pub
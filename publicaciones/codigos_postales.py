@@ -0,0 +1,224 @@
+"""
+@file codigos_postales.py
+@brief Catálogo de códigos postales (SEPOMEX) en un índice binario mapeado en memoria.
+@details
+ Con el CP el formulario de publicación llena ciudad, estado y la lista de colonias sin
+ consultar servicios externos, y el mapa se centra en el centroide del CP.
+
+ El índice (`CODIGOS_POSTALES_INDICE`) lo genera `manage.py compilar_codigos_postales`
+ a partir del archivo de SEPOMEX y se versiona con el proyecto. Formato (little endian):
+  - Cabecera `<4sHHI`: `b"CPMX"`, versión, reservado, número de CPs.
+  - Un registro de tamaño fijo por CP, ordenados por CP (búsqueda binaria):
+    `cp, lat, lon, ciudad, municipio, estado, colonias, n_colonias`; las coordenadas
+    son `float32` (NaN sin centroide) y los textos, desplazamientos en el archivo.
+  - Los textos: `uint16` con el largo + UTF-8. Ciudad, municipio y estado se guardan
+    una sola vez; las colonias de un CP van seguidas.
+
+ El archivo se abre con `mmap` al arrancar la app: no se copia a la memoria de cada
+ worker (el sistema comparte las páginas) y una búsqueda sólo toca ~17 registros.
+ Sin índice el catálogo está vacío y todo sigue funcionando como antes.
+"""
+
+import functools
+import math
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+MAGIA = b"CPMX"
+VERSION = 1
+
+_CABECERA = struct.Struct("<4sHHI")
+_REGISTRO = struct.Struct("<IffIIIIH2x")
+_CP = struct.Struct("<I")
+_LARGO = struct.Struct("<H")
+
+
+class Catalogo:
+    """
+    @class Catalogo
+    @brief Lector del índice; `buscar(cp)` hace una búsqueda binaria sobre el `mmap`.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self._mm = None
+        self._n = 0
+        try:
+            with open(self.ruta, "rb") as fh:
+                self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # no existe o está vacío
+            return
+        magia, version, _, n = _CABECERA.unpack_from(self._mm, 0)
+        if magia != MAGIA or version != VERSION:
+            raise ValueError(f"{self.ruta} no es un índice de códigos postales v{VERSION}")
+        self._n = n
+
+    def __len__(self):
+        return self._n
+
+    def _texto(self, desplazamiento: int) -> tuple[str, int]:
+        (largo,) = _LARGO.unpack_from(self._mm, desplazamiento)
+        inicio = desplazamiento + _LARGO.size
+        return self._mm[inicio:inicio + largo].decode("utf-8"), inicio + largo
+
+    def _indice(self, cp: int):
+        bajo, alto = 0, self._n - 1
+        while bajo <= alto:
+            medio = (bajo + alto) // 2
+            (valor,) = _CP.unpack_from(self._mm, _CABECERA.size + medio * _REGISTRO.size)
+            if valor == cp:
+                return medio
+            if valor < cp:
+                bajo = medio + 1
+            else:
+                alto = medio - 1
+        return None
+
+    def buscar(self, cp):
+        """
+        @brief Datos de un código postal.
+        @param cp CP de 5 dígitos (texto o número).
+        @return Dict `{codigo_postal, colonias, ciudad, municipio, estado, centroide}`
+         (`centroide` es `(lat, lon)` o `None`), o `None` si no está en el catálogo.
+        """
+        cp = str(cp or "").strip()
+        if not self._n or len(cp) != 5 or not cp.isdigit():
+            return None
+        i = self._indice(int(cp))
+        if i is None:
+            return None
+        _, lat, lon, ciudad, municipio, estado, colonias, n = _REGISTRO.unpack_from(
+            self._mm, _CABECERA.size + i * _REGISTRO.size
+        )
+        nombres, pos = [], colonias
+        for _ in range(n):
+            nombre, pos = self._texto(pos)
+            nombres.append(nombre)
+        return {
+            "codigo_postal": cp,
+            "colonias": nombres,
+            "ciudad": self._texto(ciudad)[0],
+            "municipio": self._texto(municipio)[0],
+            "estado": self._texto(estado)[0],
+            "centroide": None if math.isnan(lat) else (round(lat, 5), round(lon, 5)),
+        }
+
+
+@functools.lru_cache(maxsize=1)
+def _catalogo(ruta: str) -> Catalogo:
+    return Catalogo(ruta)
+
+
+def catalogo() -> Catalogo:
+    """
+    @brief Catálogo del proceso (se abre una vez por ruta de `CODIGOS_POSTALES_INDICE`).
+    """
+    return _catalogo(str(settings.CODIGOS_POSTALES_INDICE))
+
+
+def recargar():
+    """
+    @brief Vuelve a abrir el índice en la siguiente búsqueda (p.ej. tras recompilarlo).
+    """
+    _catalogo.cache_clear()
+
+
+def buscar(cp):
+    return catalogo().buscar(cp)
+
+
+def centroide(cp):
+    """
+    @brief `(lat, lon)` aproximado del CP o `None`.
+    """
+    datos = buscar(cp)
+    return datos["centroide"] if datos else None
+
+
+# ============================
+# Compilación
+# ============================
+
+#: Columnas del archivo de SEPOMEX (`CPdescarga.txt`) que se usan
+_COLUMNAS = ("d_codigo", "d_asenta", "D_mnpio", "d_estado", "d_ciudad")
+
+
+def leer_sepomex(lineas):
+    """
+    @brief Lee el archivo de SEPOMEX (texto separado por `|`, con una línea de aviso
+     antes del encabezado).
+    @param lineas Iterable de líneas ya decodificadas (el archivo oficial es latin-1).
+    @return Dict `cp -> {colonias, ciudad, municipio, estado}`; si el asentamiento no
+     tiene ciudad se usa el municipio.
+    """
+    cps, posiciones = {}, None
+    for linea in lineas:
+        campos = linea.rstrip("\r\n").split("|")
+        if posiciones is None:
+            if campos[0] == "d_codigo":
+                posiciones = [campos.index(c) for c in _COLUMNAS]
+            continue
+        if len(campos) <= max(posiciones):
+            continue
+        cp, colonia, municipio, estado, ciudad = (campos[p].strip() for p in posiciones)
+        if len(cp) != 5 or not cp.isdigit():
+            continue
+        datos = cps.setdefault(cp, {
+            "colonias": set(), "ciudad": ciudad or municipio, "municipio": municipio, "estado": estado,
+        })
+        if colonia:
+            datos["colonias"].add(colonia)
+    return cps
+
+
+def compilar(cps: dict, destino, centroides=None) -> int:
+    """
+    @brief Escribe el índice binario.
+    @param cps Dict `cp -> {colonias, ciudad, municipio, estado}` (ver `leer_sepomex`).
+    @param destino Ruta del índice; se reemplaza de forma atómica, así los procesos que
+     ya lo tienen abierto siguen leyendo el anterior hasta `recargar()`.
+    @param centroides Dict `cp -> (lat, lon)` opcional.
+    @return Número de CPs escritos.
+    """
+    centroides = centroides or {}
+    orden = sorted(cps)
+    textos, blob = {}, bytearray()
+    inicio_textos = _CABECERA.size + len(orden) * _REGISTRO.size
+
+    def guardar(texto: str, compartido=True) -> int:
+        if compartido and texto in textos:
+            return textos[texto]
+        datos = texto.encode("utf-8")[:0xFFFF]
+        desplazamiento = inicio_textos + len(blob)
+        blob.extend(_LARGO.pack(len(datos)))
+        blob.extend(datos)
+        if compartido:
+            textos[texto] = desplazamiento
+        return desplazamiento
+
+    registros = bytearray()
+    for cp in orden:
+        datos = cps[cp]
+        ciudad, municipio, estado = (guardar(datos[c]) for c in ("ciudad", "municipio", "estado"))
+        colonias = sorted(datos["colonias"], key=str.casefold)[:0xFFFF]
+        primera = inicio_textos + len(blob)
+        for colonia in colonias:
+            guardar(colonia, compartido=False)
+        lat, lon = centroides.get(cp) or (math.nan, math.nan)
+        registros.extend(_REGISTRO.pack(int(cp), lat, lon, ciudad, municipio, estado, primera, len(colonias)))
+
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporal = tempfile.mkstemp(dir=destino.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(_CABECERA.pack(MAGIA, VERSION, 0, len(orden)))
+        fh.write(registros)
+        fh.write(blob)
+    os.chmod(temporal, 0o644)
+    os.replace(temporal, destino)
+    return len(orden)
@@ -0,0 +1,138 @@
+"""
+@file detalle.py
+@brief Caché del detalle de una publicación como un único objeto serializado.
+@details
+ La página de detalle necesita la publicación, sus fotos ordenadas, el contacto del
+ vendedor (`usuario__perfil`) y el número de likes. Todo eso se arma una vez en un
+ diccionario y se guarda en caché bajo `detalle:<pk>`; una página "caliente" cuesta
+ una sola lectura de caché. Lo único que depende del visitante (si ya le dio like) se
+ resuelve en la vista.
+
+ Las señales de `publicaciones/models.py` invalidan la llave cuando cambia la
+ publicación, alguna de sus fotos, sus favoritos o el perfil/usuario del vendedor, al
+ confirmarse la transacción (antes, otra petición podría volver a guardar la fila
+ vieja). Por lo mismo el diccionario se arma siempre desde la primaria aunque la
+ vista lea de réplicas: lo comparten todos durante `DETALLE_CACHE_TIMEOUT` y una
+ réplica atrasada lo dejaría viejo todo ese tiempo.
+
+ Si la publicación ya no está en la tabla viva se busca en el archivo
+ (`publicaciones/archivo.py`) y se muestra igual, marcada con `archivada`.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Prefetch
+from django.http import Http404
+
+from publicaciones.almacen import almacen_fotos
+from publicaciones.codigos_postales import centroide
+from publicaciones.models import FotoPublicacion, Publicacion, PublicacionArchivada
+
+#: Incrementar si cambia la forma del diccionario
+VERSION_DETALLE = 3
+
+
+def llave_detalle(pk) -> str:
+    return f"detalle:v{VERSION_DETALLE}:{pk}"
+
+
+def _serializar(pub) -> dict:
+    """
+    @brief Convierte una publicación (con fotos y vendedor precargados) en un dict plano.
+    @details Las llaves de campos coinciden con los atributos del modelo para que la
+     plantilla los use igual (`pub.titulo`, `pub.direccion_completa`, ...).
+    """
+    usuario = pub.usuario
+    perfil = getattr(usuario, "perfil", None)
+    archivada = isinstance(pub, PublicacionArchivada)
+    if archivada:
+        fotos = [{"id": i, "url": almacen_fotos().url(f["imagen"])} for i, f in enumerate(pub.fotos)]
+    else:
+        # Sólo existe el archivo original; si se agregan miniaturas van aquí
+        fotos = [{"id": f.id, "url": f.imagen.url} for f in pub.fotos.all()]
+    datos = {
+        campo: getattr(pub, campo)
+        for campo in (
+            "id", "titulo", "descripcion", "precio", "tipo_operacion", "recamaras", "banos",
+            "estacionamientos", "metros_construccion", "metros_terreno", "tipo_financiamiento",
+            "estatus", "codigo_postal", "latitud", "longitud", "fecha_creacion", "fecha_actualizacion",
+            "direccion_completa", "tiene_coordenadas",
+        )
+    }
+    datos.update({
+        "get_tipo_operacion_display": pub.get_tipo_operacion_display(),
+        "get_tipo_financiamiento_display": pub.get_tipo_financiamiento_display(),
+        "get_estatus_display": pub.get_estatus_display(),
+        "fotos": fotos,
+        "archivada": archivada,
+        "vendedor": {
+            "nombre": usuario.get_full_name() or usuario.username,
+            "email": usuario.email,
+            "whatsapp": getattr(perfil, "whatsapp", None),
+        },
+        "like_count": pub.like_count,
+        # Sin coordenadas propias el mapa muestra la zona del CP (catálogo de SEPOMEX)
+        "centroide": None if pub.tiene_coordenadas else centroide(pub.codigo_postal),
+    })
+    return datos
+
+
+def _consulta(pk):
+    return (
+        Publicacion.objects.using("default")
+        .select_related("usuario__perfil")
+        .prefetch_related(Prefetch("fotos", queryset=FotoPublicacion.objects.order_by("orden", "id")))
+        .annotate(like_count=Count("favoritos"))
+        .filter(pk=pk)
+    )
+
+
+def _consulta_archivada(pk):
+    return PublicacionArchivada.objects.using("default").select_related("usuario__perfil").filter(pk=pk)
+
+
+def obtener_detalle(pk) -> dict:
+    """
+    @brief Devuelve el dict del detalle desde caché o lo construye.
+    @param pk ID de la publicación.
+    @return Diccionario serializable con todos los datos de la página.
+    @throws Http404 Si la publicación no existe.
+    """
+    llave = llave_detalle(pk)
+    datos = cache.get(llave)
+    if datos is not None:
+        return datos
+
+    pub = _consulta(pk).first() or _consulta_archivada(pk).first()
+    if pub is None:
+        raise Http404("Publicación no encontrada")
+
+    datos = _serializar(pub)
+    cache.set(llave, datos, getattr(settings, "DETALLE_CACHE_TIMEOUT", 60 * 60))
+    return datos
+
+
+async def aobtener_detalle(pk) -> dict:
+    """
+    @brief Versión asíncrona de `obtener_detalle` (caché y ORM asíncronos).
+    """
+    llave = llave_detalle(pk)
+    datos = await cache.aget(llave)
+    if datos is not None:
+        return datos
+
+    pub = await _consulta(pk).afirst() or await _consulta_archivada(pk).afirst()
+    if pub is None:
+        raise Http404("Publicación no encontrada")
+
+    datos = _serializar(pub)
+    await cache.aset(llave, datos, getattr(settings, "DETALLE_CACHE_TIMEOUT", 60 * 60))
+    return datos
+
+
+def invalidar_detalle(*pks):
+    """
+    @brief Borra de caché el detalle de las publicaciones indicadas.
+    """
+    if pks:
+        cache.delete_many([llave_detalle(pk) for pk in pks])
@@ -31,7 +31,7 @@ class PublicacionForm(forms.ModelForm):
             "calle": forms.TextInput(attrs={"placeholder": "Calle", "class": "input-text dir-input"}),
             "numero": forms.TextInput(attrs={"placeholder": "Número (opcional)", "class": "input-text dir-input"}),
             "codigo_postal": forms.TextInput(attrs={"placeholder": "CP (5 dígitos)", "class": "input-text dir-input"}),
-            "colonia": forms.TextInput(attrs={"placeholder": "Colonia", "class": "input-text dir-input"}),
+            "colonia": forms.TextInput(attrs={"placeholder": "Colonia", "class": "input-text dir-input", "list": "colonias-cp"}),
             "ciudad": forms.TextInput(attrs={"placeholder": "Ciudad", "class": "input-text dir-input"}),
             "estado": forms.TextInput(attrs={"placeholder": "Estado", "class": "input-text dir-input"}),
 
@@ -0,0 +1,253 @@
+"""
+@file geocodificacion.py
+@brief Geocodificación de direcciones del formulario de publicación, del lado del servidor.
+@details
+ El formulario ya no llama a Nominatim desde el navegador: pide
+ `publicaciones:geocodificar`, que resuelve en este orden:
+  1. Caché (`vivienda.cache.obtener_o_calcular`): las peticiones simultáneas por la
+     misma dirección esperan a la primera en lugar de repetir la consulta.
+  2. Tabla `Geocodificacion`, por dirección normalizada (sin acentos, mayúsculas ni
+     puntuación; "Cd. Juárez" == "ciudad juarez"). Los "no encontrado" también se
+     guardan, pero sólo valen `GEOCODIFICACION_NEGATIVA_HORAS`.
+  3. El proveedor configurado en `GEOCODIFICACION_PROVEEDOR`:
+      * `Nominatim`: API pública de OpenStreetMap. Se respeta su límite de una
+        petición por segundo entre todos los workers (turnos en el caché compartido)
+        y cada consulta tiene `GEOCODIFICACION_TIMEOUT`. Todas las consultas de una
+        búsqueda (turnos incluidos) comparten un plazo de `GEOCODIFICACION_PLAZO`
+        segundos, así una búsqueda no retiene al worker más que eso.
+      * `ProveedorLocal`: sin red, para pruebas y desarrollo.
+
+ Si el proveedor falla, no hay turno o se agota el plazo se lanza `ProveedorNoDisponible` y no
+ se guarda nada; el formulario sigue permitiendo marcar el punto en el mapa a mano.
+"""
+
+import functools
+import hashlib
+import json
+import re
+import time
+import unicodedata
+import urllib.parse
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from publicaciones.models import Geocodificacion
+from vivienda.cache import obtener_o_calcular
+
+#: Campos de `Publicacion` que forman la dirección
+CAMPOS_DIRECCION = ("calle", "numero", "colonia", "codigo_postal", "ciudad", "estado")
+
+
+class ProveedorNoDisponible(Exception):
+    """
+    El proveedor no respondió, falló o no hubo turno dentro de la espera permitida.
+    """
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Normalización
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _limpiar(texto) -> str:
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^a-z0-9ñ]+", " ", texto).split())
+
+
+def normalizar(partes: dict) -> dict:
+    """
+    @brief Limpia cada campo de la dirección y unifica variantes comunes de ciudad/estado.
+    """
+    limpias = {campo: _limpiar(partes.get(campo)) for campo in CAMPOS_DIRECCION}
+    ciudad = re.sub(r"^(ciudad|cd)\s+", "", limpias["ciudad"])
+    if "juarez" in ciudad:
+        ciudad = "juarez"
+    limpias["ciudad"] = ciudad
+    if re.fullmatch(r"chih(uahua)?", limpias["estado"]):
+        limpias["estado"] = "chihuahua"
+    return limpias
+
+
+def direccion_normalizada(partes: dict) -> str:
+    """
+    @brief Llave de la tabla `Geocodificacion`: `calle numero|colonia|cp|ciudad|estado`.
+    """
+    n = normalizar(partes)
+    linea1 = " ".join(filter(None, (n["calle"], n["numero"])))
+    return "|".join((linea1, n["colonia"], n["codigo_postal"], n["ciudad"], n["estado"]))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Proveedores
+# ──────────────────────────────────────────────────────────────────────────────
+
+class Proveedor:
+    """
+    Interfaz de un proveedor: `buscar(partes)` devuelve `(lat, lon)` o `None` si la
+    dirección no existe; lanza `ProveedorNoDisponible` si no pudo responder.
+    """
+    nombre = ""
+
+    def buscar(self, partes: dict):
+        raise NotImplementedError
+
+
+def _esperar_turno(plazo: float):
+    """
+    Un turno de `GEOCODIFICACION_INTERVALO` segundos por servidor (`cache.add` en el
+    nivel compartido); espera hasta `GEOCODIFICACION_ESPERA_MAX` sin pasar de `plazo`
+    (`time.monotonic()`).
+
+    El límite es de mejor esfuerzo: con `FileBasedCache` (el caché compartido en
+    producción) `add` no es atómico entre procesos, así que dos workers pueden tomar
+    el mismo turno en raras ocasiones. Basta para no rebasar la política de Nominatim
+    por mucho; no es un candado.
+    """
+    intervalo = getattr(settings, "GEOCODIFICACION_INTERVALO", 1.0)
+    limite = min(plazo, time.monotonic() + getattr(settings, "GEOCODIFICACION_ESPERA_MAX", 3))
+    while True:
+        ranura = int(time.time() / intervalo)
+        if cache.add(f"geo:turno:{ranura}", 1, int(intervalo) + 1):
+            return
+        if time.monotonic() >= limite:
+            raise ProveedorNoDisponible("Límite de consultas al proveedor")
+        time.sleep(min(0.1, intervalo))
+
+
+class Nominatim(Proveedor):
+    """
+    API de búsqueda de OpenStreetMap. Prueba de la dirección más completa a la más
+    general y termina con la búsqueda estructurada, igual que lo hacía el formulario.
+    """
+    nombre = "nominatim"
+    URL = "https://nominatim.openstreetmap.org/search"
+
+    def _consultas(self, partes: dict):
+        calle = " ".join(filter(None, (partes.get("calle"), partes.get("numero"))))
+        col, cp = partes.get("colonia"), partes.get("codigo_postal")
+        cd, edo = partes.get("ciudad"), partes.get("estado")
+        vistas = set()
+        for campos in ((calle, col, cp, cd, edo), (calle, col, cd, edo), (calle, cd, edo)):
+            q = ", ".join(filter(None, (*campos, "México")))
+            if q not in vistas:
+                vistas.add(q)
+                yield {"q": q}
+        estructurada = {"street": calle, "neighbourhood": col, "postalcode": cp, "city": cd, "state": edo}
+        yield {k: v for k, v in estructurada.items() if v} | {"country": "México"}
+
+    def _pedir(self, params: dict, plazo: float):
+        params = params | {"format": "json", "limit": 1, "countrycodes": "mx"}
+        peticion = urllib.request.Request(
+            f"{self.URL}?{urllib.parse.urlencode(params)}",
+            headers={
+                "User-Agent": getattr(settings, "GEOCODIFICACION_USER_AGENT", "ViviendaYa"),
+                "Accept-Language": "es",
+            },
+        )
+        _esperar_turno(plazo)
+        restante = plazo - time.monotonic()
+        if restante <= 0:
+            raise ProveedorNoDisponible("Se agotó el plazo de la búsqueda")
+        timeout = min(getattr(settings, "GEOCODIFICACION_TIMEOUT", 4), restante)
+        try:
+            with urllib.request.urlopen(peticion, timeout=timeout) as resp:
+                datos = json.load(resp)
+        except (OSError, ValueError) as e:
+            raise ProveedorNoDisponible(str(e)) from e
+        if datos:
+            return float(datos[0]["lat"]), float(datos[0]["lon"])
+        return None
+
+    def buscar(self, partes: dict):
+        plazo = time.monotonic() + getattr(settings, "GEOCODIFICACION_PLAZO", 8)
+        for params in self._consultas(partes):
+            encontrada = self._pedir(params, plazo)
+            if encontrada:
+                return encontrada
+        return None
+
+
+class ProveedorLocal(Proveedor):
+    """
+    Sustituto sin red (pruebas y desarrollo). Usa `GEOCODIFICACION_LOCAL`
+    (`{direccion_normalizada: (lat, lon) | None}`); las direcciones que no están ahí
+    reciben un punto estable a menos de ~5 km de `GEOCODIFICACION_LOCAL_CENTRO`.
+    """
+    nombre = "local"
+
+    def buscar(self, partes: dict):
+        llave = direccion_normalizada(partes)
+        fijas = getattr(settings, "GEOCODIFICACION_LOCAL", {})
+        if llave in fijas:
+            return fijas[llave]
+        lat, lon = getattr(settings, "GEOCODIFICACION_LOCAL_CENTRO", (31.6904, -106.4245))
+        h = hashlib.blake2b(llave.encode("utf-8"), digest_size=4).digest()
+        d_lat = (int.from_bytes(h[:2], "big") - 32768) / 700_000
+        d_lon = (int.from_bytes(h[2:], "big") - 32768) / 700_000
+        return round(lat + d_lat, 6), round(lon + d_lon, 6)
+
+
+@functools.lru_cache(maxsize=None)
+def _proveedor(ruta: str) -> Proveedor:
+    return import_string(ruta)()
+
+
+def proveedor() -> Proveedor:
+    return _proveedor(getattr(settings, "GEOCODIFICACION_PROVEEDOR", "publicaciones.geocodificacion.Nominatim"))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# API
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _resolver(direccion: str, partes: dict):
+    guardada = Geocodificacion.objects.filter(direccion=direccion).first()
+    if guardada is not None:
+        if guardada.latitud is not None:
+            return {"lat": guardada.latitud, "lon": guardada.longitud}
+        vigencia = timedelta(hours=getattr(settings, "GEOCODIFICACION_NEGATIVA_HORAS", 24))
+        if guardada.creado >= timezone.now() - vigencia:
+            return None
+
+    prov = proveedor()
+    encontrada = prov.buscar(partes)
+    lat, lon = encontrada if encontrada else (None, None)
+    Geocodificacion.objects.update_or_create(
+        direccion=direccion,
+        defaults={"latitud": lat, "longitud": lon, "proveedor": prov.nombre, "creado": timezone.now()},
+    )
+    return {"lat": lat, "lon": lon} if encontrada else None
+
+
+def geocodificar(partes: dict):
+    """
+    @brief Coordenadas de una dirección.
+    @param partes Dict con los campos de `CAMPOS_DIRECCION` (los vacíos se ignoran).
+    @return `{"lat": float, "lon": float}` o `None` si no se encontró.
+    @throws ProveedorNoDisponible Si hubo que consultar al proveedor y no respondió.
+    """
+    direccion = direccion_normalizada(partes)
+    llave = "geo:" + hashlib.sha1(direccion.encode("utf-8")).hexdigest()
+    # El candado debe durar lo que una búsqueda completa; si no, otro worker repite las consultas
+    espera = getattr(settings, "GEOCODIFICACION_PLAZO", 8) + 2
+    return obtener_o_calcular(
+        llave, lambda: _resolver(direccion, partes), getattr(settings, "GEOCODIFICACION_CACHE_TIMEOUT", 60 * 60),
+        espera=espera,
+    )
+
+
+def permitir_consulta(usuario_id) -> bool:
+    """
+    @brief Límite por usuario: `GEOCODIFICACION_POR_MINUTO` búsquedas por minuto.
+    """
+    llave = f"geo:usuario:{usuario_id}:{int(time.time() // 60)}"
+    cache.add(llave, 0, 60)
+    try:
+        return cache.incr(llave) <= getattr(settings, "GEOCODIFICACION_POR_MINUTO", 30)
+    except ValueError:  # expiró entre add e incr
+        return True
@@ -0,0 +1,182 @@
+"""
+@file huerfanos.py
+@brief Recolector de archivos huérfanos en `MEDIA_ROOT/publicaciones/`.
+@details
+ Quedan archivos sin fila que los use cuando se reemplaza una foto en el formset de
+ `editar_publicacion`, cuando se abandona una subida o cuando algo borra filas sin
+ pasar por `purga.py`. `recolectar()`:
+  1. Arma el conjunto de referencias: los nombres de `FotoPublicacion.imagen` y de
+     `PublicacionArchivada.fotos`, leídos con `iterator()` y guardados como huellas
+     de 64 bits en un `array` ordenado (8 bytes por foto; con millones de fotos son
+     unos MB, no cientos como un `set` de cadenas). Se guarda el nombre sin
+     extensión, así también cuentan sus derivados (`foto.<variante>.webp`). No se
+     usa `foto_<sufijo>`: es lo que agrega Django al repetirse un nombre subido.
+  2. Recorre el árbol con `os.scandir`, un directorio por tarea en un
+     `ThreadPoolExecutor` (el tiempo se va en E/S del sistema de archivos).
+  3. Un archivo es huérfano si ni su nombre ni su nombre sin el último sufijo de
+     variante está en el conjunto y su mtime tiene más de `MEDIA_GC_GRACIA_HORAS`
+     (protege las subidas en curso: el archivo se escribe antes que la fila).
+
+ Una colisión de huellas sólo hace que se conserve un huérfano, nunca que se borre
+ una foto en uso. Se corre con `manage.py limpiar_media`.
+"""
+
+import hashlib
+import os
+import re
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from publicaciones.models import FotoPublicacion, PublicacionArchivada
+
+#: Carpeta (relativa a `MEDIA_ROOT`) que se recorre
+PREFIJO = "publicaciones"
+
+#: Último sufijo de variante de un derivado: `foto.<variante>`
+_VARIANTE = re.compile(r"\.[\w-]+$")
+
+
+def _sin_extension(nombre: str) -> str:
+    return os.path.splitext(nombre)[0]
+
+
+def huella(nombre: str) -> int:
+    """
+    @brief Huella de 64 bits de un nombre de archivo sin extensión.
+    """
+    return int.from_bytes(hashlib.blake2b(_sin_extension(nombre).encode(), digest_size=8).digest(), "big")
+
+
+class Referencias:
+    """
+    @class Referencias
+    @brief Conjunto compacto (huellas ordenadas) de los archivos que usa alguna fila.
+    """
+
+    def __init__(self, nombres=()):
+        huellas = array("Q", (huella(n) for n in nombres if n))
+        self._huellas = array("Q", sorted(huellas))
+
+    def __len__(self):
+        return len(self._huellas)
+
+    def _tiene(self, valor: int) -> bool:
+        i = bisect_left(self._huellas, valor)
+        return i < len(self._huellas) and self._huellas[i] == valor
+
+    def __contains__(self, nombre: str) -> bool:
+        if self._tiene(huella(nombre)):
+            return True
+        # Derivado: `foto.<variante>.webp` -> `foto`
+        base = _VARIANTE.sub("", _sin_extension(nombre))
+        return base != _sin_extension(nombre) and self._tiene(huella(base))
+
+
+def nombres_referenciados():
+    """
+    @brief Nombres de archivo en uso, en streaming (fotos vivas, de lápidas y archivadas).
+    """
+    # `objects` de FotoPublicacion no filtra lápidas: sus archivos los borra la purga
+    yield from FotoPublicacion.objects.values_list("imagen", flat=True).iterator(chunk_size=5000)
+    for fotos in PublicacionArchivada.objects.values_list("fotos", flat=True).iterator(chunk_size=1000):
+        for foto in fotos or ():
+            yield foto.get("imagen")
+
+
+@dataclass
+class Resultado:
+    archivos: int = 0
+    bytes: int = 0
+    huerfanos: int = 0
+    bytes_huerfanos: int = 0
+    recientes: int = 0
+    borrados: int = 0
+    bytes_recuperados: int = 0
+
+
+def _escanear(raiz: str, relativa: str):
+    archivos, carpetas = [], []
+    with os.scandir(os.path.join(raiz, relativa)) as entradas:
+        for entrada in entradas:
+            ruta = f"{relativa}/{entrada.name}"
+            if entrada.is_dir(follow_symlinks=False):
+                carpetas.append(ruta)
+            elif entrada.is_file(follow_symlinks=False):
+                st = entrada.stat(follow_symlinks=False)
+                archivos.append((ruta, st.st_size, st.st_mtime))
+    return archivos, carpetas
+
+
+def recorrer(raiz: str, prefijo: str = PREFIJO, hilos: int = 8):
+    """
+    @brief Genera `(ruta relativa, tamaño, mtime)` de cada archivo bajo `raiz/prefijo`,
+     leyendo varios directorios a la vez.
+    """
+    if not os.path.isdir(os.path.join(raiz, prefijo)):
+        return
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="limpiar-media") as pool:
+        pendientes = {pool.submit(_escanear, raiz, prefijo)}
+        while pendientes:
+            listos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+            for tarea in listos:
+                try:
+                    archivos, carpetas = tarea.result()
+                except FileNotFoundError:  # la borró alguien más mientras tanto
+                    continue
+                pendientes |= {pool.submit(_escanear, raiz, c) for c in carpetas}
+                yield from archivos
+
+
+def recolectar(borrar: bool = False, gracia_horas: float | None = None, hilos: int = 8, raiz=None,
+               al_encontrar=None) -> Resultado:
+    """
+    @brief Busca (y con `borrar` elimina) los archivos huérfanos de `MEDIA_ROOT/publicaciones/`.
+    @param gracia_horas Antigüedad mínima para considerar huérfano un archivo (por
+     omisión `MEDIA_GC_GRACIA_HORAS`).
+    @param al_encontrar Se llama con `(ruta relativa, tamaño)` por cada huérfano.
+    """
+    gracia_horas = getattr(settings, "MEDIA_GC_GRACIA_HORAS", 24) if gracia_horas is None else gracia_horas
+    raiz = str(raiz or settings.MEDIA_ROOT)
+    # Referencias antes de recorrer: lo que se suba durante el recorrido es reciente
+    referencias = Referencias(nombres_referenciados())
+    limite = time.time() - gracia_horas * 3600
+    resultado = Resultado()
+    tocadas = set()
+    for ruta, tamano, mtime in recorrer(raiz, hilos=hilos):
+        resultado.archivos += 1
+        resultado.bytes += tamano
+        if ruta in referencias:
+            continue
+        if mtime > limite:
+            resultado.recientes += 1
+            continue
+        resultado.huerfanos += 1
+        resultado.bytes_huerfanos += tamano
+        if al_encontrar:
+            al_encontrar(ruta, tamano)
+        if borrar:
+            try:
+                os.remove(os.path.join(raiz, ruta))
+            except FileNotFoundError:
+                continue
+            resultado.borrados += 1
+            resultado.bytes_recuperados += tamano
+            tocadas.add(os.path.dirname(ruta))
+    _quitar_carpetas_vacias(raiz, tocadas)
+    return resultado
+
+
+def _quitar_carpetas_vacias(raiz: str, carpetas):
+    # De la más profunda a la menos; nunca la carpeta base
+    for carpeta in sorted(carpetas, key=lambda c: c.count("/"), reverse=True):
+        while carpeta and carpeta != PREFIJO:
+            try:
+                os.rmdir(os.path.join(raiz, carpeta))
+            except OSError:  # no está vacía o ya no existe
+                break
+            carpeta = os.path.dirname(carpeta)
@@ -0,0 +1,33 @@
+"""
+@file archivar_publicaciones.py
+@brief Comando `archivar_publicaciones`: mueve al archivo las publicaciones cerradas antiguas.
+@details
+ Ver `publicaciones/archivo.py`. Pensado para correr a diario (cron). Con
+ `--solo-contar` sólo reporta cuántas se archivarían.
+
+ Ejemplo:
+  python manage.py archivar_publicaciones
+  python manage.py archivar_publicaciones --dias 90 --lote 500 --limite 10000
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from publicaciones.archivo import archivar, candidatas
+
+
+class Command(BaseCommand):
+    help = "Mueve las publicaciones cerradas sin cambios en ARCHIVO_DIAS días a la tabla de archivo."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=settings.ARCHIVO_DIAS)
+        parser.add_argument("--lote", type=int, default=settings.ARCHIVO_LOTE)
+        parser.add_argument("--limite", type=int, help="Máximo de publicaciones a archivar en esta corrida.")
+        parser.add_argument("--solo-contar", action="store_true", help="Sólo reporta cuántas se archivarían.")
+
+    def handle(self, *args, **opts):
+        if opts["solo_contar"]:
+            self.stdout.write(f"{candidatas(opts['dias']).count()} publicaciones por archivar.")
+            return
+        total = archivar(dias=opts["dias"], lote=opts["lote"], limite=opts["limite"])
+        self.stdout.write(self.style.SUCCESS(f"{total} publicaciones archivadas."))
@@ -0,0 +1,89 @@
+"""
+@file compilar_codigos_postales.py
+@brief Comando `compilar_codigos_postales`: genera el índice del catálogo de CPs.
+@details
+ Lee el archivo de SEPOMEX (https://www.correosdemexico.gob.mx/SSLServicios/ConsultaCP/CodigoPostal_Exportar.aspx,
+ formato TXT) y escribe `CODIGOS_POSTALES_INDICE` (ver publicaciones/codigos_postales.py).
+
+ SEPOMEX no publica coordenadas; el centroide de cada CP sale de:
+  1. `--centroides`, un CSV `cp,lat,lon` (p.ej. exportado de los polígonos del INEGI).
+  2. Si no viene en el CSV, la mediana de las publicaciones con coordenadas de ese CP.
+
+ Ejemplo:
+  python manage.py compilar_codigos_postales CPdescarga.txt
+  python manage.py compilar_codigos_postales CPdescarga.txt --estado Chihuahua --centroides cps.csv
+"""
+
+import csv
+import statistics
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from publicaciones import codigos_postales
+from publicaciones.models import Publicacion
+
+
+def _centroides_csv(ruta) -> dict:
+    centroides = {}
+    with open(ruta, newline="", encoding="utf-8") as fh:
+        for fila in csv.reader(fh):
+            try:
+                centroides[fila[0].strip().zfill(5)] = (float(fila[1]), float(fila[2]))
+            except (IndexError, ValueError):  # encabezado o fila incompleta
+                continue
+    return centroides
+
+
+def _centroides_publicaciones(cps) -> dict:
+    puntos = defaultdict(list)
+    consulta = (
+        Publicacion.objects
+        .filter(latitud__isnull=False, longitud__isnull=False)
+        .values_list("codigo_postal", "latitud", "longitud")
+    )
+    for cp, lat, lon in consulta.iterator(chunk_size=2000):
+        if cp in cps:
+            puntos[cp].append((lat, lon))
+    return {
+        cp: (statistics.median(p[0] for p in lista), statistics.median(p[1] for p in lista))
+        for cp, lista in puntos.items()
+    }
+
+
+class Command(BaseCommand):
+    help = "Compila el catálogo de códigos postales de SEPOMEX en el índice que usa el formulario."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="CPdescarga.txt de SEPOMEX (separado por |).")
+        parser.add_argument("--encoding", default="latin-1", help="Codificación del archivo (default latin-1).")
+        parser.add_argument("--estado", action="append", default=[],
+                            help="Sólo CPs de este estado (repetible). Por defecto todo el país.")
+        parser.add_argument("--centroides", help="CSV cp,lat,lon con el centroide de cada CP.")
+        parser.add_argument("--salida", default=str(settings.CODIGOS_POSTALES_INDICE),
+                            help="Ruta del índice (default CODIGOS_POSTALES_INDICE).")
+
+    def handle(self, *args, **opts):
+        try:
+            with open(opts["archivo"], encoding=opts["encoding"]) as fh:
+                cps = codigos_postales.leer_sepomex(fh)
+        except OSError as e:
+            raise CommandError(f"No se pudo leer {opts['archivo']}: {e}") from e
+        if not cps:
+            raise CommandError("El archivo no tiene el encabezado de SEPOMEX (d_codigo|d_asenta|...).")
+
+        if opts["estado"]:
+            estados = {e.casefold() for e in opts["estado"]}
+            cps = {cp: d for cp, d in cps.items() if d["estado"].casefold() in estados}
+
+        centroides = _centroides_publicaciones(cps.keys())
+        if opts["centroides"]:
+            centroides.update(_centroides_csv(opts["centroides"]))
+
+        n = codigos_postales.compilar(cps, opts["salida"], {cp: c for cp, c in centroides.items() if cp in cps})
+        codigos_postales.recargar()
+        con_centroide = sum(1 for cp in cps if cp in centroides)
+        self.stdout.write(self.style.SUCCESS(
+            f"{n} códigos postales ({con_centroide} con centroide) -> {opts['salida']}"
+        ))
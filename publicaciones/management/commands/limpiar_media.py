@@ -0,0 +1,45 @@
+"""
+@file limpiar_media.py
+@brief Comando `limpiar_media`: reporta (y con `--borrar` elimina) las fotos sin publicación en `MEDIA_ROOT`.
+@details
+ Ver `publicaciones/huerfanos.py`. Sin `--borrar` sólo reporta; conviene correrlo
+ así primero y después desde cron con `--borrar`.
+
+ Ejemplo:
+  python manage.py limpiar_media --listar
+  python manage.py limpiar_media --borrar --gracia-horas 48 --hilos 16
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from publicaciones.huerfanos import recolectar
+
+
+class Command(BaseCommand):
+    help = "Busca archivos de MEDIA_ROOT/publicaciones/ que ninguna foto usa y, con --borrar, los elimina."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--borrar", action="store_true", help="Elimina los huérfanos (por omisión sólo reporta).")
+        parser.add_argument(
+            "--gracia-horas", type=float, default=settings.MEDIA_GC_GRACIA_HORAS,
+            help="Antigüedad mínima de un huérfano (protege subidas en curso).",
+        )
+        parser.add_argument("--hilos", type=int, default=8, help="Directorios leídos en paralelo.")
+        parser.add_argument("--listar", action="store_true", help="Muestra la ruta de cada huérfano.")
+
+    def handle(self, *args, **opts):
+        listar = (lambda ruta, tamano: self.stdout.write(f"  {ruta} ({filesizeformat(tamano)})")) if opts["listar"] else None
+        r = recolectar(
+            borrar=opts["borrar"], gracia_horas=opts["gracia_horas"], hilos=opts["hilos"], al_encontrar=listar,
+        )
+        self.stdout.write(
+            f"{r.archivos} archivos ({filesizeformat(r.bytes)}); "
+            f"{r.huerfanos} huérfanos ({filesizeformat(r.bytes_huerfanos)}); "
+            f"{r.recientes} sin referencia dentro del periodo de gracia."
+        )
+        if opts["borrar"]:
+            self.stdout.write(self.style.SUCCESS(
+                f"{r.borrados} archivos borrados, {filesizeformat(r.bytes_recuperados)} recuperados."
+            ))
@@ -0,0 +1,378 @@
+"""
+@file loadtest_marketplace.py
+@brief Comando `loadtest_marketplace`: generador de carga local multi-proceso.
+@details
+ Reproduce una mezcla configurable de tráfico (home, búsqueda, detalle y toggle de
+ favorito) contra:
+  - `--target wsgi`: la aplicación WSGI en el mismo proceso (sin red ni servidor).
+  - `--target asgi`: la aplicación ASGI en el mismo proceso, con `--concurrencia`
+    peticiones simultáneas por proceso en un event loop. Para medir las vistas
+    asíncronas hay que correrlo con `VISTAS_ASYNC=1`.
+  - `--target http`: un servidor ya levantado (`runserver`, gunicorn) en `--url`.
+
+ Cada proceso usa una sesión autenticada de un usuario existente (creada directamente
+ en la tabla de sesiones) para poder pedir `home` y hacer toggles. Al final reporta por
+ vista conteo, errores, throughput y latencias p50/p95/p99, y la memoria residente
+ máxima por proceso (para comparar a igual memoria); guarda el resultado en JSON
+ (`--salida`) y opcionalmente lo compara con una corrida previa (`--comparar`).
+
+ Ejemplo (síncrono contra asíncrono, mismos procesos):
+  python manage.py loadtest_marketplace --procesos 4 --duracion 30 \
+      --mezcla home=20,search=40,detail=35,toggle=5 --salida bench/sync.json
+  VISTAS_ASYNC=1 python manage.py loadtest_marketplace --target asgi --concurrencia 8 \
+      --procesos 4 --duracion 30 --salida bench/async.json --comparar bench/sync.json
+"""
+
+import asyncio
+import json
+import multiprocessing
+import random
+import resource
+import secrets
+import statistics
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import reverse
+
+from publicaciones.models import Publicacion
+
+User = get_user_model()
+
+#: Mezcla por defecto (pesos relativos)
+MEZCLA_DEFAULT = "home=20,search=40,detail=35,toggle=5"
+
+TERMINOS_BUSQUEDA = ["casa", "departamento", "centro", "jardín", "residencia", "remodelada", "Juárez"]
+
+
+def _parse_mezcla(texto):
+    mezcla = {}
+    for parte in texto.split(","):
+        nombre, _, peso = parte.partition("=")
+        nombre = nombre.strip()
+        if nombre not in ("home", "search", "detail", "toggle"):
+            raise CommandError(f"Operación desconocida en --mezcla: {nombre!r}")
+        mezcla[nombre] = float(peso or 1)
+    return mezcla
+
+
+def percentil(valores_ordenados, p):
+    """
+    @brief Percentil por rango más cercano sobre una lista ya ordenada.
+    """
+    if not valores_ordenados:
+        return 0.0
+    k = max(0, min(len(valores_ordenados) - 1, int(round(p / 100 * len(valores_ordenados) + 0.5)) - 1))
+    return valores_ordenados[k]
+
+
+# ============================
+# Transportes
+# ============================
+
+class _WSGITransport:
+    """
+    @brief Llama a la aplicación WSGI en el mismo proceso mediante el cliente de pruebas.
+    """
+
+    def __init__(self, sessionid, csrftoken):
+        from django.test import Client
+        self.client = Client(HTTP_X_CSRFTOKEN=csrftoken)
+        self.client.cookies["sessionid"] = sessionid
+        self.client.cookies["csrftoken"] = csrftoken
+
+    def request(self, method, path):
+        response = self.client.generic(method, path)
+        # Consumir el cuerpo como lo haría un cliente real
+        if getattr(response, "streaming", False):
+            b"".join(response.streaming_content)
+        return response.status_code
+
+
+class _ASGITransport:
+    """
+    @brief Llama a la aplicación ASGI en el mismo proceso mediante el cliente asíncrono.
+    """
+
+    def __init__(self, sessionid, csrftoken):
+        from django.test import AsyncClient
+        self.client = AsyncClient(headers={"X-CSRFToken": csrftoken})
+        self.client.cookies["sessionid"] = sessionid
+        self.client.cookies["csrftoken"] = csrftoken
+
+    async def request(self, method, path):
+        response = await self.client.generic(method, path)
+        if getattr(response, "streaming", False):
+            async for _ in response.streaming_content:
+                pass
+        return response.status_code
+
+
+class _HTTPTransport:
+    """
+    @brief Cliente HTTP mínimo (urllib) contra un servidor en ejecución.
+    """
+
+    def __init__(self, base_url, sessionid, csrftoken):
+        self.base_url = base_url.rstrip("/")
+        self.headers = {
+            "Cookie": f"sessionid={sessionid}; csrftoken={csrftoken}",
+            "X-CSRFToken": csrftoken,
+            "Referer": self.base_url + "/",
+        }
+
+    def request(self, method, path):
+        req = urllib.request.Request(self.base_url + path, method=method, headers=self.headers,
+                                     data=b"" if method == "POST" else None)
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except (urllib.error.URLError, OSError):
+            return 0
+
+
+# ============================
+# Worker
+# ============================
+
+def _siguiente(rnd, nombres, pesos, pub_ids, ciudades):
+    """
+    @brief Elige la siguiente operación de la mezcla.
+    @return Tupla `(op, método, ruta)`.
+    """
+    op = rnd.choices(nombres, pesos)[0]
+    if op == "home":
+        return op, "GET", reverse("principal:home")
+    if op == "search":
+        params = [f"page={rnd.randint(1, 5)}"]
+        if rnd.random() < 0.5:
+            params.append(f"direccion={urllib.request.quote(rnd.choice(TERMINOS_BUSQUEDA))}")
+        if ciudades and rnd.random() < 0.5:
+            params.append(f"ciudad={urllib.request.quote(rnd.choice(ciudades))}")
+        if rnd.random() < 0.3:
+            params.append(f"tipo_operacion={rnd.choice(['venta', 'renta'])}")
+        return op, "GET", f"{reverse('principal:resultados_busqueda')}?{'&'.join(params)}"
+    if op == "detail":
+        return op, "GET", reverse("principal:publicacion_detalle", args=[rnd.choice(pub_ids)])
+    return op, "POST", reverse("principal:toggle_favorito", args=[rnd.choice(pub_ids)])
+
+
+def _rss_mb():
+    # ru_maxrss está en KiB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _worker(args):
+    """
+    @brief Proceso de carga: ejecuta operaciones hasta agotar el tiempo o el número de peticiones.
+    @return Tupla `({vista: {"lat": [...], "errores": n}}, rss_max_mb)`.
+    """
+    (idx, target, url, sessionid, csrftoken, mezcla, pub_ids, ciudades,
+     duracion, peticiones, semilla, concurrencia) = args
+    connections.close_all()
+    if target == "asgi":
+        resultados = asyncio.run(_aworker(
+            idx, sessionid, csrftoken, mezcla, pub_ids, ciudades, duracion, peticiones, semilla, concurrencia,
+        ))
+        return resultados, _rss_mb()
+
+    rnd = random.Random(semilla + idx)
+    transporte = _WSGITransport(sessionid, csrftoken) if target == "wsgi" else _HTTPTransport(url, sessionid, csrftoken)
+
+    nombres = list(mezcla)
+    pesos = [mezcla[n] for n in nombres]
+    resultados = {n: {"lat": [], "errores": 0} for n in nombres}
+
+    fin = time.perf_counter() + duracion if duracion else None
+    hechas = 0
+    while True:
+        if fin is not None and time.perf_counter() >= fin:
+            break
+        if peticiones and hechas >= peticiones:
+            break
+        op, method, path = _siguiente(rnd, nombres, pesos, pub_ids, ciudades)
+
+        inicio = time.perf_counter()
+        status = transporte.request(method, path)
+        resultados[op]["lat"].append(time.perf_counter() - inicio)
+        if not (200 <= status < 400):
+            resultados[op]["errores"] += 1
+        hechas += 1
+    return resultados, _rss_mb()
+
+
+async def _aworker(idx, sessionid, csrftoken, mezcla, pub_ids, ciudades, duracion, peticiones, semilla, concurrencia):
+    """
+    @brief Variante ASGI del worker: `concurrencia` tareas comparten el event loop del proceso.
+    @details `--peticiones` es por proceso, repartido entre las tareas.
+    """
+    transporte = _ASGITransport(sessionid, csrftoken)
+    nombres = list(mezcla)
+    pesos = [mezcla[n] for n in nombres]
+    resultados = {n: {"lat": [], "errores": 0} for n in nombres}
+    fin = time.perf_counter() + duracion if duracion else None
+    restantes = [peticiones]
+
+    async def tarea(k):
+        rnd = random.Random((semilla + idx) * 1000 + k)
+        while True:
+            if fin is not None and time.perf_counter() >= fin:
+                return
+            if peticiones:
+                if restantes[0] <= 0:
+                    return
+                restantes[0] -= 1
+            op, method, path = _siguiente(rnd, nombres, pesos, pub_ids, ciudades)
+            inicio = time.perf_counter()
+            status = await transporte.request(method, path)
+            resultados[op]["lat"].append(time.perf_counter() - inicio)
+            if not (200 <= status < 400):
+                resultados[op]["errores"] += 1
+
+    await asyncio.gather(*(tarea(k) for k in range(concurrencia)))
+    return resultados
+
+
+class Command(BaseCommand):
+    help = "Genera carga multi-proceso (home/búsqueda/detalle/toggle) y reporta latencias por vista."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", choices=["wsgi", "asgi", "http"], default="wsgi")
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--procesos", type=int, default=4)
+        parser.add_argument("--concurrencia", type=int, default=8,
+                            help="Peticiones simultáneas por proceso (sólo --target asgi).")
+        parser.add_argument("--duracion", type=float, default=20.0, help="Segundos por proceso (0 = usar --peticiones).")
+        parser.add_argument("--peticiones", type=int, default=0, help="Peticiones por proceso.")
+        parser.add_argument("--mezcla", default=MEZCLA_DEFAULT)
+        parser.add_argument("--muestra-publicaciones", type=int, default=5000)
+        parser.add_argument("--semilla", type=int, default=7)
+        parser.add_argument("--salida", help="Ruta JSON donde guardar el resultado.")
+        parser.add_argument("--comparar", help="JSON de una corrida previa para comparar.")
+
+    def handle(self, *args, **opts):
+        mezcla = _parse_mezcla(opts["mezcla"])
+        if not opts["duracion"] and not opts["peticiones"]:
+            raise CommandError("Indica --duracion o --peticiones.")
+        if opts["target"] == "asgi" and not settings.VISTAS_ASYNC:
+            self.stderr.write("Aviso: VISTAS_ASYNC=0; se medirán las vistas síncronas servidas por ASGI.")
+
+        pub_ids = list(
+            Publicacion.objects.filter(estatus="disponible")
+            .order_by("?").values_list("id", flat=True)[: opts["muestra_publicaciones"]]
+        )
+        if not pub_ids:
+            raise CommandError("No hay publicaciones disponibles; ejecuta primero seed_marketplace.")
+        ciudades = sorted(set(Publicacion.objects.values_list("ciudad", flat=True).distinct()[:50]))
+
+        usuarios = list(User.objects.filter(perfil__rfc__isnull=False).exclude(first_name="")[: opts["procesos"]])
+        if not usuarios:
+            raise CommandError("No hay usuarios con perfil completo para autenticar la carga.")
+
+        tareas = []
+        for i in range(opts["procesos"]):
+            user = usuarios[i % len(usuarios)]
+            tareas.append((
+                i, opts["target"], opts["url"], self._sesion(user), secrets.token_hex(16), mezcla,
+                pub_ids, ciudades, opts["duracion"], opts["peticiones"], opts["semilla"],
+                opts["concurrencia"],
+            ))
+
+        connections.close_all()
+        inicio = time.perf_counter()
+        if opts["procesos"] == 1:
+            parciales = [_worker(tareas[0])]
+        else:
+            with multiprocessing.get_context("fork").Pool(opts["procesos"]) as pool:
+                parciales = pool.map(_worker, tareas)
+        pared = time.perf_counter() - inicio
+
+        rss_max = max(rss for _, rss in parciales)
+        resumen = self._resumir([r for r, _ in parciales], pared)
+        self._imprimir(resumen)
+        self.stdout.write(f"Memoria residente máx. por proceso: {rss_max:.1f} MiB")
+
+        resultado = {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "config": {
+                k: opts[k] for k in ("target", "url", "procesos", "concurrencia", "duracion", "peticiones", "mezcla")
+            },
+            "vistas_async": settings.VISTAS_ASYNC,
+            "duracion_real": pared,
+            "rss_max_mb": rss_max,
+            "vistas": resumen,
+        }
+        if opts["salida"]:
+            destino = Path(opts["salida"])
+            destino.parent.mkdir(parents=True, exist_ok=True)
+            destino.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding="utf-8")
+            self.stdout.write(f"Resultado guardado en {destino}")
+        if opts["comparar"]:
+            base = json.loads(Path(opts["comparar"]).read_text(encoding="utf-8"))
+            self._comparar(base.get("vistas", {}), resumen)
+            if base.get("rss_max_mb"):
+                self.stdout.write(f"  memoria  base {base['rss_max_mb']:.1f} MiB, actual {rss_max:.1f} MiB")
+
+    # ---------------------------
+    # Helpers
+    # ---------------------------
+    @staticmethod
+    def _sesion(user):
+        """
+        @brief Crea una sesión autenticada en la BD y devuelve su clave (cookie `sessionid`).
+        """
+        s = SessionStore()
+        s[SESSION_KEY] = str(user.pk)
+        s[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+        s[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        s.create()
+        return s.session_key
+
+    @staticmethod
+    def _resumir(parciales, pared):
+        resumen = {}
+        vistas = {v for p in parciales for v in p}
+        for vista in sorted(vistas):
+            lat = sorted(x for p in parciales for x in p.get(vista, {}).get("lat", []))
+            errores = sum(p.get(vista, {}).get("errores", 0) for p in parciales)
+            resumen[vista] = {
+                "peticiones": len(lat),
+                "errores": errores,
+                "rps": len(lat) / pared if pared else 0.0,
+                "media_ms": statistics.fmean(lat) * 1000 if lat else 0.0,
+                "p50_ms": percentil(lat, 50) * 1000,
+                "p95_ms": percentil(lat, 95) * 1000,
+                "p99_ms": percentil(lat, 99) * 1000,
+            }
+        return resumen
+
+    def _imprimir(self, resumen):
+        self.stdout.write(f"{'vista':<8} {'pet':>7} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for vista, r in resumen.items():
+            self.stdout.write(
+                f"{vista:<8} {r['peticiones']:>7} {r['errores']:>5} {r['rps']:>8.1f} "
+                f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}"
+            )
+
+    def _comparar(self, base, actual):
+        self.stdout.write("\nComparación contra la corrida base (negativo = mejor en latencia):")
+        for vista, r in actual.items():
+            b = base.get(vista)
+            if not b:
+                continue
+            partes = []
+            for clave in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+                if b.get(clave):
+                    partes.append(f"{clave} {100 * (r[clave] - b[clave]) / b[clave]:+.1f}%")
+            self.stdout.write(f"  {vista:<8} " + "  ".join(partes))
@@ -0,0 +1,138 @@
+"""
+@file migrar_fotos_contenido.py
+@brief Comando `migrar_fotos_contenido`: pasa las fotos guardadas por fecha al almacenamiento por contenido.
+@details
+ Ver `publicaciones/almacen.py`. Para cada archivo que usan las fotos vivas o
+ archivadas y que aún no está en `publicaciones/contenido/`:
+  1. Calcula su SHA-256 (varios archivos a la vez en `--hilos` hilos; `hashlib`
+     suelta el GIL al procesar los bytes).
+  2. Lo enlaza (o copia, si el sistema de archivos no admite enlaces) a
+     `publicaciones/contenido/<ab>/<sha256>.<ext>`. Los duplicados encuentran el
+     archivo ya creado y sólo cambian de nombre.
+  3. Actualiza `FotoPublicacion.imagen` y `PublicacionArchivada.fotos`, una
+     transacción por `--lote` archivos.
+  4. Tras confirmar, borra los originales (salvo `--conservar-originales`) e
+     invalida las cachés de tarjetas, detalle y recientes.
+
+ Se puede volver a correr: sólo toma lo que falta. Con `--simular` sólo reporta
+ cuántos duplicados hay y cuánto espacio se recuperaría.
+
+ Ejemplo:
+  python manage.py migrar_fotos_contenido --simular
+  python manage.py migrar_fotos_contenido --hilos 16
+"""
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+
+from principal.views import invalidar_recientes
+from publicaciones.almacen import almacen_fotos, digest_de, es_por_contenido, extension, nombre_por_contenido
+from publicaciones.detalle import invalidar_detalle
+from publicaciones.huerfanos import nombres_referenciados
+from publicaciones.models import FotoPublicacion, Generacion, PublicacionArchivada
+
+
+class Command(BaseCommand):
+    help = "Mueve las fotos guardadas por fecha al almacenamiento por contenido y une los duplicados."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, default=8, help="Archivos procesados en paralelo.")
+        parser.add_argument("--lote", type=int, default=500, help="Archivos por transacción al actualizar filas.")
+        parser.add_argument("--simular", action="store_true", help="Sólo reporta; no mueve ni actualiza nada.")
+        parser.add_argument("--conservar-originales", action="store_true", help="No borra los archivos originales.")
+
+    def handle(self, *args, **opts):
+        almacen = almacen_fotos()
+        pendientes = sorted({n for n in nombres_referenciados() if n and not es_por_contenido(n)})
+        self.stdout.write(f"{len(pendientes)} archivos por migrar.")
+
+        def calcular(nombre):
+            try:
+                with almacen.open(nombre, "rb") as archivo:
+                    return nombre, digest_de(archivo), almacen.size(nombre)
+            except FileNotFoundError:
+                return nombre, None, 0
+
+        nuevos, faltantes = {}, []
+        duplicados = bytes_duplicados = 0
+        mapa = {}
+        with ThreadPoolExecutor(max_workers=opts["hilos"], thread_name_prefix="fotos-contenido") as pool:
+            for nombre, digest, tamano in pool.map(calcular, pendientes):
+                if digest is None:
+                    faltantes.append(nombre)
+                    continue
+                destino = nombre_por_contenido(digest, extension(nombre))
+                mapa[nombre] = destino
+                if destino in nuevos or almacen.exists(destino):
+                    duplicados += 1
+                    bytes_duplicados += tamano
+                else:
+                    nuevos[destino] = nombre
+
+        self.stdout.write(
+            f"{len(nuevos)} contenidos distintos, {duplicados} duplicados "
+            f"({filesizeformat(bytes_duplicados)} recuperables), {len(faltantes)} sin archivo."
+        )
+        for nombre in faltantes:
+            self.stderr.write(f"  sin archivo: {nombre}")
+        if opts["simular"] or not mapa:
+            return
+
+        for destino, origen in nuevos.items():
+            self._enlazar(almacen.path(origen), almacen.path(destino))
+
+        afectadas = set()
+        nombres = list(mapa)
+        for i in range(0, len(nombres), opts["lote"]):
+            afectadas |= self._actualizar({n: mapa[n] for n in nombres[i:i + opts["lote"]]})
+        afectadas |= self._actualizar_archivadas(mapa)
+
+        Generacion.incrementar(Generacion.PUBLICACIONES)
+        invalidar_detalle(*afectadas)
+        invalidar_recientes()
+
+        if not opts["conservar_originales"]:
+            for nombre in mapa:
+                almacen.delete(nombre)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(mapa)} archivos migrados; {filesizeformat(bytes_duplicados)} recuperados por duplicados."
+        ))
+
+    @staticmethod
+    def _enlazar(origen, destino):
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        try:
+            os.link(origen, destino)
+        except FileExistsError:
+            pass
+        except OSError:  # otro dispositivo o sin soporte de enlaces
+            shutil.copy2(origen, destino)
+
+    @staticmethod
+    @transaction.atomic
+    def _actualizar(mapa) -> set:
+        afectadas = set(
+            FotoPublicacion.objects.filter(imagen__in=list(mapa)).values_list("publicacion_id", flat=True)
+        )
+        for origen, destino in mapa.items():
+            FotoPublicacion.objects.filter(imagen=origen).update(imagen=destino)
+        return afectadas
+
+    @staticmethod
+    def _actualizar_archivadas(mapa) -> set:
+        afectadas = set()
+        for archivada in PublicacionArchivada.objects.only("pk", "fotos").iterator(chunk_size=500):
+            cambio = False
+            for foto in archivada.fotos:
+                if foto.get("imagen") in mapa:
+                    foto["imagen"] = mapa[foto["imagen"]]
+                    cambio = True
+            if cambio:
+                archivada.save(update_fields=["fotos"])
+                afectadas.add(archivada.pk)
+        return afectadas
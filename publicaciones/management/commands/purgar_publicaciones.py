@@ -0,0 +1,32 @@
+"""
+@file purgar_publicaciones.py
+@brief Comando `purgar_publicaciones`: borra las publicaciones eliminadas (lápidas) con sus fotos y favoritos.
+@details
+ Ver `publicaciones/purga.py`. Normalmente lo hace el hilo de cada proceso; el comando
+ sirve para cron (con `PURGA_EN_SEGUNDO_PLANO=0`) o para vaciar a mano.
+
+ Ejemplo:
+  python manage.py purgar_publicaciones
+  python manage.py purgar_publicaciones --limite 100 --lote 1000
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from publicaciones.purga import pendientes, purgar_pendientes
+
+
+class Command(BaseCommand):
+    help = "Purga las publicaciones eliminadas: favoritos, fotos y archivos por lotes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limite", type=int, help="Máximo de publicaciones a purgar.")
+        parser.add_argument("--lote", type=int, default=settings.PURGA_LOTE, help="Filas por DELETE.")
+        parser.add_argument("--solo-contar", action="store_true", help="Sólo reporta cuántas hay pendientes.")
+
+    def handle(self, *args, **opts):
+        if opts["solo_contar"]:
+            self.stdout.write(f"{pendientes().count()} publicaciones por purgar.")
+            return
+        total = purgar_pendientes(limite=opts["limite"], lote=opts["lote"])
+        self.stdout.write(self.style.SUCCESS(f"{total} publicaciones purgadas."))
@@ -0,0 +1,288 @@
+"""
+@file seed_marketplace.py
+@brief Comando `seed_marketplace`: genera datos sintéticos del marketplace.
+@details
+ Crea usuarios con `Perfil` completo, publicaciones repartidas en ciudades de México,
+ fotos (un conjunto pequeño de JPEGs generados y reutilizados) y favoritos, todo con
+ `bulk_create` por lotes para poder llegar a cientos de miles de publicaciones y
+ millones de favoritos en minutos.
+
+ Ejemplo:
+  python manage.py seed_marketplace --usuarios 5000 --publicaciones 100000 --favoritos 2000000
+"""
+
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from cuentas.models import Perfil
+from publicaciones.models import Favorito, FotoPublicacion, Generacion, Publicacion
+
+User = get_user_model()
+
+#: (ciudad, estado, latitud, longitud, prefijo de CP)
+CIUDADES = [
+    ("Ciudad Juárez", "Chihuahua", 31.690, -106.424, "32"),
+    ("Chihuahua", "Chihuahua", 28.632, -106.069, "31"),
+    ("Monterrey", "Nuevo León", 25.686, -100.316, "64"),
+    ("Guadalajara", "Jalisco", 20.659, -103.349, "44"),
+    ("Ciudad de México", "Ciudad de México", 19.432, -99.133, "03"),
+    ("Puebla", "Puebla", 19.041, -98.206, "72"),
+    ("Querétaro", "Querétaro", 20.588, -100.389, "76"),
+    ("Mérida", "Yucatán", 20.967, -89.623, "97"),
+    ("Tijuana", "Baja California", 32.514, -117.038, "22"),
+    ("Hermosillo", "Sonora", 29.072, -110.955, "83"),
+    ("León", "Guanajuato", 21.122, -101.686, "37"),
+    ("Cancún", "Quintana Roo", 21.161, -86.851, "77"),
+]
+
+COLONIAS = [
+    "Centro", "Del Valle", "Las Américas", "Jardines del Sol", "San Lorenzo", "Campestre",
+    "Lomas Verdes", "Los Pinos", "Santa Fe", "Las Torres", "Residencial del Bosque", "Industrial",
+]
+
+CALLES = [
+    "Av. Juárez", "Calle Hidalgo", "Av. Reforma", "Calle Morelos", "Av. Insurgentes",
+    "Calle Allende", "Av. Tecnológico", "Calle Zaragoza", "Av. de las Torres", "Calle Madero",
+]
+
+TIPOS = ["Casa", "Departamento", "Casa en privada", "Residencia", "Dúplex", "Local comercial"]
+
+ADJETIVOS = ["amplia", "remodelada", "con jardín", "céntrica", "nueva", "con cochera", "iluminada"]
+
+
+@contextmanager
+def _fechas_manuales(*fields):
+    """
+    @brief Desactiva temporalmente `auto_now`/`auto_now_add` para fijar fechas distribuidas.
+    """
+    originales = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in originales:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def _lotes(iterable, size):
+    lote = []
+    for item in iterable:
+        lote.append(item)
+        if len(lote) >= size:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+class Command(BaseCommand):
+    help = "Genera usuarios, perfiles, publicaciones, fotos y favoritos sintéticos con bulk_create."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuarios", type=int, default=500)
+        parser.add_argument("--publicaciones", type=int, default=5000)
+        parser.add_argument("--fotos-por-publicacion", type=int, default=3)
+        parser.add_argument("--favoritos", type=int, default=50000)
+        parser.add_argument("--imagenes", type=int, default=24,
+                            help="Número de JPEGs distintos a generar y reutilizar.")
+        parser.add_argument("--lote", type=int, default=5000)
+        parser.add_argument("--semilla", type=int, default=42)
+        parser.add_argument("--dias", type=int, default=365,
+                            help="Antigüedad máxima de las publicaciones generadas.")
+
+    def handle(self, *args, **opts):
+        rnd = random.Random(opts["semilla"])
+        lote = opts["lote"]
+
+        imagenes = self._generar_imagenes(opts["imagenes"], rnd)
+        usuario_ids = self._crear_usuarios(opts["usuarios"], rnd, lote)
+        pub_ids = self._crear_publicaciones(opts["publicaciones"], usuario_ids, opts["dias"], rnd, lote)
+        self._crear_fotos(pub_ids, opts["fotos_por_publicacion"], imagenes, rnd, lote)
+        self._crear_favoritos(opts["favoritos"], usuario_ids, pub_ids, rnd, lote)
+
+        # bulk_create no dispara señales: avanzar las generaciones a mano (ETag/Last-Modified)
+        Generacion.incrementar(Generacion.PUBLICACIONES)
+        Generacion.incrementar(Generacion.FAVORITOS)
+
+    # ---------------------------
+    # Imágenes
+    # ---------------------------
+    def _generar_imagenes(self, n, rnd):
+        """
+        @brief Genera `n` JPEGs pequeños en `MEDIA_ROOT/publicaciones/seed/` (si no existen).
+        @return Lista de nombres relativos a `MEDIA_ROOT`.
+        """
+        if n <= 0:
+            return []
+        from PIL import Image, ImageDraw
+
+        carpeta = Path(settings.MEDIA_ROOT) / "publicaciones" / "seed"
+        carpeta.mkdir(parents=True, exist_ok=True)
+        nombres = []
+        for i in range(n):
+            nombre = f"publicaciones/seed/seed_{i:03d}.jpg"
+            destino = Path(settings.MEDIA_ROOT) / nombre
+            if not destino.exists():
+                color = tuple(rnd.randint(60, 220) for _ in range(3))
+                img = Image.new("RGB", (640, 480), color)
+                draw = ImageDraw.Draw(img)
+                draw.polygon([(120, 260), (320, 110), (520, 260)], fill=(250, 250, 250))
+                draw.rectangle([170, 260, 470, 430], fill=(240, 235, 225))
+                draw.rectangle([295, 330, 345, 430], fill=tuple(c // 2 for c in color))
+                img.save(destino, "JPEG", quality=70)
+            nombres.append(nombre)
+        self.stdout.write(f"Imágenes: {len(nombres)}")
+        return nombres
+
+    # ---------------------------
+    # Usuarios y perfiles
+    # ---------------------------
+    def _crear_usuarios(self, n, rnd, lote):
+        inicio = (User.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+        password = make_password("seed-marketplace")
+        nombres = ["Ana", "Luis", "María", "José", "Sofía", "Carlos", "Valeria", "Jorge", "Fernanda", "Miguel"]
+        apellidos = ["García", "Hernández", "López", "Martínez", "González", "Pérez", "Rodríguez", "Sánchez"]
+
+        usuarios = (
+            User(
+                username=f"seed{inicio + i}",
+                email=f"seed{inicio + i}@example.com",
+                first_name=rnd.choice(nombres),
+                last_name=rnd.choice(apellidos),
+                password=password,
+            )
+            for i in range(n)
+        )
+        for chunk in _lotes(usuarios, lote):
+            with transaction.atomic():
+                User.objects.bulk_create(chunk, batch_size=lote)
+
+        ids = list(User.objects.filter(username__startswith="seed", id__gte=inicio).values_list("id", flat=True))
+        perfiles = (
+            Perfil(
+                user_id=uid,
+                # RFC con formato de persona moral: 4 letras + 6 dígitos + 3 alfanuméricos
+                rfc=f"SEED{uid % 1_000_000:06d}{_base36(uid // 1_000_000, 3)}",
+                whatsapp=f"656{rnd.randint(0, 9_999_999):07d}",
+            )
+            for uid in ids
+        )
+        for chunk in _lotes(perfiles, lote):
+            with transaction.atomic():
+                Perfil.objects.bulk_create(chunk, batch_size=lote)
+        self.stdout.write(f"Usuarios con perfil: {len(ids)}")
+        return ids
+
+    # ---------------------------
+    # Publicaciones
+    # ---------------------------
+    def _crear_publicaciones(self, n, usuario_ids, dias, rnd, lote):
+        if not usuario_ids or n <= 0:
+            return []
+        ahora = timezone.now()
+        inicio = (Publicacion.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+
+        def generar():
+            for _ in range(n):
+                ciudad, estado, lat, lon, cp = rnd.choice(CIUDADES)
+                operacion = "venta" if rnd.random() < 0.7 else "renta"
+                precio = rnd.randrange(700_000, 9_000_000, 5_000) if operacion == "venta" else rnd.randrange(4_000, 45_000, 500)
+                recamaras = rnd.randint(1, 5)
+                creada = ahora - timedelta(seconds=rnd.randint(0, dias * 86400))
+                yield Publicacion(
+                    usuario_id=rnd.choice(usuario_ids),
+                    titulo=f"{rnd.choice(TIPOS)} {rnd.choice(ADJETIVOS)} en {ciudad}",
+                    descripcion=f"{recamaras} recámaras, cerca de escuelas, comercios y transporte.",
+                    precio=Decimal(precio),
+                    tipo_operacion=operacion,
+                    recamaras=recamaras,
+                    banos=Decimal(rnd.choice(["1.0", "1.5", "2.0", "2.5", "3.0"])),
+                    estacionamientos=rnd.randint(0, 3),
+                    metros_construccion=rnd.randint(45, 400),
+                    metros_terreno=rnd.randint(60, 600),
+                    tipo_financiamiento=rnd.choice(["contado", "credito", "ambos"]),
+                    calle=rnd.choice(CALLES),
+                    numero=str(rnd.randint(1, 9999)),
+                    colonia=rnd.choice(COLONIAS),
+                    ciudad=ciudad,
+                    estado=estado,
+                    codigo_postal=f"{cp}{rnd.randint(0, 999):03d}",
+                    latitud=lat + rnd.uniform(-0.08, 0.08),
+                    longitud=lon + rnd.uniform(-0.08, 0.08),
+                    estatus=rnd.choices(["disponible", "en_trato", "cerrada"], weights=[80, 10, 10])[0],
+                    fecha_creacion=creada,
+                    fecha_actualizacion=creada,
+                )
+
+        campos = [Publicacion._meta.get_field("fecha_creacion"), Publicacion._meta.get_field("fecha_actualizacion")]
+        with _fechas_manuales(*campos):
+            for chunk in _lotes(generar(), lote):
+                with transaction.atomic():
+                    Publicacion.objects.bulk_create(chunk, batch_size=lote)
+
+        ids = list(Publicacion.objects.filter(id__gte=inicio).values_list("id", flat=True))
+        self.stdout.write(f"Publicaciones: {len(ids)}")
+        return ids
+
+    def _crear_fotos(self, pub_ids, por_publicacion, imagenes, rnd, lote):
+        if not imagenes or por_publicacion <= 0:
+            return
+        fotos = (
+            FotoPublicacion(publicacion_id=pid, imagen=rnd.choice(imagenes), orden=i, es_portada=(i == 0))
+            for pid in pub_ids
+            for i in range(por_publicacion)
+        )
+        total = 0
+        for chunk in _lotes(fotos, lote):
+            with transaction.atomic():
+                FotoPublicacion.objects.bulk_create(chunk, batch_size=lote)
+            total += len(chunk)
+        self.stdout.write(f"Fotos: {total}")
+
+    def _crear_favoritos(self, n, usuario_ids, pub_ids, rnd, lote):
+        """
+        @brief Reparte `n` favoritos únicos (usuario, publicación) entre los usuarios.
+        """
+        if not usuario_ids or not pub_ids or n <= 0:
+            return
+        por_usuario = max(1, min(len(pub_ids), -(-n // len(usuario_ids))))
+        ahora = timezone.now()
+
+        def generar():
+            restantes = n
+            for uid in usuario_ids:
+                if restantes <= 0:
+                    return
+                k = min(por_usuario, restantes)
+                for pid in rnd.sample(pub_ids, k):
+                    yield Favorito(usuario_id=uid, publicacion_id=pid,
+                                   creado=ahora - timedelta(seconds=rnd.randint(0, 90 * 86400)))
+                restantes -= k
+
+        total = 0
+        with _fechas_manuales(Favorito._meta.get_field("creado")):
+            for chunk in _lotes(generar(), lote):
+                with transaction.atomic():
+                    Favorito.objects.bulk_create(chunk, batch_size=lote, ignore_conflicts=True)
+                total += len(chunk)
+        self.stdout.write(f"Favoritos: {total}")
+
+
+def _base36(n: int, width: int) -> str:
+    digits = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    out = ""
+    for _ in range(width):
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+    return out
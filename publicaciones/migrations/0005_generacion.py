@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-19 16:57
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publicaciones', '0004_favorito'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Generacion',
+            fields=[
+                ('nombre', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('valor', models.PositiveBigIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publicaciones', '0005_generacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Geocodificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('direccion', models.CharField(max_length=600, unique=True)),
+                ('latitud', models.FloatField(blank=True, null=True)),
+                ('longitud', models.FloatField(blank=True, null=True)),
+                ('proveedor', models.CharField(max_length=40)),
+                ('creado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
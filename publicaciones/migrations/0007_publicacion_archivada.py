@@ -0,0 +1,55 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:58
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publicaciones', '0006_geocodificacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublicacionArchivada',
+            fields=[
+                ('titulo', models.CharField(max_length=160)),
+                ('descripcion', models.TextField(blank=True)),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('tipo_operacion', models.CharField(choices=[('venta', 'Venta'), ('renta', 'Renta')], max_length=10)),
+                ('recamaras', models.PositiveIntegerField(default=0)),
+                ('banos', models.DecimalField(decimal_places=1, default=0, max_digits=3, validators=[django.core.validators.MinValueValidator(0)])),
+                ('estacionamientos', models.PositiveIntegerField(default=0)),
+                ('metros_construccion', models.PositiveIntegerField(default=0)),
+                ('metros_terreno', models.PositiveIntegerField(default=0)),
+                ('tipo_financiamiento', models.CharField(choices=[('contado', 'Contado'), ('credito', 'Crédito'), ('ambos', 'Crédito o contado')], default='ambos', max_length=12)),
+                ('calle', models.CharField(max_length=120)),
+                ('numero', models.CharField(blank=True, max_length=20)),
+                ('colonia', models.CharField(max_length=120)),
+                ('ciudad', models.CharField(max_length=120)),
+                ('estado', models.CharField(max_length=120)),
+                ('codigo_postal', models.CharField(max_length=5, validators=[django.core.validators.RegexValidator(message='El código postal debe tener exactamente 5 dígitos.', regex='^\\d{5}$')])),
+                ('latitud', models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90.0), django.core.validators.MaxValueValidator(90.0)])),
+                ('longitud', models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180.0), django.core.validators.MaxValueValidator(180.0)])),
+                ('estatus', models.CharField(choices=[('disponible', 'Disponible'), ('en_trato', 'En trato'), ('cerrada', 'Vendida/Rentada')], default='disponible', max_length=12)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('fecha_creacion', models.DateTimeField()),
+                ('fecha_actualizacion', models.DateTimeField()),
+                ('archivada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('fotos', models.JSONField(blank=True, default=list)),
+                ('favoritos', models.JSONField(blank=True, default=list)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='publicaciones_archivadas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'publicación archivada',
+                'verbose_name_plural': 'publicaciones archivadas',
+                'ordering': ('-archivada',),
+                'indexes': [models.Index(fields=['usuario', '-archivada'], name='publicacion_usuario_9dad1a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publicaciones', '0007_publicacion_archivada'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publicacion',
+            name='eliminada',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='publicacion',
+            index=models.Index(condition=models.Q(('eliminada__isnull', False)), fields=['eliminada'], name='publicacion_lapida_idx'),
+        ),
+    ]
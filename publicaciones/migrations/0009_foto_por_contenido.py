@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:10
+
+import publicaciones.almacen
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('publicaciones', '0008_publicacion_eliminada'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fotopublicacion',
+            name='imagen',
+            field=models.ImageField(db_index=True, storage=publicaciones.almacen.almacen_fotos, upload_to='publicaciones/%Y/%m/%d/'),
+        ),
+    ]
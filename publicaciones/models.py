@@ -2,6 +2,13 @@
 from django.db import models
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from publicaciones.almacen import almacen_fotos
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Choices reutilizables (evita strings "mágicos")
@@ -29,19 +36,11 @@ cp_validator = RegexValidator(
     message="El código postal debe tener exactamente 5 dígitos."
 )
 
-class Publicacion(models.Model):
+class DatosPublicacion(models.Model):
     """
-    Una Publicación representa una casa que un usuario sube para venta o renta.
-    Campos principales: usuario, título, descripción, precio, tipo de operación.
-    Incluye características, financiamiento, dirección (con lat/lon), estatus y timestamps.
+    Campos descriptivos de una publicación, compartidos por la tabla viva
+    (`Publicacion`) y el archivo de cerradas (`PublicacionArchivada`).
     """
-    # ─────────── Relación con el usuario propietario ───────────
-    usuario = models.ForeignKey(
-        settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
-        related_name="publicaciones"
-    )
-
     # ─────────── Identificación y detalle ───────────
     titulo = models.CharField(max_length=160)
     descripcion = models.TextField(blank=True)
@@ -84,18 +83,8 @@ class Publicacion(models.Model):
     # ─────────── Estatus de la publicación ───────────
     estatus = models.CharField(max_length=12, choices=ESTATUS_PUBLICACION, default="disponible")
 
-    # ─────────── Control de fechas ───────────
-    fecha_creacion = models.DateTimeField(auto_now_add=True)
-    fecha_actualizacion = models.DateTimeField(auto_now=True)
-
     class Meta:
-        ordering = ("-fecha_creacion",)
-        indexes = [
-            models.Index(fields=["estatus"]),
-            models.Index(fields=["tipo_operacion"]),
-            models.Index(fields=["ciudad", "estado"]),
-            models.Index(fields=["precio"]),
-        ]
+        abstract = True
 
     def __str__(self):
         return f"{self.titulo} · {self.get_tipo_operacion_display()} · ${self.precio}"
@@ -110,12 +99,75 @@ class Publicacion(models.Model):
     @property
     def tiene_coordenadas(self) -> bool:
         return self.latitud is not None and self.longitud is not None
-    
-    # al final de la clase Publicacion
+
+
+class VigentesManager(models.Manager):
+    """
+    Manager por defecto de `Publicacion`: omite las eliminadas (con lápida) que aún
+    no purga `publicaciones/purga.py`.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(eliminada__isnull=True)
+
+
+class Publicacion(DatosPublicacion):
+    """
+    Una Publicación representa una casa que un usuario sube para venta o renta.
+    Campos principales: usuario, título, descripción, precio, tipo de operación.
+    Incluye características, financiamiento, dirección (con lat/lon), estatus y timestamps.
+    Las cerradas con cierta antigüedad se mueven a `PublicacionArchivada`
+    (ver publicaciones/archivo.py). Eliminar sólo marca `eliminada`; las filas y los
+    archivos se borran en segundo plano (ver publicaciones/purga.py).
+    """
+    # ─────────── Relación con el usuario propietario ───────────
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="publicaciones"
+    )
+
+    # ─────────── Control de fechas ───────────
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    # Lápida: con fecha, la publicación ya no existe para la app (falta purgarla)
+    eliminada = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = VigentesManager()
+    #: Incluye las eliminadas pendientes de purga
+    todas = models.Manager()
+
+    class Meta:
+        ordering = ("-fecha_creacion",)
+        indexes = [
+            models.Index(fields=["estatus"]),
+            models.Index(fields=["tipo_operacion"]),
+            models.Index(fields=["ciudad", "estado"]),
+            models.Index(fields=["precio"]),
+            # Parcial: sólo las lápidas, que son pocas y duran hasta la purga
+            models.Index(fields=["eliminada"], name="publicacion_lapida_idx", condition=models.Q(eliminada__isnull=False)),
+        ]
+
+    def eliminar(self):
+        """
+        Marca la publicación como eliminada. Las señales de `post_save` invalidan
+        cachés y generaciones como con cualquier cambio.
+        """
+        self.eliminada = timezone.now()
+        self.save(update_fields=["eliminada", "fecha_actualizacion"])
+
 
     @property
     def foto_portada(self):
-        """Devuelve la foto de portada (o la primera por orden) o None."""
+        """
+        Devuelve la foto de portada (o la primera por orden) o None.
+        Si las fotos vienen de `prefetch_related("fotos")` las usa en memoria
+        en lugar de lanzar una consulta por tarjeta.
+        """
+        prefetched = getattr(self, "_prefetched_objects_cache", {}).get("fotos")
+        if prefetched is not None:
+            fotos = sorted(prefetched, key=lambda f: (f.orden, f.id))
+            return next((f for f in fotos if f.es_portada), fotos[0] if fotos else None)
         f = self.fotos.filter(es_portada=True).order_by("orden", "id").first()
         if not f:
             f = self.fotos.order_by("orden", "id").first()
@@ -132,7 +184,8 @@ class FotoPublicacion(models.Model):
         on_delete=models.CASCADE,
         related_name="fotos"
     )
-    imagen = models.ImageField(upload_to="publicaciones/%Y/%m/%d/")
+    # Por contenido (ver publicaciones/almacen.py); `upload_to` sólo aporta la extensión
+    imagen = models.ImageField(upload_to="publicaciones/%Y/%m/%d/", storage=almacen_fotos, db_index=True)
     # Campo opcional por si quieres destacar una foto en listados
     es_portada = models.BooleanField(default=False)
     # Orden opcional de aparición
@@ -166,3 +219,186 @@ class Favorito(models.Model):
 
     def __str__(self):
         return f"{self.usuario} ❤ {self.publicacion_id}"
+
+
+class PublicacionArchivada(DatosPublicacion):
+    """
+    Publicación cerrada que salió de la tabla viva (ver publicaciones/archivo.py).
+    Conserva el mismo id, así que `publicacion/<pk>/` la sigue mostrando (sólo
+    lectura). Sus fotos y favoritos se guardan como listas para poder restaurarla.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="publicaciones_archivadas"
+    )
+    # Sin auto_now: se copian tal cual de la publicación original
+    fecha_creacion = models.DateTimeField()
+    fecha_actualizacion = models.DateTimeField()
+    archivada = models.DateTimeField(default=timezone.now)
+    #: [{"imagen": ruta, "es_portada": bool, "orden": int}, ...] en orden
+    fotos = models.JSONField(default=list, blank=True)
+    #: [{"usuario_id": int, "creado": iso}, ...]
+    favoritos = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ("-archivada",)
+        indexes = [
+            models.Index(fields=["usuario", "-archivada"]),
+        ]
+        verbose_name = "publicación archivada"
+        verbose_name_plural = "publicaciones archivadas"
+
+    @property
+    def url_portada(self):
+        """
+        URL de la portada (o de la primera foto) o None.
+        """
+        rutas = [f["imagen"] for f in self.fotos if f.get("es_portada")] or [f["imagen"] for f in self.fotos]
+        return almacen_fotos().url(rutas[0]) if rutas else None
+
+    @property
+    def like_count(self) -> int:
+        return len(self.favoritos)
+
+
+class Generacion(models.Model):
+    """
+    Contador de "generación" de un conjunto de datos.
+
+    Se incrementa cada vez que cambia algo que afecta lo que se muestra en los
+    listados; las vistas lo usan para construir ETag/Last-Modified sin ejecutar
+    las consultas pesadas (ver `principal/validadores.py`).
+    """
+    #: Publicaciones, fotos o datos del vendedor
+    PUBLICACIONES = "publicaciones"
+    #: Cualquier alta/baja de favorito (contadores de likes)
+    FAVORITOS = "favoritos"
+
+    nombre = models.CharField(max_length=40, primary_key=True)
+    valor = models.PositiveBigIntegerField(default=0)
+    actualizado = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.nombre}={self.valor}"
+
+    @classmethod
+    def incrementar(cls, nombre):
+        actualizados = cls.objects.filter(nombre=nombre).update(valor=F("valor") + 1, actualizado=timezone.now())
+        if not actualizados:
+            cls.objects.get_or_create(nombre=nombre, defaults={"valor": 1})
+
+    @classmethod
+    def actuales(cls, *nombres):
+        """
+        Devuelve `{nombre: (valor, actualizado)}` con una sola consulta.
+        Los contadores que aún no existen valen `(0, None)`.
+        """
+        filas = {g.nombre: (g.valor, g.actualizado) for g in cls.objects.filter(nombre__in=nombres)}
+        return {n: filas.get(n, (0, None)) for n in nombres}
+
+    @classmethod
+    async def aactuales(cls, *nombres):
+        filas = {g.nombre: (g.valor, g.actualizado) async for g in cls.objects.filter(nombre__in=nombres)}
+        return {n: filas.get(n, (0, None)) for n in nombres}
+
+
+class Geocodificacion(models.Model):
+    """
+    Coordenadas de una dirección normalizada (ver `publicaciones/geocodificacion.py`).
+    Con `latitud` nula es un "no encontrado", válido por un tiempo limitado.
+    """
+    direccion = models.CharField(max_length=600, unique=True)
+    latitud = models.FloatField(null=True, blank=True)
+    longitud = models.FloatField(null=True, blank=True)
+    proveedor = models.CharField(max_length=40)
+    creado = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.direccion} -> {self.latitud},{self.longitud}"
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Señales: avanzar generaciones
+# ──────────────────────────────────────────────────────────────────────────────
+
+@receiver([post_save, post_delete], sender=Publicacion)
+@receiver([post_save, post_delete], sender=FotoPublicacion)
+@receiver([post_save, post_delete], sender="cuentas.Perfil")
+def _generacion_publicaciones(sender, **kwargs):
+    Generacion.incrementar(Generacion.PUBLICACIONES)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def _generacion_vendedor(sender, update_fields=None, **kwargs):
+    # El login sólo toca `last_login`; no cambia nada visible en las tarjetas
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    Generacion.incrementar(Generacion.PUBLICACIONES)
+
+
+@receiver([post_save, post_delete], sender=Favorito)
+def _generacion_favoritos(sender, **kwargs):
+    Generacion.incrementar(Generacion.FAVORITOS)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Señales: invalidar el detalle en caché (ver publicaciones/detalle.py)
+# ──────────────────────────────────────────────────────────────────────────────
+
+#: Campos del vendedor que aparecen en el detalle
+_CAMPOS_VENDEDOR = {"first_name", "last_name", "username", "email", "whatsapp"}
+
+
+def _invalidar_detalle(*pks):
+    from publicaciones.detalle import invalidar_detalle
+    # Al confirmar: antes, una petición concurrente volvería a guardar la fila vieja
+    transaction.on_commit(lambda: invalidar_detalle(*pks))
+
+
+def _invalidar_detalle_de_usuario(user_id, update_fields):
+    if update_fields and not set(update_fields) & _CAMPOS_VENDEDOR:
+        return
+    _invalidar_detalle(*Publicacion.objects.filter(usuario_id=user_id).values_list("id", flat=True))
+
+
+@receiver([post_save, post_delete], sender=Publicacion)
+def _detalle_publicacion(sender, instance, **kwargs):
+    _invalidar_detalle(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=FotoPublicacion)
+@receiver([post_save, post_delete], sender=Favorito)
+def _detalle_relacionado(sender, instance, **kwargs):
+    _invalidar_detalle(instance.publicacion_id)
+
+
+@receiver(post_save, sender="cuentas.Perfil")
+def _detalle_perfil(sender, instance, update_fields=None, **kwargs):
+    _invalidar_detalle_de_usuario(instance.user_id, update_fields)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def _detalle_vendedor(sender, instance, update_fields=None, **kwargs):
+    _invalidar_detalle_de_usuario(instance.pk, update_fields)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Señales: deltas de likes para las conexiones SSE (ver vivienda/eventos.py)
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _publicar_like(pub_id, delta):
+    from vivienda.eventos import bus
+    transaction.on_commit(lambda: bus.publicar_like(pub_id, delta))
+
+
+@receiver(post_save, sender=Favorito)
+def _evento_like(sender, instance, created, **kwargs):
+    if created:
+        _publicar_like(instance.publicacion_id, 1)
+
+
+@receiver(post_delete, sender=Favorito)
+def _evento_unlike(sender, instance, **kwargs):
+    _publicar_like(instance.publicacion_id, -1)
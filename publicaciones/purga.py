@@ -0,0 +1,138 @@
+"""
+@file purga.py
+@brief Purga en segundo plano de las publicaciones eliminadas (lápidas).
+@details
+ `eliminar_publicacion` sólo marca `Publicacion.eliminada` (un UPDATE); el manager
+ por defecto ya no la devuelve, así que desaparece de listados, detalle y panel al
+ instante. Lo costoso se hace después:
+  - `purgar(pk)`: borra sus favoritos y fotos con DELETE crudos por lotes de
+    `PURGA_LOTE` filas (sin cargar objetos ni mandar señales; una transacción corta
+    por lote), luego la publicación y al final los archivos de sus fotos que ya no
+    use ninguna otra fila (`almacen.liberar`).
+  - `purgador`: un hilo por proceso que despierta tras cada eliminación confirmada y
+    además cada `PURGA_INTERVALO` segundos. `manage.py purgar_publicaciones` hace lo
+    mismo a mano o desde cron (p.ej. con `PURGA_EN_SEGUNDO_PLANO=0`).
+"""
+
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from publicaciones.almacen import liberar
+from publicaciones.models import Favorito, FotoPublicacion, Publicacion
+from vivienda.metrics import store
+
+logger = logging.getLogger(__name__)
+
+
+def _borrar_por_lotes(modelo, columna: str, valor, lote: int) -> int:
+    """
+    @brief `DELETE` crudo de las filas de `modelo` con `columna = valor`, de `lote` en `lote`.
+    @return Filas borradas.
+    """
+    q = connection.ops.quote_name
+    tabla, pk = q(modelo._meta.db_table), q(modelo._meta.pk.column)
+    sql = f"DELETE FROM {tabla} WHERE {pk} IN (SELECT {pk} FROM {tabla} WHERE {q(columna)} = %s LIMIT %s)"
+    total = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [valor, lote])
+            borradas = cursor.rowcount
+        total += borradas
+        if borradas < lote:
+            return total
+
+
+def purgar(pk: int, lote: int | None = None) -> bool:
+    """
+    @brief Borra una publicación eliminada con sus favoritos, fotos y archivos.
+    @return False si no era una lápida (p.ej. ya la purgó otro proceso).
+    """
+    lote = lote or getattr(settings, "PURGA_LOTE", 500)
+    if not Publicacion.todas.filter(pk=pk, eliminada__isnull=False).exists():
+        return False
+    archivos = set(FotoPublicacion.objects.filter(publicacion_id=pk).values_list("imagen", flat=True))
+
+    filas = {
+        "favorito": _borrar_por_lotes(Favorito, "publicacion_id", pk, lote),
+        "foto": _borrar_por_lotes(FotoPublicacion, "publicacion_id", pk, lote),
+    }
+    q = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {q(Publicacion._meta.db_table)} WHERE {q('id')} = %s AND {q('eliminada')} IS NOT NULL", [pk],
+        )
+        filas["publicacion"] = cursor.rowcount
+    for tabla, n in filas.items():
+        if n:
+            store.inc("listing_purge_rows_total", n, table=tabla)
+
+    # Sólo archivos que ninguna otra foto usa (pueden ser compartidos, ver almacen.py)
+    liberar(archivos)
+    return True
+
+
+def pendientes():
+    """
+    @brief Lápidas con más de `PURGA_ESPERA` segundos (deja terminar peticiones en curso).
+    """
+    limite = timezone.now() - timedelta(seconds=getattr(settings, "PURGA_ESPERA", 30))
+    return Publicacion.todas.filter(eliminada__isnull=False, eliminada__lte=limite)
+
+
+def purgar_pendientes(limite: int | None = None, lote: int | None = None) -> int:
+    """
+    @brief Purga las lápidas de `pendientes()`.
+    @return Cuántas publicaciones se purgaron.
+    """
+    pks = pendientes().order_by("eliminada").values_list("pk", flat=True)
+    total = 0
+    for pk in list(pks[:limite] if limite else pks):
+        total += purgar(pk, lote)
+    return total
+
+
+class Purgador:
+    """
+    @class Purgador
+    @brief Hilo por proceso que purga las lápidas; se arranca con la primera eliminación.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._aviso = threading.Event()
+        self._hilo = None
+        self._pid = None
+
+    def despertar(self):
+        """
+        @brief Pide purgar cuanto antes (llamar tras confirmar la transacción).
+        """
+        if not getattr(settings, "PURGA_EN_SEGUNDO_PLANO", True):
+            return
+        with self._lock:
+            # Tras un fork (gunicorn) el hilo del padre no existe en el hijo
+            if self._hilo is None or not self._hilo.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._hilo = threading.Thread(target=self._ciclo, name="purga-publicaciones", daemon=True)
+                self._hilo.start()
+        self._aviso.set()
+
+    def _ciclo(self):
+        while True:
+            self._aviso.wait(getattr(settings, "PURGA_INTERVALO", 60))
+            self._aviso.clear()
+            try:
+                purgar_pendientes()
+            except Exception:
+                logger.exception("Error al purgar publicaciones eliminadas")
+            finally:
+                close_old_connections()
+
+
+purgador = Purgador()
@@ -0,0 +1,118 @@
+"""
+@file tarjetas.py
+@brief Caché de fragmentos HTML de las tarjetas de publicación.
+@details
+ Las tarjetas de `home`, `resultados_busqueda`, `mis_favoritos` y `panel_ventas` se
+ renderizan una vez y se guardan en caché con una llave versionada:
+
+   tarjeta:<variante>:<id>:<versión>
+
+ donde la versión resume `fecha_actualizacion`, las fotos (ya precargadas) y los datos
+ de contacto del vendedor. Así, cualquier cambio produce una llave nueva y no hace falta
+ invalidar nada.
+
+ Lo que depende del usuario o del momento (favorito marcado, contador de likes,
+ "hace X días") queda fuera del fragmento como marcadores `__VY_*__` que se
+ sustituyen en cada petición. Una página pide todas sus tarjetas con un solo
+ `cache.get_many`.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.timesince import timesince
+
+#: Plantilla parcial por variante de tarjeta
+PLANTILLAS = {
+    "home": "publicaciones/tarjetas/home.html",
+    "resultados": "publicaciones/tarjetas/resultados.html",
+    "favoritos": "publicaciones/tarjetas/favoritos.html",
+    "panel": "publicaciones/tarjetas/panel.html",
+}
+
+#: Clase CSS que marca el botón de favorito activo en cada variante
+CLASE_LIKED = {
+    "home": "home-like--active",
+    "resultados": "is-liked",
+    "favoritos": "is-liked",
+    "panel": "",
+}
+
+#: Incrementar para invalidar todas las tarjetas al cambiar el marcado de las plantillas
+VERSION_MARCADO = 1
+
+# Marcadores que se sustituyen por petición (fuera del fragmento en caché)
+HUECO_LIKED = "__VY_LIKED__"
+HUECO_LIKE_LABEL = "__VY_LIKE_LABEL__"
+HUECO_LIKE_COUNT = "__VY_LIKE_COUNT__"
+HUECO_TIMESINCE = "__VY_TIMESINCE__"
+
+
+def _fotos(pub):
+    prefetched = getattr(pub, "_prefetched_objects_cache", {}).get("fotos")
+    if prefetched is None:
+        prefetched = pub.fotos.all()
+    return sorted((f.id, f.orden, f.es_portada, f.imagen.name) for f in prefetched)
+
+
+def version_tarjeta(pub) -> str:
+    """
+    @brief Versión del contenido de una tarjeta.
+    @details Combina `fecha_actualizacion`, el estatus, las fotos (id, orden, portada,
+     archivo) y el contacto del vendedor (nombre, email, WhatsApp). Usa sólo datos ya
+     cargados por `select_related("usuario__perfil")` y `prefetch_related("fotos")`.
+    """
+    usuario = pub.usuario
+    perfil = getattr(usuario, "perfil", None)
+    partes = (
+        VERSION_MARCADO,
+        pub.fecha_actualizacion.isoformat() if pub.fecha_actualizacion else "",
+        # No todo cambio de estatus pasa por `save()` completo (p.ej. UPDATE por queryset)
+        pub.estatus,
+        _fotos(pub),
+        usuario.get_full_name(), usuario.username, usuario.email,
+        getattr(perfil, "whatsapp", None),
+    )
+    return hashlib.blake2b(repr(partes).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def llave_tarjeta(variante: str, pub) -> str:
+    return f"tarjeta:{variante}:{pub.id}:{version_tarjeta(pub)}"
+
+
+def renderizar_tarjetas(variante: str, pubs) -> dict:
+    """
+    @brief Devuelve `{pub.id: html}` para todas las publicaciones de la página.
+    @details Un `get_many` para las existentes; las faltantes se renderizan y se guardan
+     con un único `set_many`.
+    @param variante Una de las llaves de `PLANTILLAS`.
+    @param pubs Iterable de publicaciones (idealmente con fotos y vendedor precargados).
+    """
+    pubs = list(pubs)
+    llaves = {llave_tarjeta(variante, pub): pub for pub in pubs}
+    encontradas = cache.get_many(list(llaves))
+
+    nuevas = {}
+    for llave, pub in llaves.items():
+        if llave not in encontradas:
+            nuevas[llave] = render_to_string(PLANTILLAS[variante], {"pub": pub})
+    if nuevas:
+        cache.set_many(nuevas, getattr(settings, "TARJETAS_CACHE_TIMEOUT", 60 * 60 * 24))
+
+    encontradas.update(nuevas)
+    return {pub.id: encontradas[llave] for llave, pub in llaves.items()}
+
+
+def completar_tarjeta(variante: str, html: str, pub, liked_ids) -> str:
+    """
+    @brief Rellena los huecos por usuario/petición de un fragmento en caché.
+    """
+    liked = bool(liked_ids) and pub.id in liked_ids
+    return (
+        html.replace(HUECO_LIKED, CLASE_LIKED[variante] if liked else "")
+        .replace(HUECO_LIKE_LABEL, "Quitar de favoritos" if liked else "Agregar a favoritos")
+        .replace(HUECO_LIKE_COUNT, str(getattr(pub, "like_count", 0) or 0))
+        .replace(HUECO_TIMESINCE, timesince(pub.fecha_creacion) if pub.fecha_creacion else "")
+    )
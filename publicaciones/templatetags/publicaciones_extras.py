@@ -1,6 +1,9 @@
 # publicaciones/templatetags/publicaciones_extras.py
 from django import template
+from django.utils.safestring import mark_safe
+
 from publicaciones.models import Publicacion
+from publicaciones.tarjetas import completar_tarjeta, renderizar_tarjetas
 
 register = template.Library()
 
@@ -38,3 +41,24 @@ def tidy_banos(value):
     if s.endswith(".0"):
         return s[:-2]
     return s
+
+
+@register.simple_tag
+def tarjetas(pubs, variante):
+    """
+    Trae de caché (o renderiza) todas las tarjetas de una página en una sola ida:
+    {% tarjetas page_obj.object_list "resultados" as cards %}
+    """
+    return {"variante": variante, "html": renderizar_tarjetas(variante, pubs)}
+
+
+@register.simple_tag
+def tarjeta(cards, pub, liked_ids=None):
+    """
+    Imprime la tarjeta de `pub` con el estado de favorito del usuario actual:
+    {% tarjeta cards pub liked_ids %}
+    """
+    html = cards["html"].get(pub.id)
+    if html is None:
+        html = renderizar_tarjetas(cards["variante"], [pub])[pub.id]
+    return mark_safe(completar_tarjeta(cards["variante"], html, pub, liked_ids))
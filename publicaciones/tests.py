@@ -1,3 +1,647 @@
-from django.test import TestCase
+"""
+@file tests.py
+@brief Pruebas de la aplicación `publicaciones`.
+"""
 
-# Create your tests here.
+import io
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from cuentas.models import Perfil
+from publicaciones.models import Favorito, FotoPublicacion, Geocodificacion, Publicacion, PublicacionArchivada
+from publicaciones.detalle import llave_detalle, obtener_detalle
+from publicaciones import almacen, archivo, codigos_postales, huerfanos, purga
+from publicaciones.geocodificacion import ProveedorLocal, ProveedorNoDisponible, direccion_normalizada
+from publicaciones.tarjetas import llave_tarjeta
+
+from principal.tests import crear_publicaciones, crear_usuario
+
+
+@override_settings(QUERY_INSPECTOR_ENABLED=True, QUERY_INSPECTOR_STRICT=True)
+class PanelVentasConsultasTests(TestCase):
+    """
+    @class PanelVentasConsultasTests
+    @brief El panel del vendedor respeta su presupuesto de consultas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = crear_usuario("vendedor")
+        crear_publicaciones(cls.vendedor, 12)
+
+    def test_panel_ventas(self):
+        self.client.force_login(self.vendedor)
+        r = self.client.get(reverse("publicaciones:panel"))
+        self.assertEqual(r.status_code, 200)
+
+
+class TarjetasCacheTests(TestCase):
+    """
+    @class TarjetasCacheTests
+    @brief Las tarjetas se cachean por versión y el estado de favorito no queda en caché.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = crear_usuario("vendedor")
+        cls.comprador = crear_usuario("comprador")
+        cls.pubs = crear_publicaciones(cls.vendedor, 3)
+
+    def setUp(self):
+        cache.clear()
+
+    def _pub(self):
+        return Publicacion.objects.select_related("usuario__perfil").prefetch_related("fotos").get(pk=self.pubs[0].pk)
+
+    def test_llave_cambia_al_editar(self):
+        antes = llave_tarjeta("resultados", self._pub())
+        pub = Publicacion.objects.get(pk=self.pubs[0].pk)
+        pub.titulo = "Otro título"
+        pub.save()
+        self.assertNotEqual(antes, llave_tarjeta("resultados", self._pub()))
+
+    def test_cambiar_estatus_renderiza_de_nuevo(self):
+        self.client.force_login(self.vendedor)
+        panel = reverse("publicaciones:panel")
+        self.assertContains(self.client.get(panel), "badge-disponible", count=3)
+
+        self.client.post(reverse("publicaciones:cambiar_estatus", args=[self.pubs[0].pk]), {"estatus": "cerrada"})
+        self.assertContains(self.client.get(panel), "badge-cerrada", count=1)
+        # Aunque la fecha no cambie (UPDATE directo), la llave sigue al estatus
+        Publicacion.objects.filter(pk=self.pubs[1].pk).update(estatus="cerrada")
+        self.assertContains(self.client.get(panel), "badge-cerrada", count=2)
+
+    def test_favorito_fuera_del_fragmento(self):
+        url = reverse("principal:resultados_busqueda")
+        self.client.get(url)
+        self.assertIsNotNone(cache.get(llave_tarjeta("resultados", self._pub())))
+
+        Favorito.objects.create(usuario=self.comprador, publicacion=self.pubs[0])
+        self.client.force_login(self.comprador)
+        html = self.client.get(url).content.decode()
+        self.assertEqual(html.count('class="like-btn is-liked"'), 1)
+        self.assertNotIn("__VY_", html)
+
+
+class DetalleCacheTests(TestCase):
+    """
+    @class DetalleCacheTests
+    @brief El detalle se sirve de caché y se invalida al cambiar publicación, fotos o vendedor.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = crear_usuario("vendedor")
+        cls.pub = crear_publicaciones(cls.vendedor, 1)[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_lectura_caliente_sin_consultas(self):
+        obtener_detalle(self.pub.pk)
+        with self.assertNumQueries(0):
+            datos = obtener_detalle(self.pub.pk)
+        self.assertEqual(len(datos["fotos"]), 2)
+        self.assertEqual(datos["vendedor"]["whatsapp"], "6561234567")
+
+    def test_invalidaciones(self):
+        cambios = [
+            lambda: FotoPublicacion.objects.filter(publicacion=self.pub).first().delete(),
+            lambda: self._guardar_perfil(),
+            lambda: Publicacion.objects.get(pk=self.pub.pk).save(),
+            lambda: Favorito.objects.create(usuario=self.vendedor, publicacion=self.pub),
+        ]
+        for cambio in cambios:
+            obtener_detalle(self.pub.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                cambio()
+            self.assertIsNone(cache.get(llave_detalle(self.pub.pk)))
+
+    def test_invalida_al_confirmar(self):
+        obtener_detalle(self.pub.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Publicacion.objects.filter(pk=self.pub.pk).update(titulo="Nuevo")
+            Publicacion.objects.get(pk=self.pub.pk).save()
+            # Sin confirmar: una lectura concurrente aún ve (y vuelve a guardar) lo anterior
+            self.assertIsNotNone(cache.get(llave_detalle(self.pub.pk)))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(llave_detalle(self.pub.pk)))
+        self.assertEqual(obtener_detalle(self.pub.pk)["titulo"], "Nuevo")
+
+    def _guardar_perfil(self):
+        perfil = Perfil.objects.get(user=self.vendedor)
+        perfil.whatsapp = "6569999999"
+        perfil.save()
+
+    def test_login_no_invalida(self):
+        obtener_detalle(self.pub.pk)
+        self.client.force_login(self.vendedor)
+        self.assertIsNotNone(cache.get(llave_detalle(self.pub.pk)))
+
+
+class SeedMarketplaceTests(TestCase):
+    """
+    @class SeedMarketplaceTests
+    @brief `seed_marketplace` genera los volúmenes pedidos con perfiles completos.
+    """
+
+    def test_genera_datos(self):
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            call_command(
+                "seed_marketplace", usuarios=5, publicaciones=30, fotos_por_publicacion=2,
+                favoritos=40, imagenes=2, lote=7, stdout=io.StringIO(),
+            )
+        self.assertEqual(Perfil.objects.count(), 5)
+        self.assertTrue(all(p.is_complete() for p in Perfil.objects.select_related("user")))
+        self.assertEqual(Publicacion.objects.count(), 30)
+        self.assertEqual(FotoPublicacion.objects.count(), 60)
+        self.assertEqual(Favorito.objects.count(), 40)
+
+
+@override_settings(GEOCODIFICACION_PROVEEDOR="publicaciones.geocodificacion.ProveedorLocal")
+class GeocodificacionTests(TestCase):
+    """
+    @class GeocodificacionTests
+    @brief La búsqueda de direcciones se resuelve en el servidor y se guarda por dirección normalizada.
+    """
+    DIRECCION = {"calle": "Av. Tecnológico", "numero": "1340", "colonia": "El Crucero",
+                 "codigo_postal": "32500", "ciudad": "Cd. Juárez", "estado": "Chih."}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = crear_usuario("vendedor")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def _buscar(self, **cambios):
+        return self.client.get(reverse("publicaciones:geocodificar"), self.DIRECCION | cambios)
+
+    def test_normalizacion(self):
+        variante = self.DIRECCION | {"calle": "AV TECNOLOGICO", "ciudad": "ciudad juarez", "estado": "Chihuahua"}
+        self.assertEqual(direccion_normalizada(self.DIRECCION), direccion_normalizada(variante))
+
+    def test_guarda_y_reutiliza(self):
+        original = ProveedorLocal.buscar
+        with mock.patch.object(ProveedorLocal, "buscar", autospec=True, side_effect=original) as buscar:
+            r = self._buscar()
+            self.assertEqual(r.status_code, 200)
+            self.assertTrue(r.json()["encontrada"])
+            self.assertEqual(Geocodificacion.objects.count(), 1)
+
+            cache.clear()
+            r2 = self._buscar(ciudad="Ciudad Juarez")
+        self.assertEqual(buscar.call_count, 1)
+        self.assertEqual((r2.json()["lat"], r2.json()["lon"]), (r.json()["lat"], r.json()["lon"]))
+
+    def test_no_encontrada_se_guarda(self):
+        with override_settings(GEOCODIFICACION_LOCAL={direccion_normalizada(self.DIRECCION): None}):
+            r = self._buscar()
+        self.assertEqual(r.json(), {"encontrada": False})
+        self.assertIsNone(Geocodificacion.objects.get().latitud)
+
+    def test_limite_por_usuario(self):
+        with override_settings(GEOCODIFICACION_POR_MINUTO=2):
+            codigos = [self._buscar().status_code for _ in range(3)]
+        self.assertEqual(codigos, [200, 200, 429])
+
+    def test_proveedor_no_disponible(self):
+        with mock.patch.object(ProveedorLocal, "buscar", side_effect=ProveedorNoDisponible("timeout")):
+            r = self._buscar()
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(r["Retry-After"], "2")
+        self.assertFalse(Geocodificacion.objects.exists())
+
+    def test_requiere_calle_o_colonia(self):
+        self.assertEqual(self._buscar(calle="", colonia="").status_code, 400)
+
+    def test_candado_cubre_la_busqueda_completa(self):
+        with override_settings(GEOCODIFICACION_PLAZO=8), \
+                mock.patch("publicaciones.geocodificacion.obtener_o_calcular", return_value=None) as obtener:
+            self._buscar()
+        self.assertGreater(obtener.call_args.kwargs["espera"], 8)
+
+    @override_settings(GEOCODIFICACION_PROVEEDOR="publicaciones.geocodificacion.Nominatim",
+                       GEOCODIFICACION_PLAZO=0.3, GEOCODIFICACION_INTERVALO=0.1)
+    def test_plazo_de_la_busqueda_completa(self):
+        timeouts = []
+
+        def lenta(peticion, timeout):
+            timeouts.append(timeout)
+            time.sleep(0.15)
+            return io.BytesIO(b"[]")
+
+        with mock.patch("publicaciones.geocodificacion.urllib.request.urlopen", side_effect=lenta):
+            inicio = time.monotonic()
+            r = self._buscar(codigo_postal="")
+        self.assertEqual(r.status_code, 503)
+        self.assertLess(time.monotonic() - inicio, 1)
+        self.assertLess(len(timeouts), 4)
+        self.assertTrue(all(t <= 0.3 for t in timeouts))
+        self.assertFalse(Geocodificacion.objects.exists())
+
+
+SEPOMEX = """El Catálogo Nacional de Códigos Postales, es elaborado por Correos de México.
+d_codigo|d_asenta|d_tipo_asenta|D_mnpio|d_estado|d_ciudad|d_CP|c_estado|c_oficina|c_CP
+32500|El Crucero|Colonia|Juárez|Chihuahua|Juárez|32001|08|32001|
+32500|Partido Romero|Colonia|Juárez|Chihuahua|Juárez|32001|08|32001|
+32000|Centro|Colonia|Juárez|Chihuahua|Juárez|32001|08|32001|
+33000|Delicias Centro|Colonia|Delicias|Chihuahua||33001|08|33001|
+"""
+
+
+class CodigosPostalesTests(TestCase):
+    """
+    @class CodigosPostalesTests
+    @brief Catálogo de CPs: compilación, búsqueda en el índice, autollenado y centroide de respaldo.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = crear_usuario("vendedor")
+
+    def setUp(self):
+        cache.clear()
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.indice = f"{carpeta.name}/cps.idx"
+        ajustes = override_settings(CODIGOS_POSTALES_INDICE=self.indice)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.addCleanup(codigos_postales.recargar)
+        cps = codigos_postales.leer_sepomex(SEPOMEX.splitlines())
+        codigos_postales.compilar(cps, self.indice, {"32500": (31.7051, -106.4272)})
+        codigos_postales.recargar()
+
+    def test_busqueda(self):
+        datos = codigos_postales.buscar("32500")
+        self.assertEqual(datos["colonias"], ["El Crucero", "Partido Romero"])
+        self.assertEqual((datos["ciudad"], datos["estado"]), ("Juárez", "Chihuahua"))
+        self.assertEqual(datos["centroide"], (31.7051, -106.4272))
+        # Sin ciudad en SEPOMEX se usa el municipio; sin centroide, None
+        self.assertEqual(codigos_postales.buscar("33000")["ciudad"], "Delicias")
+        self.assertIsNone(codigos_postales.centroide("33000"))
+        for cp in ("32001", "99999", "00000", "3250", ""):
+            self.assertIsNone(codigos_postales.buscar(cp))
+
+    def test_endpoint(self):
+        r = self.client.get(reverse("publicaciones:codigo_postal", args=["32000"]))
+        self.assertEqual(r.json()["colonias"], ["Centro"])
+        self.assertIn("max-age", r["Cache-Control"])
+        self.assertEqual(self.client.get(reverse("publicaciones:codigo_postal", args=["32001"])).json(),
+                         {"encontrado": False})
+        self.assertEqual(self.client.get(reverse("publicaciones:codigo_postal", args=["3200a"])).status_code, 400)
+
+    def test_sin_indice(self):
+        with override_settings(CODIGOS_POSTALES_INDICE=self.indice + ".no"):
+            codigos_postales.recargar()
+            self.assertIsNone(codigos_postales.buscar("32500"))
+
+    def test_detalle_usa_centroide(self):
+        pub = crear_publicaciones(self.vendedor, 1)[0]
+        Publicacion.objects.filter(pk=pub.pk).update(codigo_postal="32500", latitud=None, longitud=None)
+        self.assertEqual(obtener_detalle(pub.pk)["centroide"], (31.7051, -106.4272))
+
+    @override_settings(GEOCODIFICACION_PROVEEDOR="publicaciones.geocodificacion.ProveedorLocal")
+    def test_geocodificar_recurre_al_centroide(self):
+        self.client.force_login(self.vendedor)
+        with mock.patch.object(ProveedorLocal, "buscar", side_effect=ProveedorNoDisponible("timeout")):
+            r = self.client.get(reverse("publicaciones:geocodificar"), {"calle": "Sin nombre", "codigo_postal": "32500"})
+        self.assertEqual(r.json(), {"encontrada": True, "aproximada": True, "lat": 31.7051, "lon": -106.4272})
+
+    def test_comando(self):
+        Publicacion.objects.all().delete()
+        pub = crear_publicaciones(self.vendedor, 1)[0]
+        Publicacion.objects.filter(pk=pub.pk).update(codigo_postal="33000", latitud=28.19, longitud=-105.47)
+        with tempfile.NamedTemporaryFile("w", encoding="latin-1", suffix=".txt", delete=False) as fh:
+            fh.write(SEPOMEX)
+        self.addCleanup(os.unlink, fh.name)
+        salida = io.StringIO()
+        call_command("compilar_codigos_postales", fh.name, estado=["chihuahua"], stdout=salida)
+        self.assertIn("3 códigos postales (1 con centroide)", salida.getvalue())
+        self.assertEqual(codigos_postales.centroide("33000"), (28.19, -105.47))
+
+
+class ArchivoTests(TestCase):
+    """
+    @class ArchivoTests
+    @brief Las cerradas antiguas pasan al archivo por lotes, se ven en sólo lectura y se restauran.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.vendedor = crear_usuario("vendedor")
+        self.comprador = crear_usuario("comprador")
+        self.viejas = crear_publicaciones(self.vendedor, 3)
+        self.reciente, self.activa = crear_publicaciones(self.vendedor, 2)
+        hace_un_anio = timezone.now() - timedelta(days=365)
+        Publicacion.objects.filter(pk__in=[p.pk for p in self.viejas]).update(
+            estatus="cerrada", fecha_actualizacion=hace_un_anio,
+        )
+        Publicacion.objects.filter(pk=self.reciente.pk).update(estatus="cerrada")
+        Publicacion.objects.filter(pk=self.activa.pk).update(fecha_actualizacion=hace_un_anio)
+        self.favorito = Favorito.objects.create(usuario=self.comprador, publicacion=self.viejas[0])
+        Favorito.objects.filter(pk=self.favorito.pk).update(creado=hace_un_anio)
+
+    def test_archiva_por_lotes_solo_cerradas_antiguas(self):
+        salida = io.StringIO()
+        call_command("archivar_publicaciones", dias=180, lote=2, stdout=salida)
+        self.assertIn("3 publicaciones archivadas", salida.getvalue())
+        self.assertEqual(
+            set(Publicacion.objects.values_list("pk", flat=True)), {self.reciente.pk, self.activa.pk},
+        )
+        archivada = PublicacionArchivada.objects.get(pk=self.viejas[0].pk)
+        self.assertEqual(archivada.usuario, self.vendedor)
+        self.assertEqual([f["orden"] for f in archivada.fotos], [0, 1])
+        self.assertEqual(archivada.favoritos[0]["usuario_id"], self.comprador.pk)
+        self.assertFalse(Favorito.objects.exists())
+        self.assertFalse(FotoPublicacion.objects.filter(publicacion_id=self.viejas[0].pk).exists())
+
+    def test_detalle_y_panel_en_solo_lectura(self):
+        pk = self.viejas[0].pk
+        self.client.get(reverse("principal:publicacion_detalle", args=[pk]))  # detalle vivo en caché
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("archivar_publicaciones", stdout=io.StringIO())
+        r = self.client.get(reverse("principal:publicacion_detalle", args=[pk]))
+        self.assertContains(r, "Archivada")
+        self.assertNotContains(r, 'id="btn-like"')
+        self.assertEqual(r.context["pub"]["like_count"], 1)
+
+        self.client.force_login(self.vendedor)
+        r = self.client.get(reverse("publicaciones:panel"), {"estatus": "archivada"})
+        self.assertEqual(r.context["stats"]["archivadas"], 3)
+        self.assertContains(r, reverse("publicaciones:restaurar", args=[pk]))
+        # Sólo lectura: editar o cambiar estatus ya no la encuentran
+        self.assertEqual(self.client.get(reverse("publicaciones:editar", args=[pk])).status_code, 404)
+
+    def test_restaurar(self):
+        call_command("archivar_publicaciones", stdout=io.StringIO())
+        pk = self.viejas[0].pk
+        otro = crear_usuario("otro")
+        self.client.force_login(otro)
+        self.assertEqual(self.client.post(reverse("publicaciones:restaurar", args=[pk])).status_code, 404)
+
+        self.client.force_login(self.vendedor)
+        self.client.post(reverse("publicaciones:restaurar", args=[pk]))
+        pub = Publicacion.objects.get(pk=pk)
+        self.assertEqual(pub.estatus, "cerrada")
+        self.assertEqual(pub.fecha_creacion, self.viejas[0].fecha_creacion)
+        self.assertEqual(pub.fotos.count(), 2)
+        self.assertLess(Favorito.objects.get(publicacion=pub, usuario=self.comprador).creado, timezone.now() - timedelta(days=300))
+        self.assertFalse(PublicacionArchivada.objects.filter(pk=pk).exists())
+        # La restauración cuenta como cambio: no vuelve al archivo en la siguiente corrida
+        call_command("archivar_publicaciones", stdout=io.StringIO())
+        self.assertTrue(Publicacion.objects.filter(pk=pk).exists())
+
+    def test_cerrar_actualiza_la_fecha(self):
+        self.client.force_login(self.vendedor)
+        self.client.post(reverse("publicaciones:cambiar_estatus", args=[self.activa.pk]), {"estatus": "cerrada"})
+        self.assertFalse(archivo.candidatas(180).filter(pk=self.activa.pk).exists())
+
+
+@override_settings(PURGA_EN_SEGUNDO_PLANO=False, PURGA_ESPERA=0)
+class PurgaTests(TestCase):
+    """
+    @class PurgaTests
+    @brief Eliminar sólo marca la lápida; la purga borra filas y archivos por lotes.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        ajustes = override_settings(MEDIA_ROOT=self.media.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.vendedor = crear_usuario("vendedor")
+        self.pub, self.otra = crear_publicaciones(self.vendedor, 2, fotos=3)
+        for foto in FotoPublicacion.objects.all():
+            ruta = os.path.join(self.media.name, foto.imagen.name)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, "wb") as f:
+                f.write(b"jpg")
+        for i in range(5):
+            Favorito.objects.create(usuario=crear_usuario(f"fan{i}"), publicacion=self.pub)
+
+    def _existe(self, nombre):
+        return os.path.exists(os.path.join(self.media.name, nombre))
+
+    def test_eliminar_oculta_sin_borrar(self):
+        self.client.force_login(self.vendedor)
+        r = self.client.post(reverse("publicaciones:eliminar", args=[self.pub.pk]))
+        self.assertEqual(r.status_code, 302)
+        self.assertFalse(Publicacion.objects.filter(pk=self.pub.pk).exists())
+        self.assertIsNotNone(Publicacion.todas.get(pk=self.pub.pk).eliminada)
+        self.assertEqual(Favorito.objects.filter(publicacion_id=self.pub.pk).count(), 5)
+        self.assertEqual(
+            self.client.get(reverse("principal:publicacion_detalle", args=[self.pub.pk])).status_code, 404,
+        )
+        self.assertEqual(self.client.get(reverse("publicaciones:editar", args=[self.pub.pk])).status_code, 404)
+
+    def test_purga_filas_y_archivos_por_lotes(self):
+        nombres = list(self.pub.fotos.values_list("imagen", flat=True))
+        self.pub.eliminar()
+        salida = io.StringIO()
+        call_command("purgar_publicaciones", lote=2, stdout=salida)
+        self.assertIn("1 publicaciones purgadas", salida.getvalue())
+        self.assertFalse(Publicacion.todas.filter(pk=self.pub.pk).exists())
+        self.assertFalse(Favorito.objects.filter(publicacion_id=self.pub.pk).exists())
+        self.assertFalse(FotoPublicacion.objects.filter(publicacion_id=self.pub.pk).exists())
+        self.assertFalse(any(self._existe(n) for n in nombres))
+        # La otra publicación no se toca
+        self.assertEqual(self.otra.fotos.count(), 3)
+        self.assertTrue(all(self._existe(f.imagen.name) for f in self.otra.fotos.all()))
+
+    def test_no_borra_archivos_compartidos_ni_vigentes(self):
+        compartida = self.pub.fotos.first().imagen.name
+        FotoPublicacion.objects.create(publicacion=self.otra, imagen=compartida, orden=9)
+        self.assertFalse(purga.purgar(self.otra.pk))  # no es lápida
+        self.pub.eliminar()
+        self.assertEqual(purga.purgar_pendientes(), 1)
+        self.assertTrue(self._existe(compartida))
+        self.assertTrue(Publicacion.objects.filter(pk=self.otra.pk).exists())
+
+    def test_espera_antes_de_purgar(self):
+        self.pub.eliminar()
+        with override_settings(PURGA_ESPERA=3600):
+            self.assertEqual(purga.purgar_pendientes(), 0)
+        self.assertEqual(purga.purgar_pendientes(), 1)
+
+
+class LimpiarMediaTests(TestCase):
+    """
+    @class LimpiarMediaTests
+    @brief Sólo se borran archivos sin referencia y fuera del periodo de gracia.
+    """
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        ajustes = override_settings(MEDIA_ROOT=self.media.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        vendedor = crear_usuario("vendedor")
+        self.viva, cerrada = crear_publicaciones(vendedor, 2, fotos=1)
+        Publicacion.objects.filter(pk=cerrada.pk).update(
+            estatus="cerrada", fecha_actualizacion=timezone.now() - timedelta(days=365),
+        )
+        archivo.archivar(dias=180)
+        self.usadas = ["publicaciones/test/0-0.jpg", "publicaciones/test/1-0.jpg"]  # viva y archivada
+        self.derivado = "publicaciones/test/0-0.a1b2c3d4e5f6.webp"
+        self.huerfanas = ["publicaciones/2024/01/02/vieja.jpg", "publicaciones/test/0-0_Xy12AbC.jpg"]
+        self.reciente = "publicaciones/2024/01/03/subiendo.jpg"
+        antes = time.time() - 3 * 24 * 3600
+        for nombre in self.usadas + [self.derivado] + self.huerfanas + [self.reciente]:
+            ruta = os.path.join(self.media.name, nombre)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, "wb") as f:
+                f.write(b"x" * 100)
+            if nombre != self.reciente:
+                os.utime(ruta, (antes, antes))
+
+    def _existe(self, nombre):
+        return os.path.exists(os.path.join(self.media.name, nombre))
+
+    def test_solo_reporta_por_omision(self):
+        r = huerfanos.recolectar(hilos=2)
+        self.assertEqual((r.archivos, r.huerfanos, r.bytes_huerfanos, r.recientes), (6, 2, 200, 1))
+        self.assertEqual(r.borrados, 0)
+        self.assertTrue(all(self._existe(n) for n in self.huerfanas))
+
+    def test_borra_huerfanos_y_carpetas_vacias(self):
+        salida = io.StringIO()
+        call_command("limpiar_media", borrar=True, listar=True, stdout=salida)
+        self.assertIn("2 archivos borrados", salida.getvalue())
+        self.assertIn("publicaciones/2024/01/02/vieja.jpg", salida.getvalue())
+        self.assertFalse(any(self._existe(n) for n in self.huerfanas))
+        self.assertFalse(self._existe("publicaciones/2024/01/02"))
+        self.assertTrue(all(self._existe(n) for n in self.usadas + [self.derivado, self.reciente]))
+
+    def test_referencias_compactas(self):
+        refs = huerfanos.Referencias(["publicaciones/a/foto.jpg"])
+        self.assertIn("publicaciones/a/foto.jpg", refs)
+        self.assertIn("publicaciones/a/foto.400w.webp", refs)
+        self.assertNotIn("publicaciones/a/foto_2.jpg", refs)
+        self.assertNotIn("publicaciones/b/foto.jpg", refs)
+
+
+@override_settings(PURGA_EN_SEGUNDO_PLANO=False, PURGA_ESPERA=0, FOTOS_CONTENIDO_GRACIA=0)
+class AlmacenPorContenidoTests(TestCase):
+    """
+    @class AlmacenPorContenidoTests
+    @brief Fotos iguales comparten un archivo por SHA-256 y se borra al quedar sin referencias.
+    """
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        ajustes = override_settings(MEDIA_ROOT=self.media.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.vendedor = crear_usuario("vendedor")
+        self.pub, self.otra = crear_publicaciones(self.vendedor, 2, fotos=0)
+
+    def _subir(self, pub, nombre, datos):
+        return FotoPublicacion.objects.create(publicacion=pub, imagen=SimpleUploadedFile(nombre, datos))
+
+    def _existe(self, nombre):
+        return os.path.exists(os.path.join(self.media.name, nombre))
+
+    def test_mismo_contenido_un_archivo(self):
+        a = self._subir(self.pub, "casa.JPEG", b"foto-1")
+        b = self._subir(self.otra, "otra.jpg", b"foto-1")
+        c = self._subir(self.otra, "otra.jpg", b"foto-2")
+        self.assertEqual(a.imagen.name, b.imagen.name)
+        self.assertRegex(a.imagen.name, r"^publicaciones/contenido/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$")
+        self.assertNotEqual(a.imagen.name, c.imagen.name)
+        self.assertEqual(len(os.listdir(os.path.dirname(os.path.join(self.media.name, a.imagen.name)))), 1)
+        self.assertEqual(a.imagen.url, "/media/" + a.imagen.name)
+
+    def test_se_libera_sin_referencias(self):
+        nombre = self._subir(self.pub, "casa.jpg", b"foto-1").imagen.name
+        self._subir(self.otra, "casa.jpg", b"foto-1")
+        derivado = nombre.replace(".jpg", ".400w.webp")
+        with open(os.path.join(self.media.name, derivado), "wb") as f:
+            f.write(b"miniatura")
+
+        self.pub.eliminar()
+        purga.purgar_pendientes()
+        self.assertTrue(self._existe(nombre))  # la otra publicación la usa
+
+        Publicacion.objects.filter(pk=self.otra.pk).update(
+            estatus="cerrada", fecha_actualizacion=timezone.now() - timedelta(days=365),
+        )
+        archivo.archivar(dias=180)
+        self.assertEqual(almacen.referenciados([nombre, "publicaciones/otra.jpg"]), {nombre})
+        self.assertEqual(almacen.liberar([nombre]), 0)
+
+        PublicacionArchivada.objects.all().delete()
+        self.assertEqual(almacen.liberar([nombre]), 2)
+        self.assertFalse(self._existe(nombre) or self._existe(derivado))
+
+    def test_liberar_consulta_por_lote(self):
+        Publicacion.objects.filter(pk=self.otra.pk).update(
+            estatus="cerrada", fecha_actualizacion=timezone.now() - timedelta(days=365),
+        )
+        archivo.archivar(dias=180)
+        nombres = [f"publicaciones/2024/01/01/{i}.jpg" for i in range(40)]
+        # Vivas por índice, ¿hay archivo?, y una sola pasada por el archivo
+        with self.assertNumQueries(3):
+            almacen.liberar(nombres)
+
+    def test_no_libera_lo_recien_reutilizado(self):
+        nombre = self._subir(self.pub, "casa.jpg", b"foto-1").imagen.name
+        FotoPublicacion.objects.all().delete()
+        with override_settings(FOTOS_CONTENIDO_GRACIA=600):
+            self.assertEqual(almacen.liberar([nombre]), 0)
+
+    def test_migrar_une_duplicados(self):
+        datos = {"publicaciones/2024/01/01/a.jpg": b"igual", "publicaciones/2024/02/01/b.jpeg": b"igual",
+                 "publicaciones/2024/03/01/c.png": b"distinta"}
+        for nombre, contenido in datos.items():
+            ruta = os.path.join(self.media.name, nombre)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, "wb") as f:
+                f.write(contenido)
+        FotoPublicacion.objects.create(publicacion=self.pub, imagen="publicaciones/2024/01/01/a.jpg")
+        FotoPublicacion.objects.create(publicacion=self.otra, imagen="publicaciones/2024/03/01/c.png")
+        FotoPublicacion.objects.create(publicacion=self.otra, imagen="publicaciones/2024/09/09/perdida.jpg")
+        cerrada, = crear_publicaciones(self.vendedor, 1, fotos=0)
+        FotoPublicacion.objects.create(publicacion=cerrada, imagen="publicaciones/2024/02/01/b.jpeg")
+        Publicacion.objects.filter(pk=cerrada.pk).update(
+            estatus="cerrada", fecha_actualizacion=timezone.now() - timedelta(days=365),
+        )
+        archivo.archivar(dias=180)
+
+        salida = io.StringIO()
+        call_command("migrar_fotos_contenido", simular=True, stdout=salida, stderr=io.StringIO())
+        self.assertIn("2 contenidos distintos, 1 duplicados", salida.getvalue())
+        self.assertTrue(all(self._existe(n) for n in datos))
+
+        call_command("migrar_fotos_contenido", hilos=2, stdout=io.StringIO(), stderr=io.StringIO())
+        igual = FotoPublicacion.objects.get(publicacion=self.pub).imagen.name
+        self.assertTrue(almacen.es_por_contenido(igual))
+        self.assertEqual(PublicacionArchivada.objects.get(pk=cerrada.pk).fotos[0]["imagen"], igual)
+        self.assertTrue(self._existe(igual))
+        self.assertFalse(any(self._existe(n) for n in datos))
+        self.assertEqual(
+            FotoPublicacion.objects.filter(imagen="publicaciones/2024/09/09/perdida.jpg").count(), 1,
+        )
+        # Idempotente
+        salida = io.StringIO()
+        call_command("migrar_fotos_contenido", stdout=salida, stderr=io.StringIO())
+        self.assertIn("1 archivos por migrar", salida.getvalue())
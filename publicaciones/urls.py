@@ -11,5 +11,10 @@ urlpatterns = [
     path("panel/", views.panel_ventas, name="panel"),
     path("<int:pk>/cambiar-estatus/", views.cambiar_estatus, name="cambiar_estatus"),
     path("<int:pk>/eliminar/", views.eliminar_publicacion, name="eliminar"),
+    path("<int:pk>/restaurar/", views.restaurar_publicacion, name="restaurar"),
+
+    # Geocodificación de la dirección del formulario (AJAX)
+    path("geocodificar/", views.geocodificar_direccion, name="geocodificar"),
+    path("cp/<str:cp>/", views.codigo_postal, name="codigo_postal"),
 
 ]
@@ -3,13 +3,24 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.views.decorators.http import require_POST
-from .models import Publicacion
+from django.views.decorators.http import require_GET, require_POST
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.conf import settings
+from .models import Publicacion, PublicacionArchivada
 from .forms import PublicacionForm, FotoPublicacionFormSet
 from django.db.models import Q, Count
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.shortcuts import render
+from django.db import transaction
+from django.urls import reverse
 from cuentas.models import perfil_incompleto
+from vivienda.eventos import bus
+from vivienda.sqlite import reintentar_bloqueos
+from .geocodificacion import CAMPOS_DIRECCION, ProveedorNoDisponible, geocodificar, permitir_consulta
+from . import archivo, codigos_postales
+from .almacen import liberar
+from .purga import purgador
 
 
 
@@ -32,6 +43,22 @@ def _normalizar_portada(publicacion):
             f.save(update_fields=["es_portada"])
 
 
+def _anunciar_disponible(publicacion):
+    """
+    Avisa a las conexiones SSE (home) que hay una publicación disponible nueva.
+    Se llama cuando ya están guardadas las fotos, para que el fragmento de recientes
+    que pida el navegador salga completo.
+    """
+    if publicacion.estatus != "disponible":
+        return
+    datos = {
+        "id": publicacion.pk,
+        "titulo": publicacion.titulo,
+        "url": reverse("principal:publicacion_detalle", args=[publicacion.pk]),
+    }
+    transaction.on_commit(lambda: bus.publicar_publicacion(publicacion.pk, datos))
+
+
 @login_required
 def crear_publicacion(request):
     if perfil_incompleto(request.user):
@@ -46,6 +73,7 @@ def crear_publicacion(request):
             formset.instance = publicacion
             formset.save()
             _normalizar_portada(publicacion)
+            _anunciar_disponible(publicacion)
             messages.success(request, "¡Publicación creada correctamente!")
             return redirect("publicaciones:panel")
     else:
@@ -67,9 +95,14 @@ def editar_publicacion(request, pk):
         form = PublicacionForm(request.POST, request.FILES, instance=publicacion)
         formset = FotoPublicacionFormSet(request.POST, request.FILES, instance=publicacion)
         if form.is_valid() and formset.is_valid():
+            anteriores = set(publicacion.fotos.values_list("imagen", flat=True))
             form.save()
             formset.save()
             _normalizar_portada(publicacion)
+            # Fotos quitadas o reemplazadas: se borran si ninguna otra fila las usa
+            quitadas = anteriores - set(publicacion.fotos.values_list("imagen", flat=True))
+            if quitadas:
+                transaction.on_commit(lambda: liberar(quitadas))
             messages.success(request, "¡Publicación actualizada!")
             return redirect("publicaciones:panel")
     else:
@@ -100,15 +133,23 @@ def panel_ventas(request):
         cerradas=Count('id', filter=Q(estatus='cerrada')),
     )
 
+    # Las cerradas antiguas viven en el archivo (publicaciones/archivo.py): sólo lectura
+    archivadas = PublicacionArchivada.objects.filter(usuario=request.user)
+    stats["archivadas"] = archivadas.count()
+
     qs = base_qs
     estatus = request.GET.get("estatus")
     operacion = request.GET.get("operacion")
-    if estatus:
+    if estatus == "archivada":
+        qs = archivadas
+    elif estatus:
         qs = qs.filter(estatus=estatus)
     if operacion:
         qs = qs.filter(tipo_operacion=operacion)
 
-    paginator = Paginator(qs.prefetch_related("fotos"), 9)
+    if estatus != "archivada":
+        qs = qs.select_related("usuario__perfil").prefetch_related("fotos")
+    paginator = Paginator(qs, 9)
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
 
@@ -117,13 +158,15 @@ def panel_ventas(request):
         "estatus_sel": estatus or "",
         "operacion_sel": operacion or "",
         "stats": stats, 
-        "is_subscribed": getattr(request.user.perfil, "is_subscribed", False)
+        # Desde el espejo local de Stripe (billing/espejo.py), sin llamar a la API
+        "is_subscribed": request.user.perfil.has_active_subscription,
     })
 
 
 
 @login_required
 @require_POST
+@reintentar_bloqueos
 def cambiar_estatus(request, pk):
     if perfil_incompleto(request.user):
         return redirect('cuentas:complete_profile')
@@ -138,22 +181,88 @@ def cambiar_estatus(request, pk):
         messages.error(request, "Estatus inválido.")
         return redirect("publicaciones:panel")
 
+    anterior = publicacion.estatus
     publicacion.estatus = nuevo
-    publicacion.save(update_fields=["estatus"])
+    # `fecha_actualizacion` marca el cierre (archivo) y cambia la versión de la tarjeta
+    publicacion.save(update_fields=["estatus", "fecha_actualizacion"])
+    if anterior != nuevo:
+        _anunciar_disponible(publicacion)
     messages.success(request, "Estatus actualizado.")
     return redirect("publicaciones:panel")
 
 
 @login_required
 @require_POST
+@reintentar_bloqueos
 def eliminar_publicacion(request, pk):
     if perfil_incompleto(request.user):
         return redirect('cuentas:complete_profile')
     """
     Elimina una publicación del usuario (con confirmación por POST).
+    Sólo marca la lápida; fotos, favoritos y archivos se purgan en segundo plano.
     """
     publicacion = get_object_or_404(Publicacion, pk=pk, usuario=request.user)
     titulo = publicacion.titulo
-    publicacion.delete()
+    publicacion.eliminar()
+    transaction.on_commit(purgador.despertar)
     messages.success(request, f"‘{titulo}’ eliminada correctamente.")
-    return redirect("publicaciones:panel")
\ No newline at end of file
+    return redirect("publicaciones:panel")
+
+
+@login_required
+@require_POST
+@reintentar_bloqueos
+def restaurar_publicacion(request, pk):
+    if perfil_incompleto(request.user):
+        return redirect('cuentas:complete_profile')
+    """
+    Devuelve una publicación archivada del usuario a la tabla viva (queda cerrada).
+    """
+    archivada = get_object_or_404(PublicacionArchivada, pk=pk, usuario=request.user)
+    publicacion = archivo.restaurar(archivada)
+    messages.success(request, f"‘{publicacion.titulo}’ restaurada.")
+    return redirect("publicaciones:panel")
+
+
+@login_required
+@require_GET
+def geocodificar_direccion(request):
+    """
+    Coordenadas de la dirección del formulario (ver publicaciones/geocodificacion.py).
+    GET con los campos de la dirección -> {"encontrada": bool, "lat", "lon"}.
+    """
+    partes = {campo: request.GET.get(campo, "").strip() for campo in CAMPOS_DIRECCION}
+    if not (partes["calle"] or partes["colonia"]):
+        return JsonResponse({"error": "Escribe al menos calle y número o colonia."}, status=400)
+    if not permitir_consulta(request.user.pk):
+        return JsonResponse({"error": "Demasiadas búsquedas; espera un momento."}, status=429)
+    try:
+        resultado = geocodificar(partes)
+    except ProveedorNoDisponible:
+        resultado = False
+    if not resultado:
+        # Sin respuesta del proveedor: el centro del CP sirve para ubicar el mapa
+        centro = codigos_postales.centroide(partes["codigo_postal"])
+        if centro:
+            return JsonResponse({"encontrada": True, "aproximada": True, "lat": centro[0], "lon": centro[1]})
+    if resultado is False:
+        respuesta = JsonResponse({"error": "El servicio de mapas no respondió; intenta de nuevo."}, status=503)
+        respuesta["Retry-After"] = "2"
+        return respuesta
+    if resultado is None:
+        return JsonResponse({"encontrada": False})
+    return JsonResponse({"encontrada": True, **resultado})
+
+
+@require_GET
+def codigo_postal(request, cp):
+    """
+    Datos del catálogo de CPs para llenar el formulario (ver publicaciones/codigos_postales.py).
+    -> {"encontrado": bool, "colonias", "ciudad", "municipio", "estado", "centroide"}.
+    """
+    if len(cp) != 5 or not cp.isdigit():
+        return JsonResponse({"error": "El código postal debe tener 5 dígitos."}, status=400)
+    datos = codigos_postales.buscar(cp)
+    respuesta = JsonResponse({"encontrado": True, **datos} if datos else {"encontrado": False})
+    patch_cache_control(respuesta, public=True, max_age=getattr(settings, "CODIGOS_POSTALES_MAX_AGE", 60 * 60 * 24))
+    return respuesta
@@ -4,6 +4,8 @@
 @details
  Expone la aplicación ASGI como una variable de nivel de módulo llamada `application`.
  Se utiliza para manejar conexiones asíncronas (WebSockets, HTTP/2, etc.) en despliegues compatibles.
+ El stream de eventos en vivo (`principal:eventos`, SSE) sólo funciona servido por aquí:
+ cada conexión es un generador asíncrono en el event loop, no un hilo.
 
 @see https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
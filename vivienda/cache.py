@@ -0,0 +1,399 @@
+"""
+@file cache.py
+@brief Caché de dos niveles con protección contra estampidas.
+@details
+ Contiene:
+  - `CacheDosNiveles`: backend de Django con un LRU por proceso (nivel 1, con TTL
+    corto) delante de otro caché compartido entre workers (nivel 2, el alias
+    `OPTIONS["COMPARTIDO"]`; en `settings.py` es `FileBasedCache`). Las lecturas
+    calientes no salen del proceso; las escrituras y borrados van a ambos niveles.
+    Un borrado en un worker no alcanza el nivel 1 de los demás: ahí el dato puede
+    seguir vivo hasta `L1_TIMEOUT` segundos. Con `FileBasedCache` detrás, `add` e
+    `incr` leen y luego escriben el archivo: no son atómicos entre procesos, así que
+    los contadores compartidos (límites por usuario, turnos) son de mejor esfuerzo.
+    Para exclusión real entre workers está `tomar_candado`.
+  - `obtener_o_calcular`: lectura con recálculo coordinado para llaves calientes:
+      * single-flight: sólo una petición por proceso (y, mientras dure el candado
+        entre workers, una por servidor) recalcula; las demás esperan el resultado o
+        siguen sirviendo el valor anterior. Con la opción `CANDADOS` el candado es un
+        archivo creado con `O_CREAT | O_EXCL` en esa carpeta (atómico en el mismo
+        sistema de archivos); sin ella se usa `add` del nivel compartido.
+      * refresco anticipado probabilístico (XFetch): cerca de la expiración cada
+        lectura tiene una probabilidad creciente de recalcular antes de tiempo, en
+        proporción a lo que tarda el cálculo, así la llave casi nunca llega a vencer.
+  - Métricas `cache_*` por prefijo de llave (lo que va antes del primer `:`).
+"""
+
+import hashlib
+import math
+import os
+import pickle
+import random
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from vivienda.metrics import store
+
+_AUSENTE = object()
+
+
+def _prefijo(llave) -> str:
+    return str(llave).split(":", 1)[0]
+
+
+class _LRU:
+    """
+    @brief Diccionario acotado con expiración; guarda los valores serializados.
+    @details Igual que `LocMemCache`, se guarda el pickle para que quien lee no
+     comparta (ni modifique) el objeto de otra petición.
+    """
+
+    def __init__(self, maximo: int):
+        self._maximo = maximo
+        self._datos: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, llave):
+        with self._lock:
+            entrada = self._datos.get(llave)
+            if entrada is None:
+                return _AUSENTE
+            expira, datos = entrada
+            if expira <= time.monotonic():
+                del self._datos[llave]
+                return _AUSENTE
+            self._datos.move_to_end(llave)
+        return pickle.loads(datos)
+
+    def guardar(self, llave, valor, segundos):
+        if segundos <= 0:
+            self.quitar(llave)
+            return
+        datos = pickle.dumps(valor, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._datos[llave] = (time.monotonic() + segundos, datos)
+            self._datos.move_to_end(llave)
+            while len(self._datos) > self._maximo:
+                self._datos.popitem(last=False)
+
+    def quitar(self, llave):
+        with self._lock:
+            self._datos.pop(llave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+class CacheDosNiveles(BaseCache):
+    """
+    @class CacheDosNiveles
+    @brief Backend de caché: LRU en proceso + caché compartido.
+    @details Opciones (`OPTIONS`):
+     - `COMPARTIDO`: alias del caché de nivel 2 (por defecto `"compartido"`).
+     - `L1_MAX_ENTRADAS`: entradas del LRU por proceso (por defecto 1000).
+     - `L1_TIMEOUT`: segundos máximos que una entrada vive en el nivel 1 (por defecto 5).
+     - `CANDADOS`: carpeta compartida por los workers para los candados de
+       `tomar_candado` (por defecto ninguna: se usa `add` del nivel compartido, que
+       con `FileBasedCache` no es atómico entre procesos).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        opciones = params.get("OPTIONS", {})
+        self._alias = opciones.get("COMPARTIDO", "compartido")
+        self._l1_timeout = float(opciones.get("L1_TIMEOUT", 5))
+        self._l1 = _LRU(int(opciones.get("L1_MAX_ENTRADAS", 1000)))
+        self._candados = opciones.get("CANDADOS")
+
+    @property
+    def compartido(self):
+        return caches[self._alias]
+
+    def _segundos_l1(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return self._l1_timeout
+        return min(self._l1_timeout, timeout - time.time())
+
+    @staticmethod
+    def _registrar(key, resultado):
+        store.inc("cache_requests_total", prefix=_prefijo(key), result=resultado)
+
+    # ---------------------------
+    # Lectura
+    # ---------------------------
+    def get(self, key, default=None, version=None):
+        llave = self.make_and_validate_key(key, version=version)
+        valor = self._l1.obtener(llave)
+        if valor is not _AUSENTE:
+            self._registrar(key, "l1")
+            return valor
+        valor = self.compartido.get(key, _AUSENTE, version=version)
+        if valor is _AUSENTE:
+            self._registrar(key, "miss")
+            return default
+        self._registrar(key, "l2")
+        self._l1.guardar(llave, valor, self._l1_timeout)
+        return valor
+
+    def get_many(self, keys, version=None):
+        encontrados, faltantes = {}, []
+        for key in keys:
+            valor = self._l1.obtener(self.make_and_validate_key(key, version=version))
+            if valor is _AUSENTE:
+                faltantes.append(key)
+            else:
+                encontrados[key] = valor
+                self._registrar(key, "l1")
+        if faltantes:
+            compartidos = self.compartido.get_many(faltantes, version=version)
+            for key in faltantes:
+                if key in compartidos:
+                    encontrados[key] = compartidos[key]
+                    self._registrar(key, "l2")
+                    self._l1.guardar(self.make_and_validate_key(key, version=version), compartidos[key],
+                                     self._l1_timeout)
+                else:
+                    self._registrar(key, "miss")
+        return encontrados
+
+    def has_key(self, key, version=None):
+        llave = self.make_and_validate_key(key, version=version)
+        return self._l1.obtener(llave) is not _AUSENTE or self.compartido.has_key(key, version=version)
+
+    # ---------------------------
+    # Escritura
+    # ---------------------------
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        llave = self.make_and_validate_key(key, version=version)
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        self.compartido.set(key, value, timeout, version=version)
+        self._l1.guardar(llave, value, self._segundos_l1(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        llave = self.make_and_validate_key(key, version=version)
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        if not self.compartido.add(key, value, timeout, version=version):
+            return False
+        self._l1.guardar(llave, value, self._segundos_l1(timeout))
+        return True
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        fallidas = self.compartido.set_many(data, timeout, version=version)
+        segundos = self._segundos_l1(timeout)
+        for key, value in data.items():
+            if key not in fallidas:
+                self._l1.guardar(self.make_and_validate_key(key, version=version), value, segundos)
+        return fallidas
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1.quitar(self.make_and_validate_key(key, version=version))
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        return self.compartido.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._l1.quitar(self.make_and_validate_key(key, version=version))
+        return self.compartido.incr(key, delta, version=version)
+
+    # ---------------------------
+    # Borrado
+    # ---------------------------
+    def delete(self, key, version=None):
+        self._l1.quitar(self.make_and_validate_key(key, version=version))
+        return self.compartido.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self._l1.quitar(self.make_and_validate_key(key, version=version))
+        self.compartido.delete_many(keys, version=version)
+
+    def clear(self):
+        self._l1.limpiar()
+        self.compartido.clear()
+
+    # ---------------------------
+    # Candados entre workers
+    # ---------------------------
+    def _archivo_candado(self, key):
+        if not self._candados:
+            return None
+        nombre = hashlib.md5(self.make_and_validate_key(key).encode(), usedforsecurity=False).hexdigest()
+        return os.path.join(self._candados, nombre + ".lock")
+
+    def tomar_candado(self, key, segundos):
+        """
+        @brief Toma un candado entre procesos que vence solo a los `segundos`.
+        @details Con la opción `CANDADOS` es un archivo creado con `O_EXCL` que guarda el
+         token del dueño; si ya existe y tiene más de `segundos` (su dueño murió sin
+         soltarlo) se reemplaza. Sin ella se usa `add` del nivel compartido.
+        @return Token del dueño (para `soltar_candado`) o `None` si lo tiene otro.
+        """
+        token = secrets.token_hex(8)
+        ruta = self._archivo_candado(key)
+        if ruta is None:
+            return token if self.compartido.add(f"candado:{key}", token, segundos) else None
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                pass
+            else:
+                with os.fdopen(fd, "w") as archivo:
+                    archivo.write(token)
+                return token
+            try:
+                if os.path.getmtime(ruta) > time.time() - segundos:
+                    return None
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+        return None
+
+    def soltar_candado(self, key, token):
+        """
+        @brief Suelta el candado sólo si sigue siendo de `token` (no el de quien lo
+         reemplazó por vencido).
+        """
+        ruta = self._archivo_candado(key)
+        if ruta is None:
+            if self.compartido.get(f"candado:{key}") == token:
+                self.compartido.delete(f"candado:{key}")
+            return
+        try:
+            with open(ruta) as archivo:
+                if archivo.read() != token:
+                    return
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+
+# ============================
+# Recálculo coordinado
+# ============================
+
+#: Recálculos en curso en este proceso: llave -> Event
+_vuelos: dict = {}
+_vuelos_lock = threading.Lock()
+
+
+def _tomar_vuelo(llave):
+    """
+    @return Tupla `(es_lider, evento)`.
+    """
+    with _vuelos_lock:
+        evento = _vuelos.get(llave)
+        if evento is not None:
+            return False, evento
+        evento = _vuelos[llave] = threading.Event()
+        return True, evento
+
+
+def _soltar_vuelo(llave, evento):
+    with _vuelos_lock:
+        _vuelos.pop(llave, None)
+    evento.set()
+
+
+def _refrescar_antes(sobre, beta) -> bool:
+    """
+    @brief XFetch: `ahora - delta * beta * ln(U) >= expira`, con U uniforme en (0, 1].
+    """
+    if beta <= 0:
+        return False
+    return time.time() - sobre["delta"] * beta * math.log(1.0 - random.random()) >= sobre["expira"]
+
+
+def _tomar_candado(cache, llave, segundos):
+    if hasattr(cache, "tomar_candado"):
+        return cache.tomar_candado(llave, segundos)
+    token = secrets.token_hex(8)
+    return token if cache.add(f"sf:{llave}", token, segundos) else None
+
+
+def _soltar_candado(cache, llave, token):
+    if hasattr(cache, "soltar_candado"):
+        cache.soltar_candado(llave, token)
+    elif cache.get(f"sf:{llave}") == token:
+        cache.delete(f"sf:{llave}")
+
+
+def _esperar_valor(cache, llave, segundos):
+    fin = time.monotonic() + segundos
+    while time.monotonic() < fin:
+        time.sleep(0.05)
+        sobre = cache.get(llave)
+        if sobre is not None:
+            return sobre
+    return None
+
+
+def obtener_o_calcular(llave, calcular, timeout, beta=None, cache=None, espera=None):
+    """
+    @brief Devuelve el valor en caché de `llave` o lo calcula una sola vez.
+    @param llave Llave del caché.
+    @param calcular Función sin argumentos que produce el valor (serializable).
+    @param timeout Segundos de vida del valor.
+    @param beta Agresividad del refresco anticipado (0 lo desactiva; por defecto
+     `settings.CACHE_BETA`).
+    @param cache Caché a usar (por defecto el `default`).
+    @param espera Segundos que dura el candado del recálculo y que los demás lo esperan
+     antes de calcular por su cuenta (por defecto `settings.CACHE_SINGLE_FLIGHT_ESPERA`).
+     Debe cubrir lo que puede tardar `calcular`: si vence antes, otro worker recalcula.
+    @return El valor, recién calculado o desde caché.
+    """
+    cache = cache or caches["default"]
+    beta = getattr(settings, "CACHE_BETA", 1.0) if beta is None else beta
+    if espera is None:
+        espera = getattr(settings, "CACHE_SINGLE_FLIGHT_ESPERA", 5)
+    prefijo = _prefijo(llave)
+
+    sobre = cache.get(llave)
+    if sobre is not None and not _refrescar_antes(sobre, beta):
+        return sobre["valor"]
+
+    lider, evento = _tomar_vuelo(llave)
+    if not lider:
+        store.inc("cache_coalesced_total", prefix=prefijo)
+        if sobre is not None:
+            return sobre["valor"]
+        evento.wait(espera)
+        sobre = cache.get(llave)
+        if sobre is not None:
+            return sobre["valor"]
+        # El líder falló o tardó demasiado: calcular por cuenta propia
+        return calcular()
+
+    try:
+        propio = _tomar_candado(cache, llave, espera)  # token del candado o None
+        if not propio:
+            # Otro worker ya recalcula
+            store.inc("cache_coalesced_total", prefix=prefijo)
+            if sobre is not None:
+                return sobre["valor"]
+            sobre = _esperar_valor(cache, llave, espera)
+            if sobre is not None:
+                return sobre["valor"]
+
+        store.inc("cache_recomputes_total", prefix=prefijo, reason="early" if sobre is not None else "miss")
+        inicio = time.perf_counter()
+        try:
+            valor = calcular()
+            delta = time.perf_counter() - inicio
+            cache.set(llave, {"valor": valor, "delta": delta, "expira": time.time() + timeout}, timeout)
+        finally:
+            if propio:
+                _soltar_candado(cache, llave, propio)
+        return valor
+    finally:
+        _soltar_vuelo(llave, evento)
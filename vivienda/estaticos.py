@@ -0,0 +1,176 @@
+"""
+@file estaticos.py
+@brief Archivos estáticos: almacenamiento con hash + compresión y librerías de terceros.
+@details
+ Contiene:
+  - `EstaticosComprimidos`: storage de `collectstatic` (WhiteNoise) que agrega el hash
+    del contenido al nombre y precomprime cada archivo con gzip y Brotli (si el paquete
+    `Brotli` está instalado). WhiteNoise sirve los archivos con hash con
+    `Cache-Control: max-age=315360000, public, immutable`.
+  - `VENDOR`: librerías de terceros servidas desde la app (`static/vendor/<nombre>/`)
+    en lugar de su CDN. `manage.py vendorizar_estaticos` las descarga y recorta Font
+    Awesome a los íconos que usan las plantillas; mientras no estén descargadas las
+    etiquetas de `principal/templatetags/vendorizados.py` siguen apuntando al CDN.
+  - `iconos_usados` / `recortar_css`: el recorte de Font Awesome.
+"""
+
+import functools
+import re
+from pathlib import Path
+
+from django.contrib.staticfiles import finders
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+#: Librerías de terceros; `archivos` son rutas relativas a `origen` que se descargan tal cual
+VENDOR = {
+    "leaflet": {
+        "version": "1.9.4",
+        "origen": "https://unpkg.com/leaflet@1.9.4/dist/",
+        "css": "leaflet.css",
+        "js": "leaflet.js",
+        "archivos": (
+            "leaflet.css", "leaflet.js",
+            "images/layers.png", "images/layers-2x.png",
+            "images/marker-icon.png", "images/marker-icon-2x.png", "images/marker-shadow.png",
+        ),
+    },
+    "fontawesome": {
+        "version": "6.5.0",
+        "origen": "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.0/",
+        # Local: el recorte generado por `vendorizar_estaticos`; CDN: la hoja completa
+        "css": "css/iconos.min.css",
+        "css_cdn": "css/all.min.css",
+        "archivos": (),
+    },
+}
+
+
+def ruta_vendor(nombre: str, tipo: str) -> str:
+    """
+    @brief Ruta estática local de la hoja (`css`) o script (`js`) de una librería.
+    """
+    return f"vendor/{nombre}/{VENDOR[nombre][tipo]}"
+
+
+def url_cdn(nombre: str, tipo: str) -> str:
+    info = VENDOR[nombre]
+    return info["origen"] + info.get(f"{tipo}_cdn", info[tipo])
+
+
+@functools.lru_cache(maxsize=None)
+def vendorizado(ruta: str) -> bool:
+    """
+    @brief Indica si el archivo ya se descargó a alguna carpeta `static/` del proyecto.
+    """
+    return finders.find(ruta) is not None
+
+
+class EstaticosComprimidos(CompressedManifestStaticFilesStorage):
+    """
+    @class EstaticosComprimidos
+    @brief Nombres con hash + `.gz`/`.br` precomprimidos, tolerante a la falta de manifiesto.
+    @details
+     - Si existe el manifiesto de `collectstatic` se usan las URLs con hash aunque
+       `DEBUG` esté activo (el despliegue actual corre con `DEBUG = True`).
+     - Sin manifiesto (desarrollo, pruebas) o para archivos que no estaban al
+       recolectar, se usa el nombre original en lugar de lanzar `ValueError`.
+    """
+    manifest_strict = False
+
+    def url(self, name, force=False):
+        return super().url(name, force=force or bool(self.hashed_files))
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+
+# ============================
+# Recorte de Font Awesome
+# ============================
+
+_PATRON_ICONO = re.compile(r"\bfa-([a-z0-9]+(?:-[a-z0-9]+)*)")
+_SELECTOR_ICONO = re.compile(r"^\.fa-([a-z0-9-]+)(?:::?before)?$")
+_CODIGO = re.compile(r'(?:content|--fa)\s*:\s*"\\([0-9a-fA-F]+)')
+_EXTENSIONES = {".html", ".js", ".py"}
+_IGNORAR = {"vendor", "staticfiles", "media", "var", "node_modules", ".git", "migrations"}
+
+
+def iconos_usados(raiz: Path) -> set[str]:
+    """
+    @brief Nombres `fa-*` (sin prefijo) que aparecen en plantillas, JS y Python bajo `raiz`.
+    """
+    usados = set()
+    for ruta in raiz.rglob("*"):
+        if ruta.suffix not in _EXTENSIONES or _IGNORAR.intersection(ruta.relative_to(raiz).parts):
+            continue
+        try:
+            usados.update(_PATRON_ICONO.findall(ruta.read_text(encoding="utf-8")))
+        except (OSError, UnicodeDecodeError):
+            continue
+    return usados
+
+
+def _reglas(css: str):
+    """
+    @brief Recorre las reglas de primer nivel: `(preludio, cuerpo)`.
+    @details Respeta llaves anidadas (`@media`, `@keyframes`) y cadenas entre comillas.
+    """
+    i, n = 0, len(css)
+    while i < n:
+        j = css.find("{", i)
+        if j < 0:
+            resto = css[i:]
+            if resto.strip():
+                yield resto, None
+            return
+        profundidad, k, comilla = 0, j, None
+        while k < n:
+            c = css[k]
+            if comilla:
+                if c == "\\":
+                    k += 2
+                    continue
+                if c == comilla:
+                    comilla = None
+            elif c in "\"'":
+                comilla = c
+            elif c == "{":
+                profundidad += 1
+            elif c == "}":
+                profundidad -= 1
+                if profundidad == 0:
+                    break
+            k += 1
+        yield css[i:j], css[j + 1:k]
+        i = k + 1
+
+
+def recortar_css(css: str, iconos: set[str]) -> tuple[str, set[int]]:
+    """
+    @brief Quita de la hoja de Font Awesome las reglas de íconos no usados.
+    @details Una regla de ícono es aquella cuyos selectores son todos `.fa-<nombre>`
+     (con o sin `::before`) y que define `content` o `--fa`; el resto (base, tamaños,
+     animaciones, `@font-face`) se conserva tal cual.
+    @param css Contenido de `all.min.css`.
+    @param iconos Nombres usados, sin el prefijo `fa-`.
+    @return Tupla `(css_recortado, codigos)` con los puntos de código de los íconos conservados.
+    """
+    partes, codigos = [], set()
+    for preludio, cuerpo in _reglas(css):
+        if cuerpo is None:
+            partes.append(preludio)
+            continue
+        selectores = [s.strip() for s in preludio.split(",")]
+        nombres = [_SELECTOR_ICONO.match(s) for s in selectores]
+        codigo = _CODIGO.search(cuerpo)
+        if codigo and all(nombres):
+            conservados = [s for s, m in zip(selectores, nombres) if m.group(1) in iconos]
+            if not conservados:
+                continue
+            codigos.add(int(codigo.group(1), 16))
+            preludio = ",".join(conservados)
+        partes.append(f"{preludio}{{{cuerpo}}}")
+    return "".join(partes), codigos
@@ -0,0 +1,141 @@
+"""
+@file eventos.py
+@brief Pub/sub en proceso para empujar cambios a los navegadores (Server-Sent Events).
+@details
+ Contiene:
+  - `Bus`: reparte eventos a todas las conexiones SSE abiertas en el proceso.
+    Los publicadores (vistas y señales, en cualquier hilo) sólo acumulan; cada
+    `EVENTOS_COALESCE_SEGUNDOS` se envía un único lote:
+      * `likes`: `{pub_id: delta}` con los deltas sumados (los que quedan en 0 se omiten).
+      * `publicaciones`: lista de publicaciones nuevas disponibles (sin duplicados).
+  - `Suscripcion`: una `asyncio.Queue` acotada por conexión. No hay hilos por
+    conexión: el stream es un generador asíncrono que vive en el event loop del
+    servidor ASGI (`vivienda/asgi.py`), así que miles de conexiones inactivas
+    sólo cuestan su cola.
+  - `formatear_sse`: serializa un evento al formato `text/event-stream`.
+
+ El bus es por proceso: cada worker ASGI reparte lo que se publica en él mismo.
+"""
+
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+
+
+def formatear_sse(evento: str, datos) -> str:
+    """
+    @brief Serializa un evento SSE (`event:` + `data:` + línea en blanco).
+    """
+    return f"event: {evento}\ndata: {json.dumps(datos, separators=(',', ':'))}\n\n"
+
+
+class Suscripcion:
+    """
+    @class Suscripcion
+    @brief Cola de una conexión SSE.
+    @details Si el cliente no consume y la cola se llena, se marca como desbordada y se
+     cierra; `EventSource` se reconecta solo y vuelve a pedir el estado actual.
+    """
+
+    def __init__(self, maximo: int):
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=maximo)
+        self.desbordada = False
+
+    def entregar(self, evento):
+        if self.desbordada:
+            return
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.desbordada = True
+            # Hueco garantizado: sacar uno para poder avisar el cierre
+            self.cola.get_nowait()
+            self.cola.put_nowait(None)
+
+
+class Bus:
+    """
+    @class Bus
+    @brief Fan-out en proceso con agrupación de actualizaciones rápidas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._suscripciones: set[Suscripcion] = set()
+        self._likes: dict[int, int] = {}
+        self._publicaciones: dict[int, dict] = {}
+        self._programado = False
+
+    # ---------------------------
+    # Conexiones (desde el event loop)
+    # ---------------------------
+    def suscribir(self) -> Suscripcion:
+        """
+        @brief Registra una conexión. Debe llamarse desde el event loop del servidor.
+        """
+        sus = Suscripcion(getattr(settings, "EVENTOS_COLA_MAX", 100))
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._suscripciones.add(sus)
+        return sus
+
+    def cancelar(self, sus: Suscripcion):
+        with self._lock:
+            self._suscripciones.discard(sus)
+
+    @property
+    def conexiones(self) -> int:
+        return len(self._suscripciones)
+
+    # ---------------------------
+    # Publicación (desde cualquier hilo)
+    # ---------------------------
+    def publicar_like(self, pub_id: int, delta: int):
+        with self._lock:
+            if not self._suscripciones:
+                return
+            self._likes[pub_id] = self._likes.get(pub_id, 0) + delta
+            self._programar()
+
+    def publicar_publicacion(self, pub_id: int, datos: dict):
+        with self._lock:
+            if not self._suscripciones:
+                return
+            self._publicaciones[pub_id] = datos
+            self._programar()
+
+    def _programar(self):
+        # Con el lock tomado
+        if self._programado or self._loop is None or self._loop.is_closed():
+            return
+        self._programado = True
+        espera = getattr(settings, "EVENTOS_COALESCE_SEGUNDOS", 0.5)
+        self._loop.call_soon_threadsafe(self._loop.call_later, espera, self._vaciar)
+
+    def _vaciar(self):
+        """
+        @brief Envía el lote acumulado a todas las conexiones (en el event loop).
+        """
+        with self._lock:
+            likes = {pid: d for pid, d in self._likes.items() if d}
+            publicaciones = list(self._publicaciones.values())
+            self._likes.clear()
+            self._publicaciones.clear()
+            self._programado = False
+            suscripciones = list(self._suscripciones)
+
+        eventos = []
+        if publicaciones:
+            eventos.append(("publicaciones", publicaciones))
+        if likes:
+            eventos.append(("likes", {str(pid): d for pid, d in likes.items()}))
+        for evento in eventos:
+            for sus in suscripciones:
+                sus.entregar(evento)
+
+
+#: Bus global del proceso
+bus = Bus()
@@ -0,0 +1,164 @@
+"""
+@file media.py
+@brief Vista para servir los archivos de `MEDIA_ROOT` (fotos de publicaciones).
+@details
+ Reemplaza a `django.views.static.serve` (lo que monta `static()`), que lee el archivo
+ completo en el worker y no manda cabeceras de caché:
+  - `ETag` (mtime + tamaño) y `Last-Modified`; responde `304` a las revalidaciones.
+  - `Range: bytes=...` (un solo rango, con `If-Range`): `206` / `416`.
+  - `Cache-Control`: los nombres con hash de contenido (`foto.<hex>.jpg`, derivados y
+    almacenamiento por contenido) son `immutable` por un año; el resto
+    `MEDIA_MAX_AGE`.
+  - Con `MEDIA_ACELERADOR` el cuerpo lo envía el proxy: la vista sólo valida la ruta y
+    arma las cabeceras.
+      * `"x-accel-redirect"` (nginx): `X-Accel-Redirect: <MEDIA_ACCEL_PREFIJO><ruta>`
+        con una ubicación interna, p.ej.:
+          location /_media/ { internal; alias /var/app/current/media/; }
+      * `"x-sendfile"` (Apache mod_xsendfile, lighttpd): `X-Sendfile: <ruta absoluta>`.
+"""
+
+import mimetypes
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+#: `nombre.<hash hex>.ext` o `<sha256>[.<variante>].ext` (por contenido): el contenido de esa URL nunca cambia
+_CON_HASH = re.compile(r"(?:\.[0-9a-f]{12,64}|/[0-9a-f]{64}(?:\.[\w-]+)?)\.[A-Za-z0-9]+$")
+_RANGO = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+#: Tamaño de lectura al enviar un rango
+TROZO = 64 * 1024
+
+UN_ANIO = 60 * 60 * 24 * 365
+
+
+def _resolver(ruta: str) -> Path:
+    try:
+        completa = Path(safe_join(settings.MEDIA_ROOT, ruta))
+    except SuspiciousFileOperation:  # intenta salir de MEDIA_ROOT
+        raise Http404("Archivo no encontrado")
+    if not completa.is_file():
+        raise Http404("Archivo no encontrado")
+    return completa
+
+
+def _cache_control(ruta: str) -> str:
+    if _CON_HASH.search(ruta):
+        return f"public, max-age={UN_ANIO}, immutable"
+    return f"public, max-age={getattr(settings, 'MEDIA_MAX_AGE', 60 * 60)}"
+
+
+def _rango(cabecera: str, tamano: int):
+    """
+    @brief Interpreta un `Range` de un solo intervalo.
+    @return `(inicio, fin)` inclusivos, `None` si se ignora (sintaxis desconocida o
+     varios rangos: se responde completo) o `False` si no es satisfacible.
+    """
+    m = _RANGO.match(cabecera.strip())
+    if not m:
+        return None
+    inicio, fin = m.groups()
+    if not inicio and not fin:
+        return None
+    if not inicio:  # sufijo: últimos N bytes
+        n = int(fin)
+        if n == 0:
+            return False
+        return max(0, tamano - n), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or inicio > fin:
+        return False
+    return inicio, fin
+
+
+def _if_range_vigente(request, etag: str, mtime: int) -> bool:
+    valor = request.headers.get("If-Range")
+    if not valor:
+        return True
+    if valor.startswith(('"', 'W/')):
+        return valor == etag  # comparación fuerte
+    fecha = parse_http_date_safe(valor)
+    return fecha is not None and fecha >= mtime
+
+
+def _leer(completa: Path, inicio: int, largo: int):
+    with completa.open("rb") as fh:
+        fh.seek(inicio)
+        while largo > 0:
+            datos = fh.read(min(TROZO, largo))
+            if not datos:
+                return
+            largo -= len(datos)
+            yield datos
+
+
+@require_safe
+def servir_media(request, ruta):
+    """
+    @brief Sirve `MEDIA_ROOT/<ruta>` con validadores, rangos y caché (o vía el proxy).
+    @param ruta Ruta relativa dentro de `MEDIA_ROOT`.
+    @throws Http404 Si no existe o sale de `MEDIA_ROOT`.
+    """
+    completa = _resolver(ruta)
+    st = completa.stat()
+    mtime = int(st.st_mtime)
+    etag = quote_etag(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+
+    respuesta = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if respuesta is None:
+        respuesta = _cuerpo(request, ruta, completa, st.st_size, etag, mtime)
+    respuesta.headers.setdefault("ETag", etag)
+    respuesta.headers.setdefault("Last-Modified", http_date(mtime))
+    respuesta["Cache-Control"] = _cache_control(ruta)
+    return respuesta
+
+
+def _cuerpo(request, ruta, completa: Path, tamano: int, etag: str, mtime: int):
+    tipo, codificacion = mimetypes.guess_type(completa.name)
+    tipo = tipo or "application/octet-stream"
+
+    acelerador = getattr(settings, "MEDIA_ACELERADOR", None)
+    if acelerador:
+        respuesta = HttpResponse(content_type=tipo)
+        if acelerador == "x-sendfile":
+            respuesta["X-Sendfile"] = str(completa)
+        else:
+            prefijo = getattr(settings, "MEDIA_ACCEL_PREFIJO", "/_media/")
+            respuesta["X-Accel-Redirect"] = prefijo + quote(ruta)
+        return respuesta
+
+    rango = None
+    if "Range" in request.headers and _if_range_vigente(request, etag, mtime):
+        rango = _rango(request.headers["Range"], tamano)
+    if rango is False:
+        respuesta = HttpResponse(status=416)
+        respuesta["Content-Range"] = f"bytes */{tamano}"
+        return respuesta
+
+    if rango is None:
+        if request.method == "HEAD":
+            respuesta = HttpResponse(content_type=tipo)
+        else:
+            respuesta = FileResponse(completa.open("rb"), content_type=tipo)
+        respuesta["Content-Length"] = str(tamano)
+    else:
+        inicio, fin = rango
+        largo = fin - inicio + 1
+        cuerpo = () if request.method == "HEAD" else _leer(completa, inicio, largo)
+        respuesta = StreamingHttpResponse(cuerpo, status=206, content_type=tipo)
+        respuesta["Content-Range"] = f"bytes {inicio}-{fin}/{tamano}"
+        respuesta["Content-Length"] = str(largo)
+
+    if codificacion:
+        respuesta["Content-Encoding"] = codificacion
+    respuesta["Accept-Ranges"] = "bytes"
+    return respuesta
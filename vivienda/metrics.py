@@ -0,0 +1,634 @@
+"""
+@file metrics.py
+@brief Métricas estilo Prometheus para el proyecto "vivienda".
+@details
+ Contiene:
+  - `MetricsStore`: contadores e histogramas en memoria por proceso, volcados
+    periódicamente a un archivo JSON por PID dentro de `METRICS_DIR`. Lo de los
+    workers que terminaron se pasa a un agregado persistente (`retirados.json`) para
+    que los contadores nunca bajen.
+  - `MetricsMiddleware`: mide por nombre de URL el número de peticiones, la
+    latencia, las consultas SQL (un `execute_wrapper` instalado en cada conexión que
+    consulta la petición en curso vía `ContextVar`, así también cuenta el ORM
+    asíncrono, que corre en otro hilo), el tiempo de render de plantillas y el tamaño
+    de la respuesta. Funciona en modo síncrono y asíncrono.
+  - `metrics_view`: expone el agregado de todos los workers de gunicorn en el
+    formato de texto de Prometheus (`/metrics`, con `METRICS_TOKEN`).
+"""
+
+import atexit
+import contextlib
+import functools
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import Template as BackendTemplate
+
+#: Prefijo común de todas las métricas exportadas
+METRIC_PREFIX = "vivienda_"
+
+#: Límites (segundos) de los buckets del histograma de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+#: Descripción y tipo de cada métrica conocida (para las líneas HELP/TYPE)
+METRIC_HELP = {
+    "http_requests_total": ("counter", "Peticiones atendidas por vista, método y código de estado."),
+    "http_request_duration_seconds": ("histogram", "Latencia de las peticiones por vista."),
+    "http_response_bytes_total": ("counter", "Bytes enviados en el cuerpo de las respuestas por vista."),
+    "db_queries_total": ("counter", "Consultas SQL ejecutadas por vista."),
+    "db_query_seconds_total": ("counter", "Tiempo total en consultas SQL por vista."),
+    "template_render_seconds_total": ("counter", "Tiempo total de render de plantillas por vista."),
+    "cache_requests_total": ("counter", "Lecturas de caché por prefijo de llave y nivel que respondió (l1, l2, miss)."),
+    "cache_recomputes_total": ("counter", "Recálculos de llaves calientes por prefijo y motivo (miss, early)."),
+    "cache_coalesced_total": ("counter", "Peticiones que no recalcularon porque otra ya lo hacía."),
+    "db_lock_retries_total": ("counter", "Vistas repetidas porque SQLite estaba bloqueada, por vista."),
+    "db_reads_routed_total": ("counter", "Lecturas de vistas marcadas por destino (réplica o primary_fallback)."),
+    "db_replica_errors_total": ("counter", "Fallas al medir el retraso de una réplica, por alias."),
+    "photo_store_writes_total": ("counter", "Fotos subidas por resultado: archivo nuevo o contenido ya guardado."),
+    "listing_purge_rows_total": ("counter", "Filas borradas al purgar publicaciones eliminadas, por tabla."),
+    "stripe_webhooks_total": ("counter", "Webhooks de Stripe recibidos por tipo y resultado (new, duplicate)."),
+    "stripe_events_processed_total": ("counter", "Eventos de Stripe procesados por tipo y resultado (ok, ignored, error)."),
+    "stripe_request_duration_seconds": ("histogram", "Latencia de las llamadas a la API de Stripe por operación y resultado."),
+    "stripe_requests_total": ("counter", "Llamadas a la API de Stripe por operación y resultado (ok, red, servidor, limite, cliente, circuit_open)."),
+    "stripe_circuit_opened_total": ("counter", "Veces que el circuito de Stripe se abrió."),
+    "stripe_reconcile_drift_total": ("counter", "Campos del espejo de Stripe corregidos por la reconciliación, por objeto y campo."),
+}
+
+
+def _labels_key(labels: dict) -> tuple:
+    """
+    @brief Convierte un dict de etiquetas en una tupla ordenada y hasheable.
+    """
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+class MetricsStore:
+    """
+    @class MetricsStore
+    @brief Registro de métricas por proceso con volcado a disco.
+    @details
+     Cada worker escribe su estado completo en `<METRICS_DIR>/<pid>.json` mediante
+     un reemplazo atómico, de modo que `collect()` puede leer y sumar los archivos
+     de todos los procesos sin bloqueos entre ellos.
+
+     Los totales de un worker que ya no existe se suman a `retirados.json` y su archivo
+     se borra; así el directorio no crece sin límite y un PID reutilizado no pisa (ni
+     resta) lo de su antecesor. Se retira un archivo:
+      - al salir el worker (`atexit`);
+      - en `collect()`, si su PID ya no corre (el worker murió sin `atexit`);
+      - en el primer volcado de un proceso, si su `<pid>.json` ya existía (es de un
+        proceso anterior con el mismo PID).
+     Los retiros y las lecturas de `collect()` se serializan con un candado
+     (`.retirados.lock`, creado con `O_EXCL`) para que nunca se cuente un archivo dos
+     veces ni ninguna.
+    """
+
+    #: Agregado de los workers retirados
+    RETIRED_FILE = "retirados.json"
+    #: Candado de los retiros
+    LOCK_FILE = ".retirados.lock"
+    #: Segundos tras los que un candado se considera abandonado
+    LOCK_STALE = 10.0
+
+    def __init__(self, directory=None, flush_interval: float | None = None):
+        self._directory = directory
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._counters: dict = {}
+        self._histograms: dict = {}
+        self._last_flush = 0.0
+        self._written = False
+        self._atexit_pid = None
+
+    # ---------------------------
+    # Configuración perezosa
+    # ---------------------------
+    @property
+    def directory(self) -> Path:
+        if self._directory is None:
+            return Path(getattr(settings, "METRICS_DIR", Path(tempfile.gettempdir()) / "vivienda-metrics"))
+        return Path(self._directory)
+
+    @property
+    def flush_interval(self) -> float:
+        if self._flush_interval is None:
+            return float(getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0))
+        return self._flush_interval
+
+    def _check_fork(self):
+        """
+        @brief Descarta lo heredado del proceso padre tras un `fork()` (preload de gunicorn).
+        """
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._counters = {}
+            self._histograms = {}
+            self._last_flush = 0.0
+            self._written = False
+
+    # ---------------------------
+    # Registro
+    # ---------------------------
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """
+        @brief Incrementa un contador.
+        @param name Nombre de la métrica (sin prefijo).
+        @param value Cantidad a sumar.
+        @param labels Etiquetas de la serie.
+        """
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+        """
+        @brief Registra una observación en un histograma.
+        @details El estado guarda el conteo por bucket (no acumulado), la suma y el total.
+        """
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._check_fork()
+            state = self._histograms.get(key)
+            if state is None:
+                state = {"buckets": list(buckets), "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+                self._histograms[key] = state
+            for i, upper in enumerate(state["buckets"]):
+                if value <= upper:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    # ---------------------------
+    # Persistencia compartida
+    # ---------------------------
+    def _snapshot(self) -> dict:
+        with self._lock:
+            self._check_fork()
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, list(labels), dict(state, counts=list(state["counts"]))]
+                               for (name, labels), state in self._histograms.items()],
+            }
+
+    def claim_flush(self) -> bool:
+        """
+        @brief Indica si venció el intervalo de volcado y, si es así, lo reserva.
+        @details Para el camino asíncrono: sólo quien recibe `True` manda el volcado
+         (`flush(force=True)`) a un hilo, así el event loop no escribe archivos.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_flush < self.flush_interval:
+                return False
+            self._last_flush = now
+            return True
+
+    def flush(self, force: bool = False):
+        """
+        @brief Escribe el estado del proceso en disco si venció el intervalo (o si `force`).
+        """
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        directory = self.directory
+        pid = os.getpid()
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            if not self._written:
+                self._written = True
+                self._register_atexit()
+                # Un archivo con nuestro PID antes de escribir es de un proceso anterior
+                own = directory / f"{pid}.json"
+                if own.exists():
+                    with self._retire_lock(directory):
+                        self._retire(directory, [own])
+            self._write_json(directory, f"{pid}.json", self._snapshot())
+        except OSError as e:  # pragma: no cover
+            print(f"[Metrics] No se pudo volcar métricas: {e}")
+
+    def close(self):
+        """
+        @brief Retira el archivo de este proceso: suma su estado final al agregado y lo borra.
+        @details Se registra con `atexit` en el primer volcado de cada proceso.
+        """
+        if not self._written or self._pid != os.getpid():
+            return
+        directory = self.directory
+        own = directory / f"{os.getpid()}.json"
+        try:
+            self._write_json(directory, own.name, self._snapshot())
+            with self._retire_lock(directory):
+                self._retire(directory, [own])
+        except OSError as e:  # pragma: no cover
+            print(f"[Metrics] No se pudo retirar métricas: {e}")
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self._written = False
+
+    def _register_atexit(self):
+        pid = os.getpid()
+        if self._atexit_pid != pid:
+            self._atexit_pid = pid
+            atexit.register(self.close)
+
+    @staticmethod
+    def _write_json(directory: Path, name: str, data: dict):
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(data, fh)
+            os.replace(tmp, directory / name)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    @staticmethod
+    def _read_json(path: Path):
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    # ---------------------------
+    # Retiro de workers terminados
+    # ---------------------------
+    @contextlib.contextmanager
+    def _retire_lock(self, directory: Path, wait: float = 2.0):
+        """
+        @brief Candado entre procesos para retirar archivos y leer el agregado.
+        @details Si no se obtiene en `wait` segundos se continúa sin él: sólo se
+         arriesga un conteo doble momentáneo, no perder el volcado.
+        """
+        path = directory / self.LOCK_FILE
+        deadline = time.monotonic() + wait
+        owned = False
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+                owned = True
+                break
+            except FileExistsError:
+                pass
+            try:
+                if os.path.getmtime(path) < time.time() - self.LOCK_STALE:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(0.01)
+        try:
+            yield owned
+        finally:
+            if owned:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _retire(self, directory: Path, paths):
+        """
+        @brief Suma `paths` a `retirados.json` y los borra (con el candado tomado).
+        """
+        paths = [p for p in paths if p.exists()]
+        if not paths:
+            return
+        retired = directory / self.RETIRED_FILE
+        counters, histograms = {}, {}
+        for path in [retired, *paths]:
+            data = self._read_json(path)
+            if data:
+                _merge(counters, histograms, data)
+        self._write_json(directory, self.RETIRED_FILE, _dump(counters, histograms))
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _dead_files(self, directory: Path) -> list:
+        dead = []
+        for path in directory.glob("*.json"):
+            if path.stem.isdigit() and int(path.stem) != os.getpid() and not _pid_alive(int(path.stem)):
+                dead.append(path)
+        return dead
+
+    def collect(self) -> tuple[dict, dict]:
+        """
+        @brief Suma los archivos de todos los workers.
+        @return Tupla `(counters, histograms)` indexados por `(name, labels)`.
+        """
+        counters: dict = {}
+        histograms: dict = {}
+        directory = self.directory
+        if not directory.is_dir():
+            return counters, histograms
+        with self._retire_lock(directory) as owned:
+            if owned:
+                try:
+                    self._retire(directory, self._dead_files(directory))
+                except OSError as e:  # pragma: no cover
+                    print(f"[Metrics] No se pudo retirar métricas: {e}")
+            for path in directory.glob("*.json"):
+                data = self._read_json(path)
+                if data:
+                    _merge(counters, histograms, data)
+        return counters, histograms
+
+    def render(self) -> str:
+        """
+        @brief Genera la exposición en formato de texto de Prometheus (v0.0.4).
+        """
+        counters, histograms = self.collect()
+        lines = []
+        seen = set()
+
+        def header(name, default_type):
+            if name in seen:
+                return
+            seen.add(name)
+            mtype, help_text = METRIC_HELP.get(name, (default_type, name))
+            lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} {mtype}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), state in sorted(histograms.items()):
+            header(name, "histogram")
+            cumulative = 0
+            for upper, count in zip(state["buckets"], state["counts"]):
+                cumulative += count
+                le = labels + (("le", _format_value(upper)),)
+                lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(le)} {cumulative}")
+            lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {state['count']}")
+            lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {_format_value(state['sum'])}")
+            lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(labels)} {state['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _merge(counters: dict, histograms: dict, data: dict):
+    """
+    @brief Suma el estado volcado `data` a `counters`/`histograms` (indexados por `(name, labels)`).
+    """
+    for name, labels, value in data.get("counters", []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        counters[key] = counters.get(key, 0.0) + value
+    for name, labels, state in data.get("histograms", []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        acc = histograms.get(key)
+        if acc is None or acc["buckets"] != state["buckets"]:
+            histograms[key] = dict(state, counts=list(state["counts"]))
+            continue
+        acc["counts"] = [a + b for a, b in zip(acc["counts"], state["counts"])]
+        acc["sum"] += state["sum"]
+        acc["count"] += state["count"]
+
+
+def _dump(counters: dict, histograms: dict) -> dict:
+    """
+    @brief Inverso de `_merge`: el formato de los archivos volcados.
+    """
+    return {
+        "counters": [[name, [list(pair) for pair in labels], value] for (name, labels), value in counters.items()],
+        "histograms": [[name, [list(pair) for pair in labels], state] for (name, labels), state in histograms.items()],
+    }
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":  # `os.kill(pid, 0)` terminaría el proceso en Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # existe, pero es de otro usuario
+        return True
+    return True
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in labels
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value) -> str:
+    value = float(value)
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+#: Registro global del proceso
+store = MetricsStore()
+
+
+# ============================
+# Medición por petición
+# ============================
+
+class _RequestStats:
+    """
+    @brief Acumuladores de una petición (SQL y plantillas).
+    """
+    __slots__ = ("queries", "sql_time", "template_time", "template_depth")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        @brief Wrapper para `connection.execute_wrapper`.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - start
+
+
+#: Estadísticas de la petición en curso (None fuera de una petición medida)
+_current_stats: ContextVar[_RequestStats | None] = ContextVar("vivienda_metrics_stats", default=None)
+
+
+def _sql_hook(execute, sql, params, many, context):
+    """
+    @brief `execute_wrapper` permanente: delega en las estadísticas de la petición en curso.
+    """
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_sql_hook(hook, connection=None, **kwargs):
+    """
+    @brief Agrega `hook` a los `execute_wrappers` de una conexión (o de las ya abiertas).
+    @details Se conecta a `connection_created` para las conexiones nuevas de cualquier
+     hilo (incluido el de `sync_to_async`); también lo usa `queryinspector`.
+    """
+    targets = [connection] if connection is not None else connections.all(initialized_only=True)
+    for conn in targets:
+        if hook not in conn.execute_wrappers:
+            conn.execute_wrappers.append(hook)
+
+
+def _install_metrics_hook(sender, connection, **kwargs):
+    install_sql_hook(_sql_hook, connection)
+
+
+_templates_instrumented = False
+
+
+def _instrument_templates():
+    """
+    @brief Envuelve `Template.render` del backend de Django para medir el render.
+    @details Sólo se cuenta el render más externo; los `include`/`render_to_string`
+     anidados quedan dentro de ese tiempo.
+    """
+    global _templates_instrumented
+    if _templates_instrumented:
+        return
+    original = BackendTemplate.render
+
+    @functools.wraps(original)
+    def render(self, context=None, request=None):
+        stats = _current_stats.get()
+        if stats is None:
+            return original(self, context, request)
+        stats.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            stats.template_depth -= 1
+            if stats.template_depth == 0:
+                stats.template_time += time.perf_counter() - start
+
+    BackendTemplate.render = render
+    _templates_instrumented = True
+
+
+def _view_label(request) -> str:
+    """
+    @brief Nombre de URL de la petición (acotado para no disparar la cardinalidad).
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unresolved>"
+    return match.view_name or "<unnamed>"
+
+
+def _response_size(response) -> int:
+    if getattr(response, "streaming", False):
+        return int(response.get("Content-Length") or 0)
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    """
+    @class MetricsMiddleware
+    @brief Registra métricas por nombre de URL para cada petición.
+    @details Debe ir al inicio de `MIDDLEWARE` para medir también al resto de middlewares.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        _instrument_templates()
+        connection_created.connect(_install_metrics_hook, dispatch_uid="vivienda_metrics_sql")
+        install_sql_hook(_sql_hook)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = _RequestStats()
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = _RequestStats()
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start, flush=False)
+        if store.claim_flush():
+            # Escritura y `os.replace` fuera del event loop (no detener a los demás, p.ej. SSE)
+            await sync_to_async(store.flush, thread_sensitive=False)(force=True)
+        return response
+
+    @staticmethod
+    def _record(request, response, stats, elapsed, flush=True):
+        view = _view_label(request)
+        store.inc("http_requests_total", view=view, method=request.method, status=response.status_code)
+        store.observe("http_request_duration_seconds", elapsed, view=view)
+        store.inc("http_response_bytes_total", _response_size(response), view=view)
+        store.inc("db_queries_total", stats.queries, view=view)
+        store.inc("db_query_seconds_total", stats.sql_time, view=view)
+        store.inc("template_render_seconds_total", stats.template_time, view=view)
+        if flush:
+            store.flush()
+
+
+# ============================
+# Endpoint /metrics
+# ============================
+
+def metrics_view(request):
+    """
+    @brief Expone las métricas agregadas de todos los workers.
+    @details Exige `Authorization: Bearer <METRICS_TOKEN>`. Detrás del proxy de
+     Elastic Beanstalk todas las peticiones llegan desde 127.0.0.1, así que la IP no
+     sirve para distinguir al scraper; sin `METRICS_TOKEN` configurado se niega todo.
+    @return HttpResponse `text/plain; version=0.0.4`.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    autorizacion = request.headers.get("Authorization", "")
+    if not token or not hmac.compare_digest(autorizacion.encode(), f"Bearer {token}".encode()):
+        return HttpResponseForbidden("Forbidden")
+    store.flush(force=True)
+    return HttpResponse(store.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
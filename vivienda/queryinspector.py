@@ -0,0 +1,278 @@
+"""
+@file queryinspector.py
+@brief Instrumentación de SQL por petición para desarrollo y pruebas.
+@details
+ Contiene:
+  - `normalize_sql`: reduce una consulta a su "forma" (sin literales ni listas IN).
+  - `QueryRecorder`: `execute_wrapper` que agrupa consultas por forma y punto de llamada
+    (línea de plantilla o línea de código del proyecto).
+  - `fuera_de_presupuesto`: bloque cuyas consultas no se cuentan (infraestructura).
+  - `query_budget`: decorador para declarar cuántas consultas puede emitir una vista.
+  - `QueryInspectorMiddleware`: compara cada petición contra su presupuesto
+    (`QUERY_BUDGETS` o el decorador) y marca como N+1 las formas repetidas.
+    Con `QUERY_INSPECTOR_STRICT` lanza `QueryBudgetExceeded`, lo que hace fallar
+    la prueba que hizo la petición. Funciona en modo síncrono y asíncrono: el
+    recorder de la petición viaja en un `ContextVar` hasta el hilo del ORM.
+  - `PresupuestosTestRunner` (`TEST_RUNNER`): corre toda la suite con el inspector
+    activo y estricto, así cualquier petición de prueba que pase su presupuesto falla.
+"""
+
+import logging
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.template.base import Node
+from django.test.runner import DiscoverRunner
+
+from vivienda.metrics import install_sql_hook
+
+logger = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"%s|\?")
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_SPACES_RE = re.compile(r"\s+")
+
+#: Archivos de instrumentación (se excluyen al buscar el punto de llamada)
+_INSTRUMENTATION_FILES = {
+    str(Path(__file__).resolve()),
+    str((Path(__file__).parent / "metrics.py").resolve()),
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    @class QueryBudgetExceeded
+    @brief Una vista superó su presupuesto de consultas o repitió una consulta (N+1).
+    @details Hereda de `AssertionError` para que el runner de pruebas lo reporte como fallo.
+    """
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    @brief Normaliza una sentencia SQL a su forma.
+    @details Sustituye literales y parámetros por `?` y colapsa `IN (?, ?, ...)` a `IN (...)`.
+    @param sql Sentencia SQL.
+    @return Forma normalizada.
+    """
+    shape = _STRING_RE.sub("?", sql)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _PARAM_RE.sub("?", shape)
+    shape = _IN_LIST_RE.sub("IN (...)", shape)
+    return _SPACES_RE.sub(" ", shape).strip()
+
+
+def _call_site() -> str:
+    """
+    @brief Ubica quién disparó la consulta.
+    @details Primero busca el nodo de plantilla más interno en la pila (nombre de plantilla
+     y línea del tag); si no hay, la primera línea de código del proyecto fuera de dependencias.
+    @return Cadena `archivo:línea` o `"?"`.
+    """
+    base_dir = str(Path(settings.BASE_DIR).resolve())
+    code_site = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        node = frame.f_locals.get("self")
+        # `type()` y no `isinstance()`: este último evaluaría objetos perezosos (p.ej. request.user)
+        if issubclass(type(node), Node) and getattr(node, "token", None) is not None:
+            origin = getattr(node, "origin", None)
+            name = getattr(origin, "template_name", None) or getattr(origin, "name", "?")
+            return f"{name}:{node.token.lineno}"
+        filename = frame.f_code.co_filename
+        if (
+            code_site is None
+            and filename.startswith(base_dir)
+            and filename not in _INSTRUMENTATION_FILES
+            and "site-packages" not in filename
+        ):
+            code_site = f"{Path(filename).relative_to(base_dir)}:{frame.f_lineno}"
+        frame = frame.f_back
+    return code_site or "?"
+
+
+class QueryRecorder:
+    """
+    @class QueryRecorder
+    @brief Registra las consultas de una petición para `connection.execute_wrapper`.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                "sql": sql,
+                "params": params,
+                "shape": normalize_sql(sql),
+                "site": _call_site(),
+                "time": time.perf_counter() - start,
+            })
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    def repeated(self, threshold: int) -> list[dict]:
+        """
+        @brief Formas ejecutadas `threshold` veces o más desde el mismo punto de llamada.
+        @return Lista de dicts `{shape, site, count, time}` ordenada por repeticiones.
+        """
+        groups = defaultdict(lambda: {"count": 0, "time": 0.0})
+        for q in self.queries:
+            g = groups[(q["shape"], q["site"])]
+            g["count"] += 1
+            g["time"] += q["time"]
+        found = [
+            {"shape": shape, "site": site, "count": g["count"], "time": g["time"]}
+            for (shape, site), g in groups.items()
+            if g["count"] >= threshold
+        ]
+        return sorted(found, key=lambda g: -g["count"])
+
+
+#: Recorder de la petición en curso (None fuera de una petición inspeccionada)
+_current_recorder: ContextVar[QueryRecorder | None] = ContextVar("vivienda_query_recorder", default=None)
+
+
+def _sql_hook(execute, sql, params, many, context):
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@contextmanager
+def fuera_de_presupuesto():
+    """
+    @brief Las consultas dentro del bloque no cuentan para el presupuesto de la petición.
+    @details Para trabajo de infraestructura que ocurre de vez en cuando dentro de una
+     petición cualquiera (p.ej. medir el retraso de las réplicas cada pocos segundos).
+    """
+    token = _current_recorder.set(None)
+    try:
+        yield
+    finally:
+        _current_recorder.reset(token)
+
+
+def _install_inspector_hook(sender, connection, **kwargs):
+    install_sql_hook(_sql_hook, connection)
+
+
+def query_budget(max_queries: int):
+    """
+    @brief Declara el presupuesto de consultas de una vista.
+    @details Equivalente a una entrada en `settings.QUERY_BUDGETS`; la tabla de settings
+     tiene prioridad. Sólo se verifica con `QueryInspectorMiddleware` activo.
+    @param max_queries Número máximo de consultas SQL por petición.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def _budget_for(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None, None
+    budgets = getattr(settings, "QUERY_BUDGETS", {})
+    if match.view_name in budgets:
+        return match.view_name, budgets[match.view_name]
+    return match.view_name, getattr(match.func, "query_budget", None)
+
+
+class QueryInspectorMiddleware:
+    """
+    @class QueryInspectorMiddleware
+    @brief Verifica presupuestos de consultas y detecta N+1 por petición.
+    @details
+     Se activa con `QUERY_INSPECTOR_ENABLED` (por defecto apagado).
+     Agrega la cabecera `X-Query-Count` a la respuesta.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(_install_inspector_hook, dispatch_uid="vivienda_queryinspector_sql")
+        install_sql_hook(_sql_hook)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, "QUERY_INSPECTOR_ENABLED", False):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        return self._check(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not getattr(settings, "QUERY_INSPECTOR_ENABLED", False):
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        return self._check(request, response, recorder)
+
+    @staticmethod
+    def _check(request, response, recorder):
+        response["X-Query-Count"] = str(recorder.count)
+        problems = []
+
+        view_name, budget = _budget_for(request)
+        if budget is not None and recorder.count > budget:
+            problems.append(f"{view_name}: {recorder.count} consultas (presupuesto {budget})")
+
+        threshold = getattr(settings, "QUERY_INSPECTOR_NPLUSONE_THRESHOLD", 3)
+        for g in recorder.repeated(threshold):
+            problems.append(f"N+1 en {view_name or request.path}: {g['count']}x desde {g['site']}: {g['shape']}")
+
+        if problems:
+            message = "\n".join(problems)
+            if getattr(settings, "QUERY_INSPECTOR_STRICT", False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class PresupuestosTestRunner(DiscoverRunner):
+    """
+    @class PresupuestosTestRunner
+    @brief `DiscoverRunner` con `QUERY_INSPECTOR_ENABLED` y `QUERY_INSPECTOR_STRICT` en toda la suite.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._previos = (settings.QUERY_INSPECTOR_ENABLED, settings.QUERY_INSPECTOR_STRICT)
+        settings.QUERY_INSPECTOR_ENABLED = True
+        settings.QUERY_INSPECTOR_STRICT = True
+
+    def teardown_test_environment(self, **kwargs):
+        settings.QUERY_INSPECTOR_ENABLED, settings.QUERY_INSPECTOR_STRICT = self._previos
+        super().teardown_test_environment(**kwargs)
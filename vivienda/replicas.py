@@ -0,0 +1,239 @@
+"""
+@file replicas.py
+@brief Lecturas en réplicas: router de base de datos, vistas marcadas y lectura de lo propio.
+@details
+ Contiene:
+  - `RouterReplicas` (`DATABASE_ROUTERS`): las escrituras van siempre a `default`;
+    las lecturas van a una réplica sólo dentro de una vista marcada con
+    `@lectura_en_replica` (búsqueda, home, detalle, favoritos). Todo lo demás
+    (formularios, panel, comandos, hilos) lee de la primaria.
+  - Lectura de lo propio: tras una petición que escribe (método no seguro) de un
+    usuario autenticado, `ReplicasMiddleware` guarda en su sesión hasta cuándo debe
+    leer de la primaria (`REPLICAS_VENTANA` segundos); mientras tanto sus vistas
+    marcadas no usan réplicas. Las sesiones siempre se leen de la primaria.
+  - Retraso: cada `REPLICAS_REVISAR_CADA` segundos (por proceso) se mide cuánto va
+    atrasada cada réplica; las que pasan de `REPLICAS_RETRASO_MAX`, o que fallaron al
+    medir (`REPLICAS_PAUSA`), se saltan. Si no queda ninguna, se lee de la primaria.
+    En PostgreSQL se usa `pg_last_xact_replay_timestamp()`; en otros motores (p.ej.
+    copias SQLite con litestream) se compara el último `Generacion.actualizado`.
+
+ Las réplicas se declaran en `DATABASES` (alias en `REPLICAS`); en desarrollo,
+ `DB_REPLICAS=/ruta/replica.sqlite3` agrega una réplica SQLite.
+"""
+
+import random
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Max
+
+from vivienda.metrics import store
+from vivienda.queryinspector import fuera_de_presupuesto
+
+#: Llave de sesión con el timestamp hasta el que el usuario lee de la primaria
+LLAVE_SESION = "_replicas_primaria_hasta"
+
+#: True dentro de una vista marcada con `lectura_en_replica`
+_en_replica: ContextVar[bool] = ContextVar("en_replica", default=False)
+
+
+def _ajuste(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+# ============================
+# Salud y retraso de las réplicas
+# ============================
+
+def medir_retraso(alias: str) -> float:
+    """
+    @brief Segundos de atraso de una réplica respecto a la primaria.
+    """
+    conexion = connections[alias]
+    if conexion.vendor == "postgresql":
+        with conexion.cursor() as cursor:
+            cursor.execute(
+                "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+            )
+            return float(cursor.fetchone()[0])
+    generacion = apps.get_model("publicaciones", "Generacion")
+    primaria = generacion.objects.using("default").aggregate(m=Max("actualizado"))["m"]
+    replica = generacion.objects.using(alias).aggregate(m=Max("actualizado"))["m"]
+    if primaria is None or (replica is not None and replica >= primaria):
+        return 0.0
+    if replica is None:
+        return float("inf")
+    return (primaria - replica).total_seconds()
+
+
+class Salud:
+    """
+    @class Salud
+    @brief Retraso medido de cada réplica (por proceso, se renueva cada `REPLICAS_REVISAR_CADA`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estado = {}  # alias -> (retraso, medido_en, caida_hasta)
+
+    def _revisar(self, alias, ahora):
+        retraso, medido, caida_hasta = self._estado.get(alias, (0.0, 0.0, 0.0))
+        if ahora < caida_hasta or ahora - medido < _ajuste("REPLICAS_REVISAR_CADA", 5):
+            return retraso, caida_hasta
+        try:
+            # Se mide cada `REPLICAS_REVISAR_CADA` dentro de la petición que toque: no es de la vista
+            with fuera_de_presupuesto():
+                retraso, caida_hasta = medir_retraso(alias), 0.0
+        except DatabaseError:
+            store.inc("db_replica_errors_total", alias=alias)
+            retraso, caida_hasta = float("inf"), ahora + _ajuste("REPLICAS_PAUSA", 30)
+        with self._lock:
+            self._estado[alias] = (retraso, ahora, caida_hasta)
+        return retraso, caida_hasta
+
+    def disponibles(self) -> list:
+        """
+        @brief Réplicas al día (retraso <= `REPLICAS_RETRASO_MAX`) y sin fallas recientes.
+        """
+        ahora = time.monotonic()
+        maximo = _ajuste("REPLICAS_RETRASO_MAX", 5)
+        elegibles = []
+        for alias in _ajuste("REPLICAS", []):
+            retraso, caida_hasta = self._revisar(alias, ahora)
+            if ahora >= caida_hasta and retraso <= maximo:
+                elegibles.append(alias)
+        return elegibles
+
+    def olvidar(self):
+        with self._lock:
+            self._estado.clear()
+
+
+salud = Salud()
+
+
+# ============================
+# Router
+# ============================
+
+class RouterReplicas:
+    """
+    @class RouterReplicas
+    @brief Lecturas a réplicas dentro de vistas marcadas; todo lo demás a `default`.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _en_replica.get() or not _ajuste("REPLICAS", []):
+            return None
+        if model._meta.app_label in _ajuste("REPLICAS_APPS_PRIMARIA", ["sessions"]):
+            return None
+        elegibles = salud.disponibles()
+        if not elegibles:
+            store.inc("db_reads_routed_total", target="primary_fallback")
+            return None
+        alias = random.choice(elegibles)
+        store.inc("db_reads_routed_total", target=alias)
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Las réplicas son copias de la primaria: cualquier relación entre ellas vale
+        bases = {"default", *_ajuste("REPLICAS", [])}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas reciben el esquema por replicación
+        return False if db in _ajuste("REPLICAS", []) else None
+
+
+# ============================
+# Vistas y middleware
+# ============================
+
+def _fijado(valor) -> bool:
+    return bool(valor) and valor > time.time()
+
+
+def lectura_en_replica(vista):
+    """
+    @brief Decorador: las lecturas de la vista pueden ir a una réplica, salvo que el
+     usuario haya escrito hace menos de `REPLICAS_VENTANA` segundos.
+    """
+    if iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltura_async(request, *args, **kwargs):
+            sesion = getattr(request, "session", None)
+            if sesion is not None and _fijado(await sesion.aget(LLAVE_SESION)):
+                return await vista(request, *args, **kwargs)
+            token = _en_replica.set(True)
+            try:
+                return await vista(request, *args, **kwargs)
+            finally:
+                _en_replica.reset(token)
+        return envoltura_async
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        sesion = getattr(request, "session", None)
+        if sesion is not None and _fijado(sesion.get(LLAVE_SESION)):
+            return vista(request, *args, **kwargs)
+        token = _en_replica.set(True)
+        try:
+            return vista(request, *args, **kwargs)
+        finally:
+            _en_replica.reset(token)
+    return envoltura
+
+
+class ReplicasMiddleware:
+    """
+    @class ReplicasMiddleware
+    @brief Tras una escritura de un usuario autenticado, fija sus lecturas a la primaria.
+    @details Va después de `AuthenticationMiddleware`. Sin réplicas configuradas no
+     toca la sesión.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _escritura(request, response) -> bool:
+        return (
+            bool(_ajuste("REPLICAS", []))
+            and request.method not in ("GET", "HEAD", "OPTIONS", "TRACE")
+            and response.status_code < 500
+            and hasattr(request, "session")
+        )
+
+    @staticmethod
+    def _hasta():
+        return time.time() + _ajuste("REPLICAS_VENTANA", 10)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self._escritura(request, response) and request.user.is_authenticated:
+            request.session[LLAVE_SESION] = self._hasta()
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self._escritura(request, response) and (await request.auser()).is_authenticated:
+            await request.session.aset(LLAVE_SESION, self._hasta())
+        return response
@@ -7,9 +7,11 @@
  - Aplicaciones instaladas (INSTALLED_APPS).
  - Autenticación (Allauth con Google).
  - Middleware.
+ - Métricas Prometheus.
+ - Eventos en vivo (SSE).
  - Templates.
  - Base de datos.
- - Archivos estáticos y media.
+ - Archivos estáticos (WhiteNoise) y media.
  - Idioma y zona horaria.
 """
 
@@ -84,11 +86,15 @@ SOCIALACCOUNT_AUTO_SIGNUP = True
 # Middleware
 # ==============================
 MIDDLEWARE = [
+    'vivienda.metrics.MetricsMiddleware',
+    'vivienda.queryinspector.QueryInspectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'vivienda.replicas.ReplicasMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
@@ -123,13 +129,64 @@ TEMPLATES = [
 # ==============================
 # Base de datos
 # ==============================
+#: Pragmas de cada conexión SQLite (ver vivienda/sqlite.py). WAL: los lectores no
+#: esperan al escritor; NORMAL: en WAL sólo se arriesga la última transacción ante
+#: un apagón, no la integridad.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,            # ms esperando el candado antes de "database is locked"
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -20000,            # KiB (negativo) por conexión
+    "temp_store": "MEMORY",
+}
+#: WAL queda grabado en el encabezado del archivo: con el `db.sqlite3` versionado de
+#: desarrollo, el primer `manage.py` lo reescribiría y ensuciaría el árbol de git. Por
+#: eso sólo se activa con `SQLITE_WAL=1` (lo pone el Procfile); sin él se aplican los
+#: demás pragmas y el journal queda como esté en el archivo.
+SQLITE_WAL = os.getenv("SQLITE_WAL", "0") == "1"
+#: Reintentos de `reintentar_bloqueos` y su espera base en segundos (se duplica, con jitter)
+SQLITE_REINTENTOS = 3
+SQLITE_REINTENTO_BASE = 0.05
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': "; ".join(
+                f"PRAGMA {k}={v}" for k, v in SQLITE_PRAGMAS.items() if SQLITE_WAL or k != "journal_mode"
+            ),
+            # El candado de escritura se toma al abrir la transacción
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Réplicas de lectura (vivienda/replicas.py). En desarrollo, DB_REPLICAS con rutas
+# SQLite separadas por comas (copias de db.sqlite3, p.ej. con litestream); en
+# producción se declaran aquí como alias 'replica_N' del motor que corresponda.
+# Son copias de sólo lectura: sin `journal_mode` (reescribe el encabezado del archivo)
+# ni `transaction_mode` IMMEDIATE (toma el candado de escritura), y con `query_only`.
+_PRAGMAS_REPLICA = {k: v for k, v in SQLITE_PRAGMAS.items() if k != "journal_mode"} | {"query_only": 1}
+for _i, _ruta in enumerate(filter(None, os.getenv("DB_REPLICAS", "").split(",")), 1):
+    DATABASES[f"replica_{_i}"] = {
+        **DATABASES["default"],
+        "NAME": _ruta.strip(),
+        "OPTIONS": {"init_command": "; ".join(f"PRAGMA {k}={v}" for k, v in _PRAGMAS_REPLICA.items())},
+        "TEST": {"MIRROR": "default"},
+    }
+REPLICAS = [alias for alias in DATABASES if alias.startswith("replica_")]
+DATABASE_ROUTERS = ["vivienda.replicas.RouterReplicas"]
+#: Segundos que un usuario lee de la primaria después de escribir (leer lo propio)
+REPLICAS_VENTANA = 10
+#: Atraso máximo tolerado de una réplica, cada cuánto se mide y pausa tras una falla
+REPLICAS_RETRASO_MAX = 5
+REPLICAS_REVISAR_CADA = 5
+REPLICAS_PAUSA = 30
+#: Apps que siempre se leen de la primaria
+REPLICAS_APPS_PRIMARIA = ["sessions"]
+
 # ==============================
 # Validación de contraseñas
 # ==============================
@@ -158,8 +215,28 @@ STATICFILES_DIRS = [
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+#: `collectstatic` agrega hash al nombre y genera `.gz`/`.br` (ver vivienda/estaticos.py)
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    # Fotos de publicaciones, por contenido (ver publicaciones/almacen.py)
+    "fotos": {"BACKEND": "publicaciones.almacen.AlmacenPorContenido"},
+    "staticfiles": {"BACKEND": "vivienda.estaticos.EstaticosComprimidos"},
+}
+#: Sin `collectstatic` WhiteNoise sirve desde las carpetas `static/` de las apps y relee los cambios
+_ESTATICOS_RECOLECTADOS = (STATIC_ROOT / "staticfiles.json").exists()
+WHITENOISE_USE_FINDERS = not _ESTATICOS_RECOLECTADOS
+WHITENOISE_AUTOREFRESH = DEBUG and not _ESTATICOS_RECOLECTADOS
+#: Cache-Control de los archivos sin hash; los que llevan hash son `immutable`
+WHITENOISE_MAX_AGE = 60 * 60
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+#: Cache-Control de las fotos sin hash en el nombre (las que lo llevan son `immutable`)
+MEDIA_MAX_AGE = 60 * 60
+#: Delegar el envío al proxy: None, "x-accel-redirect" (nginx) o "x-sendfile" (Apache/lighttpd)
+MEDIA_ACELERADOR = os.getenv("MEDIA_ACELERADOR") or None
+#: Ubicación `internal` de nginx que apunta a MEDIA_ROOT (sólo con x-accel-redirect)
+MEDIA_ACCEL_PREFIJO = "/_media/"
 
 
 # ==============================
@@ -167,6 +244,138 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # ==============================
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# ==============================
+# Métricas (Prometheus)
+# ==============================
+#: Directorio compartido donde cada worker vuelca sus métricas
+METRICS_DIR = Path(os.getenv("METRICS_DIR", BASE_DIR / "var" / "metrics"))
+#: Segundos mínimos entre volcados a disco de un mismo worker
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1.0"))
+#: Token que el scraper manda como `Authorization: Bearer ...` para leer /metrics (sin él, 403)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+
+# ==============================
+# Presupuestos de consultas SQL (desarrollo / pruebas)
+# ==============================
+#: Activa `QueryInspectorMiddleware` (`QUERY_INSPECTOR=1`). No depende de DEBUG: este
+#: settings es el que se despliega y el inspector recorre la pila en cada consulta
+QUERY_INSPECTOR_ENABLED = os.getenv("QUERY_INSPECTOR", "0") == "1"
+#: Lanza `QueryBudgetExceeded` en lugar de sólo registrar una advertencia
+#: (`manage.py test` siempre corre activo y estricto, ver `TEST_RUNNER`)
+QUERY_INSPECTOR_STRICT = False
+TEST_RUNNER = "vivienda.queryinspector.PresupuestosTestRunner"
+#: Repeticiones de una misma forma de consulta, desde el mismo punto, que cuentan como N+1
+QUERY_INSPECTOR_NPLUSONE_THRESHOLD = 3
+#: Máximo de consultas por petición, por nombre de URL
+QUERY_BUDGETS = {
+    "principal:home": 6,
+    "principal:resultados_busqueda": 10,
+    "principal:publicacion_detalle": 8,
+    "principal:mis_favoritos": 6,
+    "publicaciones:panel": 8,
+}
+
+# ==============================
+# Caché (LRU por proceso + archivos compartidos entre workers, ver vivienda/cache.py)
+# ==============================
+#: Directorio del caché compartido (nivel 2)
+CACHE_DIR = Path(os.getenv("CACHE_DIR", BASE_DIR / "var" / "cache"))
+CACHES = {
+    "default": {
+        "BACKEND": "vivienda.cache.CacheDosNiveles",
+        "TIMEOUT": 300,
+        "OPTIONS": {
+            "COMPARTIDO": "compartido",
+            "L1_MAX_ENTRADAS": 1000,
+            #: Un borrado en otro worker tarda a lo más esto en verse aquí
+            "L1_TIMEOUT": 5,
+            #: Candados entre workers (single-flight), con `O_EXCL` en esta carpeta
+            "CANDADOS": CACHE_DIR / "candados",
+        },
+    },
+    "compartido": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": CACHE_DIR,
+        "TIMEOUT": 300,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+#: Agresividad del refresco anticipado de llaves calientes (0 = sólo al vencer)
+CACHE_BETA = 1.0
+#: Segundos que una petición espera el recálculo de otra antes de hacerlo ella misma
+CACHE_SINGLE_FLIGHT_ESPERA = 5
+#: Vida de la lista de recientes del home
+RECIENTES_CACHE_TIMEOUT = 60
+
+# ==============================
+# Geocodificación (ver publicaciones/geocodificacion.py)
+# ==============================
+#: Proveedor: `...Nominatim` (OpenStreetMap) o `...ProveedorLocal` (sin red)
+GEOCODIFICACION_PROVEEDOR = os.getenv("GEOCODIFICACION_PROVEEDOR", "publicaciones.geocodificacion.Nominatim")
+#: Nominatim exige identificar la aplicación
+GEOCODIFICACION_USER_AGENT = "ViviendaYa/1.0 (viviendayamx@gmail.com)"
+#: Segundos máximos por consulta al proveedor
+GEOCODIFICACION_TIMEOUT = 4
+#: Un turno de consulta al proveedor cada tantos segundos (política de Nominatim)
+GEOCODIFICACION_INTERVALO = 1.0
+#: Segundos que una búsqueda espera turno antes de responder 503
+GEOCODIFICACION_ESPERA_MAX = 3
+#: Segundos máximos de una búsqueda completa (todas sus consultas y turnos) antes de responder 503
+GEOCODIFICACION_PLAZO = 8
+#: Búsquedas por usuario por minuto
+GEOCODIFICACION_POR_MINUTO = 30
+#: Vigencia de un "no encontrado" guardado
+GEOCODIFICACION_NEGATIVA_HORAS = 24
+#: Índice del catálogo de CPs de SEPOMEX (`manage.py compilar_codigos_postales`)
+CODIGOS_POSTALES_INDICE = BASE_DIR / "publicaciones" / "datos" / "codigos_postales.idx"
+#: `Cache-Control: max-age` de las respuestas del catálogo (cambia con cada compilación)
+CODIGOS_POSTALES_MAX_AGE = 60 * 60 * 24
+
+# ==============================
+# Archivo de publicaciones cerradas (ver publicaciones/archivo.py)
+# ==============================
+#: Días sin cambios tras los que una publicación cerrada pasa al archivo
+ARCHIVO_DIAS = int(os.getenv("ARCHIVO_DIAS", "180"))
+#: Publicaciones por transacción al archivar
+ARCHIVO_LOTE = 200
+
+# ==============================
+# Purga de publicaciones eliminadas (ver publicaciones/purga.py)
+# ==============================
+#: Hilo por proceso que purga; con 0 hay que correr `manage.py purgar_publicaciones`
+PURGA_EN_SEGUNDO_PLANO = os.getenv("PURGA_EN_SEGUNDO_PLANO", "1") == "1"
+#: Segundos entre pasadas del hilo (además de despertar con cada eliminación)
+PURGA_INTERVALO = 60
+#: Segundos que una lápida espera antes de purgarse (peticiones en curso)
+PURGA_ESPERA = 30
+#: Filas por DELETE al borrar favoritos y fotos
+PURGA_LOTE = 500
+#: Horas que debe tener un archivo sin referencias antes de que `manage.py limpiar_media` lo borre
+MEDIA_GC_GRACIA_HORAS = 24
+#: Segundos tras reutilizar una foto por contenido en los que no se borra aunque no tenga referencias
+FOTOS_CONTENIDO_GRACIA = 10 * 60
+
+# ==============================
+# Vistas asíncronas (servidas por vivienda.asgi; opcionales)
+# ==============================
+# El Procfile sirve `vivienda.wsgi`. Bajo ASGI todas las vistas síncronas que quedan
+# (checkout y webhook de Stripe, geocodificación, formularios) corren de a una en un
+# solo hilo por proceso: una llamada lenta al proveedor detiene a las demás. Sólo
+# conviene cambiar cuando `loadtest_marketplace --comparar` muestre una mejora:
+#   web: SQLITE_WAL=1 VISTAS_ASYNC=1 gunicorn vivienda.asgi:application -k uvicorn.workers.UvicornWorker
+#: Usa `principal.views_async` para home, resultados, recientes, detalle y favoritos
+VISTAS_ASYNC = os.getenv("VISTAS_ASYNC", "0") == "1"
+
+# ==============================
+# Eventos en vivo (SSE, requiere vivienda.asgi)
+# ==============================
+#: Ventana en la que se agrupan likes/publicaciones antes de enviarlos
+EVENTOS_COALESCE_SEGUNDOS = 0.5
+#: Comentario de latido para mantener viva la conexión a través de proxies
+EVENTOS_HEARTBEAT_SEGUNDOS = 15
+#: Eventos pendientes por conexión antes de cerrarla por lenta
+EVENTOS_COLA_MAX = 100
+
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
 STRIPE_PRICE_ID_WEEKLY  = os.getenv("STRIPE_PRICE_ID_WEEKLY")
@@ -175,6 +384,41 @@ STRIPE_PRICE_ID_YEARLY  = os.getenv("STRIPE_PRICE_ID_YEARLY")
 DOMAIN = os.getenv("DOMAIN")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 
+# Llamadas a Stripe (billing/conexion.py)
+#: Segundos para abrir la conexión y para esperar cada respuesta
+STRIPE_TIMEOUT_CONEXION = 3
+STRIPE_TIMEOUT_LECTURA = 10
+#: Conexiones keep-alive por hilo
+STRIPE_CONEXIONES = 10
+#: Reintentos ante red/429/5xx, espera base (se duplica, con jitter) y tope total en segundos
+STRIPE_REINTENTOS = 2
+STRIPE_REINTENTO_BASE = 0.25
+STRIPE_TIEMPO_MAX = 20
+#: Fallas seguidas que abren el circuito y segundos que permanece abierto
+STRIPE_CIRCUITO_FALLAS = 5
+STRIPE_CIRCUITO_PAUSA = 30
+
+# Cola de webhooks de Stripe (ver billing/procesador.py)
+#: Procesar en un hilo de cada worker; si es False sólo `manage.py reprocesar_eventos_stripe`
+STRIPE_EVENTOS_EN_SEGUNDO_PLANO = os.getenv("STRIPE_EVENTOS_EN_SEGUNDO_PLANO", "1") == "1"
+#: Segundos entre revisiones de la cola aunque no lleguen webhooks (reintentos)
+STRIPE_EVENTOS_INTERVALO = 30
+#: Eventos revisados por pasada
+STRIPE_EVENTOS_LOTE = 100
+#: Intentos antes de marcar un evento como fallido
+STRIPE_EVENTOS_MAX_INTENTOS = 8
+#: Espera antes del primer reintento; se duplica en cada intento
+STRIPE_EVENTOS_ESPERA_BASE = 30
+#: Segundos que un evento tomado queda reservado a su proceso
+STRIPE_EVENTOS_ARRENDAMIENTO = 300
+#: Cada cuántos segundos un worker recorre Stripe para corregir el espejo local (None: sólo el comando)
+STRIPE_RECONCILIAR_CADA = 6 * 60 * 60
+#: Listas de Stripe descargadas a la vez al reconciliar, y máximo de peticiones por segundo
+STRIPE_RECONCILIAR_HILOS = 4
+STRIPE_RECONCILIAR_POR_SEGUNDO = 20
+#: Acceso provisional al volver de Checkout, mientras llega el webhook
+STRIPE_ACTIVACION_PROVISIONAL = 30 * 60
+
 LOGIN_URL = '/cuentas/login/'
 LOGIN_REDIRECT_URL = '/publicaciones/panel/'
 LOGOUT_REDIRECT_URL = '/'
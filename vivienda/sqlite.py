@@ -0,0 +1,70 @@
+"""
+@file sqlite.py
+@brief SQLite en producción: pragmas de conexión y reintento de escrituras bloqueadas.
+@details
+ Contiene:
+  - `SQLITE_PRAGMAS` (settings) va en `OPTIONS["init_command"]` de `DATABASES`:
+    WAL, `synchronous=NORMAL`, `mmap_size`, `cache_size`, `busy_timeout` y
+    `temp_store=MEMORY`; Django lo ejecuta al abrir cada conexión. Con WAL los
+    lectores no bloquean al escritor ni al revés; sólo los escritores se esperan
+    entre sí. `init_command` arma la misma cadena (para el benchmark). El
+    `journal_mode` sólo se aplica con `SQLITE_WAL=1`: queda grabado en el archivo y
+    el `db.sqlite3` de desarrollo está versionado.
+  - Las transacciones usan `BEGIN IMMEDIATE` (`OPTIONS["transaction_mode"]`): la
+    transacción toma el candado de escritura al empezar y espera `busy_timeout`,
+    en lugar de fallar al querer escribir después de haber leído.
+  - `reintentar_bloqueos`: decorador para vistas que escriben. Corre la vista en
+    una transacción y, si aun así SQLite responde "database is locked", la repite
+    con espera aleatoria creciente (`SQLITE_REINTENTOS`, `SQLITE_REINTENTO_BASE`).
+
+ `manage.py benchmark_sqlite` mide lecturas y escrituras concurrentes con y sin
+ estos ajustes.
+"""
+
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+from vivienda.metrics import store
+
+
+def init_command(pragmas: dict) -> str:
+    """
+    @brief `PRAGMA k=v; ...` para `OPTIONS["init_command"]`.
+    """
+    return "; ".join(f"PRAGMA {nombre}={valor}" for nombre, valor in pragmas.items())
+
+
+def es_bloqueo(error) -> bool:
+    """
+    @brief Indica si un error de SQLite es por candado (se puede reintentar).
+    """
+    mensaje = str(error).lower()
+    return "database is locked" in mensaje or "database is busy" in mensaje or "database table is locked" in mensaje
+
+
+def reintentar_bloqueos(vista):
+    """
+    @brief Decorador: ejecuta la vista en una transacción y la repite si la base estaba bloqueada.
+    @details Dentro de una transacción ya abierta no reintenta (no se puede repetir
+     sólo una parte); en ese caso el error sube como siempre.
+    """
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if connection.in_atomic_block:
+            return vista(request, *args, **kwargs)
+        intentos = getattr(settings, "SQLITE_REINTENTOS", 3)
+        base = getattr(settings, "SQLITE_REINTENTO_BASE", 0.05)
+        for intento in range(intentos + 1):
+            try:
+                with transaction.atomic():
+                    return vista(request, *args, **kwargs)
+            except OperationalError as e:
+                if not es_bloqueo(e) or intento == intentos:
+                    raise
+                store.inc("db_lock_retries_total", view=vista.__name__)
+                time.sleep(random.uniform(0, base * 2 ** intento))
+    return envoltura
@@ -8,12 +8,18 @@
  - Rutas de la aplicación `cuentas`.
  - Rutas de la aplicación `publicaciones`.
  - Rutas de autenticación social con Allauth.
+ - Endpoint `/metrics` en formato Prometheus.
+ - Archivos subidos (`MEDIA_URL`) con `vivienda.media.servir_media`.
 """
 
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from vivienda.media import servir_media
+from vivienda.metrics import metrics_view
 
 urlpatterns = [
     # Admin
@@ -33,9 +39,10 @@ urlpatterns = [
 
     # Billing / Stripe
     path('billing/', include('billing.urls')),
-]
 
+    # Métricas Prometheus (scraper local)
+    path('metrics', metrics_view, name='metrics'),
 
-# Servir archivos MEDIA y STATIC tanto en desarrollo como producción (Elastic Beanstalk Single Instance)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
+    # Archivos MEDIA (fotos); los STATIC los sirve WhiteNoise
+    re_path(r'^%s(?P<ruta>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), servir_media, name='media'),
+]